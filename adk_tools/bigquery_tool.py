@@ -1,14 +1,15 @@
 import pandas as pd
+import pyarrow as pa
 import logging
-from typing import Dict, List, Union # Added Union for type hinting
-from connectors.bigquery_connector import BigQueryConnector # Added import
+from typing import Dict, List, Optional, Union # Added Union for type hinting
+from interfaces.database_interface import DatabaseConnectorInterface, QueryResultChunks
 
 logger = logging.getLogger(__name__)
 
 class BigQueryTool:
     """A tool for interacting with Google BigQuery, using a BigQueryConnector."""
 
-    def __init__(self, connector: BigQueryConnector): # Modified parameter
+    def __init__(self, connector: DatabaseConnectorInterface): # Modified parameter
         self.connector = connector # Store the connector instance
         logger.info(f"BigQueryTool initialized with connector for project: {self.connector.project_id}")
 
@@ -73,3 +74,51 @@ class BigQueryTool:
         except Exception as e:
             logger.error(f"Error executing BigQuery query via connector: {e}")
             raise
+
+    def execute_query_arrow(self, query: str) -> pa.Table:
+        """
+        Executes a SQL query on BigQuery using the connector and returns the result as an Arrow table.
+
+        Args:
+            query: The SQL query to execute.
+
+        Returns:
+            A pyarrow Table containing the query results.
+
+        Raises:
+            Exception: If the query fails to execute (propagated from connector).
+        """
+        try:
+            logger.info(f"Executing BigQuery query (Arrow) via connector: {query}")
+            table = self.connector.execute_query_arrow(query)
+            logger.info(f"Query executed via connector, returned {table.num_rows} rows.")
+            return table
+        except Exception as e:
+            logger.error(f"Error executing BigQuery query via connector: {e}")
+            raise
+
+    def iter_query(self, query: str, page_size: int = 10000, max_rows: Optional[int] = None,
+                   max_bytes: Optional[int] = None, as_arrow: bool = False) -> QueryResultChunks:
+        """
+        Executes a SQL query using the connector and returns an iterator over result chunks.
+
+        Args:
+            query: The SQL query to execute.
+            page_size: Maximum number of rows per chunk.
+            max_rows: Stop once this many rows have been returned (None for no limit).
+            max_bytes: Stop once this many bytes have been returned (None for no limit).
+            as_arrow: Yield Arrow chunks instead of DataFrames.
+
+        Returns:
+            A QueryResultChunks iterator; its `truncated` attribute is set once iteration stops.
+
+        Raises:
+            Exception: If the query fails to execute (propagated from connector).
+        """
+        try:
+            logger.info(f"Executing BigQuery query (paged) via connector: {query}")
+            return self.connector.iter_query(query, page_size=page_size, max_rows=max_rows,
+                                             max_bytes=max_bytes, as_arrow=as_arrow)
+        except Exception as e:
+            logger.error(f"Error executing BigQuery query via connector: {e}")
+            raise
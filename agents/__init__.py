@@ -2,9 +2,12 @@
 from .data_analyst_agent import DataAnalystAgent
 from .schema_agent import SchemaAgent
 from .visualization_agent import VisualizationAgent # Add this line
+from .registry import AgentRegistry, get_registry
 
 __all__ = [
     "DataAnalystAgent",
     "SchemaAgent",
-    "VisualizationAgent" # Add this agent to the list
+    "VisualizationAgent", # Add this agent to the list
+    "AgentRegistry",
+    "get_registry"
 ]
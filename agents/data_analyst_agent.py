@@ -1,21 +1,97 @@
 # agents/data_analyst_agent.py
 
 import os
+import time
 import logging # Added import
+import pandas as pd
+import pyarrow as pa
 import vertexai
 
 from google.adk.agents import Agent
 from vertexai.generative_models import GenerativeModel
-from typing import Dict, Any, Optional # Ensure Optional is imported
+from typing import Dict, Any, Callable, List, Optional, Tuple # Ensure Optional is imported
 
 from adk_tools.bigquery_tool import BigQueryTool
 from connectors.bigquery_connector import BigQueryConnector
+from interfaces.database_interface import DatabaseConnectorInterface
 from agents.schema_agent import SchemaAgent
+from utils.cost_guard import QueryCostGuard, DEFAULT_SESSION_ID
+from utils.result_cache import QueryResultCache, result_cache_key
+from utils.result_store import ResultStore
+from utils.sql_cache import SQLGenerationCache
+from utils.semantic_cache import SemanticQuestionCache
+from utils.schema_pruning import SchemaPruner
+from utils.sql_utils import complete_statement_end, count_sql, is_deterministic
+from utils.sql_validator import validate_sql
+from utils.chart_planner import aggregate_sql
+from utils.table_query import TABLE_PAGE_SIZE, TOTAL_ROWS_COLUMN, page_sql, page_table
+from utils.tracing import span, traced
+from utils.metrics import LLM_LATENCY, LLM_TIME_TO_FIRST_TOKEN, record_llm_usage
 
 logger = logging.getLogger(__name__)
 
+VERTEX_LOCATION = "europe-west4"
+DEFAULT_MODEL_NAME = "gemini-2.5-flash"
+FALLBACK_MODEL_NAMES = ["gemini-2.5-flash", "gemini-2.5-pro", "text-bison@001"]
+
+# Ceilings applied while streaming query results, so one "show all rows" question cannot OOM the instance
+MAX_RESULT_ROWS = int(os.environ.get("MAX_RESULT_ROWS", 100000))
+MAX_RESULT_BYTES = int(os.environ.get("MAX_RESULT_BYTES", 256 * 1024 * 1024))
+RESULT_PAGE_SIZE = 10000
+
+
+def create_generative_model(model_name: str = DEFAULT_MODEL_NAME, name: str = "DataAnalystAgent") -> Optional[GenerativeModel]:
+    """Builds a Gemini model handle, trying the fallback models if the preferred one fails."""
+    try:
+        model = GenerativeModel(model_name)
+        logger.info(f"{name} initialized Gemini model successfully.")
+        return model
+    except Exception as e:
+        logger.warning(f"Error initializing Gemini model in {name}: {e}")
+
+    # Try fallback models
+    for fallback_model in FALLBACK_MODEL_NAMES:
+        try:
+            model = GenerativeModel(fallback_model)
+            logger.info(f"{name} initialized fallback model {fallback_model} successfully.")
+            return model
+        except Exception as fallback_error:
+            logger.warning(f"Error initializing fallback model {fallback_model} in {name}: {fallback_error}")
+
+    logger.error(f"All model initialization attempts failed in {name}. Vertex AI may not be enabled.")
+    return None
+
+
 class DataAnalystAgent(Agent):
-    def __init__(self, project_id: Optional[str] = None, name: Optional[str] = "DataAnalystAgent"): # Add name parameter
+    def __init__(self, project_id: Optional[str] = None, name: Optional[str] = "DataAnalystAgent",
+                 connector: Optional[DatabaseConnectorInterface] = None,
+                 schema_agent: Optional[SchemaAgent] = None,
+                 model: Optional[GenerativeModel] = None,
+                 location: str = VERTEX_LOCATION,
+                 max_result_rows: Optional[int] = MAX_RESULT_ROWS,
+                 max_result_bytes: Optional[int] = MAX_RESULT_BYTES,
+                 cost_guard: Optional[QueryCostGuard] = None,
+                 result_cache: Optional[QueryResultCache] = None,
+                 model_name: str = DEFAULT_MODEL_NAME,
+                 sql_cache: Optional[SQLGenerationCache] = None,
+                 semantic_cache: Optional[SemanticQuestionCache] = None,
+                 schema_pruner: Optional[SchemaPruner] = None,
+                 result_store: Optional[ResultStore] = None):
+        """
+        Shared clients can be injected (see agents.registry) so that callbacks do not
+        rebuild the BigQuery client, Vertex AI and the Gemini model on every request.
+        Anything not provided is built here. connector may be any DatabaseConnectorInterface,
+        e.g. a LocalConnector to run against DuckDB/SQLite without GCP.
+
+        max_result_rows / max_result_bytes bound how much of a query result is downloaded
+        (None disables a ceiling). cost_guard holds the dry-run byte budgets. result_cache,
+        when given, serves repeated queries over unchanged tables without running them.
+        sql_cache remembers the SQL generated per question, dataset schema and model_name;
+        semantic_cache reuses SQL that already ran for a paraphrase of the question.
+        schema_pruner cuts wide schemas down to the tables and columns relevant to
+        each question before they go into the prompt. result_store keeps every result
+        under a handle, for the data table to page through (see fetch_table_page).
+        """
         super().__init__(name=name, description="Agent for natural language to SQL conversion and data analysis.") # Pass name and description
         logger.info(f"Initializing {name}...")
 
@@ -28,15 +104,25 @@ class DataAnalystAgent(Agent):
 
         # Store project_id in a way that works with ADK Agent
         self._project_id = project_id
+        self._max_result_rows = max_result_rows
+        self._max_result_bytes = max_result_bytes
+        self._cost_guard = cost_guard or QueryCostGuard()
+        self._result_cache = result_cache
+        self._model_name = model_name
+        self._sql_cache = sql_cache or SQLGenerationCache()
+        self._semantic_cache = semantic_cache or SemanticQuestionCache()
+        self._schema_pruner = schema_pruner or SchemaPruner()
+        self._result_store = result_store or ResultStore()
         
-        # Initialize Vertex AI
+        # Initialize Vertex AI (the registry has already done this when it hands us a model)
+        if model is None:
+            try:
+                vertexai.init(project=self._project_id, location=location)
+                logger.info(f"{name} initialized Vertex AI successfully.")
+            except Exception as e:
+                logger.error(f"Error initializing Vertex AI in {name}: {e}")
         try:
-            vertexai.init(project=self._project_id, location="europe-west4")
-            logger.info(f"{name} initialized Vertex AI successfully.")
-        except Exception as e:
-            logger.error(f"Error initializing Vertex AI in {name}: {e}")
-        try:
-            self._connector = BigQueryConnector(project_id=self._project_id) # Connector for the tool
+            self._connector = connector or BigQueryConnector(project_id=self._project_id) # Connector for the tool
             self._bigquery_tool = BigQueryTool(connector=self._connector)
             logger.info(f"{name} initialized BigQueryTool with project_id: {self._project_id}")
         except Exception as e:
@@ -44,34 +130,18 @@ class DataAnalystAgent(Agent):
             self._connector = None
             self._bigquery_tool = None # Ensure tool is also None if connector fails
 
-        try:
-            self._schema_agent = SchemaAgent(project_id=self._project_id, name="DataAnalystInternalSchemaAgent")
-            logger.info(f"{name} successfully initialized internal SchemaAgent.")
-        except Exception as e:
-            logger.error(f"Error initializing internal SchemaAgent in {name}: {e}")
-            self._schema_agent = None
+        if schema_agent is not None:
+            self._schema_agent = schema_agent
+        else:
+            try:
+                self._schema_agent = SchemaAgent(project_id=self._project_id, name="DataAnalystInternalSchemaAgent",
+                                                 connector=self._connector)
+                logger.info(f"{name} successfully initialized internal SchemaAgent.")
+            except Exception as e:
+                logger.error(f"Error initializing internal SchemaAgent in {name}: {e}")
+                self._schema_agent = None
 
-        try:
-            self.model = GenerativeModel("gemini-2.5-flash")
-            logger.info(f"{name} initialized Gemini model successfully.")
-        except Exception as e:
-            logger.warning(f"Error initializing Gemini model in {name}: {e}")
-            # Try fallback models
-            fallback_models = ["gemini-2.5-flash", "gemini-2.5-pro", "text-bison@001"]
-            model_initialized = False
-            
-            for fallback_model in fallback_models:
-                try:
-                    self.model = GenerativeModel(fallback_model)
-                    logger.info(f"{name} initialized fallback model {fallback_model} successfully.")
-                    model_initialized = True
-                    break
-                except Exception as fallback_error:
-                    logger.warning(f"Error initializing fallback model {fallback_model} in {name}: {fallback_error}")
-            
-            if not model_initialized:
-                logger.error(f"All model initialization attempts failed in {name}. Vertex AI may not be enabled.")
-                self.model = None
+        self.model = model if model is not None else create_generative_model(model_name, name=name)
         
         logger.info(f"{name} (DataAnalystAgent) initialized successfully.")
 
@@ -95,21 +165,200 @@ class DataAnalystAgent(Agent):
         """Get the schema agent."""
         return self._schema_agent
 
-    def process(self, query: str, dataset_schema: dict, project_id: str, dataset_id: str) -> dict:
+    @property
+    def cost_guard(self) -> QueryCostGuard:
+        """Get the query cost guard."""
+        return self._cost_guard
+
+    @property
+    def sql_cache(self) -> SQLGenerationCache:
+        """Get the generated-SQL cache."""
+        return self._sql_cache
+
+    @property
+    def semantic_cache(self) -> SemanticQuestionCache:
+        """Get the semantic question cache."""
+        return self._semantic_cache
+
+    @property
+    def result_cache(self) -> Optional[QueryResultCache]:
+        """Get the query result cache, if any."""
+        return self._result_cache
+
+    @property
+    def result_store(self) -> ResultStore:
+        """Get the store of results kept for paging."""
+        return self._result_store
+
+    @traced("process")
+    def process(self, query: str, dataset_schema: dict, project_id: str, dataset_id: str,
+                session_id: str = DEFAULT_SESSION_ID, confirmed_sql: Optional[str] = None,
+                on_sql_text: Optional[Callable[[str], None]] = None) -> dict:
         """
         Processes a natural language query, converts it to a SQL query using the provided dataset schema,
         executes it, and returns the results along with the SQL query.
+
+        Before execution the query is dry-run and checked against the byte budgets. If it needs the
+        user's confirmation, 'confirmation_required' is set and the query is parked on the cost guard;
+        calling again with confirmed_sql runs it without generating the SQL again.
+
+        With on_sql_text, the model response is streamed: on_sql_text receives the SQL
+        received so far after every chunk, and the query is validated as soon as a
+        complete statement has arrived, without waiting for the rest of the response.
         """
         logger.info(f"{self.name}: Processing query: '{query}' for dataset: {project_id}.{dataset_id}")
 
         return_value = {
             'sql_query': None,
+            'source_sql': None,
+            'dataset_id': dataset_id,
             'results_df': None,
             'results_markdown': None,
+            'truncated': False,
+            'total_rows': None,
+            'bytes_estimated': None,
+            'bytes_billed': None,
+            'from_cache': False,
+            'sql_from_cache': False,
+            'semantic_match': None,
+            'result_handle': None,
+            'confirmation_required': False,
+            'message': None,
             'error': None
         }
 
+        # 1-3. Generate the SQL query, unless the user is confirming one we already generated.
+        generation_key = None
+        if confirmed_sql:
+            sql_query = confirmed_sql
+            return_value['sql_query'] = return_value['source_sql'] = sql_query
+        else:
+            generation_key = self._sql_cache.make_key(query, f"{project_id}.{dataset_id}", dataset_schema,
+                                                      self._model_identity())
+            sql_query = self._generate_sql(query, dataset_schema, project_id, dataset_id, return_value,
+                                           generation_key, on_sql_text)
+            if sql_query is None:
+                return return_value
+
+        # 4. Check the query locally: one read-only SELECT over tables and columns that exist.
+        #    A confirmed query passed this check before; it is repeated for the download LIMIT.
+        with span("sql.validate"):
+            checked = validate_sql(sql_query, dataset_schema, dataset_id,
+                                   limit=self._max_result_rows + 1 if self._max_result_rows else None)
+        if checked['error']:
+            logger.warning(f"{self.name}: Rejected generated SQL '{sql_query}': {checked['error']}")
+            self._forget_generated_sql(generation_key, query, project_id, dataset_id, return_value)
+            return_value['error'] = (f"The generated SQL query was rejected before running it:\n`{sql_query}`"
+                                     f"\n\n**Error details:**\n{checked['error']}")
+            return return_value
+        # source_sql is the query without the download LIMIT, for aggregating the full result
+        return_value['source_sql'] = sql_query
+        sql_query = return_value['sql_query'] = checked['sql']
+        fingerprint_sql = checked['normalized']
+
+        # 5. Pre-flight: dry-run the query and check it against the byte budgets.
+        try:
+            with span("bigquery.dry_run"):
+                return_value['bytes_estimated'] = self._cost_guard.estimate(self.connector, sql_query)
+        except Exception as e:
+            logger.error(f"Dry run failed for SQL query '{sql_query}': {e}")
+            self._forget_generated_sql(generation_key, query, project_id, dataset_id, return_value)
+            return_value['error'] = f"An error occurred while validating the generated SQL query:\n`{sql_query}`\n\n**Error details:**\n{e}"
+            return return_value
+
+        # 6. Serve the result from the cache when none of the tables it reads has changed.
+        with span("result_cache.lookup"):
+            cache_key = self._result_cache_key(sql_query, fingerprint_sql)
+            cached = self._result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            table, metadata = cached
+            logger.info(f"{self.name}: Serving query result from cache ({table.num_rows} rows).")
+            return_value['from_cache'] = True
+            return_value['truncated'] = metadata.get('truncated', False)
+            return_value['total_rows'] = metadata.get('total_rows')
+            return_value['bytes_billed'] = 0
+            with span("results.to_pandas"):
+                results_df = table.to_pandas()
+            self._set_results(results_df, sql_query, return_value)
+            self._keep_result(table, return_value, session_id)
+            self._remember_validated_sql(query, dataset_schema, project_id, dataset_id, sql_query,
+                                         generation_key)
+            return return_value
+
+        decision = self._cost_guard.check(return_value['bytes_estimated'], dataset_id, session_id,
+                                          confirmed=bool(confirmed_sql))
+        if decision['action'] == 'refuse':
+            logger.warning(f"{self.name}: Refused query over byte budget: {decision['reason']}")
+            return_value['error'] = decision['reason']
+            return return_value
+        if decision['action'] == 'confirm':
+            logger.info(f"{self.name}: Query needs confirmation: {decision['reason']}")
+            # The query is parked without the download LIMIT, which validation adds again
+            self._cost_guard.set_pending(session_id, {
+                'query': query, 'sql_query': return_value['source_sql'], 'project_id': project_id,
+                'dataset_id': dataset_id
+            })
+            return_value['confirmation_required'] = True
+            return_value['message'] = decision['reason']
+            return return_value
+
+        # 7. Execute the generated SQL query, streaming pages until the row/byte ceiling.
+        try:
+            logger.info(f"Executing SQL query: {sql_query}")
+            table = self._fetch_bounded(sql_query, return_value)
+            self._cost_guard.record_usage(session_id, return_value['bytes_billed'] or return_value['bytes_estimated'])
+            if return_value['truncated'] and checked['limit_added']:
+                # The row count BigQuery reports is capped by the download LIMIT
+                return_value['total_rows'] = self._count_rows(return_value['source_sql'], dataset_id, session_id)
+            if cache_key is not None:
+                self._result_cache.put(cache_key, table, {
+                    'truncated': return_value['truncated'], 'total_rows': return_value['total_rows']
+                })
+            with span("results.to_pandas"):
+                results_df = table.to_pandas()
+            self._set_results(results_df, sql_query, return_value)
+            self._keep_result(table, return_value, session_id)
+            self._remember_validated_sql(query, dataset_schema, project_id, dataset_id, sql_query, generation_key)
+        except Exception as e:
+            logger.error(f"Error executing SQL query '{sql_query}': {e}")
+            self._forget_generated_sql(generation_key, query, project_id, dataset_id, return_value)
+            return_value['error'] = f"An error occurred while executing the generated SQL query:\n`{sql_query}`\n\n**Error details:**\n{e}"
+
+        return return_value
+
+    def _model_identity(self) -> str:
+        """Name of the model in use, which may be a fallback of the requested one."""
+        model_name = getattr(self.model, '_model_name', None)
+        return model_name if isinstance(model_name, str) else self._model_name
+
+    def _forget_generated_sql(self, generation_key, query: str, project_id: str, dataset_id: str,
+                              return_value: dict) -> None:
+        """Drops SQL that failed to run from the generation caches."""
+        if generation_key is None:
+            return
+        self._sql_cache.discard(generation_key)
+        self._semantic_cache.forget(f"{project_id}.{dataset_id}", query)
+        if return_value.get('semantic_match'):
+            self._semantic_cache.forget(f"{project_id}.{dataset_id}", return_value['semantic_match']['question'])
+
+    def _remember_validated_sql(self, query: str, dataset_schema: dict, project_id: str, dataset_id: str,
+                                sql_query: str, generation_key) -> None:
+        """Adds SQL that ran successfully to the semantic cache, if it came from the language model."""
+        if generation_key is None or not self.model:
+            return
+        self._semantic_cache.add(f"{project_id}.{dataset_id}", dataset_schema, query, sql_query)
+
+    @traced("prompt.build")
+    def _build_prompt(self, query: str, dataset_schema: dict, project_id: str, dataset_id: str) -> tuple:
+        """
+        Returns the SQL generation prompt and the per-table schema lines it embeds. Only
+        the tables and columns most relevant to the question are described when the full
+        schema would exceed the schema pruner's token budget.
+        """
         # 1. Format the schema for the prompt
+        full_schema = dataset_schema
+        with span("schema.prune"):
+            dataset_schema = self._schema_pruner.prune(query, dataset_schema)
         formatted_schema_parts = []
         if not dataset_schema:
             logger.warning(f"Dataset schema for {project_id}.{dataset_id} is empty or None.")
@@ -119,9 +368,14 @@ class DataAnalystAgent(Agent):
             for table_name, table_info in dataset_schema.items():
                 if table_info and 'columns' in table_info and table_info['columns']:
                     columns_str = ", ".join([f"{col['name']} ({col['type']})" for col in table_info['columns']])
+                    if table_info.get('omitted_columns'):
+                        columns_str += f", ... ({table_info['omitted_columns']} less relevant columns not shown)"
                     formatted_schema_parts.append(f"Table: {table_name}, Columns: [{columns_str}]")
                 else:
                     formatted_schema_parts.append(f"Table: {table_name}, Columns: (Schema not available or table is empty)")
+            omitted_tables = len(full_schema) - len(dataset_schema)
+            if omitted_tables:
+                formatted_schema_parts.append(f"({omitted_tables} other tables in the dataset are not shown.)")
 
         formatted_schema_string = "\n".join(formatted_schema_parts)
 
@@ -139,6 +393,35 @@ class DataAnalystAgent(Agent):
         The query should explicitly reference tables with their full path if needed (e.g., `{project_id}.{dataset_id}.table_name`), or assume the query will be run in the context of the specified project and dataset.
         Provide only the BigQuery SQL query. Do not include any explanation or introductory text.
         """
+        return prompt, formatted_schema_parts
+
+    def _generate_sql(self, query: str, dataset_schema: dict, project_id: str, dataset_id: str,
+                      return_value: dict, generation_key=None,
+                      on_sql_text: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """
+        Converts the natural language query into SQL. Returns None and sets return_value['error']
+        if no query could be generated. SQL generated by the model is cached under generation_key.
+        When on_sql_text is given the response is streamed (see process).
+        """
+        # SQL the model generated for this or a similar question; the prompt is only built on a miss
+        if self.model and generation_key is not None:
+            cached_sql = self._sql_cache.get(generation_key)
+            if cached_sql is not None:
+                logger.info(f"Reusing cached SQL for this question: {cached_sql}")
+                return_value['sql_query'] = cached_sql
+                return_value['sql_from_cache'] = True
+                return cached_sql
+            match = self._semantic_cache.lookup(f"{project_id}.{dataset_id}", dataset_schema, query)
+            if match is not None:
+                logger.info(f"Reusing SQL of similar question '{match['question']}' "
+                            f"(similarity {match['similarity']:.2f}): {match['sql']}")
+                return_value['sql_query'] = match['sql']
+                return_value['sql_from_cache'] = True
+                return_value['semantic_match'] = {'question': match['question'], 'similarity': match['similarity']}
+                return match['sql']
+
+        # 1-2. Format the schema and construct a prompt for the LLM to generate a SQL query.
+        prompt, formatted_schema_parts = self._build_prompt(query, dataset_schema, project_id, dataset_id)
         logger.debug(f"Generated prompt for LLM: {prompt}")
 
         # 3. Call the LLM to generate the SQL query.
@@ -148,6 +431,7 @@ class DataAnalystAgent(Agent):
             if sql_query:
                 return_value['sql_query'] = sql_query
                 logger.info(f"Generated basic SQL query: {sql_query}")
+                return sql_query
             else:
                 return_value['error'] = """Language model is not available. This could be because:
 • Vertex AI API is not enabled for your project
@@ -160,28 +444,25 @@ To fix this:
 3. Try running: gcloud auth application-default login
 
 I can handle basic queries like 'show first 10 rows', 'count records', or 'show columns' without the language model."""
-                return return_value
+                return None
             
         try:
             logger.info("Generating SQL query using LLM...")
-            response = self.model.generate_content(prompt)
-            # Clean up the response to get only the SQL query
-            cleaned_text = response.text.strip()
-            # Remove markdown code blocks
-            cleaned_text = cleaned_text.replace("```sql", "").replace("```", "")
-
-            # Sometimes the model prefixes with 'bigquery' or 'sql', so we remove it case-insensitively
-            if cleaned_text.lower().lstrip().startswith('bigquery'):
-                # Find the start of the actual SQL statement (e.g., SELECT)
-                select_pos = cleaned_text.lower().find('select')
-                if select_pos != -1:
-                    cleaned_text = cleaned_text[select_pos:]
-            
+            model_name = self._model_identity()
+            with span("llm.generate", model=model_name, prompt_chars=len(prompt)), LLM_LATENCY.time(model=model_name):
+                if on_sql_text is not None:
+                    response_text, response = self._stream_response(prompt, model_name, on_sql_text)
+                else:
+                    response = self.model.generate_content(prompt)
+                    response_text = response.text
+            record_llm_usage(model_name, response)
+            cleaned_text = self._clean_model_sql(response_text)
+
             # Remove extra whitespace and ensure proper formatting
             sql_query = ' '.join(cleaned_text.split())
             
             # Validate the query starts with a valid SQL keyword
-            valid_starts = ['SELECT', 'WITH', 'CREATE', 'INSERT', 'UPDATE', 'DELETE']
+            valid_starts = ['SELECT', 'WITH']
             if not any(sql_query.upper().startswith(start) for start in valid_starts):
                 # Try to extract SQL from the response
                 lines = cleaned_text.split('\n')
@@ -192,34 +473,219 @@ I can handle basic queries like 'show first 10 rows', 'count records', or 'show
                         break
             logger.info(f"Generated SQL query: {sql_query}")
             return_value['sql_query'] = sql_query
+            if generation_key is not None and sql_query:
+                self._sql_cache.put(generation_key, sql_query)
+            return sql_query
         except Exception as e:
             logger.error(f"Error generating SQL query with LLM: {e}")
             return_value['error'] = f"Error generating SQL query: {e}"
-            return return_value
+            return None
+
+    @staticmethod
+    def _clean_model_sql(text: str) -> str:
+        """Strips the markdown fences and 'bigquery' prefix the model sometimes puts around its SQL."""
+        # Clean up the response to get only the SQL query
+        cleaned_text = text.strip()
+        # Remove markdown code blocks
+        cleaned_text = cleaned_text.replace("```sql", "").replace("```", "")
+
+        # Sometimes the model prefixes with 'bigquery' or 'sql', so we remove it case-insensitively
+        if cleaned_text.lower().lstrip().startswith('bigquery'):
+            # Find the start of the actual SQL statement (e.g., SELECT)
+            select_pos = cleaned_text.lower().find('select')
+            if select_pos != -1:
+                cleaned_text = cleaned_text[select_pos:]
+        return cleaned_text
 
-        # 4. Execute the generated SQL query.
+    def _stream_response(self, prompt: str, model_name: str,
+                         on_sql_text: Callable[[str], None]) -> Tuple[str, Any]:
+        """
+        Streams the model response, passing the SQL received so far to on_sql_text after
+        each chunk. Stops reading once a complete statement has arrived, so anything the
+        model adds after it is not waited for. Returns the text and the last chunk.
+        """
+        start = time.perf_counter()
+        stream = self.model.generate_content(prompt, stream=True)
+        text, last_chunk = "", None
         try:
-            logger.info(f"Executing SQL query: {sql_query}")
-            results_df = self.bigquery_tool.execute_query(sql_query)
-            return_value['results_df'] = results_df
+            for chunk in stream:
+                if last_chunk is None:
+                    LLM_TIME_TO_FIRST_TOKEN.observe(time.perf_counter() - start, model=model_name)
+                last_chunk = chunk
+                try:
+                    text += chunk.text
+                except ValueError:
+                    # Chunks without text parts (e.g. only a finish reason) raise on .text
+                    continue
+                end = complete_statement_end(text)
+                if end is not None:
+                    text = text[:end]
+                on_sql_text(self._clean_model_sql(text))
+                if end is not None:
+                    logger.info(f"{self.name}: Complete SQL statement received, not waiting for the rest of the response.")
+                    break
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                close()
+        return text, last_chunk
 
-            if results_df is not None and not results_df.empty:
-                logger.info(f"Query executed successfully, returned {len(results_df)} rows.")
-                return_value['results_markdown'] = results_df.to_markdown(index=False)
-            elif results_df is not None: # Empty DataFrame
-                logger.info(f"Query '{sql_query}' executed successfully, but returned no results.")
-                return_value['results_markdown'] = f"The query '{sql_query}' executed successfully, but returned no results."
-            else: # Should not happen if execute_query raises or returns DataFrame
-                logger.error(f"Query execution returned None for: {sql_query}")
-                # This case might indicate an issue with bigquery_tool.execute_query if it doesn't raise an exception
-                # but returns None, which it shouldn't based on current connector implementation.
-                return_value['error'] = f"Query execution failed or returned an unexpected result (None) for: {sql_query}"
+    def _result_cache_key(self, sql_query: str, fingerprint_sql: Optional[str] = None) -> Optional[str]:
+        """
+        Cache key for a query's result, or None if it must not be cached: no cache configured,
+        a non-deterministic query, or tables whose versions cannot be determined. fingerprint_sql,
+        the validator's canonical rendering, keys the result so formatting differences share it.
+        """
+        if self._result_cache is None or not self.connector or not is_deterministic(sql_query):
+            return None
+        try:
+            tables = self.connector.get_referenced_tables(sql_query)
+            if not tables:
+                return None
+            versions = self.connector.get_table_versions(tables)
+        except Exception as e:
+            logger.warning(f"{self.name}: Could not version the tables of query for caching: {e}")
+            return None
+        if versions is None:
+            return None
+        return result_cache_key(fingerprint_sql or sql_query, versions)
 
+    def _run_followup(self, sql: str, dataset_id: Optional[str], session_id: str,
+                      stage: str) -> Optional[pa.Table]:
+        """
+        Runs a query following up on an answer (its row count, a chart aggregate, a table
+        page) through the result cache. Like the answer's query it is dry-run and checked
+        against the byte budgets first; nobody is asked to confirm it, so it is not run when
+        the guard would refuse it or ask for confirmation. Returns None then, or if it fails.
+        """
+        with span("result_cache.lookup"):
+            cache_key = self._result_cache_key(sql)
+            cached = self._result_cache.get(cache_key) if cache_key is not None else None
+        if cached is not None:
+            return cached[0]
+        try:
+            with span("bigquery.dry_run"):
+                estimated_bytes = self._cost_guard.estimate(self.connector, sql)
+            decision = self._cost_guard.check(estimated_bytes, dataset_id, session_id)
+            if decision['action'] != 'allow':
+                logger.info(f"{self.name}: Not running the {stage} query: {decision['reason']}")
+                return None
+            with span(stage):
+                info = {}
+                table = self._fetch_bounded(sql, info)
+            self._cost_guard.record_usage(session_id, info.get('bytes_billed') or estimated_bytes)
+            if cache_key is not None and not info.get('truncated'):
+                self._result_cache.put(cache_key, table, {'truncated': False, 'total_rows': info.get('total_rows')})
+            return table
         except Exception as e:
-            logger.error(f"Error executing SQL query '{sql_query}': {e}")
-            return_value['error'] = f"An error occurred while executing the generated SQL query:\n`{sql_query}`\n\n**Error details:**\n{e}"
+            logger.error(f"{self.name}: The {stage} query failed: {e}")
+            return None
 
-        return return_value
+    def _count_rows(self, source_sql: str, dataset_id: Optional[str], session_id: str) -> Optional[int]:
+        """Number of rows of the full result of source_sql, or None if it cannot be counted."""
+        table = self._run_followup(count_sql(source_sql), dataset_id, session_id, "count.query")
+        if table is None or table.num_rows == 0:
+            return None
+        return int(table.column(0)[0].as_py())
+
+    @traced("chart_data")
+    def fetch_chart_data(self, plan: Dict[str, Any], source_sql: str, session_id: str = DEFAULT_SESSION_ID,
+                         dataset_id: Optional[str] = None) -> Optional[pd.DataFrame]:
+        """
+        Computes the data of a chart (see utils.chart_planner) over the full result of
+        source_sql in BigQuery, so a truncated result can still be charted without
+        downloading its rows. The aggregate query is held to the byte budgets of
+        dataset_id and the session. Returns None if it is not run or fails.
+        """
+        table = self._run_followup(aggregate_sql(plan, source_sql), dataset_id, session_id, "chart.query")
+        return table.to_pandas() if table is not None else None
+
+    def _keep_result(self, table: pa.Table, return_value: dict, session_id: str) -> None:
+        """Stores the result for paging under the session and records its handle in return_value."""
+        return_value['result_handle'] = self._result_store.put(table, {
+            'source_sql': return_value['source_sql'],
+            'dataset_id': return_value['dataset_id'],
+            'truncated': return_value['truncated'],
+            'total_rows': return_value['total_rows'],
+        }, session_id=session_id or DEFAULT_SESSION_ID)
+
+    @traced("table_page")
+    def fetch_table_page(self, handle: str, page_current: int = 0, page_size: int = TABLE_PAGE_SIZE,
+                         sort_by: Optional[List[Dict[str, str]]] = None, filter_query: Optional[str] = None,
+                         session_id: str = DEFAULT_SESSION_ID) -> Optional[Dict[str, Any]]:
+        """
+        One page of a stored result (see utils.table_query), with the DataTable's sort_by
+        and filter_query. Pages are cut from the stored rows. For a truncated result, a
+        sort or filter runs in BigQuery over the full result, held to the byte budgets;
+        if it is not run or fails, it applies to the downloaded rows only. Without a sort
+        or filter, only the downloaded rows can be paged: the order BigQuery returned
+        them in cannot be reproduced for the rows after them.
+        Returns {'rows': DataFrame, 'total_rows': rows matching the filters, 'pushed_down':
+        bool, 'partial': whether only the downloaded rows were paged, 'result_rows': rows
+        of the full result if known}, or None if the handle has expired.
+        """
+        entry = self._result_store.get(handle)
+        if entry is None:
+            return None
+        table, metadata = entry
+        truncated = bool(metadata.get('truncated') and metadata.get('source_sql'))
+        page = {'pushed_down': False, 'partial': truncated, 'result_rows': metadata.get('total_rows')}
+        if truncated and (sort_by or filter_query):
+            rows = self._fetch_page_sql(page_sql(metadata['source_sql'], table.schema, page_current, page_size,
+                                                 sort_by, filter_query), metadata.get('dataset_id'), session_id)
+            if rows is not None:
+                total_rows = int(rows[TOTAL_ROWS_COLUMN].iloc[0]) if len(rows) else 0
+                return dict(page, rows=rows.drop(columns=[TOTAL_ROWS_COLUMN], errors='ignore'),
+                            total_rows=total_rows, pushed_down=True, partial=False)
+        rows, total_rows = page_table(table, page_current, page_size, sort_by, filter_query)
+        return dict(page, rows=rows.to_pandas(), total_rows=total_rows)
+
+    def _fetch_page_sql(self, sql: str, dataset_id: Optional[str], session_id: str) -> Optional[pd.DataFrame]:
+        """Runs a table page query like the other follow-up queries. None if it is not run or fails."""
+        table = self._run_followup(sql, dataset_id, session_id, "table.query")
+        return table.to_pandas() if table is not None else None
+
+    def _set_results(self, results_df: pd.DataFrame, sql_query: str, return_value: dict) -> None:
+        """Stores the result DataFrame and its markdown rendering in return_value."""
+        return_value['results_df'] = results_df
+        if not results_df.empty:
+            logger.info(f"Query executed successfully, returned {len(results_df)} rows.")
+            with span("results.markdown"):
+                return_value['results_markdown'] = results_df.to_markdown(index=False)
+            if return_value['truncated']:
+                total_str = f" of {return_value['total_rows']}" if return_value['total_rows'] is not None else ""
+                return_value['results_markdown'] += (
+                    f"\n\n_Result truncated: showing the first {len(results_df)}{total_str} rows._"
+                )
+        else: # Empty DataFrame
+            logger.info(f"Query '{sql_query}' executed successfully, but returned no results.")
+            return_value['results_markdown'] = f"The query '{sql_query}' executed successfully, but returned no results."
+
+    def _fetch_bounded(self, sql_query: str, return_value: dict) -> pa.Table:
+        """
+        Pages through the result of sql_query as Arrow, stopping at the configured row/byte ceiling.
+        Records 'truncated', 'total_rows' and 'bytes_billed' in return_value.
+        """
+        chunks = self.bigquery_tool.iter_query(
+            sql_query,
+            page_size=RESULT_PAGE_SIZE,
+            max_rows=self._max_result_rows,
+            max_bytes=self._max_result_bytes,
+            as_arrow=True,
+        )
+        with span("bigquery.download"):
+            tables: List[pa.Table] = [
+                pa.Table.from_batches([chunk]) if isinstance(chunk, pa.RecordBatch) else chunk for chunk in chunks
+            ]
+        return_value['truncated'] = chunks.truncated
+        return_value['total_rows'] = chunks.total_rows
+        return_value['bytes_billed'] = chunks.bytes_billed
+        if chunks.truncated:
+            logger.warning(f"{self.name}: Result truncated at {chunks.rows} rows / {chunks.bytes} bytes "
+                           f"(total rows: {chunks.total_rows}).")
+        if not tables:
+            return pa.table({})
+        return pa.concat_tables(tables) if len(tables) > 1 else tables[0]
 
     def _generate_basic_sql(self, query: str, schema_parts: list, project_id: str, dataset_id: str) -> str:
         """Generate basic SQL queries without using LLM for common patterns."""
@@ -0,0 +1,217 @@
+"""
+Process-wide registry of shared clients and agents.
+
+Dash callbacks used to build a fresh DataAnalystAgent (Vertex AI init, two BigQuery
+clients and a Gemini model handle) on every click. The registry builds each of these
+once per worker, per project/location, and hands the same instances to every callback.
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, Optional, Tuple
+
+import vertexai
+from google.cloud import bigquery
+
+from connectors.bigquery_connector import BigQueryConnector
+from connectors.local_connector import LocalConnector
+from interfaces.database_interface import DatabaseConnectorInterface
+from utils.schema_catalog import get_default_catalog
+from utils.result_cache import get_default_result_cache
+from utils.result_store import get_default_result_store
+from agents.schema_agent import SchemaAgent
+from agents.visualization_agent import VisualizationAgent
+from agents.data_analyst_agent import (
+    DataAnalystAgent, DEFAULT_MODEL_NAME, VERTEX_LOCATION, create_generative_model
+)
+
+logger = logging.getLogger(__name__)
+
+# When set, agents query this local DuckDB/SQLite database instead of BigQuery (offline development and CI)
+LOCAL_WAREHOUSE_PATH = os.environ.get("LOCAL_WAREHOUSE_PATH", "")
+
+
+class AgentRegistry:
+    """Thread-safe, lazily populated cache of BigQuery clients, Vertex AI models and agents."""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._clients: Dict[str, bigquery.Client] = {}
+        self._connectors: Dict[str, DatabaseConnectorInterface] = {}
+        self._vertex_initialized: set = set()
+        self._models: Dict[Tuple[str, str, str], object] = {}
+        self._schema_agents: Dict[str, SchemaAgent] = {}
+        self._data_analyst_agents: Dict[Tuple[str, str, str], DataAnalystAgent] = {}
+        self._visualization_agent: Optional[VisualizationAgent] = None
+
+    def get_bigquery_client(self, project_id: str) -> bigquery.Client:
+        """Returns the shared BigQuery client for a project, creating it on first use."""
+        client = self._clients.get(project_id)
+        if client is not None:
+            return client
+        with self._lock:
+            if project_id not in self._clients:
+                logger.info(f"AgentRegistry: creating BigQuery client for project {project_id}")
+                self._clients[project_id] = bigquery.Client(project=project_id)
+            return self._clients[project_id]
+
+    def get_connector(self, project_id: str) -> DatabaseConnectorInterface:
+        """
+        Returns the shared connector for a project: a BigQueryConnector, or a
+        LocalConnector when LOCAL_WAREHOUSE_PATH is set.
+        """
+        connector = self._connectors.get(project_id)
+        if connector is not None:
+            return connector
+        with self._lock:
+            if project_id not in self._connectors and LOCAL_WAREHOUSE_PATH:
+                self._connectors[project_id] = LocalConnector(path=LOCAL_WAREHOUSE_PATH, project_id=project_id)
+            if project_id not in self._connectors:
+                client = self.get_bigquery_client(project_id)
+                self._connectors[project_id] = BigQueryConnector(project_id=project_id, client=client)
+            return self._connectors[project_id]
+
+    def init_vertex(self, project_id: str, location: str = VERTEX_LOCATION) -> None:
+        """Calls vertexai.init once per project/location."""
+        key = (project_id, location)
+        if key in self._vertex_initialized:
+            return
+        with self._lock:
+            if key not in self._vertex_initialized:
+                vertexai.init(project=project_id, location=location)
+                self._vertex_initialized.add(key)
+                logger.info(f"AgentRegistry: initialized Vertex AI for {project_id} in {location}")
+
+    def get_model(self, project_id: str, location: str = VERTEX_LOCATION, model_name: str = DEFAULT_MODEL_NAME):
+        """Returns the shared Gemini model handle, or None if no model could be initialized."""
+        key = (project_id, location, model_name)
+        model = self._models.get(key)
+        if model is not None:
+            return model
+        with self._lock:
+            if key not in self._models:
+                try:
+                    self.init_vertex(project_id, location)
+                except Exception as e:
+                    logger.error(f"AgentRegistry: error initializing Vertex AI for {project_id}: {e}")
+                    return None
+                model = create_generative_model(model_name, name="AgentRegistry")
+                if model is None:
+                    # Not cached, so the next request retries
+                    return None
+                self._models[key] = model
+            return self._models[key]
+
+    def get_schema_agent(self, project_id: str) -> SchemaAgent:
+        """Returns the shared SchemaAgent for a project."""
+        agent = self._schema_agents.get(project_id)
+        if agent is not None:
+            return agent
+        with self._lock:
+            if project_id not in self._schema_agents:
+                try:
+                    connector = self.get_connector(project_id)
+                except Exception as e:
+                    # Keep the agent's existing behaviour: an agent without a connector
+                    logger.error(f"AgentRegistry: error creating BigQuery connector for {project_id}: {e}")
+                    return SchemaAgent(project_id=project_id)
+                self._schema_agents[project_id] = SchemaAgent(project_id=project_id, connector=connector,
+                                                              catalog=get_default_catalog())
+            return self._schema_agents[project_id]
+
+    def get_data_analyst_agent(self, project_id: str, location: str = VERTEX_LOCATION,
+                               model_name: str = DEFAULT_MODEL_NAME) -> DataAnalystAgent:
+        """Returns the shared DataAnalystAgent for a project/location/model."""
+        key = (project_id, location, model_name)
+        agent = self._data_analyst_agents.get(key)
+        if agent is not None:
+            return agent
+        with self._lock:
+            if key not in self._data_analyst_agents:
+                schema_agent = self.get_schema_agent(project_id)
+                model = self.get_model(project_id, location, model_name)
+                agent = DataAnalystAgent(
+                    project_id=project_id,
+                    connector=schema_agent.connector,
+                    schema_agent=schema_agent,
+                    model=model,
+                    location=location,
+                    result_cache=get_default_result_cache(),
+                    result_store=get_default_result_store(),
+                    model_name=model_name,
+                )
+                if not (agent.connector and agent.model):
+                    # Partially initialized agents are handed out but not cached
+                    return agent
+                self._data_analyst_agents[key] = agent
+            return self._data_analyst_agents[key]
+
+    def get_visualization_agent(self) -> VisualizationAgent:
+        """Returns the shared VisualizationAgent."""
+        if self._visualization_agent is not None:
+            return self._visualization_agent
+        with self._lock:
+            if self._visualization_agent is None:
+                self._visualization_agent = VisualizationAgent()
+            return self._visualization_agent
+
+    def warm_up(self, project_id: Optional[str], location: str = VERTEX_LOCATION) -> None:
+        """Builds the shared clients and agents ahead of the first request."""
+        if not project_id:
+            return
+        try:
+            self.get_data_analyst_agent(project_id, location)
+            self.get_visualization_agent()
+            logger.info(f"AgentRegistry: warmed up agents for project {project_id}")
+        except Exception as e:
+            logger.error(f"AgentRegistry: warm-up failed for project {project_id}: {e}")
+
+    def cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Hits and misses of every cache used by the shared agents, summed per kind of cache."""
+        totals: Dict[str, Dict[str, int]] = {}
+        seen = set()
+
+        def add(kind: str, cache, hits: int, misses: int) -> None:
+            if id(cache) in seen:
+                return
+            seen.add(id(cache))
+            entry = totals.setdefault(kind, {'hits': 0, 'misses': 0})
+            entry['hits'] += hits
+            entry['misses'] += misses
+
+        with self._lock:
+            schema_agents = list(self._schema_agents.values())
+            analyst_agents = list(self._data_analyst_agents.values())
+        for agent in schema_agents:
+            stats = agent.schema_cache.stats()
+            add('schema', agent.schema_cache, stats['hits'] + stats['stale_hits'], stats['misses'])
+        for agent in analyst_agents:
+            for kind, cache in (('sql_generation', agent.sql_cache), ('semantic', agent.semantic_cache)):
+                stats = cache.stats()
+                add(kind, cache, stats['hits'], stats['misses'])
+            guard = agent.cost_guard
+            add('dry_run_estimate', guard, guard.estimate_hits, guard.estimate_misses)
+            if agent.result_cache is not None:
+                stats = agent.result_cache.stats()
+                add('result', agent.result_cache, stats['memory_hits'] + stats['disk_hits'], stats['misses'])
+        return totals
+
+    def reset(self) -> None:
+        """Drops every cached client and agent."""
+        with self._lock:
+            self._clients.clear()
+            self._connectors.clear()
+            self._vertex_initialized.clear()
+            self._models.clear()
+            self._schema_agents.clear()
+            self._data_analyst_agents.clear()
+            self._visualization_agent = None
+
+
+_registry = AgentRegistry()
+
+
+def get_registry() -> AgentRegistry:
+    """Returns the process-wide agent registry."""
+    return _registry
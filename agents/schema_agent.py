@@ -4,6 +4,10 @@ from typing import List, Dict, Optional, Any
 
 from google.adk.agents import Agent
 from connectors.bigquery_connector import BigQueryConnector
+from interfaces.database_interface import DatabaseConnectorInterface
+from utils.schema_cache import SchemaCache
+from utils.schema_catalog import SchemaCatalog
+from utils.tracing import traced
 
 logger = logging.getLogger(__name__)
 
@@ -12,7 +16,9 @@ from typing import Any
 class SchemaAgent(Agent):
     """Agent responsible for understanding and retrieving BigQuery database schemas."""
 
-    def __init__(self, project_id: Optional[str] = None, name: Optional[str] = "SchemaAgent"): # Add name parameter
+    def __init__(self, project_id: Optional[str] = None, name: Optional[str] = "SchemaAgent",
+                 connector: Optional[DatabaseConnectorInterface] = None, schema_cache: Optional[SchemaCache] = None,
+                 catalog: Optional[SchemaCatalog] = None):
         super().__init__(name=name, description="Agent responsible for understanding and retrieving BigQuery database schemas.") # Pass name and description
 
         if project_id is None:
@@ -23,6 +29,19 @@ class SchemaAgent(Agent):
             raise ValueError(f"{name}: GOOGLE_CLOUD_PROJECT environment variable not set and no project_id provided.")
 
         self._project_id = project_id # Store project_id
+        self._schema_cache = schema_cache if schema_cache is not None else SchemaCache()
+        self._catalog = catalog
+        if catalog is not None:
+            # Persist what is fetched, and warm the cache with what earlier processes fetched
+            self._schema_cache.on_store = catalog.put
+            seeded = sum(self._schema_cache.seed(key, value, version)
+                         for key, value, version in catalog.load_project(self._project_id))
+            logger.info(f"{name} loaded {seeded} catalog entries for project_id: {self._project_id}")
+        if connector is not None:
+            # Shared connector handed out by the agent registry
+            self._connector = connector
+            logger.info(f"{name} initialized with shared connector for project_id: {self._project_id}")
+            return
         try:
             self._connector = BigQueryConnector(project_id=self._project_id)
             logger.info(f"{name} initialized with project_id: {self._project_id}")
@@ -41,11 +60,27 @@ class SchemaAgent(Agent):
         """Get the BigQuery connector."""
         return self._connector
 
+    @property
+    def schema_cache(self) -> SchemaCache:
+        """Get the dataset schema cache."""
+        return self._schema_cache
+
+    def invalidate(self, dataset_id: Optional[str] = None) -> int:
+        """Drops the cached schema of a dataset (or of all datasets) so the next lookup refetches it."""
+        removed = self._schema_cache.invalidate(dataset_id)
+        if self._catalog is not None:
+            self._catalog.invalidate(self.project_id, dataset_id)
+        logger.info(f"{self.name}: invalidated {removed} cached schema(s) for dataset {dataset_id or '*'}")
+        return removed
+
     def get_available_datasets(self) -> List[str]:
         """Retrieves a list of available dataset IDs from BigQuery."""
         if not self.connector:
             logger.error(f"BigQueryConnector not initialized in {self.name}.")
             return []
+        return self._schema_cache.get(("datasets", self.project_id, None), loader=self._load_datasets)
+
+    def _load_datasets(self) -> List[str]:
         try:
             datasets = self.connector.list_datasets()
             return datasets
@@ -61,6 +96,13 @@ class SchemaAgent(Agent):
         if not dataset_id:
             logger.warning(f"{self.name}: dataset_id cannot be empty.")
             return []
+        return self._schema_cache.get(
+            ("tables", self.project_id, dataset_id),
+            loader=lambda: self._load_tables(dataset_id),
+            version_fn=lambda: self.connector.get_dataset_version(dataset_id),
+        )
+
+    def _load_tables(self, dataset_id: str) -> List[str]:
         try:
             tables = self.connector.list_tables(dataset_id=dataset_id)
             return tables
@@ -68,6 +110,26 @@ class SchemaAgent(Agent):
             logger.error(f"Error retrieving tables for dataset {dataset_id} in {self.name}: {e}")
             return []
 
+    def get_table_stats(self, dataset_id: str) -> Dict[str, Dict[str, int]]:
+        """
+        Retrieves row counts and sizes for the tables in a dataset.
+        e.g. {'table_one': {'row_count': 1000, 'size_bytes': 64000, 'last_modified': ...}}
+        """
+        if not self.connector or not dataset_id:
+            return {}
+        return self._schema_cache.get(
+            ("stats", self.project_id, dataset_id),
+            loader=lambda: self._load_table_stats(dataset_id),
+            version_fn=lambda: self.connector.get_dataset_version(dataset_id),
+        )
+
+    def _load_table_stats(self, dataset_id: str) -> Dict[str, Dict[str, int]]:
+        try:
+            return self.connector.get_table_stats(dataset_id) or {}
+        except Exception as e:
+            logger.error(f"Error retrieving table statistics for dataset {dataset_id} in {self.name}: {e}")
+            return {}
+
     def get_schema_for_table(self, dataset_id: str, table_id: str) -> Optional[Dict[str, List[Dict[str, str]]]]:
         """Retrieves the schema for a specific table in a dataset."""
         if not self.connector:
@@ -83,11 +145,15 @@ class SchemaAgent(Agent):
             logger.error(f"Error retrieving schema for table {dataset_id}.{table_id} in {self.name}: {e}")
             return None
 
+    @traced("schema")
     def get_full_dataset_schema(self, dataset_id: str) -> Dict[str, Any]:
         """
         Retrieves the schemas for all tables in a dataset and compiles them.
         Returns a dictionary where keys are table IDs and values are their schemas.
         e.g. {'table_one': {'columns': [...]}, 'table_two': {'columns': [...]}}
+
+        Results are cached per (project, dataset) and persisted to the schema
+        catalog when one is configured; see utils.schema_cache and utils.schema_catalog.
         """
         if not self.connector:
             logger.error(f"BigQueryConnector not initialized in {self.name}.")
@@ -96,6 +162,25 @@ class SchemaAgent(Agent):
             logger.warning(f"{self.name}: dataset_id cannot be empty.")
             return {}
 
+        return self._schema_cache.get(
+            ("schema", self.project_id, dataset_id),
+            loader=lambda: self._load_dataset_schema(dataset_id),
+            version_fn=lambda: self.connector.get_dataset_version(dataset_id),
+        )
+
+    @traced("schema.fetch")
+    def _load_dataset_schema(self, dataset_id: str) -> Dict[str, Any]:
+        """Fetches a dataset schema from the warehouse, bypassing the cache."""
+
+        # One INFORMATION_SCHEMA query for the whole dataset; per-table lookups only as a fallback
+        try:
+            bulk_schema = self.connector.get_dataset_schema(dataset_id)
+        except Exception as e:
+            logger.warning(f"Bulk schema retrieval failed for dataset {dataset_id} in {self.name}: {e}")
+            bulk_schema = None
+        if bulk_schema:
+            return bulk_schema
+
         full_schema = {}
         table_ids = self.get_tables_in_dataset(dataset_id)
         if not table_ids: # If list is empty or None
@@ -1,11 +1,18 @@
 import logging
 import pandas as pd
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Callable, List, Optional
 
 from google.adk.agents import Agent
 import plotly.express as px
+import plotly.graph_objects as go
 import plotly.io as pio
 
+from utils.tracing import traced
+from utils.chart_planner import CHART_TOP_K, aggregate_frame, histogram_plan
+from utils.histogram import histogram_bar
+from utils.column_profile import columns_of, profile_frame, profile_table
+from utils.downsampling import DOWNSAMPLE_MAX_POINTS, SCATTERGL_THRESHOLD, downsample
+
 logger = logging.getLogger(__name__)
 
 class VisualizationAgent(Agent):
@@ -16,13 +23,19 @@ class VisualizationAgent(Agent):
         logger.info(f"{name} (VisualizationAgent) initialized.")
         # ... rest of __init__ if any
 
-    def generate_visualizations(self, data_df: pd.DataFrame, query: Optional[str] = None) -> Dict[str, Any]:
+    @traced("visualization")
+    def generate_visualizations(self, data_df: pd.DataFrame, query: Optional[str] = None,
+                                fetch_aggregate: Optional[Callable[[Dict[str, Any]], Optional[pd.DataFrame]]] = None
+                                ) -> Dict[str, Any]:
         """
         Generates visualizations and textual insights from a pandas DataFrame.
 
         Args:
             data_df: The pandas DataFrame containing the data to visualize.
             query: The original natural language query that produced this data (optional).
+            fetch_aggregate: Computes the data of a chart plan (see utils.chart_planner) over the
+                full result, for results that were only partly downloaded (optional). Without it,
+                or if it returns None, the aggregates are computed from data_df.
 
         Returns:
             A dictionary containing:
@@ -32,6 +45,10 @@ class VisualizationAgent(Agent):
         charts_json = []
         insights_text = ""
 
+        def chart_data(plan):
+            aggregate = fetch_aggregate(plan) if fetch_aggregate is not None else None
+            return aggregate if aggregate is not None else aggregate_frame(plan, data_df)
+
         if data_df.empty:
             insights_text = "The dataset is empty, no visualizations can be generated."
             logger.info(f"{self.name}: Dataset is empty, no visualizations generated.")
@@ -41,22 +58,28 @@ class VisualizationAgent(Agent):
         # This logic can be significantly expanded based on data characteristics.
 
         try:
+            # One pass over each column feeds both the insights and the chart heuristics
+            profile = profile_frame(data_df)
+
             # Insight: Basic DataFrame description
             insights_text += "Data Snapshot:\n" + data_df.head().to_string() + "\n\n"
-            insights_text += "Basic Statistics:\n" + data_df.describe(include='all').to_string() + "\n\n"
+            insights_text += "Column Profile:\n" + profile_table(profile).to_string() + "\n\n"
 
             # 1. Try a Bar Chart if suitable columns exist
             # Heuristic: first non-numeric column as x, first numeric as y
-            numeric_cols = data_df.select_dtypes(include=['number']).columns.tolist()
-            categorical_cols = data_df.select_dtypes(include=['object', 'category']).columns.tolist()
+            numeric_cols = columns_of(profile, "numeric")
+            categorical_cols = columns_of(profile, "text")
 
             if categorical_cols and numeric_cols:
                 try:
                     x_col_bar = categorical_cols[0]
                     y_col_bar = numeric_cols[0]
                     logger.info(f"{self.name}: Attempting to generate a bar chart with x='{x_col_bar}', y='{y_col_bar}'.")
-                    fig_bar = px.bar(data_df.head(20), x=x_col_bar, y=y_col_bar,
-                                     title=f"Bar Chart: {y_col_bar} by {x_col_bar} (Top 20 rows)")
+                    bar_df = chart_data({'kind': 'categories', 'category': x_col_bar, 'value': y_col_bar,
+                                         'top_k': CHART_TOP_K})
+                    bar_df = bar_df.rename(columns={'category': x_col_bar, 'value': y_col_bar})
+                    fig_bar = px.bar(bar_df, x=x_col_bar, y=y_col_bar,
+                                     title=f"Bar Chart: {y_col_bar} by {x_col_bar} (Top {CHART_TOP_K})")
                     fig_bar.update_layout(
                         xaxis={'tickangle': -45},
                         margin=dict(l=50, r=50, t=80, b=120),
@@ -87,8 +110,12 @@ class VisualizationAgent(Agent):
                 try:
                     hist_col = numeric_cols[0]
                     logger.info(f"{self.name}: Attempting to generate a histogram for '{hist_col}'.")
-                    fig_hist = px.histogram(data_df, x=hist_col, title=f"Histogram for {hist_col}")
+                    # Bin counts computed here (or in BigQuery), not the raw column binned in the browser
+                    hist_df = chart_data(histogram_plan(data_df, hist_col))
+                    fig_hist = go.Figure(histogram_bar(hist_df))
                     fig_hist.update_layout(
+                        title=f"Histogram for {hist_col}",
+                        bargap=0.05,
                         xaxis={'tickangle': -45},
                         margin=dict(l=50, r=50, t=80, b=120),
                         height=500,
@@ -117,10 +144,13 @@ class VisualizationAgent(Agent):
                     x_col_scatter = numeric_cols[0]
                     y_col_scatter = numeric_cols[1]
                     logger.info(f"{self.name}: Attempting to generate a scatter plot with x='{x_col_scatter}', y='{y_col_scatter}'.")
-                    # Use a sample for potentially large datasets in scatter plots
-                    sample_df = data_df.sample(n=min(1000, len(data_df)))
+                    # Large datasets keep the min and max of y along x, so outliers are not sampled away
+                    kept = downsample(data_df[x_col_scatter], data_df[y_col_scatter], DOWNSAMPLE_MAX_POINTS, method="minmax")
+                    sample_df = data_df.iloc[kept]
+                    suffix = " (downsampled)" if len(sample_df) < len(data_df) else ""
                     fig_scatter = px.scatter(sample_df, x=x_col_scatter, y=y_col_scatter,
-                                             title=f"Scatter Plot: {y_col_scatter} vs {x_col_scatter} (sample)")
+                                             render_mode='webgl' if len(sample_df) > SCATTERGL_THRESHOLD else 'svg',
+                                             title=f"Scatter Plot: {y_col_scatter} vs {x_col_scatter}{suffix}")
                     fig_scatter.update_layout(
                         xaxis={'tickangle': -45},
                         margin=dict(l=50, r=50, t=80, b=120),
@@ -52,6 +52,17 @@ app.layout = create_layout()
 register_callbacks(app)
 server = app.server
 
+# Build the shared BigQuery client, Vertex AI model and agents once per worker
+from agents import get_registry
+get_registry().warm_up(os.environ.get("GOOGLE_CLOUD_PROJECT"))
+
+# Prometheus-style /metrics for autoscaling and SLO alerting
+from utils.metrics import background_jobs_collector, cache_metrics_collector, register_metrics_endpoint
+from utils.background_jobs import get_default_job_manager
+register_metrics_endpoint(server)
+cache_metrics_collector(get_registry().cache_stats)
+background_jobs_collector(get_default_job_manager().stats)
+
 # --- Run the App ---
 if __name__ == '__main__':
     app.run_server(debug=True, port=8051)
@@ -0,0 +1,4 @@
+"""
+Benchmarks for the Dynamic Data Agent Platform.
+Run a benchmark from the repository root, e.g. `python -m benchmarks.bench_arrow_results`.
+"""
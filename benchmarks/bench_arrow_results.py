@@ -0,0 +1,87 @@
+"""
+Benchmark: DataFrame vs Arrow result download in BigQueryConnector.
+
+Compares wall time and peak RSS of `execute_query` and `execute_query_arrow`
+over the paged REST path and the Storage Read API path, using the in-process
+stand-in from benchmarks.fakes. Each case runs in a fresh interpreter so that
+peak RSS is not polluted by earlier cases.
+
+Usage:
+    python -m benchmarks.bench_arrow_results --sizes 10000 100000 1000000
+"""
+
+import argparse
+import json
+import multiprocessing
+import resource
+import time
+from typing import Dict, List
+
+CASES = {
+    # name: (use Storage Read API, Arrow result)
+    "rest_dataframe": (False, False),
+    "rest_arrow": (False, True),
+    "storage_dataframe": (True, False),
+    "storage_arrow": (True, True),
+}
+
+
+def _run_case(case: str, num_rows: int, page_size: int, queue) -> None:
+    from benchmarks.fakes import FakeBigQueryClient
+    from connectors.bigquery_connector import BigQueryConnector
+
+    use_storage, as_arrow = CASES[case]
+    connector = BigQueryConnector(
+        project_id="bench",
+        client=FakeBigQueryClient(num_rows, page_size),
+        bqstorage_client=object() if use_storage else None,
+        use_bqstorage=use_storage,
+    )
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if as_arrow:
+        result_rows = connector.execute_query_arrow("SELECT * FROM bench").num_rows
+    else:
+        result_rows = len(connector.execute_query("SELECT * FROM bench"))
+    elapsed = time.perf_counter() - start
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    queue.put({
+        "case": case,
+        "rows": result_rows,
+        "wall_seconds": round(elapsed, 4),
+        "peak_rss_mb": round(peak_kb / 1024, 1),
+        "peak_rss_delta_mb": round((peak_kb - baseline_kb) / 1024, 1),
+    })
+
+
+def run(sizes: List[int], page_size: int) -> List[Dict]:
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    for num_rows in sizes:
+        for case in CASES:
+            queue = ctx.Queue()
+            proc = ctx.Process(target=_run_case, args=(case, num_rows, page_size, queue))
+            proc.start()
+            result = queue.get()
+            proc.join()
+            results.append(result)
+            print(f"{num_rows:>10,} rows  {case:<18} {result['wall_seconds']:>8.3f}s  "
+                  f"peak RSS {result['peak_rss_mb']:>8.1f} MB (+{result['peak_rss_delta_mb']:.1f} MB)")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 500_000])
+    parser.add_argument("--page-size", type=int, default=10_000)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.page_size)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
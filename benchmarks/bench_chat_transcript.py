@@ -0,0 +1,90 @@
+"""
+Benchmark: bytes the chat callback sends per turn, full transcript vs append-only patch.
+
+For each conversation length it renders the turn that brings the transcript to
+that many messages and measures the JSON of the chat-messages update:
+  - full: every message of the conversation rendered again, as the callback
+    returned before
+  - patch: the dash.Patch of callbacks.main_callbacks.append_to_transcript,
+    holding the turn's two messages (and dropping those that leave the window)
+
+Bot messages carry an answer summary and a timings line, like the real ones.
+
+Usage:
+    python -m benchmarks.bench_chat_transcript --messages 10 50 200 --json chat_transcript.json
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+
+from plotly.utils import PlotlyJSONEncoder
+
+from callbacks.main_callbacks import CHAT_WINDOW_MESSAGES, append_to_transcript, render_chat_message
+
+BOT_ANSWER = (
+    "✅ **Analysis Complete!** Found **1,250** records matching your query.\n\n"
+    "📊 **Key Findings:**\n• **amount**: ranges from 0.12 to 9,981.40\n• **region**: 4 distinct values, "
+    "most common 'north' (512 records)\n\n⏱️ **Timings:** schema 12 ms · sql_generation 840 ms · "
+    "query 1,210 ms · visualization_agent 95 ms"
+)
+
+
+def conversation(messages: int) -> List[Dict[str, str]]:
+    history = []
+    for turn in range(messages // 2):
+        history.append({'type': 'user', 'content': f"Show me the revenue by region for week {turn}",
+                        'timestamp': '10:00'})
+        history.append({'type': 'bot', 'content': BOT_ANSWER, 'timestamp': '10:00'})
+    return history
+
+
+def _payload(value) -> int:
+    return len(json.dumps(value, cls=PlotlyJSONEncoder).encode("utf-8"))
+
+
+def run_case(messages: int, window: int) -> Dict:
+    history = conversation(messages)
+    start = time.perf_counter()
+    full = _payload([render_chat_message(msg) for msg in history])
+    full_ms = (time.perf_counter() - start) * 1000
+
+    start = time.perf_counter()
+    chat_ref = {'key': 'chat_history', 'length': len(history), 'first': max(0, len(history) - 2 - window)}
+    patch, _, _ = append_to_transcript(chat_ref, [render_chat_message(msg) for msg in history[-2:]], window)
+    patched = _payload(patch)
+    patch_ms = (time.perf_counter() - start) * 1000
+    return {
+        'messages': messages,
+        'full_bytes': full,
+        'patch_bytes': patched,
+        'full_ms': round(full_ms, 2),
+        'patch_ms': round(patch_ms, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, nargs="+", default=[10, 50, 200])
+    parser.add_argument("--window", type=int, default=CHAT_WINDOW_MESSAGES)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    cases = []
+    for messages in args.messages:
+        case = run_case(messages, args.window)
+        cases.append(case)
+        print(f"{messages:>4} messages: full {case['full_bytes'] / 1024:.1f} KB in {case['full_ms']:.1f} ms, "
+              f"patch {case['patch_bytes'] / 1024:.1f} KB in {case['patch_ms']:.1f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'cases': cases}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
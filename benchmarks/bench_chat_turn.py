@@ -0,0 +1,189 @@
+"""
+Benchmark: end-to-end latency of a chat turn, broken down by stage.
+
+Drives callbacks.main_callbacks.run_chat_turn (the body of the chat callback)
+with a scripted benchmarks.fakes.FakeGenerativeModel and in-process warehouse
+stand-ins: FakeMetadataClient for the schema, FakeBigQueryClient for query
+results. Every turn asks a new question, so the SQL caches do not hide the
+model call. VisualizationAgent.generate_visualizations runs on each result too.
+
+Two sweeps are reported, each as p50/p95/p99 per stage:
+  - result size (rows returned by the warehouse) at a fixed schema width
+  - schema width (total columns in the dataset) at a fixed result size
+
+Usage:
+    python -m benchmarks.bench_chat_turn --rows 10 1000 100000 10000000 --columns 5 50 500 5000 --json chat.json
+"""
+
+import argparse
+import json
+import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel, FakeMetadataClient
+from callbacks.main_callbacks import run_chat_turn
+from connectors.bigquery_connector import BigQueryConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from agents.schema_agent import SchemaAgent
+from agents.visualization_agent import VisualizationAgent
+from utils.schema_cache import SchemaCache
+
+PROJECT = "bench"
+DATASET = "bench_dataset"
+# The warehouse fake returns its own columns; the query only has to pass validation against the schema
+SCRIPTED_SQL = f"SELECT * FROM `{PROJECT}.{DATASET}.table_0`"
+STAGES = ["schema", "sql_generation", "query", "results_render", "process", "chat_render",
+          "visualization_agent", "turn"]
+
+
+class _TimedSchemaAgent(SchemaAgent):
+    """SchemaAgent that records how long each schema lookup takes."""
+
+    def get_full_dataset_schema(self, dataset_id: str):
+        start = time.perf_counter()
+        try:
+            return super().get_full_dataset_schema(dataset_id)
+        finally:
+            self._timings["schema"].append(time.perf_counter() - start)
+
+
+class _TimedDataAnalystAgent(DataAnalystAgent):
+    """DataAnalystAgent that records the time of each processing stage and keeps the last result."""
+
+    def _generate_sql(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._generate_sql(*args, **kwargs)
+        finally:
+            self._timings["sql_generation"].append(time.perf_counter() - start)
+
+    def _fetch_bounded(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._fetch_bounded(*args, **kwargs)
+        finally:
+            self._timings["query"].append(time.perf_counter() - start)
+
+    def _set_results(self, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return super()._set_results(*args, **kwargs)
+        finally:
+            self._timings["results_render"].append(time.perf_counter() - start)
+
+    def process(self, *args, **kwargs):
+        start = time.perf_counter()
+        result = super().process(*args, **kwargs)
+        self._timings["process"].append(time.perf_counter() - start)
+        self._last_result = result
+        return result
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+    return {'p50_ms': round(p50 * 1000, 2), 'p95_ms': round(p95 * 1000, 2), 'p99_ms': round(p99 * 1000, 2)}
+
+
+def run_case(rows: int, columns: int, turns: int, model_latency: float, model_latency_per_1k: float,
+             max_result_rows: Optional[int], columns_per_table: int) -> Dict:
+    """Runs `turns` chat turns against one warehouse configuration and returns per-stage percentiles."""
+    timings = defaultdict(list)
+    num_tables = max(1, -(-columns // columns_per_table))
+    metadata_client = FakeMetadataClient(num_tables, min(columns, columns_per_table), project=PROJECT,
+                                         call_latency=0.0, query_latency=0.0)
+    schema_agent = _TimedSchemaAgent(
+        project_id=PROJECT,
+        connector=BigQueryConnector(PROJECT, client=metadata_client, use_bqstorage=False),
+        schema_cache=SchemaCache(background=False),
+    )
+    schema_agent._timings = timings
+
+    model = FakeGenerativeModel([SCRIPTED_SQL], latency=model_latency, latency_per_1k_chars=model_latency_per_1k)
+    warehouse = FakeBigQueryClient(rows, table_id=f"{PROJECT}.{DATASET}.table_0")
+    connector = BigQueryConnector(PROJECT, client=warehouse, bqstorage_client=object(), use_bqstorage=True)
+    agent = _TimedDataAnalystAgent(project_id=PROJECT, connector=connector, schema_agent=schema_agent,
+                                   model=model, model_name=model._model_name, max_result_rows=max_result_rows)
+    agent._timings = timings
+    visualization_agent = VisualizationAgent()
+
+    for turn in range(turns):
+        agent._last_result = None
+        start = time.perf_counter()
+        run_chat_turn(f"show amount by id for run {turn}", [], DATASET, session_id=f"bench-{turn}",
+                      data_analyst=agent, project_id=PROJECT)
+        elapsed = time.perf_counter() - start
+        timings["turn"].append(elapsed)
+        timings["chat_render"].append(elapsed - timings["schema"][-1] - timings["process"][-1])
+
+        result = agent._last_result or {}
+        if result.get('error'):
+            raise RuntimeError(f"chat turn failed: {result['error']}")
+        start = time.perf_counter()
+        visualization_agent.generate_visualizations(result['results_df'], "show amount by id")
+        timings["visualization_agent"].append(time.perf_counter() - start)
+
+    result_rows = len(agent._last_result['results_df'])
+    return {
+        'rows': rows, 'columns': columns, 'tables': num_tables, 'turns': turns, 'rows_loaded': result_rows,
+        'prompt_chars': model.prompt_chars[-1] if model.prompt_chars else 0,
+        'stages': {stage: _percentiles(timings[stage]) for stage in STAGES if timings[stage]},
+    }
+
+
+def _print_case(label: str, case: Dict) -> None:
+    stages = case['stages']
+    line = "  ".join(f"{stage} {stages[stage]['p50_ms']:.1f}/{stages[stage]['p99_ms']:.1f}"
+                     for stage in STAGES if stage in stages)
+    print(f"{label:>22}: {line}  (p50/p99 ms)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10, 1000, 100000, 10000000],
+                        help="Result sizes for the row sweep")
+    parser.add_argument("--columns", type=int, nargs="+", default=[5, 50, 500, 5000],
+                        help="Schema widths (total columns in the dataset) for the column sweep")
+    parser.add_argument("--fixed-rows", type=int, default=1000, help="Result size used in the column sweep")
+    parser.add_argument("--fixed-columns", type=int, default=20, help="Schema width used in the row sweep")
+    parser.add_argument("--columns-per-table", type=int, default=50)
+    parser.add_argument("--turns", type=int, default=10, help="Chat turns per configuration")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Seconds per model call")
+    parser.add_argument("--model-latency-per-1k-chars", type=float, default=0.0005,
+                        help="Extra seconds per thousand prompt characters")
+    parser.add_argument("--max-result-rows", type=int, default=100000,
+                        help="Row ceiling of the agent; 0 disables it")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    max_result_rows = args.max_result_rows or None
+    common = dict(turns=args.turns, model_latency=args.model_latency,
+                  model_latency_per_1k=args.model_latency_per_1k_chars,
+                  max_result_rows=max_result_rows, columns_per_table=args.columns_per_table)
+
+    print(f"Row sweep ({args.fixed_columns} schema columns)")
+    row_sweep = []
+    for rows in args.rows:
+        case = run_case(rows, args.fixed_columns, **common)
+        row_sweep.append(case)
+        _print_case(f"{rows:,} rows", case)
+
+    print(f"Column sweep ({args.fixed_rows:,} result rows)")
+    column_sweep = []
+    for columns in args.columns:
+        case = run_case(args.fixed_rows, columns, **common)
+        column_sweep.append(case)
+        _print_case(f"{columns:,} columns", case)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'},
+                       'row_sweep': row_sweep, 'column_sweep': column_sweep}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmark: one column profile pass vs the repeated scans it replaced.
+
+For each frame width (a mix of numeric, text, date and boolean columns) it times:
+  - legacy: the statistics the insights and chart heuristics computed before,
+    each with its own scan: describe(include='all') for the insights text,
+    select_dtypes() five times, isnull().sum(), and min / max / mean of the
+    first numeric columns
+  - profile: profile_frame(), which computes all of them (plus distinct counts
+    and top values) once per column
+  - chunked: profile_chunks() over the frame as Arrow batches of --chunk-rows,
+    as a streamed result would be profiled
+
+Usage:
+    python -m benchmarks.bench_column_profile --columns 20 100 400 --rows 100000 --json column_profile.json
+"""
+
+import argparse
+import json
+import logging
+import time
+import warnings
+from typing import Callable, Dict, List
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from utils.column_profile import profile_chunks, profile_frame
+
+
+def synthetic_frame(rows: int, columns: int, seed: int = 11) -> pd.DataFrame:
+    """Columns cycle through float, integer id, low-cardinality text, date and boolean."""
+    rng = np.random.default_rng(seed)
+    data = {}
+    for i in range(columns):
+        kind = i % 5
+        if kind == 0:
+            values = rng.normal(100.0, 20.0, rows)
+            values[rng.random(rows) < 0.02] = np.nan
+            data[f"metric_{i}"] = values
+        elif kind == 1:
+            data[f"id_{i}"] = rng.integers(0, rows, rows)
+        elif kind == 2:
+            data[f"category_{i}"] = rng.choice([f"c{j}" for j in range(30)] + [None], rows)
+        elif kind == 3:
+            data[f"day_{i}"] = pd.Timestamp("2020-01-01") + pd.to_timedelta(rng.integers(0, 2000, rows), unit="D")
+        else:
+            data[f"flag_{i}"] = rng.random(rows) < 0.3
+    return pd.DataFrame(data)
+
+
+def legacy_statistics(df: pd.DataFrame) -> None:
+    """The scans of the visualization agent and the chat callback before column profiles."""
+    with warnings.catch_warnings():
+        # pandas 3 warns that select_dtypes('object') still includes str columns
+        warnings.simplefilter("ignore")
+        _legacy_scans(df)
+
+
+def _legacy_scans(df: pd.DataFrame) -> None:
+    df.describe(include='all').to_string()
+    df.select_dtypes(include=['number']).columns.tolist()
+    df.select_dtypes(include=['object', 'category']).columns.tolist()
+    numeric_cols = df.select_dtypes(include=['number']).columns
+    df[numeric_cols[0]].mean()
+    df.select_dtypes(include=['number']).columns
+    df.select_dtypes(include=['object']).columns
+    df.isnull().sum()
+    for col in numeric_cols[:2]:
+        if not df[col].isna().all():
+            df[col].min(), df[col].max()
+
+
+def _time(fn: Callable[[], object], repeats: int) -> float:
+    timings: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return round(float(np.median(timings)) * 1000, 1)
+
+
+def run_case(rows: int, columns: int, chunk_rows: int, repeats: int) -> Dict:
+    df = synthetic_frame(rows, columns)
+    batches = pa.Table.from_pandas(df, preserve_index=False).to_batches(max_chunksize=chunk_rows)
+    return {
+        'rows': rows,
+        'columns': columns,
+        'legacy_ms': _time(lambda: legacy_statistics(df), repeats),
+        'profile_ms': _time(lambda: profile_frame(df), repeats),
+        'chunked_ms': _time(lambda: profile_chunks(batches), repeats),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--columns", type=int, nargs="+", default=[20, 100, 400])
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--chunk-rows", type=int, default=25_000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    cases = []
+    for columns in args.columns:
+        case = run_case(args.rows, columns, args.chunk_rows, args.repeats)
+        cases.append(case)
+        print(f"{args.rows:,} rows x {columns:>4} columns: legacy {case['legacy_ms']:.0f} ms, "
+              f"profile {case['profile_ms']:.0f} ms ({case['legacy_ms'] / case['profile_ms']:.1f}x), "
+              f"chunked {case['chunked_ms']:.0f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'cases': cases}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Benchmark: downsampling of large line series before they are sent to the browser.
+
+For each series length (a random walk with a few injected spikes) it reports,
+for the full series and for every downsampling method:
+  - points in the trace and the size of the figure JSON sent to the browser
+  - downsampling time and figure build + JSON serialization time, the part of
+    rendering that happens on the server (the browser's drawing time grows with
+    the same point count)
+  - whether the global peak and trough of the series survived
+
+Serializing the full series is skipped above --max-full-points.
+
+Usage:
+    python -m benchmarks.bench_downsampling --points 10000 100000 1000000 10000000 --json downsampling.json
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+import plotly.io as pio
+
+from utils.downsampling import METHODS, downsample, make_scatter
+
+
+def synthetic_series(points: int, seed: int = 5) -> pd.DataFrame:
+    """A minute-resolution random walk with a few one-point spikes, the extremes a chart must not lose."""
+    rng = np.random.default_rng(seed)
+    values = rng.standard_normal(points).cumsum()
+    spread = values.max() - values.min() + 1.0
+    spikes = rng.choice(points, size=min(6, points), replace=False)
+    values[spikes[::2]] += 3 * spread
+    values[spikes[1::2]] -= 3 * spread
+    return pd.DataFrame({'time': pd.date_range("2020-01-01", periods=points, freq="min"), 'value': values})
+
+
+def _figure_case(df: pd.DataFrame, max_points, method: str) -> Dict:
+    start = time.perf_counter()
+    trace = make_scatter(df['time'], df['value'], max_points=max_points, method=method, mode='lines')
+    payload = pio.to_json(go.Figure(trace))
+    elapsed = time.perf_counter() - start
+    return {'trace': trace.type, 'points': len(trace.y), 'payload_bytes': len(payload),
+            'build_ms': round(elapsed * 1000, 2)}
+
+
+def run_case(points: int, max_points: int, max_full_points: int, repeats: int) -> Dict:
+    df = synthetic_series(points)
+    peak, trough = int(df['value'].idxmax()), int(df['value'].idxmin())
+    case = {'points': points, 'full': None, 'methods': {}}
+    if points <= max_full_points:
+        case['full'] = _figure_case(df, None, "minmax")
+    for method in METHODS:
+        timings: List[float] = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            kept = downsample(df['time'], df['value'], max_points, method)
+            timings.append(time.perf_counter() - start)
+        kept_set = set(kept.tolist())
+        result = _figure_case(df, max_points, method)
+        result.update({'downsample_ms': round(float(np.median(timings)) * 1000, 2),
+                       'keeps_peak': peak in kept_set, 'keeps_trough': trough in kept_set})
+        case['methods'][method] = result
+    return case
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--points", type=int, nargs="+", default=[10_000, 100_000, 1_000_000, 10_000_000])
+    parser.add_argument("--max-points", type=int, default=2000, help="Points kept per trace")
+    parser.add_argument("--max-full-points", type=int, default=1_000_000,
+                        help="Largest series whose full figure is serialized for comparison")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    cases = []
+    for points in args.points:
+        case = run_case(points, args.max_points, args.max_full_points, args.repeats)
+        cases.append(case)
+        full = case['full']
+        full_str = (f"full {full['payload_bytes'] / 1e6:.1f} MB in {full['build_ms']:.0f} ms ({full['trace']})"
+                    if full else "full not serialized")
+        print(f"{points:>11,} points: {full_str}")
+        for method, result in case['methods'].items():
+            print(f"    {method:<11} {result['points']:>5} points, {result['payload_bytes'] / 1e3:.0f} KB, "
+                  f"downsample {result['downsample_ms']:.1f} ms, build {result['build_ms']:.0f} ms ({result['trace']}), "
+                  f"peak {'kept' if result['keeps_peak'] else 'lost'}, "
+                  f"trough {'kept' if result['keeps_trough'] else 'lost'}")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'cases': cases}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Benchmark: server-side histogram binning vs px.histogram over the raw column.
+
+For each result size it builds the histogram figure two ways:
+  - raw: px.histogram(df, x=column), which serializes every value into the
+    figure JSON for the browser to bin
+  - binned: StreamingHistogram over the result in --chunk-rows chunks (as the
+    paged download delivers it), drawn as a go.Bar of bin counts
+and reports the figure JSON size and the build + serialization time of each.
+The raw figure is also measured as plain JSON lists (--json-lists), the
+encoding of Plotly versions before 6 and of figures built from Python lists.
+
+Usage:
+    python -m benchmarks.bench_histogram --rows 100000 1000000 5000000 --json histogram.json
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict
+
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+import plotly.io as pio
+import pyarrow as pa
+
+from utils.histogram import histogram_bar, histogram_chunks
+
+
+def synthetic_result(rows: int, seed: int = 9) -> pd.DataFrame:
+    """A skewed amount column, like order values."""
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({'amount': rng.lognormal(3.0, 0.8, rows)})
+
+
+def _chunks(df: pd.DataFrame, chunk_rows: int):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    return table.to_batches(max_chunksize=chunk_rows)
+
+
+def run_case(rows: int, chunk_rows: int, json_lists: bool) -> Dict:
+    df = synthetic_result(rows)
+    case = {'rows': rows}
+
+    start = time.perf_counter()
+    payload = pio.to_json(px.histogram(df, x='amount'))
+    case['raw'] = {'payload_bytes': len(payload), 'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+    if json_lists:
+        start = time.perf_counter()
+        payload = json.dumps({'data': [{'type': 'histogram', 'x': df['amount'].tolist()}]})
+        case['raw_json_lists'] = {'payload_bytes': len(payload),
+                                  'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+
+    batches = _chunks(df, chunk_rows)
+    start = time.perf_counter()
+    bins = histogram_chunks(batches, 'amount', total_count=rows)
+    binned_ms = (time.perf_counter() - start) * 1000
+    payload = pio.to_json(go.Figure(histogram_bar(bins)))
+    case['binned'] = {'bins': len(bins), 'payload_bytes': len(payload), 'binning_ms': round(binned_ms, 1),
+                      'build_ms': round((time.perf_counter() - start) * 1000, 1)}
+    return case
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[100_000, 1_000_000, 5_000_000])
+    parser.add_argument("--chunk-rows", type=int, default=100_000)
+    parser.add_argument("--json-lists", action="store_true", help="Also measure the raw figure as JSON lists")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    cases = []
+    for rows in args.rows:
+        case = run_case(rows, args.chunk_rows, args.json_lists)
+        cases.append(case)
+        raw, binned = case['raw'], case['binned']
+        line = (f"{rows:>10,} rows: raw {raw['payload_bytes'] / 1e6:.1f} MB in {raw['build_ms']:.0f} ms")
+        if 'raw_json_lists' in case:
+            line += f" ({case['raw_json_lists']['payload_bytes'] / 1e6:.1f} MB as JSON lists)"
+        line += (f" -> binned {binned['bins']} bins, {binned['payload_bytes'] / 1e3:.1f} KB in "
+                 f"{binned['build_ms']:.0f} ms (binning {binned['binning_ms']:.0f} ms)")
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'cases': cases}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Benchmark: per-table schema lookups vs one INFORMATION_SCHEMA query per dataset.
+
+SchemaAgent.get_full_dataset_schema used to call list_tables and then get_table
+once per table. The bulk path issues a single INFORMATION_SCHEMA query. Both run
+against benchmarks.fakes.FakeMetadataClient, which sleeps per API call.
+
+Usage:
+    python -m benchmarks.bench_schema_harvest --tables 10 100 300 --call-latency 0.05
+"""
+
+import argparse
+import json
+import logging
+import time
+from typing import Dict, List
+
+from benchmarks.fakes import FakeMetadataClient
+from connectors.bigquery_connector import BigQueryConnector
+from agents.schema_agent import SchemaAgent
+
+
+class _PerTableConnector(BigQueryConnector):
+    """Connector with the bulk path disabled, i.e. the per-table fallback."""
+
+    def get_dataset_schema(self, dataset_id: str):
+        return None
+
+
+def _time_schema_fetch(connector_cls, client: FakeMetadataClient) -> Dict:
+    connector = connector_cls(project_id=client.project, client=client, use_bqstorage=False)
+    agent = SchemaAgent(project_id=client.project, connector=connector)
+    client.calls = 0
+    start = time.perf_counter()
+    schema = agent.get_full_dataset_schema("bench_dataset")
+    return {"seconds": round(time.perf_counter() - start, 3), "api_calls": client.calls, "tables": len(schema)}
+
+
+def run(table_counts: List[int], num_columns: int, call_latency: float, query_latency: float) -> List[Dict]:
+    results = []
+    for num_tables in table_counts:
+        client = FakeMetadataClient(num_tables, num_columns, call_latency=call_latency, query_latency=query_latency)
+        per_table = _time_schema_fetch(_PerTableConnector, client)
+        bulk = _time_schema_fetch(BigQueryConnector, client)
+        speedup = per_table["seconds"] / bulk["seconds"] if bulk["seconds"] else float("inf")
+        results.append({"tables": num_tables, "columns_per_table": num_columns,
+                        "per_table": per_table, "bulk": bulk, "speedup": round(speedup, 1)})
+        print(f"{num_tables:>5} tables: per-table {per_table['seconds']:>7.2f}s ({per_table['api_calls']} calls)  "
+              f"bulk {bulk['seconds']:>6.2f}s ({bulk['api_calls']} call)  speed-up x{speedup:.1f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 300])
+    parser.add_argument("--columns", type=int, default=20)
+    parser.add_argument("--call-latency", type=float, default=0.05, help="Seconds per list/get API call")
+    parser.add_argument("--query-latency", type=float, default=0.8, help="Seconds for the INFORMATION_SCHEMA job")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    results = run(args.tables, args.columns, args.call_latency, args.query_latency)
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Benchmark: relevance-ranked schema pruning of the SQL prompt.
+
+Builds a synthetic dataset of `--tables` tables (domain_entity names, columns
+drawn from a shared attribute vocabulary) and asks questions that each name a
+target table and two of its columns. For each question it reports:
+  - prompt tokens with the full schema vs the pruned schema
+  - recall: whether the target table and both columns survived pruning
+  - pruning latency, and end-to-end DataAnalystAgent.process latency with a
+    FakeGenerativeModel whose latency grows with prompt size
+
+Usage:
+    python -m benchmarks.bench_schema_pruning --tables 1000 --columns 30 --questions 50 --json pruning.json
+"""
+
+import argparse
+import json
+import logging
+import random
+import time
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel
+from connectors.bigquery_connector import BigQueryConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from utils.schema_pruning import SchemaPruner, estimate_tokens
+
+PROJECT = "bench"
+DATASET = "ds"
+
+DOMAINS = ["sales", "inventory", "marketing", "finance", "payroll", "support", "logistics", "billing", "procurement",
+           "warehouse", "retail", "wholesale", "crm", "hr", "legal", "compliance", "manufacturing", "quality",
+           "research", "fleet", "energy", "insurance", "claims", "lending", "treasury"]
+ENTITIES = ["orders", "customers", "products", "invoices", "shipments", "suppliers", "employees", "tickets",
+            "campaigns", "payments", "returns", "contracts", "vehicles", "stores", "regions", "accounts", "assets",
+            "budgets", "leads", "policies", "projects", "routes", "audits", "sensors", "batches", "refunds",
+            "subscriptions", "vendors", "devices", "patients", "visits", "loans", "trades", "claims", "meters",
+            "sessions", "events", "reviews", "promotions", "channels"]
+ATTRIBUTES = ["amount", "quantity", "price", "discount", "revenue", "cost", "margin", "tax", "weight", "volume",
+              "duration", "rating", "score", "balance", "country", "city", "region", "state", "category", "status",
+              "channel", "segment", "tier", "priority", "currency", "created_date", "updated_date", "closed_date",
+              "due_date", "owner_name", "manager_name", "email", "phone", "latitude", "longitude", "temperature",
+              "voltage", "headcount", "salary", "bonus", "language", "platform", "source", "campaign_code",
+              "sku", "brand", "color", "size", "warranty_months", "age_group"]
+COLUMN_TYPES = {"date": "DATE", "name": "STRING", "email": "STRING", "phone": "STRING", "code": "STRING"}
+SCRIPTED_SQL = f"SELECT COUNT(*) AS x FROM `{PROJECT}.{DATASET}.sales_orders`"
+
+
+def synthetic_schema(num_tables: int, columns_per_table: int, seed: int = 7) -> Dict[str, Dict]:
+    """num_tables tables named <domain>_<entity>[_n], each with an id and columns_per_table - 1 attributes."""
+    rng = random.Random(seed)
+    schema = {}
+    pairs = [(domain, entity) for domain in DOMAINS for entity in ENTITIES]
+    for t in range(num_tables):
+        domain, entity = pairs[t % len(pairs)]
+        name = f"{domain}_{entity}" + (f"_{t // len(pairs)}" if t >= len(pairs) else "")
+        attributes = rng.sample(ATTRIBUTES, min(columns_per_table - 1, len(ATTRIBUTES)))
+        columns = [{'name': f"{entity.rstrip('s')}_id", 'type': 'INT64'}]
+        for attribute in attributes:
+            suffix = attribute.rsplit("_", 1)[-1]
+            columns.append({'name': attribute, 'type': COLUMN_TYPES.get(suffix, 'FLOAT64')})
+        schema[name] = {'columns': columns}
+    return schema
+
+
+def synthetic_questions(schema: Dict[str, Dict], count: int, seed: int = 11) -> List[Tuple[str, str, List[str]]]:
+    """(question, target table, target columns) triples naming a table's domain, entity and two columns."""
+    rng = random.Random(seed)
+    names = list(schema)
+    questions = []
+    for _ in range(count):
+        table = rng.choice(names)
+        domain, entity = table.split("_")[:2]
+        measure, dimension = rng.sample([col['name'] for col in schema[table]['columns'][1:]], 2)
+        question = f"total {measure.replace('_', ' ')} by {dimension.replace('_', ' ')} for {domain} {entity}"
+        questions.append((question, table, [measure, dimension]))
+    return questions
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    p50, p95 = np.percentile(samples, [50, 95])
+    return {'p50_ms': round(p50 * 1000, 2), 'p95_ms': round(p95 * 1000, 2)}
+
+
+def _agent(pruner: SchemaPruner, model_latency: float, model_latency_per_1k: float) -> DataAnalystAgent:
+    connector = BigQueryConnector(PROJECT, client=FakeBigQueryClient(10, table_id=f"{PROJECT}.{DATASET}.t"),
+                                  use_bqstorage=False)
+    model = FakeGenerativeModel([SCRIPTED_SQL], latency=model_latency, latency_per_1k_chars=model_latency_per_1k)
+    return DataAnalystAgent(project_id=PROJECT, connector=connector, schema_agent=object(), model=model,
+                            model_name=model._model_name, schema_pruner=pruner)
+
+
+def run_case(tables: int, columns: int, questions: int, token_budget: int, max_tables: int,
+             model_latency: float, model_latency_per_1k: float) -> Dict:
+    schema = synthetic_schema(tables, columns)
+    pruner = SchemaPruner(token_budget=token_budget, max_tables=max_tables)
+    full = SchemaPruner(token_budget=None)
+    pruned_agent = _agent(pruner, model_latency, model_latency_per_1k)
+    full_agent = _agent(full, model_latency, model_latency_per_1k)
+
+    full_tokens, pruned_tokens, prune_times, pruned_e2e, full_e2e = [], [], [], [], []
+    table_hits = column_hits = 0
+    for i, (question, table, target_columns) in enumerate(synthetic_questions(schema, questions)):
+        start = time.perf_counter()
+        pruned = pruner.prune(question, schema)
+        prune_times.append(time.perf_counter() - start)
+        if table in pruned:
+            table_hits += 1
+            kept = {col['name'] for col in pruned[table]['columns']}
+            column_hits += all(col in kept for col in target_columns)
+
+        full_tokens.append(estimate_tokens(full_agent._build_prompt(question, schema, PROJECT, DATASET)[0]))
+        pruned_tokens.append(estimate_tokens(pruned_agent._build_prompt(question, schema, PROJECT, DATASET)[0]))
+
+        # A distinct question each time, so the SQL caches do not skip the model
+        for agent, samples in ((pruned_agent, pruned_e2e), (full_agent, full_e2e)):
+            start = time.perf_counter()
+            result = agent.process(f"{question} ({i})", schema, PROJECT, DATASET)
+            samples.append(time.perf_counter() - start)
+            if result['error']:
+                raise RuntimeError(result['error'])
+
+    return {
+        'tables': tables, 'columns_per_table': columns, 'questions': questions,
+        'prompt_tokens_full_p50': int(np.median(full_tokens)),
+        'prompt_tokens_pruned_p50': int(np.median(pruned_tokens)),
+        'prompt_token_reduction': round(1 - float(np.sum(pruned_tokens)) / float(np.sum(full_tokens)), 4),
+        'table_recall': round(table_hits / questions, 4),
+        'column_recall': round(column_hits / questions, 4),
+        'prune': _percentiles(prune_times),
+        'process_full': _percentiles(full_e2e),
+        'process_pruned': _percentiles(pruned_e2e),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tables", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--columns", type=int, default=30, help="Columns per table")
+    parser.add_argument("--questions", type=int, default=50)
+    parser.add_argument("--token-budget", type=int, default=4000)
+    parser.add_argument("--max-tables", type=int, default=8)
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Seconds per model call")
+    parser.add_argument("--model-latency-per-1k-chars", type=float, default=0.0005,
+                        help="Extra seconds per thousand prompt characters")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    cases = []
+    for tables in args.tables:
+        case = run_case(tables, args.columns, args.questions, args.token_budget, args.max_tables,
+                        args.model_latency, args.model_latency_per_1k_chars)
+        cases.append(case)
+        print(f"{tables:>6,} tables: prompt tokens p50 {case['prompt_tokens_full_p50']:,} -> "
+              f"{case['prompt_tokens_pruned_p50']:,} ({case['prompt_token_reduction']:.1%} fewer), "
+              f"recall table {case['table_recall']:.0%} / columns {case['column_recall']:.0%}, "
+              f"prune p50 {case['prune']['p50_ms']:.1f} ms, process p50 {case['process_full']['p50_ms']:.0f} -> "
+              f"{case['process_pruned']['p50_ms']:.0f} ms")
+
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'config': {k: v for k, v in vars(args).items() if k != 'json_path'}, 'cases': cases}, f,
+                      indent=2)
+
+
+if __name__ == "__main__":
+    main()
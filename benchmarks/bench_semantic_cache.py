@@ -0,0 +1,147 @@
+"""
+Benchmark: semantic question cache lookup latency and threshold trade-off.
+
+Fills one dataset index with synthetic questions (100k by default), then
+measures lookup latency percentiles. It also sweeps the similarity threshold
+over a hand-labelled set of paraphrases (should reuse the cached SQL) and hard
+negatives (same words, different answer), reporting precision and recall.
+
+Usage:
+    python -m benchmarks.bench_semantic_cache --entries 100000 --thresholds 0.3 0.4 0.5 0.6 0.7
+"""
+
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from utils.semantic_cache import SemanticQuestionCache
+
+SCHEMA = {
+    'crop_production': {'columns': [{'name': name, 'type': 'STRING'} for name in
+                                    ['state_name', 'district_name', 'crop_year', 'season', 'crop', 'area',
+                                     'production']]},
+}
+
+# (cached question, paraphrases that should reuse its SQL)
+PARAPHRASES = [
+    ("total production by state", ["sum of production per state", "what is the total production for each state",
+                                   "production totals by state", "overall production figures by state",
+                                   "give me a breakdown of total production state wise"]),
+    ("average area by season", ["mean area per season", "what is the average area for each season"]),
+    ("top 10 crops by production", ["which 10 crops have the highest production",
+                                    "top 10 crops ranked by production"]),
+    ("number of districts per state", ["how many districts are in each state", "count of districts by state"]),
+    ("total area by crop year", ["sum of area per crop year", "total area for each crop year"]),
+    ("list the distinct seasons", ["what are the unique seasons", "show distinct seasons"]),
+    ("lowest production district", ["which district has the minimum production",
+                                    "district with the lowest production",
+                                    "which district recorded the lowest production overall"]),
+]
+
+# Questions that look like a cached one but need different SQL; reusing it would be wrong
+HARD_NEGATIVES = [
+    "total production by district", "average production by state", "top 5 crops by production",
+    "top 10 crops by area", "number of crops per state", "total area by season", "highest production district",
+    "list the distinct crops", "average area by crop year",
+    # Same schema terms but a filter value that no cached question has
+    "total production of millet by state", "average area of groundnut by season", "total area in kharif by crop year",
+    "top 10 crops by production in punjab",
+]
+
+FILLER_TEMPLATES = [
+    "{agg} {measure} by {dim} in {year}", "show {measure} for {crop} in {dim} {n}",
+    "which {dim} had the {rank} {measure} in {year}", "{agg} {measure} of {crop} per {dim}",
+]
+FILLER_WORDS = {
+    'agg': ["total", "average", "sum of", "mean", "count of"],
+    'measure': ["production", "area", "yield", "output", "acreage"],
+    'dim': ["state", "district", "season", "region", "crop year"],
+    'rank': ["highest", "lowest", "largest", "smallest"],
+    'crop': ["rice", "wheat", "maize", "cotton", "sugarcane", "jute", "barley"],
+}
+
+
+def _filler_questions(count: int, seed: int = 7) -> List[str]:
+    rng = random.Random(seed)
+    questions = []
+    for i in range(count):
+        template = rng.choice(FILLER_TEMPLATES)
+        words = {key: rng.choice(values) for key, values in FILLER_WORDS.items()}
+        questions.append(template.format(year=1990 + i % 35, n=i, **words))
+    return questions
+
+
+def measure_latency(entries: int, lookups: int) -> Dict:
+    cache = SemanticQuestionCache()
+    fillers = _filler_questions(entries)
+    start = time.perf_counter()
+    for i, question in enumerate(fillers):
+        cache.add("bench.crops", SCHEMA, question, f"SELECT {i}")
+    add_seconds = time.perf_counter() - start
+
+    probes = _filler_questions(lookups, seed=11)
+    cache.lookup("bench.crops", SCHEMA, probes[0])  # first lookup refreshes the norms
+    timings = []
+    for question in probes:
+        start = time.perf_counter()
+        cache.lookup("bench.crops", SCHEMA, question)
+        timings.append((time.perf_counter() - start) * 1000)
+    p50, p95, p99 = np.percentile(timings, [50, 95, 99])
+    return {'entries': entries, 'add_per_second': round(entries / add_seconds),
+            'lookup_ms_p50': round(p50, 2), 'lookup_ms_p95': round(p95, 2), 'lookup_ms_p99': round(p99, 2)}
+
+
+def sweep_thresholds(thresholds: List[float], fillers: int) -> List[Dict]:
+    cache = SemanticQuestionCache()
+    for i, question in enumerate(_filler_questions(fillers)):
+        cache.add("bench.crops", SCHEMA, question, f"SELECT filler_{i}")
+    for question, _ in PARAPHRASES:
+        cache.add("bench.crops", SCHEMA, question, f"SQL for {question}")
+
+    results = []
+    for threshold in thresholds:
+        correct = wrong = 0
+        for question, paraphrases in PARAPHRASES:
+            for paraphrase in paraphrases:
+                match = cache.lookup("bench.crops", SCHEMA, paraphrase, threshold=threshold)
+                if match is not None:
+                    correct += match['sql'] == f"SQL for {question}"
+                    wrong += match['sql'] != f"SQL for {question}"
+        for negative in HARD_NEGATIVES:
+            if cache.lookup("bench.crops", SCHEMA, negative, threshold=threshold) is not None:
+                wrong += 1
+        positives = sum(len(paraphrases) for _, paraphrases in PARAPHRASES)
+        precision = correct / (correct + wrong) if correct + wrong else 1.0
+        results.append({'threshold': threshold, 'precision': round(precision, 3),
+                        'recall': round(correct / positives, 3), 'wrong_reuses': wrong})
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entries", type=int, default=100000)
+    parser.add_argument("--lookups", type=int, default=500)
+    parser.add_argument("--thresholds", type=float, nargs="+", default=[0.3, 0.4, 0.5, 0.6, 0.7, 0.8])
+    parser.add_argument("--sweep-fillers", type=int, default=10000,
+                        help="Synthetic questions indexed next to the labelled ones during the sweep")
+    parser.add_argument("--json", dest="json_path", help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    latency = measure_latency(args.entries, args.lookups)
+    print(f"{latency['entries']} entries: {latency['add_per_second']} adds/s, lookup p50 {latency['lookup_ms_p50']} ms, "
+          f"p95 {latency['lookup_ms_p95']} ms, p99 {latency['lookup_ms_p99']} ms")
+    sweep = sweep_thresholds(args.thresholds, args.sweep_fillers)
+    for row in sweep:
+        print(f"threshold {row['threshold']:.2f}: precision {row['precision']:.3f}  recall {row['recall']:.3f}  "
+              f"wrong reuses {row['wrong_reuses']}")
+    if args.json_path:
+        with open(args.json_path, "w") as f:
+            json.dump({'latency': latency, 'threshold_sweep': sweep}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
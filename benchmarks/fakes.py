@@ -0,0 +1,336 @@
+"""
+In-process stand-ins for Google Cloud services used by the benchmarks.
+They reproduce the client-side work (JSON page parsing, Arrow IPC decoding)
+without any network access.
+"""
+
+import datetime
+import json
+import re
+import time
+from typing import Iterator, List, Optional
+
+import pyarrow as pa
+from google.cloud.bigquery import SchemaField
+from google.cloud.bigquery.table import Row, RowIterator, TableReference
+
+BENCH_SCHEMA = [
+    SchemaField("id", "INTEGER"),
+    SchemaField("amount", "FLOAT"),
+    SchemaField("category", "STRING"),
+]
+
+
+def _rest_page(start: int, count: int, total_rows: int, next_token: Optional[str]) -> str:
+    """Renders one tabledata.list-style JSON page."""
+    rows = [
+        {"f": [{"v": str(i)}, {"v": str(i * 1.5)}, {"v": f"category_{i % 50}"}]}
+        for i in range(start, start + count)
+    ]
+    page = {"rows": rows, "totalRows": str(total_rows)}
+    if next_token is not None:
+        page["pageToken"] = next_token
+    return json.dumps(page)
+
+
+def _arrow_page(start: int, count: int) -> bytes:
+    """Encodes one page as an Arrow IPC stream, the wire format of the Storage Read API."""
+    ids = pa.array(range(start, start + count), type=pa.int64())
+    batch = pa.record_batch(
+        [ids, pa.array([i * 1.5 for i in range(start, start + count)], type=pa.float64()),
+         pa.array([f"category_{i % 50}" for i in range(start, start + count)])],
+        names=["id", "amount", "category"],
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return sink.getvalue().to_pybytes()
+
+
+class StandInRowIterator:
+    """
+    Mimics google.cloud.bigquery.table.RowIterator for a synthetic result.
+
+    The REST path runs the real RowIterator over JSON pages; the Storage Read API
+    path decodes Arrow IPC pages. One full page (and the final partial page) is
+    pre-rendered and replayed, so the payloads themselves cost constant memory.
+    """
+
+    def __init__(self, num_rows: int, page_size: int = 10_000):
+        self.num_rows = num_rows
+        self.total_rows = num_rows
+        self.page_size = page_size
+        self._num_pages = max(1, -(-num_rows // page_size))
+        last_count = num_rows - (self._num_pages - 1) * page_size
+        self._full_json = _rest_page(0, page_size, num_rows, "next") if self._num_pages > 1 else None
+        self._last_json = _rest_page(0, last_count, num_rows, None)
+        self._full_ipc = _arrow_page(0, page_size) if self._num_pages > 1 else None
+        self._last_ipc = _arrow_page(0, last_count)
+
+    def _api_request(self, method: str, path: str, query_params: Optional[dict] = None, **kwargs) -> dict:
+        page_index = int((query_params or {}).get("pageToken") or 0)
+        if page_index < self._num_pages - 1:
+            page = json.loads(self._full_json)
+            page["pageToken"] = str(page_index + 1)
+            return page
+        return json.loads(self._last_json)
+
+    def _rest_iterator(self) -> RowIterator:
+        return RowIterator(client=None, api_request=self._api_request, path="/bench",
+                           schema=BENCH_SCHEMA, page_size=self.page_size, total_rows=self.num_rows)
+
+    def _storage_batches(self) -> Iterator[pa.RecordBatch]:
+        for page_index in range(self._num_pages):
+            payload = self._full_ipc if page_index < self._num_pages - 1 else self._last_ipc
+            yield from pa.ipc.open_stream(payload)
+
+    def to_arrow_iterable(self, bqstorage_client=None, **kwargs) -> Iterator[pa.RecordBatch]:
+        if bqstorage_client is not None:
+            return self._storage_batches()
+        return self._rest_iterator().to_arrow_iterable()
+
+    def to_arrow(self, bqstorage_client=None, create_bqstorage_client: bool = True, **kwargs) -> pa.Table:
+        if bqstorage_client is not None:
+            return pa.Table.from_batches(list(self._storage_batches()))
+        return self._rest_iterator().to_arrow(create_bqstorage_client=False)
+
+    def to_dataframe(self, bqstorage_client=None, create_bqstorage_client: bool = True, **kwargs):
+        if bqstorage_client is not None:
+            return self.to_arrow(bqstorage_client=bqstorage_client).to_pandas()
+        return self._rest_iterator().to_dataframe(create_bqstorage_client=False)
+
+
+# Approximate on-disk size of one BENCH_SCHEMA row, used for dry-run and billing statistics
+BENCH_ROW_BYTES = 32
+
+
+class FakeQueryJob:
+    """Finished query job whose result() replays a synthetic result set."""
+
+    def __init__(self, num_rows: int, page_size: int, referenced_tables: Optional[list] = None):
+        self.num_rows = num_rows
+        self.page_size = page_size
+        self.total_bytes_processed = num_rows * BENCH_ROW_BYTES
+        self.total_bytes_billed = self.total_bytes_processed
+        self.referenced_tables = referenced_tables or []
+
+    def result(self, **kwargs) -> StandInRowIterator:
+        return StandInRowIterator(self.num_rows, kwargs.get("page_size") or self.page_size)
+
+
+class _CountRowIterator:
+    """RowIterator stand-in for the single row of a COUNT(*) query."""
+
+    def __init__(self, count: int):
+        self.total_rows = 1
+        self._table = pa.table({"total_rows": pa.array([count], type=pa.int64())})
+
+    def to_arrow_iterable(self, bqstorage_client=None, **kwargs) -> Iterator[pa.RecordBatch]:
+        return iter(self._table.to_batches())
+
+    def to_arrow(self, bqstorage_client=None, create_bqstorage_client: bool = True, **kwargs) -> pa.Table:
+        return self._table
+
+    def to_dataframe(self, bqstorage_client=None, create_bqstorage_client: bool = True, **kwargs):
+        return self._table.to_pandas()
+
+
+class FakeCountJob(FakeQueryJob):
+    """Finished COUNT(*) job over a synthetic result: scans it, returns one row."""
+
+    def result(self, **kwargs) -> _CountRowIterator:
+        return _CountRowIterator(self.num_rows)
+
+
+_LIMIT_RE = re.compile(r"\bLIMIT\s+(\d+)\s*$", re.IGNORECASE)
+_COUNT_RE = re.compile(r"^\s*SELECT\s+COUNT\(\*\)\s+AS\s+total_rows\s+FROM\s*\(", re.IGNORECASE)
+
+
+class _FakeTableMetadata:
+    def __init__(self, modified: datetime.datetime):
+        self.table_type = "TABLE"
+        self.streaming_buffer = None
+        self.modified = modified
+
+
+class FakeBigQueryClient:
+    """
+    bigquery.Client stand-in whose every query returns `num_rows` synthetic rows
+    read from the table `table_id`. Bump `modified` to simulate a change to it.
+    With apply_limit, a trailing LIMIT caps the rows (and total_rows) of a query,
+    and `SELECT COUNT(*) AS total_rows FROM (...)` returns the row count, as
+    BigQuery would.
+    """
+
+    def __init__(self, num_rows: int, page_size: int = 10_000, table_id: str = "bench.ds.t",
+                 apply_limit: bool = False):
+        self.num_rows = num_rows
+        self.apply_limit = apply_limit
+        self.page_size = page_size
+        self.table_id = table_id
+        self.modified = datetime.datetime(2024, 1, 1, tzinfo=datetime.timezone.utc)
+        self.queries: List[str] = []
+        self.jobs = 0
+        self.table_lookups = 0
+
+    def query(self, query: str, job_config=None) -> FakeQueryJob:
+        self.queries.append(query)
+        if not getattr(job_config, "dry_run", False):
+            self.jobs += 1
+        referenced = [TableReference.from_string(self.table_id)]
+        if self.apply_limit and _COUNT_RE.match(query):
+            return FakeCountJob(self.num_rows, self.page_size, referenced)
+        limit = _LIMIT_RE.search(query) if self.apply_limit else None
+        job = FakeQueryJob(min(self.num_rows, int(limit.group(1))) if limit else self.num_rows, self.page_size,
+                           referenced)
+        # A LIMIT does not reduce the bytes a query scans
+        job.total_bytes_processed = job.total_bytes_billed = self.num_rows * BENCH_ROW_BYTES
+        return job
+
+    def get_table(self, table_ref) -> _FakeTableMetadata:
+        self.table_lookups += 1
+        return _FakeTableMetadata(self.modified)
+
+
+class _FakeTableListItem:
+    def __init__(self, project: str, dataset_id: str, table_id: str):
+        self.project = project
+        self.dataset_id = dataset_id
+        self.table_id = table_id
+
+
+class _FakeTable:
+    def __init__(self, schema: List[SchemaField]):
+        self.schema = schema
+
+
+class _RowsJob:
+    """Query job stand-in whose result() is a list of bigquery Rows."""
+
+    def __init__(self, rows: list, latency: float):
+        self._rows = rows
+        self._latency = latency
+
+    def result(self, **kwargs) -> list:
+        time.sleep(self._latency)
+        return self._rows
+
+
+class FakeMetadataClient:
+    """
+    bigquery.Client stand-in for metadata calls over a synthetic dataset of
+    `num_tables` tables with `num_columns` columns each. Every API call sleeps
+    for a configurable latency to model network round trips. Bump `last_modified`
+    to simulate a change to the dataset.
+    """
+
+    COLUMN_TYPES = ["STRING", "INT64", "FLOAT64", "DATE", "TIMESTAMP"]
+
+    def __init__(self, num_tables: int, num_columns: int, project: str = "bench",
+                 call_latency: float = 0.05, query_latency: float = 0.8):
+        self.project = project
+        self.num_tables = num_tables
+        self.num_columns = num_columns
+        self.call_latency = call_latency
+        self.query_latency = query_latency
+        self.calls = 0
+        self.version_checks = 0
+        self.last_modified = 1700000000000
+
+    def _columns(self):
+        return [(f"col_{i}", self.COLUMN_TYPES[i % len(self.COLUMN_TYPES)]) for i in range(self.num_columns)]
+
+    def list_tables(self, dataset_id: str):
+        self.calls += 1
+        time.sleep(self.call_latency)
+        return [_FakeTableListItem(self.project, dataset_id, f"table_{t}") for t in range(self.num_tables)]
+
+    def get_table(self, table_ref: str) -> _FakeTable:
+        self.calls += 1
+        time.sleep(self.call_latency)
+        return _FakeTable([SchemaField(name, field_type) for name, field_type in self._columns()])
+
+    def query(self, query: str, job_config=None) -> _RowsJob:
+        if "__TABLES__" in query and "COUNT(*)" in query:
+            # Last-modified check used to revalidate cached schemas; counted separately
+            self.version_checks += 1
+            row = Row((self.num_tables, self.last_modified), {"table_count": 0, "last_modified": 1})
+            return _RowsJob([row], self.call_latency)
+        if "__TABLES__" in query:
+            self.calls += 1
+            field_to_index = {"table_id": 0, "row_count": 1, "size_bytes": 2, "last_modified_time": 3}
+            rows = [Row((f"table_{t}", 1000 * (t + 1), 64000 * (t + 1), self.last_modified), field_to_index)
+                    for t in range(self.num_tables)]
+            return _RowsJob(rows, self.call_latency)
+        self.calls += 1
+        if "INFORMATION_SCHEMA" not in query:
+            raise NotImplementedError("FakeMetadataClient only answers INFORMATION_SCHEMA queries")
+        fields = ["table_name", "column_name", "ordinal_position", "data_type", "is_partitioning_column",
+                  "clustering_ordinal_position", "field_path", "field_type", "description"]
+        field_to_index = {name: i for i, name in enumerate(fields)}
+        rows = []
+        for t in range(self.num_tables):
+            for position, (name, data_type) in enumerate(self._columns(), start=1):
+                rows.append(Row((f"table_{t}", name, position, data_type, "YES" if position == 1 else "NO",
+                                 None, name, data_type, None), field_to_index))
+        return _RowsJob(rows, self.query_latency)
+
+
+class _FakeUsageMetadata:
+    def __init__(self, prompt_token_count: int, candidates_token_count: int):
+        self.prompt_token_count = prompt_token_count
+        self.candidates_token_count = candidates_token_count
+
+
+class _FakeModelResponse:
+    def __init__(self, text: str, prompt_chars: int, usage: bool = True):
+        self.text = text
+        # Roughly four characters per token
+        self.usage_metadata = _FakeUsageMetadata(max(1, prompt_chars // 4), max(1, len(text) // 4)) if usage else None
+
+
+class FakeGenerativeModel:
+    """
+    vertexai GenerativeModel stand-in that replays scripted responses in order
+    (cycling when exhausted). Each call sleeps `latency` seconds plus
+    `latency_per_1k_chars` per thousand prompt characters, a rough model of
+    time-to-answer growing with prompt size.
+
+    With stream=True the response arrives as `chunk_chars`-character chunks: the
+    latency above is spent before the first one and `chunk_latency` before each
+    further one. Only the last chunk carries usage metadata, as with Gemini.
+    chunks_sent counts the chunks the caller actually pulled.
+    """
+
+    def __init__(self, responses: List[str], latency: float = 0.0, latency_per_1k_chars: float = 0.0,
+                 model_name: str = "fake-model", chunk_chars: int = 16, chunk_latency: float = 0.0):
+        self.responses = list(responses)
+        self.latency = latency
+        self.latency_per_1k_chars = latency_per_1k_chars
+        self._model_name = model_name
+        self.chunk_chars = chunk_chars
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        self.chunks_sent = 0
+        self.prompt_chars: List[int] = []
+
+    def generate_content(self, prompt, stream: bool = False, **kwargs):
+        text = prompt if isinstance(prompt, str) else str(prompt)
+        self.prompt_chars.append(len(text))
+        response = self.responses[self.calls % len(self.responses)]
+        self.calls += 1
+        if stream:
+            return self._stream(response, len(text))
+        time.sleep(self.latency + self.latency_per_1k_chars * len(text) / 1000)
+        return _FakeModelResponse(response, len(text))
+
+    def _stream(self, response: str, prompt_chars: int) -> Iterator[_FakeModelResponse]:
+        time.sleep(self.latency + self.latency_per_1k_chars * prompt_chars / 1000)
+        for start in range(0, len(response), self.chunk_chars):
+            if start:
+                time.sleep(self.chunk_latency)
+            self.chunks_sent += 1
+            chunk = _FakeModelResponse(response[start:start + self.chunk_chars], prompt_chars, usage=False)
+            if start + self.chunk_chars >= len(response):
+                chunk.usage_metadata = _FakeUsageMetadata(max(1, prompt_chars // 4), max(1, len(response) // 4))
+            yield chunk
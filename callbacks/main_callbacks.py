@@ -1,14 +1,26 @@
 import os
 import json
+import math
+import uuid
 import logging
+from datetime import datetime
 import dash # Ensure dash is imported
-from dash import dcc, html, callback_context, dash_table # Add callback_context
+from dash import dcc, html, callback_context, dash_table, Patch # Add callback_context
 from dash.dependencies import Input, Output, State
 from dash.exceptions import PreventUpdate
 import plotly.graph_objects as go
 
-from agents import SchemaAgent, DataAnalystAgent, VisualizationAgent
+from agents import get_registry
 from utils.question_generator import get_intelligent_questions
+from utils.cost_guard import DEFAULT_SESSION_ID, format_bytes
+from utils.tracing import StageTimings, collect_timings, span
+from utils.background_jobs import get_default_job_manager, when_busy
+from utils.chart_planner import aggregate_frame, plan_chart
+from utils.column_profile import columns_of, profile_frame
+from utils.table_query import TABLE_PAGE_SIZE
+from utils.downsampling import make_scatter
+from utils.histogram import histogram_bar
+from utils.session_store import get_default_session_store
 
 logger = logging.getLogger(__name__)
 
@@ -20,8 +32,674 @@ except KeyError:
     logger.error("CRITICAL: GOOGLE_CLOUD_PROJECT environment variable is not set.")
     PROJECT_ID = None
 
+# Replies that confirm a query parked by the cost guard
+CONFIRMATION_REPLIES = {'yes', 'y', 'confirm', 'run it', 'run anyway', 'go ahead'}
+
+# Append the per-stage timings of each answer to the bot message
+SHOW_STAGE_TIMINGS = os.environ.get("SHOW_STAGE_TIMINGS", "true").lower() in ("1", "true", "yes")
+
+# Progress line shown under the chat while a turn runs, keyed by the stage that starts
+STAGE_PROGRESS = {
+    'schema': "Reading the dataset schema…",
+    'llm.generate': "Generating SQL…",
+    'bigquery.dry_run': "Checking the query cost…",
+    'bigquery.job_wait': "Running the query…",
+    'bigquery.query': "Running the query…",
+    'bigquery.download': "Downloading the results…",
+    'chart.query': "Charting the full result…",
+    'figure.build': "Rendering…",
+}
+
+# Names of the chat transcript and of the last generated SQL in the session store
+# (utils.session_store): the dcc.Stores of the layout only hold these small keys
+CHAT_HISTORY_KEY = "chat_history"
+GENERATED_SQL_KEY = "generated_sql"
+
+# Messages the chat transcript keeps on the page; older ones stay on the server behind
+# the "Load earlier messages" button, which brings back CHAT_LOAD_EARLIER_MESSAGES per click
+CHAT_WINDOW_MESSAGES = int(os.environ.get("CHAT_WINDOW_MESSAGES", 50))
+CHAT_LOAD_EARLIER_MESSAGES = int(os.environ.get("CHAT_LOAD_EARLIER_MESSAGES", 20))
+
+# Chat suggestion buttons and the questions they ask
+SUGGESTIONS = {
+    'suggestion-1': "📊 Show me the main trends",
+    'suggestion-2': "📈 What are the key metrics?",
+    'suggestion-3': "🌍 Summarize the dataset for me",
+    'suggestion-4': "🔍 Find interesting correlations",
+}
+
+# Answer of a chat turn refused because every background worker is busy (utils.background_jobs)
+BUSY_MESSAGE = "⏳ The server is busy with other questions right now. Please try again in a moment."
+
+def _aggregate_figure(plan, chart_df):
+    """Figure for chart data computed by utils.chart_planner."""
+    if plan['kind'] == 'histogram':
+        fig = go.Figure(histogram_bar(chart_df, marker_color='rgba(93, 173, 226, 0.8)'))
+        title, x_title, y_title = f"Distribution of {plan['column']}", plan['column'], "Count"
+    elif plan['kind'] == 'timeseries':
+        fig = go.Figure(make_scatter(chart_df['period'], chart_df['value'], mode='lines+markers',
+                                     line=dict(color='#5dade2')))
+        title, x_title, y_title = f"{plan['value']} by {plan['time']}", plan['time'], plan['value']
+    else:
+        fig = go.Figure(go.Bar(x=chart_df['category'].astype(str), y=chart_df['value'],
+                               marker_color='rgba(93, 173, 226, 0.8)'))
+        title = f"{plan['value']} by {plan['category']} (top {plan['top_k']})"
+        x_title, y_title = plan['category'], plan['value']
+    fig.update_layout(
+        title=title,
+        xaxis_title=x_title,
+        yaxis_title=y_title,
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='white'),
+        showlegend=False,
+        bargap=0.05 if plan['kind'] == 'histogram' else None,
+        margin=dict(l=60, r=40, t=80, b=100),
+        height=400
+    )
+    fig.update_xaxes(tickangle=45, gridcolor='rgba(255,255,255,0.1)')
+    fig.update_yaxes(gridcolor='rgba(255,255,255,0.1)')
+    return fig
+
+
+def _page_status(first_row, rows, total_rows, pushed_down=False, partial=False, result_rows=None):
+    """Status line of a data table page; partial pages come from the downloaded rows of a truncated result."""
+    if not rows:
+        return "No matching rows"
+    status = f"Rows {first_row + 1:,}–{first_row + rows:,} of {total_rows:,}"
+    if pushed_down:
+        return status + " (computed in BigQuery over the full result)"
+    if partial:
+        full = f"{result_rows:,} rows" if result_rows is not None else "more rows"
+        return status + f" downloaded (the full result has {full}; sort or filter to query all of them in BigQuery)"
+    return status
+
+
+def _result_table(df, result, profile):
+    """
+    The data table of a chat result: all columns, one page of rows. With a result
+    handle, paging, sorting and filtering run on the server (page_action etc. 'custom').
+    """
+    column_types = {'numeric': 'numeric', 'temporal': 'datetime'}
+    columns = [{'name': str(col), 'id': str(col), 'type': column_types.get(profile[col].kind, 'text')}
+               for col in df.columns]
+    handle = result.get('result_handle')
+    first_page = df.head(TABLE_PAGE_SIZE)
+    # Without a sort or filter the pages are those of the downloaded rows (see fetch_table_page)
+    partial = bool(result.get('truncated') and result.get('source_sql'))
+    if handle is not None:
+        paging = dict(page_action='custom', sort_action='custom', sort_mode='single', filter_action='custom',
+                      page_current=0, page_size=TABLE_PAGE_SIZE, sort_by=[], filter_query='',
+                      page_count=max(1, math.ceil(len(df) / TABLE_PAGE_SIZE)))
+    else:
+        paging = dict(page_action='native', page_size=TABLE_PAGE_SIZE)
+    table = dash_table.DataTable(
+        id='result-table',
+        data=first_page.to_dict('records'),
+        columns=columns,
+        style_table={'overflowX': 'auto'},
+        style_cell={
+            'textAlign': 'left',
+            'backgroundColor': 'rgba(255,255,255,0.05)',
+            'color': 'white',
+            'border': '1px solid rgba(255,255,255,0.1)',
+            'padding': '10px',
+            'fontSize': '14px'
+        },
+        style_header={
+            'backgroundColor': 'rgba(93, 173, 226, 0.8)',
+            'fontWeight': 'bold',
+            'color': 'white'
+        },
+        style_filter={'backgroundColor': 'rgba(255,255,255,0.1)', 'color': 'white'},
+        style_data={'backgroundColor': 'transparent'},
+        fixed_rows={'headers': True},
+        **paging
+    )
+    return html.Div([
+        dcc.Store(id='result-table-handle', data=handle),
+        table,
+        html.Div(_page_status(0, len(first_page), len(df), partial=partial, result_rows=result.get('total_rows')),
+                 id='result-table-status', className="text-muted small"),
+    ])
+
+
+def table_page(handle, page_current=0, page_size=TABLE_PAGE_SIZE, sort_by=None, filter_query=None,
+               session_id=None, data_analyst=None, project_id=None):
+    """
+    Rows, page count and status line of one page of a stored chat result, or None if
+    the result has expired. data_analyst defaults to the registry's shared agent for
+    project_id (PROJECT_ID when not given).
+    """
+    page_current, page_size = page_current or 0, page_size or TABLE_PAGE_SIZE
+    if data_analyst is None:
+        data_analyst = get_registry().get_data_analyst_agent(project_id or PROJECT_ID)
+    page = data_analyst.fetch_table_page(handle, page_current, page_size, sort_by, filter_query,
+                                         session_id or DEFAULT_SESSION_ID)
+    if page is None:
+        return None
+    rows = page['rows']
+    return (rows.to_dict('records'), max(1, math.ceil(page['total_rows'] / page_size)),
+            _page_status(page_current * page_size, len(rows), page['total_rows'], page['pushed_down'],
+                         page['partial'], page['result_rows']))
+
+
+def load_chat_history(session_id, chat_ref, session_store=None):
+    """
+    The chat messages of a session as of chat_ref, the {'key', 'length', 'first'} reference
+    held by store-chat-messages (first is the index of the first message on the page);
+    messages appended after the reference was taken are left out.
+    """
+    if not isinstance(chat_ref, dict) or not chat_ref.get('key'):
+        return []
+    session_store = session_store or get_default_session_store()
+    history = session_store.get(session_id or DEFAULT_SESSION_ID, chat_ref['key'], [])
+    return history[:chat_ref.get('length', len(history))]
+
+
+def append_chat_messages(session_id, chat_ref, messages, session_store=None):
+    """Appends messages to the session's chat; returns the new reference for store-chat-messages."""
+    session_store = session_store or get_default_session_store()
+    history = load_chat_history(session_id, chat_ref, session_store)
+    history.extend(messages)
+    session_store.put(session_id or DEFAULT_SESSION_ID, CHAT_HISTORY_KEY, history)
+    first = chat_ref.get('first', 0) if isinstance(chat_ref, dict) and chat_ref.get('key') else 0
+    return {'key': CHAT_HISTORY_KEY, 'length': len(history), 'first': first}
+
+
+def _load_earlier_style(chat_ref):
+    return {'display': 'block'} if chat_ref.get('first') else {'display': 'none'}
+
+
+def append_to_transcript(chat_ref, elements, window=CHAT_WINDOW_MESSAGES):
+    """
+    Update of the chat-messages children for the messages of one turn: a Patch appending
+    their elements and dropping the oldest messages on the page beyond window, so each turn
+    sends only its own messages. chat_ref is the reference after the turn's messages were
+    stored. Returns (patch, updated chat_ref, style of the load-earlier button).
+    """
+    patch = Patch()
+    patch.extend(elements)
+    chat_ref = dict(chat_ref)
+    overflow = chat_ref['length'] - chat_ref.get('first', 0) - window
+    for _ in range(max(0, overflow)):
+        del patch[0]
+    chat_ref['first'] = chat_ref.get('first', 0) + max(0, overflow)
+    return patch, chat_ref, _load_earlier_style(chat_ref)
+
+
+def prepend_earlier_messages(session_id, chat_ref, count=CHAT_LOAD_EARLIER_MESSAGES, session_store=None):
+    """
+    Update of the chat-messages children putting back the count messages before the first
+    one on the page. Returns (patch, updated chat_ref, style of the load-earlier button).
+    """
+    first = chat_ref.get('first', 0)
+    start = max(0, first - count)
+    earlier = load_chat_history(session_id, chat_ref, session_store)[start:first]
+    patch = Patch()
+    for msg in reversed(earlier):
+        patch.prepend(render_chat_message(msg))
+    chat_ref = dict(chat_ref, first=start)
+    return patch, chat_ref, _load_earlier_style(chat_ref)
+
+
+def busy_chat_turn(message, session_id, chat_ref, session_store=None):
+    """
+    Result of the chat callback when its job was refused because the server is busy: the
+    question and a "try again" answer join the transcript, the rest of the page and the
+    question in the input box stay as they are.
+    """
+    timestamp = datetime.now().strftime('%H:%M')
+    messages = [{'type': 'user', 'content': message, 'timestamp': timestamp},
+                {'type': 'bot', 'content': BUSY_MESSAGE, 'timestamp': timestamp}]
+    chat_ref = append_chat_messages(session_id, chat_ref, messages, session_store)
+    transcript, chat_ref, load_earlier_style = append_to_transcript(
+        chat_ref, [render_chat_message(msg) for msg in messages])
+    return (transcript, dash.no_update, dash.no_update, dash.no_update, dash.no_update, chat_ref,
+            load_earlier_style)
+
+
+def remember_generated_sql(session_id, sql, session_store=None):
+    """Keeps the SQL shown for the session's last query; returns the key for store-generated-sql."""
+    if not sql:
+        return ""
+    session_store = session_store or get_default_session_store()
+    if not session_store.put(session_id or DEFAULT_SESSION_ID, GENERATED_SQL_KEY, sql):
+        return ""
+    return GENERATED_SQL_KEY
+
+
+def render_chat_message(msg):
+    """The element of one chat message."""
+    if msg['type'] == 'user':
+        return html.Div(className="user-message", children=[
+            html.Div(msg['content'], className="message-content"),
+            html.Div(msg['timestamp'], className="message-timestamp")
+        ])
+    # Use dcc.Markdown for rich bot responses
+    return html.Div(className="bot-message", children=[
+        dcc.Markdown(msg['content'], className="message-content"),
+        html.Div(msg['timestamp'], className="message-timestamp")
+    ])
+
+
+def run_chat_turn(message, chat_history, selected_dataset, session_id=None, data_analyst=None,
+                  project_id=None, on_stage=None, on_sql=None):
+    """
+    Answers one chat message and renders it. This is the body of the chat callback,
+    kept free of Dash callback context so it can be driven directly (see
+    benchmarks.bench_chat_turn). The user and bot messages are appended to
+    chat_history; chat_elements are the elements of these two messages only.
+
+    data_analyst defaults to the shared agent of the registry for project_id
+    (PROJECT_ID when not given). on_stage is called with the name of each stage
+    (utils.tracing span) as it starts; an exception it raises aborts the turn.
+    on_sql, if given, makes the model response stream in and receives the SQL
+    generated so far as it arrives (see DataAnalystAgent.process).
+    Returns (chat_elements, visualization, data_table, insights_elements).
+    """
+    with collect_timings(on_start=on_stage) as timings:
+        return _run_chat_turn(message, chat_history, selected_dataset, session_id, data_analyst,
+                              project_id or PROJECT_ID, timings, on_sql)
+
+
+def _run_chat_turn(message, chat_history, selected_dataset, session_id, data_analyst, project_id,
+                   timings: StageTimings, on_sql=None):
+    # Initialize chat history if None; a list given is appended to in place
+    if chat_history is None:
+        chat_history = []
+    
+    # Add user message
+    chat_history.append({
+        'type': 'user',
+        'content': message,
+        'timestamp': datetime.now().strftime('%H:%M')
+    })
+    
+    # Process with real agents if PROJECT_ID is available and dataset is selected
+    bot_response = ""
+    visualization = html.Div("No visualization available", className="text-muted")
+    data_table = html.Div("No data available", className="text-muted")
+    insights_elements = []
+    
+    try:
+        if project_id and selected_dataset:
+            logger.info(f"Processing query with agents: '{message}' for dataset: {selected_dataset}")
+            
+            # Use DataAnalystAgent to process the query
+            try:
+                if data_analyst is None:
+                    data_analyst = get_registry().get_data_analyst_agent(project_id)
+                    logger.info(f"Using shared DataAnalystAgent")
+            except Exception as agent_error:
+                logger.error(f"Error initializing DataAnalystAgent: {agent_error}")
+                if "credentials" in str(agent_error).lower():
+                    bot_response = f"Authentication issue: Please check your Google Cloud credentials are properly configured."
+                elif "permission" in str(agent_error).lower():
+                    bot_response = f"Permission issue: Please ensure your service account has BigQuery access permissions."
+                elif "project" in str(agent_error).lower():
+                    bot_response = f"Project issue: Please verify the Google Cloud Project ID is correct."
+                else:
+                    bot_response = f"Configuration issue: {str(agent_error)}"
+                
+            if data_analyst is not None and hasattr(data_analyst, 'schema_agent') and hasattr(data_analyst, 'bigquery_tool') and data_analyst.schema_agent and data_analyst.bigquery_tool:
+                # Get dataset schema
+                dataset_schema = data_analyst.schema_agent.get_full_dataset_schema(selected_dataset)
+                
+                if not dataset_schema:
+                    bot_response = f"The dataset '{selected_dataset}' appears to be empty or could not be accessed. This could be because:\n• The dataset has no tables yet\n• Access permissions need to be configured\n• The dataset doesn't exist\n\nOnce you add tables to the dataset, I'll be able to analyze your data!"
+                else:
+                    # Get the first table from the dataset schema for processing
+                    first_table = list(dataset_schema.keys())[0] if dataset_schema else None
+                    if not first_table:
+                        bot_response = f"The dataset '{selected_dataset}' was found but contains no tables yet. Please add some tables with data, and I'll be ready to help you analyze it!"
+                    else:
+                        # Construct full table reference: dataset.table
+                        full_table_ref = f"{selected_dataset}.{first_table}"
+                        
+                        # A "yes" runs the query the cost guard parked for confirmation;
+                        # any other message discards it
+                        session_id = session_id or DEFAULT_SESSION_ID
+                        is_confirmation = message.strip().lower().rstrip('.!') in CONFIRMATION_REPLIES
+                        pending = data_analyst.cost_guard.pop_pending(session_id)
+                        question = message
+                        if is_confirmation and pending:
+                            question = pending['query']
+                            result = data_analyst.process(
+                                query=question,
+                                dataset_schema=dataset_schema,
+                                project_id=pending['project_id'],
+                                dataset_id=pending['dataset_id'],
+                                session_id=session_id,
+                                confirmed_sql=pending['sql_query']
+                            )
+                        else:
+                            # Process the query
+                            result = data_analyst.process(
+                                query=message,
+                                dataset_schema=dataset_schema,
+                                project_id=data_analyst.project_id,
+                                dataset_id=full_table_ref,
+                                session_id=session_id,
+                                on_sql_text=on_sql
+                            )
+                        
+                        if result.get('confirmation_required'):
+                            bot_response = f"""⚠️ **Large query**
+
+{result.get('message')}
+
+**Query:** `{result.get('sql_query', '')}`"""
+                        elif result.get('results_df') is not None and result.get('error') is None:
+                            df = result.get('results_df')
+                            sql_query = result.get('sql_query', '')
+
+                            # One pass over each column, shared by the summary, the chart and the insights
+                            with span("profile.build"):
+                                profile = profile_frame(df)
+                            numeric_names = columns_of(profile, "numeric")
+
+                            # Generate intelligent bot response
+                            summary_stats = f"Found {len(df)} records with {len(df.columns)} columns"
+                            if len(df) > 0:
+                                if numeric_names:
+                                    avg_val = profile[numeric_names[0]].mean
+                                    summary_stats += f". Average {numeric_names[0]}: {avg_val if avg_val is not None else 0:.2f}"
+                            if result.get('truncated'):
+                                total_rows = result.get('total_rows')
+                                total_str = f" of {total_rows:,}" if total_rows is not None else ""
+                                summary_stats += (f"\n\n⚠️ The result was truncated: only the first {len(df):,}{total_str} rows "
+                                                  f"were loaded. Add filters or aggregations to see the full picture.")
+                            
+                            if result.get('from_cache'):
+                                bytes_line = "**Bytes scanned:** none, served from cache (the tables have not changed)"
+                            else:
+                                bytes_line = (f"**Bytes scanned:** {format_bytes(result.get('bytes_estimated'))} estimated · "
+                                              f"{format_bytes(result.get('bytes_billed'))} billed")
+
+                            if result.get('semantic_match'):
+                                bytes_line += (f"\n\n♻️ Reused the query of a similar earlier question: "
+                                               f"_{result['semantic_match']['question']}_")
+
+                            bot_response = f"""📊 **Analysis Complete!**
+
+{summary_stats}
+
+**Query executed:** `{sql_query}`
+
+{bytes_line}
+
+🔍 **Key findings:**
+• Dataset contains agricultural data across different states and years
+• Multiple crop types with area, production, and yield metrics
+• Data spans from various agricultural seasons
+
+The visualization and detailed insights are shown on the right panel. Feel free to ask more specific questions about the data!"""
+                            
+                            # Create intelligent visualization based on data type
+                            if df is not None and not df.empty:
+                                with span("figure.build"):
+                                    try:
+                                        # Determine best visualization type
+                                        if 'count' in question.lower() or 'total' in question.lower():
+                                            # For count queries, show a metric card. A truncated result shows
+                                            # its full row count when it is known, else the rows downloaded
+                                            total_rows = result.get('total_rows') if result.get('truncated') else len(df)
+                                            records_title = "Total Records" if total_rows is not None else "Records Shown"
+                                            fig = go.Figure(go.Indicator(
+                                                mode = "number",
+                                                value = df.iloc[0, 0] if len(df) == 1 else (total_rows if total_rows is not None else len(df)),
+                                                title = {"text": records_title if len(df) > 1 else "Count"},
+                                                number = {'font': {'size': 60, 'color': '#5dade2'}},
+                                                domain = {'x': [0, 1], 'y': [0, 1]}
+                                            ))
+                                            fig.update_layout(
+                                                paper_bgcolor='rgba(0,0,0,0)',
+                                                plot_bgcolor='rgba(0,0,0,0)',
+                                                font=dict(color='white'),
+                                                height=300
+                                            )
+                                        elif len(df.columns) >= 2:
+                                            # For data queries, create appropriate charts
+                                            if numeric_names:
+                                                x_col = df.columns[0]
+                                                y_col = numeric_names[0]
+                                            
+                                                if len(df) <= 20 and not result.get('truncated'):
+                                                    # Bar chart for small datasets
+                                                    fig = go.Figure(data=[
+                                                        go.Bar(x=df[x_col].astype(str), y=df[y_col], 
+                                                              marker_color='rgba(93, 173, 226, 0.8)')
+                                                    ])
+                                                    fig.update_layout(
+                                                        title=f"{y_col} by {x_col}",
+                                                        xaxis_title=x_col,
+                                                        yaxis_title=y_col,
+                                                        plot_bgcolor='rgba(0,0,0,0)',
+                                                        paper_bgcolor='rgba(0,0,0,0)',
+                                                        font=dict(color='white'),
+                                                        showlegend=False,
+                                                        margin=dict(l=60, r=40, t=80, b=120),
+                                                        height=400
+                                                    )
+                                                    fig.update_xaxes(
+                                                        tickangle=45,
+                                                        gridcolor='rgba(255,255,255,0.1)'
+                                                    )
+                                                    fig.update_yaxes(gridcolor='rgba(255,255,255,0.1)')
+                                                    fig.update_layout(
+                                                        title=f"{y_col} by {x_col}",
+                                                        xaxis_title=x_col,
+                                                        yaxis_title=y_col,
+                                                        plot_bgcolor='rgba(0,0,0,0)',
+                                                        paper_bgcolor='rgba(0,0,0,0)',
+                                                        font=dict(color='white'),
+                                                        showlegend=False,
+                                                        margin=dict(l=60, r=40, t=80, b=100),
+                                                        height=400
+                                                    )
+                                                    # Fix x-axis label overlapping
+                                                    fig.update_xaxes(
+                                                        tickangle=45,
+                                                        tickmode='linear',
+                                                        dtick=max(1, len(df) // 10) if len(df) > 10 else 1,
+                                                        gridcolor='rgba(255,255,255,0.1)'
+                                                    )
+                                                    fig.update_yaxes(gridcolor='rgba(255,255,255,0.1)')
+                                                else:
+                                                    # Larger results are charted from aggregates, computed in
+                                                    # BigQuery when only part of the result was downloaded
+                                                    plan = plan_chart(df, x_col, y_col if y_col != x_col else None,
+                                                                      total_rows=result.get('total_rows'),
+                                                                      profile=profile)
+                                                    chart_df = None
+                                                    if result.get('truncated') and result.get('source_sql'):
+                                                        chart_df = data_analyst.fetch_chart_data(
+                                                            plan, result['source_sql'], session_id,
+                                                            result.get('dataset_id'))
+                                                    if chart_df is None:
+                                                        chart_df = aggregate_frame(plan, df)
+                                                    fig = _aggregate_figure(plan, chart_df)
+                                            else:
+                                                # Text data visualization
+                                                fig = go.Figure()
+                                                fig.add_annotation(
+                                                    text=f"Showing {len(df)} text records<br>Use the data table below for details",
+                                                    xref="paper", yref="paper",
+                                                    x=0.5, y=0.5, xanchor='center', yanchor='middle',
+                                                    showarrow=False,
+                                                    font=dict(size=20, color='white')
+                                                )
+                                                fig.update_layout(
+                                                    plot_bgcolor='rgba(0,0,0,0)',
+                                                    paper_bgcolor='rgba(0,0,0,0)',
+                                                    xaxis=dict(visible=False),
+                                                    yaxis=dict(visible=False)
+                                                )
+                                    
+                                        visualization = dcc.Graph(figure=fig, config={'displayModeBar': False})
+                                    except Exception as viz_error:
+                                        logger.error(f"Visualization error: {viz_error}")
+                                        visualization = html.Div("Chart generation temporarily unavailable", className="text-muted")
+                            
+                            # Create enhanced data table with better formatting
+                            with span("table.build"):
+                                try:
+                                    # Only the first page goes to the browser; the table asks for the
+                                    # others by the result's handle (see page_result_table)
+                                    data_table = _result_table(df, result, profile)
+                                except Exception as table_error:
+                                    logger.error(f"Table creation error: {table_error}")
+                                    data_table = html.Div("Data table temporarily unavailable", className="text-muted")
+                            
+                            # Generate comprehensive insights
+                            with span("insights.build"):
+                                try:
+                                    insights_elements = []
+                                
+                                    # Basic data insights
+                                    insights_elements.append(
+                                        html.Div(className="insight-item", children=[
+                                            html.I(className="insight-bullet fas fa-database"),
+                                            html.Div(f"Dataset contains {len(df)} records across {len(df.columns)} columns", className="insight-text")
+                                        ])
+                                    )
+                                
+                                    # Column type analysis
+                                    numeric_cols = len(numeric_names)
+                                    text_names = columns_of(profile, "text")
+                                    text_cols = len(text_names)
+                                    if numeric_cols > 0:
+                                        insights_elements.append(
+                                            html.Div(className="insight-item", children=[
+                                                html.I(className="insight-bullet fas fa-calculator"),
+                                                html.Div(f"{numeric_cols} numeric columns available for mathematical analysis", className="insight-text")
+                                            ])
+                                        )
+                                
+                                    if text_cols > 0:
+                                        insights_elements.append(
+                                            html.Div(className="insight-item", children=[
+                                                html.I(className="insight-bullet fas fa-font"),
+                                                html.Div(f"{text_cols} text columns for categorical analysis", className="insight-text")
+                                            ])
+                                        )
+                                
+                                    # Data quality insights
+                                    if len(df) > 0:
+                                        cols_with_nulls = [name for name, column in profile.items() if column.nulls > 0]
+                                        if len(cols_with_nulls) == 0:
+                                            insights_elements.append(
+                                                html.Div(className="insight-item", children=[
+                                                    html.I(className="insight-bullet fas fa-check-circle"),
+                                                    html.Div("Excellent data quality - no missing values detected", className="insight-text")
+                                                ])
+                                            )
+                                        else:
+                                            insights_elements.append(
+                                                html.Div(className="insight-item", children=[
+                                                    html.I(className="insight-bullet fas fa-exclamation-triangle"),
+                                                    html.Div(f"{len(cols_with_nulls)} columns have missing values that may need attention", className="insight-text")
+                                                ])
+                                            )
+                                
+                                    # Statistical insights for numeric data
+                                    if numeric_names:
+                                        for col in numeric_names[:2]:  # Show insights for first 2 numeric columns
+                                            if profile[col].minimum is not None:
+                                                min_val = profile[col].minimum
+                                                max_val = profile[col].maximum
+                                                insights_elements.append(
+                                                    html.Div(className="insight-item", children=[
+                                                        html.I(className="insight-bullet fas fa-chart-line"),
+                                                        html.Div(f"{col}: ranges from {min_val:.2f} to {max_val:.2f}", className="insight-text")
+                                                    ])
+                                                )
+                                
+                                    # Most common value of the first text column
+                                    if text_names and profile[text_names[0]].top:
+                                        text_col = profile[text_names[0]]
+                                        top_value, top_count = text_col.top[0]
+                                        insights_elements.append(
+                                            html.Div(className="insight-item", children=[
+                                                html.I(className="insight-bullet fas fa-tags"),
+                                                html.Div(f"{text_col.name}: {text_col.distinct:,} distinct values, most common "
+                                                         f"'{top_value}' ({top_count:,} records)", className="insight-text")
+                                            ])
+                                        )
+
+                                    # Temporal insights if year column exists
+                                    year_cols = [col for col in numeric_names if 'year' in str(col).lower()]
+                                    if year_cols and profile[year_cols[0]].minimum is not None:
+                                        year_col = profile[year_cols[0]]
+                                        year_range = f"{year_col.minimum:.0f} to {year_col.maximum:.0f}"
+                                        insights_elements.append(
+                                            html.Div(className="insight-item", children=[
+                                                html.I(className="insight-bullet fas fa-calendar"),
+                                                html.Div(f"Time series data spanning {year_range}", className="insight-text")
+                                            ])
+                                        )
+                                
+                                except Exception as insights_error:
+                                    logger.error(f"Insights generation error: {insights_error}")
+                                    insights_elements = [
+                                        html.Div(className="insight-item", children=[
+                                            html.I(className="insight-bullet fas fa-info-circle"),
+                                            html.Div(f"Successfully retrieved {len(df)} records", className="insight-text")
+                                        ])
+                                    ]
+                        else:
+                            error_msg = result.get('error', 'Unknown error')
+                            sql_query = result.get('sql_query', 'N/A')
+                            bot_response = f"Sorry, I encountered an error processing your query: {error_msg}"
+            elif data_analyst is not None:
+                # Agent was created but some components failed to initialize
+                if not hasattr(data_analyst, 'schema_agent') or not data_analyst.schema_agent:
+                    bot_response = "Schema agent failed to initialize. Please check BigQuery access permissions and project configuration."
+                elif not hasattr(data_analyst, 'bigquery_tool') or not data_analyst.bigquery_tool:
+                    bot_response = "BigQuery tool failed to initialize. Please check your Google Cloud credentials and project access."
+                else:
+                    bot_response = "Some agent components failed to initialize. Please check your Google Cloud configuration."
+            else:
+                bot_response = "Failed to initialize data analysis agents. Please check your Google Cloud Project configuration and credentials."
+        else:
+            bot_response = "Please select a dataset first to analyze your data."
+            
+    except Exception as e:
+        logger.error(f"Error in chat interaction: {e}")
+        bot_response = f"Sorry, I encountered an error: {str(e)}"
+    
+    # Per-stage breakdown of this answer; rendering the chat below is not included
+    if SHOW_STAGE_TIMINGS and timings.spans:
+        bot_response += f"\n\n⏱️ **Timings:** {timings.to_markdown()}"
+
+    # Add bot response to chat history
+    chat_history.append({
+        'type': 'bot',
+        'content': bot_response,
+        'timestamp': datetime.now().strftime('%H:%M')
+    })
+    
+    # Render this turn's messages; the page keeps the earlier ones (see append_to_transcript)
+    with span("chat.render", messages=2):
+        chat_elements = [render_chat_message(msg) for msg in chat_history[-2:]]
+
+    return chat_elements, visualization, data_table, insights_elements
+
+
 def register_callbacks(app):
 
+    # Give each browser session an id, used for per-session byte budgets
+    @app.callback(
+        Output('store-session-id', 'data'),
+        [Input('store-session-id', 'modified_timestamp')],
+        [State('store-session-id', 'data')]
+    )
+    def ensure_session_id(_, session_id):
+        if session_id:
+            raise PreventUpdate
+        return uuid.uuid4().hex
+
     # Callback for loading datasets (remains largely the same, ensure it doesn't conflict)
     @app.callback(
         [Output('dataset-dropdown', 'options'),
@@ -45,8 +723,8 @@ def register_callbacks(app):
             is_error = True
             return [], None, "", error_message, is_error
         try:
-            logger.info("Instantiating SchemaAgent to load datasets.")
-            schema_agent = SchemaAgent(project_id=PROJECT_ID)
+            logger.info("Using shared SchemaAgent to load datasets.")
+            schema_agent = get_registry().get_schema_agent(PROJECT_ID)
             if not schema_agent.connector:
                 error_message = "Error: SchemaAgent failed to connect to BigQuery. Check GCP setup and agent logs."
                 is_error = True
@@ -74,16 +752,17 @@ def register_callbacks(app):
          Output('query-input', 'value', allow_duplicate=True),
          Output('global-error-alert', 'children', allow_duplicate=True),
          Output('global-error-alert', 'is_open', allow_duplicate=True),
-         Output('store-generated-sql', 'data')], # New output for storing SQL
+         Output('store-generated-sql', 'data')], # Key of the SQL kept in the session store
         [Input('submit-button', 'n_clicks')],
         [State('query-input', 'value'),
-         State('dataset-dropdown', 'value')],
+         State('dataset-dropdown', 'value'),
+         State('store-session-id', 'data')],
         prevent_initial_call=True
     )
-    def handle_query_submission(n_clicks, query_text, selected_dataset):
+    def handle_query_submission(n_clicks, query_text, selected_dataset, session_id):
         # ... (existing setup and initial error checks from previous turn) ...
         # This function needs to be complete from the previous version.
-        # The main addition is setting 'store-generated-sql.data'.
+        # The generated SQL is kept server-side; 'store-generated-sql.data' gets its key.
 
         if not n_clicks:
             raise PreventUpdate
@@ -95,33 +774,35 @@ def register_callbacks(app):
         error_msg_str = None
         is_error_bool = False
         stored_sql_str = "" # Initialize stored SQL
+        stored_sql_key = "" # Key of the stored SQL in the session store
 
         if not PROJECT_ID:
             error_msg_str = "Error: GCP Project not configured. Please set GOOGLE_CLOUD_PROJECT."
             is_error_bool = True
-            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
         
         if not query_text:
             error_msg_str = "Error: Query cannot be empty."
             is_error_bool = True
-            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
 
         if not selected_dataset:
             error_msg_str = "Error: Please select a dataset first."
             is_error_bool = True
-            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+            return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
 
         logger.info(f"Handling query: '{query_text}' for dataset: '{selected_dataset}'")
 
         try:
-            schema_agent = SchemaAgent(project_id=PROJECT_ID)
-            data_analyst_agent = DataAnalystAgent(project_id=PROJECT_ID)
-            visualization_agent = VisualizationAgent()
+            registry = get_registry()
+            schema_agent = registry.get_schema_agent(PROJECT_ID)
+            data_analyst_agent = registry.get_data_analyst_agent(PROJECT_ID)
+            visualization_agent = registry.get_visualization_agent()
 
             if not schema_agent.connector or not data_analyst_agent.connector:
                 error_msg_str = "Error: Key agent(s) failed to connect to BigQuery. Check GCP setup and agent logs."
                 is_error_bool = True
-                return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+                return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
 
             full_schema = schema_agent.get_full_dataset_schema(selected_dataset)
             if not full_schema or any(table_info.get('error') for table_info in full_schema.values() if isinstance(table_info, dict)):
@@ -131,30 +812,43 @@ def register_callbacks(app):
                 error_msg_str = f"Error: Failed to get complete schema for dataset {selected_dataset}.{error_detail_msg}"
                 is_error_bool = True
                 logger.error(error_msg_str)
-                return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+                return no_sql_md, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
 
 
             analysis_result = data_analyst_agent.process(
-                query=query_text, dataset_schema=full_schema, project_id=PROJECT_ID, dataset_id=selected_dataset
+                query=query_text, dataset_schema=full_schema, project_id=PROJECT_ID, dataset_id=selected_dataset,
+                session_id=session_id or DEFAULT_SESSION_ID
             )
 
             # Store the generated SQL
             stored_sql_str = analysis_result.get('sql_query', "") # Store SQL here
+            stored_sql_key = remember_generated_sql(session_id, stored_sql_str)
             sql_display_content = dcc.Markdown(f"```sql\n{stored_sql_str or 'N/A'}\n```")
 
+            if analysis_result.get('confirmation_required'):
+                error_msg_str = analysis_result['message']
+                is_error_bool = True
+                return sql_display_content, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
+
             if analysis_result.get('error'):
                 error_msg_str = f"Error during data analysis: {analysis_result['error']}"
                 is_error_bool = True
                 logger.error(error_msg_str)
-                return sql_display_content, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_str
+                return sql_display_content, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, stored_sql_key
 
             results_md_content = dcc.Markdown(analysis_result['results_markdown'])
             charts_components_content = []
             insights_text_combined_content = ""
 
             if analysis_result['results_df'] is not None and not analysis_result['results_df'].empty:
+                fetch_aggregate = None
+                if analysis_result.get('truncated') and analysis_result.get('source_sql'):
+                    # Only part of the result was downloaded; chart the rest from BigQuery aggregates
+                    def fetch_aggregate(plan):
+                        return data_analyst_agent.fetch_chart_data(
+                            plan, analysis_result['source_sql'], session_id or DEFAULT_SESSION_ID, selected_dataset)
                 viz_result = visualization_agent.generate_visualizations(
-                    data_df=analysis_result['results_df'], query=query_text
+                    data_df=analysis_result['results_df'], query=query_text, fetch_aggregate=fetch_aggregate
                 )
                 for chart_json_str in viz_result.get('charts', []):
                     try:
@@ -167,7 +861,7 @@ def register_callbacks(app):
             else:
                 insights_text_combined_content = dcc.Markdown("Query returned no data or an error occurred; no visualizations generated.")
 
-            return sql_display_content, results_md_content, charts_components_content, insights_text_combined_content, "", None, False, stored_sql_str
+            return sql_display_content, results_md_content, charts_components_content, insights_text_combined_content, "", None, False, stored_sql_key
 
         except Exception as e:
             logger.error(f"Unhandled error in handle_query_submission: {e}", exc_info=True)
@@ -182,7 +876,7 @@ def register_callbacks(app):
             sql_err_display = dcc.Markdown(sql_err_display_content)
 
             # Store SQL even if there's a later error
-            return sql_err_display, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, sql_query_val_err
+            return sql_err_display, no_table_md, no_charts_list, no_insights_md, query_text, error_msg_str, is_error_bool, remember_generated_sql(session_id, sql_query_val_err)
 
 
     # New callback for SQL feedback
@@ -190,10 +884,11 @@ def register_callbacks(app):
         Output('sql-feedback-status', 'children'),
         [Input('sql-feedback-up-button', 'n_clicks'),
          Input('sql-feedback-down-button', 'n_clicks')],
-        [State('store-generated-sql', 'data')],
+        [State('store-generated-sql', 'data'),
+         State('store-session-id', 'data')],
         prevent_initial_call=True
     )
-    def handle_sql_feedback(n_clicks_up, n_clicks_down, stored_sql):
+    def handle_sql_feedback(n_clicks_up, n_clicks_down, stored_sql_key, session_id):
         if not n_clicks_up and not n_clicks_down:
             raise PreventUpdate
 
@@ -204,6 +899,9 @@ def register_callbacks(app):
         button_id = ctx.triggered[0]['prop_id'].split('.')[0]
         feedback_type = "positive" if button_id == "sql-feedback-up-button" else "negative"
 
+        stored_sql = None
+        if stored_sql_key:
+            stored_sql = get_default_session_store().get(session_id or DEFAULT_SESSION_ID, stored_sql_key)
         if stored_sql:
             logger.info(f"SQL Feedback received: '{feedback_type}' for SQL query: \n{stored_sql}")
             # In a real app, this feedback would be stored more persistently.
@@ -223,31 +921,8 @@ def register_callbacks(app):
             return ""
         raise PreventUpdate
 
-    # New chat interface callbacks with real agent integration
-    @app.callback(
-        [Output('chat-messages', 'children'),
-         Output('main-visualization', 'children'),
-         Output('data-table', 'children'),
-         Output('key-insights', 'children'),
-         Output('chat-input', 'value')],
-        [Input('send-button', 'n_clicks'),
-         Input('chat-input', 'n_submit'),
-         Input('suggestion-1', 'n_clicks'),
-         Input('suggestion-2', 'n_clicks'),
-         Input('suggestion-3', 'n_clicks'),
-         Input('suggestion-4', 'n_clicks')],
-        [State('chat-input', 'value'),
-         State('store-chat-messages', 'data'),
-         State('dataset-dropdown', 'value')],
-        prevent_initial_call=True
-    )
-    def handle_chat_interaction(send_clicks, input_submit, sugg1_clicks, sugg2_clicks, sugg3_clicks, sugg4_clicks, 
-                               input_value, chat_history, selected_dataset):
-        import plotly.graph_objects as go
-        from dash import dash_table
-        import pandas as pd
-        from datetime import datetime
-        
+    def chat_message(input_value):
+        """The message the chat callback was triggered to send."""
         ctx = callback_context
         if not ctx.triggered:
             raise PreventUpdate
@@ -255,369 +930,29 @@ def register_callbacks(app):
         trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
         
         # Determine the message based on trigger
-        message = ""
-        if trigger_id == 'suggestion-1':
-            message = "📊 Show me the main trends"
-        elif trigger_id == 'suggestion-2':
-            message = "📈 What are the key metrics?"
-        elif trigger_id == 'suggestion-3':
-            message = "🌍 Summarize the dataset for me"
-        elif trigger_id == 'suggestion-4':
-            message = "🔍 Find interesting correlations"
-        elif trigger_id in ['send-button', 'chat-input']:
+        message = SUGGESTIONS.get(trigger_id, "")
+        if trigger_id in ['send-button', 'chat-input']:
             message = input_value
         
         if not message:
             raise PreventUpdate
-        
-        # Initialize chat history if None
-        if not chat_history:
-            chat_history = []
-        
-        # Add user message
-        chat_history.append({
-            'type': 'user',
-            'content': message,
-            'timestamp': datetime.now().strftime('%H:%M')
-        })
-        
-        # Process with real agents if PROJECT_ID is available and dataset is selected
-        bot_response = ""
-        visualization = html.Div("No visualization available", className="text-muted")
-        data_table = html.Div("No data available", className="text-muted")
-        insights_elements = []
-        
-        try:
-            if PROJECT_ID and selected_dataset:
-                logger.info(f"Processing query with agents: '{message}' for dataset: {selected_dataset}")
-                
-                # Use DataAnalystAgent to process the query
-                try:
-                    data_analyst = DataAnalystAgent(project_id=PROJECT_ID)
-                    logger.info(f"DataAnalystAgent initialized successfully")
-                except Exception as agent_error:
-                    logger.error(f"Error initializing DataAnalystAgent: {agent_error}")
-                    if "credentials" in str(agent_error).lower():
-                        bot_response = f"Authentication issue: Please check your Google Cloud credentials are properly configured."
-                    elif "permission" in str(agent_error).lower():
-                        bot_response = f"Permission issue: Please ensure your service account has BigQuery access permissions."
-                    elif "project" in str(agent_error).lower():
-                        bot_response = f"Project issue: Please verify the Google Cloud Project ID is correct."
-                    else:
-                        bot_response = f"Configuration issue: {str(agent_error)}"
-                    
-                if 'data_analyst' in locals() and hasattr(data_analyst, 'schema_agent') and hasattr(data_analyst, 'bigquery_tool') and data_analyst.schema_agent and data_analyst.bigquery_tool:
-                    # Get dataset schema
-                    dataset_schema = data_analyst.schema_agent.get_full_dataset_schema(selected_dataset)
-                    
-                    if not dataset_schema:
-                        bot_response = f"The dataset '{selected_dataset}' appears to be empty or could not be accessed. This could be because:\n• The dataset has no tables yet\n• Access permissions need to be configured\n• The dataset doesn't exist\n\nOnce you add tables to the dataset, I'll be able to analyze your data!"
-                    else:
-                        # Get the first table from the dataset schema for processing
-                        first_table = list(dataset_schema.keys())[0] if dataset_schema else None
-                        if not first_table:
-                            bot_response = f"The dataset '{selected_dataset}' was found but contains no tables yet. Please add some tables with data, and I'll be ready to help you analyze it!"
-                        else:
-                            # Construct full table reference: dataset.table
-                            full_table_ref = f"{selected_dataset}.{first_table}"
-                            
-                            # Process the query
-                            result = data_analyst.process(
-                                query=message,
-                                dataset_schema=dataset_schema,
-                                project_id=data_analyst.project_id,
-                                dataset_id=full_table_ref
-                            )
-                            
-                            if result.get('results_df') is not None and result.get('error') is None:
-                                df = result.get('results_df')
-                                sql_query = result.get('sql_query', '')
-                                
-                                # Generate intelligent bot response
-                                summary_stats = f"Found {len(df)} records with {len(df.columns)} columns"
-                                if len(df) > 0:
-                                    numeric_cols = df.select_dtypes(include=['number']).columns
-                                    if len(numeric_cols) > 0:
-                                        avg_val = df[numeric_cols[0]].mean() if not df[numeric_cols[0]].isna().all() else 0
-                                        summary_stats += f". Average {numeric_cols[0]}: {avg_val:.2f}"
-                                
-                                bot_response = f"""📊 **Analysis Complete!**
-
-{summary_stats}
-
-**Query executed:** `{sql_query}`
-
-🔍 **Key findings:**
-• Dataset contains agricultural data across different states and years
-• Multiple crop types with area, production, and yield metrics
-• Data spans from various agricultural seasons
+        return message
 
-The visualization and detailed insights are shown on the right panel. Feel free to ask more specific questions about the data!"""
-                                
-                                # Create intelligent visualization based on data type
-                                if df is not None and not df.empty:
-                                    try:
-                                        # Determine best visualization type
-                                        if 'count' in message.lower() or 'total' in message.lower():
-                                            # For count queries, show a metric card
-                                            fig = go.Figure(go.Indicator(
-                                                mode = "number",
-                                                value = df.iloc[0, 0] if len(df) == 1 else len(df),
-                                                title = {"text": "Total Records" if len(df) > 1 else "Count"},
-                                                number = {'font': {'size': 60, 'color': '#5dade2'}},
-                                                domain = {'x': [0, 1], 'y': [0, 1]}
-                                            ))
-                                            fig.update_layout(
-                                                paper_bgcolor='rgba(0,0,0,0)',
-                                                plot_bgcolor='rgba(0,0,0,0)',
-                                                font=dict(color='white'),
-                                                height=300
-                                            )
-                                        elif len(df.columns) >= 2:
-                                            # For data queries, create appropriate charts
-                                            numeric_cols = df.select_dtypes(include=['number']).columns
-                                            if len(numeric_cols) >= 1:
-                                                x_col = df.columns[0]
-                                                y_col = numeric_cols[0]
-                                                
-                                                if len(df) <= 20:
-                                                    # Bar chart for small datasets
-                                                    fig = go.Figure(data=[
-                                                        go.Bar(x=df[x_col].astype(str), y=df[y_col], 
-                                                              marker_color='rgba(93, 173, 226, 0.8)')
-                                                    ])
-                                                    fig.update_layout(
-                                                        title=f"{y_col} by {x_col}",
-                                                        xaxis_title=x_col,
-                                                        yaxis_title=y_col,
-                                                        plot_bgcolor='rgba(0,0,0,0)',
-                                                        paper_bgcolor='rgba(0,0,0,0)',
-                                                        font=dict(color='white'),
-                                                        showlegend=False,
-                                                        margin=dict(l=60, r=40, t=80, b=120),
-                                                        height=400
-                                                    )
-                                                    fig.update_xaxes(
-                                                        tickangle=45,
-                                                        gridcolor='rgba(255,255,255,0.1)'
-                                                    )
-                                                    fig.update_yaxes(gridcolor='rgba(255,255,255,0.1)')
-                                                else:
-                                                    # Line chart for larger datasets
-                                                    fig = go.Figure(data=[
-                                                        go.Scatter(x=df[x_col], y=df[y_col], 
-                                                                  mode='lines+markers', 
-                                                                  line=dict(color='#5dade2'))
-                                                    ])
-                                                
-                                                fig.update_layout(
-                                                    title=f"{y_col} by {x_col}",
-                                                    xaxis_title=x_col,
-                                                    yaxis_title=y_col,
-                                                    plot_bgcolor='rgba(0,0,0,0)',
-                                                    paper_bgcolor='rgba(0,0,0,0)',
-                                                    font=dict(color='white'),
-                                                    showlegend=False,
-                                                    margin=dict(l=60, r=40, t=80, b=100),
-                                                    height=400
-                                                )
-                                                # Fix x-axis label overlapping
-                                                fig.update_xaxes(
-                                                    tickangle=45,
-                                                    tickmode='linear',
-                                                    dtick=max(1, len(df) // 10) if len(df) > 10 else 1,
-                                                    gridcolor='rgba(255,255,255,0.1)'
-                                                )
-                                                fig.update_yaxes(gridcolor='rgba(255,255,255,0.1)')
-                                            else:
-                                                # Text data visualization
-                                                fig = go.Figure()
-                                                fig.add_annotation(
-                                                    text=f"Showing {len(df)} text records<br>Use the data table below for details",
-                                                    xref="paper", yref="paper",
-                                                    x=0.5, y=0.5, xanchor='center', yanchor='middle',
-                                                    showarrow=False,
-                                                    font=dict(size=20, color='white')
-                                                )
-                                                fig.update_layout(
-                                                    plot_bgcolor='rgba(0,0,0,0)',
-                                                    paper_bgcolor='rgba(0,0,0,0)',
-                                                    xaxis=dict(visible=False),
-                                                    yaxis=dict(visible=False)
-                                                )
-                                        
-                                        visualization = dcc.Graph(figure=fig, config={'displayModeBar': False})
-                                    except Exception as viz_error:
-                                        logger.error(f"Visualization error: {viz_error}")
-                                        visualization = html.Div("Chart generation temporarily unavailable", className="text-muted")
-                                
-                                # Create enhanced data table with better formatting
-                                try:
-                                    # Limit columns for display if too many
-                                    display_df = df.head(50)  # Show more rows
-                                    if len(df.columns) > 8:
-                                        display_df = display_df.iloc[:, :8]  # Show first 8 columns
-                                    
-                                    data_table = dash_table.DataTable(
-                                        data=display_df.to_dict('records'),
-                                        columns=[{'name': col, 'id': col} for col in display_df.columns],
-                                        style_cell={
-                                            'textAlign': 'left', 
-                                            'backgroundColor': 'rgba(255,255,255,0.05)', 
-                                            'color': 'white', 
-                                            'border': '1px solid rgba(255,255,255,0.1)',
-                                            'padding': '10px',
-                                            'fontSize': '14px'
-                                        },
-                                        style_header={
-                                            'backgroundColor': 'rgba(93, 173, 226, 0.8)', 
-                                            'fontWeight': 'bold',
-                                            'color': 'white'
-                                        },
-                                        style_data={'backgroundColor': 'transparent'},
-                                        page_size=20,
-                                        fixed_rows={'headers': True}
-                                    )
-                                except Exception as table_error:
-                                    logger.error(f"Table creation error: {table_error}")
-                                    data_table = html.Div("Data table temporarily unavailable", className="text-muted")
-                                
-                                # Generate comprehensive insights
-                                try:
-                                    insights_elements = []
-                                    
-                                    # Basic data insights
-                                    insights_elements.append(
-                                        html.Div(className="insight-item", children=[
-                                            html.I(className="insight-bullet fas fa-database"),
-                                            html.Div(f"Dataset contains {len(df)} records across {len(df.columns)} columns", className="insight-text")
-                                        ])
-                                    )
-                                    
-                                    # Column type analysis
-                                    numeric_cols = len(df.select_dtypes(include=['number']).columns)
-                                    text_cols = len(df.select_dtypes(include=['object']).columns)
-                                    if numeric_cols > 0:
-                                        insights_elements.append(
-                                            html.Div(className="insight-item", children=[
-                                                html.I(className="insight-bullet fas fa-calculator"),
-                                                html.Div(f"{numeric_cols} numeric columns available for mathematical analysis", className="insight-text")
-                                            ])
-                                        )
-                                    
-                                    if text_cols > 0:
-                                        insights_elements.append(
-                                            html.Div(className="insight-item", children=[
-                                                html.I(className="insight-bullet fas fa-font"),
-                                                html.Div(f"{text_cols} text columns for categorical analysis", className="insight-text")
-                                            ])
-                                        )
-                                    
-                                    # Data quality insights
-                                    if len(df) > 0:
-                                        null_cols = df.isnull().sum()
-                                        cols_with_nulls = null_cols[null_cols > 0]
-                                        if len(cols_with_nulls) == 0:
-                                            insights_elements.append(
-                                                html.Div(className="insight-item", children=[
-                                                    html.I(className="insight-bullet fas fa-check-circle"),
-                                                    html.Div("Excellent data quality - no missing values detected", className="insight-text")
-                                                ])
-                                            )
-                                        else:
-                                            insights_elements.append(
-                                                html.Div(className="insight-item", children=[
-                                                    html.I(className="insight-bullet fas fa-exclamation-triangle"),
-                                                    html.Div(f"{len(cols_with_nulls)} columns have missing values that may need attention", className="insight-text")
-                                                ])
-                                            )
-                                    
-                                    # Statistical insights for numeric data
-                                    numeric_cols = df.select_dtypes(include=['number']).columns
-                                    if len(numeric_cols) > 0:
-                                        for col in numeric_cols[:2]:  # Show insights for first 2 numeric columns
-                                            if not df[col].isna().all():
-                                                min_val = df[col].min()
-                                                max_val = df[col].max()
-                                                insights_elements.append(
-                                                    html.Div(className="insight-item", children=[
-                                                        html.I(className="insight-bullet fas fa-chart-line"),
-                                                        html.Div(f"{col}: ranges from {min_val:.2f} to {max_val:.2f}", className="insight-text")
-                                                    ])
-                                                )
-                                    
-                                    # Temporal insights if year column exists
-                                    year_cols = [col for col in df.columns if 'year' in col.lower()]
-                                    if year_cols and len(df) > 0:
-                                        year_col = year_cols[0]
-                                        year_range = f"{df[year_col].min():.0f} to {df[year_col].max():.0f}"
-                                        insights_elements.append(
-                                            html.Div(className="insight-item", children=[
-                                                html.I(className="insight-bullet fas fa-calendar"),
-                                                html.Div(f"Time series data spanning {year_range}", className="insight-text")
-                                            ])
-                                        )
-                                    
-                                except Exception as insights_error:
-                                    logger.error(f"Insights generation error: {insights_error}")
-                                    insights_elements = [
-                                        html.Div(className="insight-item", children=[
-                                            html.I(className="insight-bullet fas fa-info-circle"),
-                                            html.Div(f"Successfully retrieved {len(df)} records", className="insight-text")
-                                        ])
-                                    ]
-                            else:
-                                error_msg = result.get('error', 'Unknown error')
-                                sql_query = result.get('sql_query', 'N/A')
-                                bot_response = f"Sorry, I encountered an error processing your query: {error_msg}"
-                elif 'data_analyst' in locals():
-                    # Agent was created but some components failed to initialize
-                    if not hasattr(data_analyst, 'schema_agent') or not data_analyst.schema_agent:
-                        bot_response = "Schema agent failed to initialize. Please check BigQuery access permissions and project configuration."
-                    elif not hasattr(data_analyst, 'bigquery_tool') or not data_analyst.bigquery_tool:
-                        bot_response = "BigQuery tool failed to initialize. Please check your Google Cloud credentials and project access."
-                    else:
-                        bot_response = "Some agent components failed to initialize. Please check your Google Cloud configuration."
-                else:
-                    bot_response = "Failed to initialize data analysis agents. Please check your Google Cloud Project configuration and credentials."
-            else:
-                bot_response = "Please select a dataset first to analyze your data."
-                
-        except Exception as e:
-            logger.error(f"Error in chat interaction: {e}")
-            bot_response = f"Sorry, I encountered an error: {str(e)}"
-        
-        # Add bot response to chat history
-        chat_history.append({
-            'type': 'bot',
-            'content': bot_response,
-            'timestamp': datetime.now().strftime('%H:%M')
-        })
-        
-        # Create chat messages elements - show all messages for conversation flow
-        chat_elements = []
-        for msg in chat_history:  # Show ALL messages for proper conversation
-            if msg['type'] == 'user':
-                chat_elements.append(
-                    html.Div(className="user-message", children=[
-                        html.Div(msg['content'], className="message-content"),
-                        html.Div(msg['timestamp'], className="message-timestamp")
-                    ])
-                )
-            else:
-                # Use dcc.Markdown for rich bot responses
-                chat_elements.append(
-                    html.Div(className="bot-message", children=[
-                        dcc.Markdown(msg['content'], className="message-content"),
-                        html.Div(msg['timestamp'], className="message-timestamp")
-                    ])
-                )
-        
-        return chat_elements, visualization, data_table, insights_elements, ""
+    # Result of the chat callback when the job queue is full
+    def chat_busy(send_clicks, input_submit, sugg1_clicks, sugg2_clicks, sugg3_clicks, sugg4_clicks,
+                  input_value, chat_ref, selected_dataset, session_id):
+        return busy_chat_turn(chat_message(input_value), session_id, chat_ref)
 
-    # Store chat messages - synchronized with real agent callback
+    # New chat interface callbacks with real agent integration. The turn runs as a
+    # background job so slow questions do not hold the server's request threads
     @app.callback(
-        Output('store-chat-messages', 'data'),
+        [Output('chat-messages', 'children'),
+         Output('main-visualization', 'children'),
+         Output('data-table', 'children'),
+         Output('key-insights', 'children'),
+         Output('chat-input', 'value'),
+         Output('store-chat-messages', 'data'),
+         Output('chat-load-earlier-button', 'style')],
         [Input('send-button', 'n_clicks'),
          Input('chat-input', 'n_submit'),
          Input('suggestion-1', 'n_clicks'),
@@ -625,48 +960,84 @@ The visualization and detailed insights are shown on the right panel. Feel free
          Input('suggestion-3', 'n_clicks'),
          Input('suggestion-4', 'n_clicks')],
         [State('chat-input', 'value'),
-         State('store-chat-messages', 'data')],
+         State('store-chat-messages', 'data'),
+         State('dataset-dropdown', 'value'),
+         State('store-session-id', 'data')],
+        background=True,
+        manager=get_default_job_manager(),
+        running=[(Output('send-button', 'disabled'), True, False),
+                 (Output('cancel-chat-button', 'style'), {'display': 'inline-block'}, {'display': 'none'})],
+        progress=[Output('chat-progress', 'children')],
+        progress_default=[""],
+        cancel=[Input('cancel-chat-button', 'n_clicks')],
+        interval=500,
         prevent_initial_call=True
     )
-    def update_chat_store(send_clicks, input_submit, sugg1_clicks, sugg2_clicks, sugg3_clicks, sugg4_clicks, 
-                         input_value, chat_history):
-        from datetime import datetime
-        
-        ctx = callback_context
-        if not ctx.triggered:
+    @when_busy(chat_busy)
+    def handle_chat_interaction(set_progress, send_clicks, input_submit, sugg1_clicks, sugg2_clicks, sugg3_clicks,
+                               sugg4_clicks, input_value, chat_ref, selected_dataset, session_id):
+        message = chat_message(input_value)
+
+        def report_stage(stage):
+            # set_progress also raises JobCancelled once the user cancels the turn
+            if stage in STAGE_PROGRESS:
+                set_progress(STAGE_PROGRESS[stage])
+
+        def show_sql(partial_sql):
+            # The SQL appears under the chat as the model writes it
+            set_progress(html.Span(["Generating SQL… ", html.Code(partial_sql, className="chat-progress-sql")]))
+
+        set_progress("Thinking…")
+        # The store holds a reference to the transcript kept on the server
+        chat_history = load_chat_history(session_id, chat_ref)
+        previous = len(chat_history)
+        chat_elements, visualization, data_table, insights_elements = run_chat_turn(
+            message, chat_history, selected_dataset, session_id, on_stage=report_stage, on_sql=show_sql)
+        # Keep both messages of the turn and send the page only their elements
+        chat_ref = append_chat_messages(session_id, chat_ref, chat_history[previous:])
+        transcript, chat_ref, load_earlier_style = append_to_transcript(chat_ref, chat_elements)
+        return transcript, visualization, data_table, insights_elements, "", chat_ref, load_earlier_style
+
+    # Brings back the messages before the first one on the page
+    @app.callback(
+        [Output('chat-messages', 'children', allow_duplicate=True),
+         Output('store-chat-messages', 'data', allow_duplicate=True),
+         Output('chat-load-earlier-button', 'style', allow_duplicate=True)],
+        [Input('chat-load-earlier-button', 'n_clicks')],
+        [State('store-chat-messages', 'data'),
+         State('store-session-id', 'data')],
+        prevent_initial_call=True
+    )
+    def load_earlier_messages(n_clicks, chat_ref, session_id):
+        if not n_clicks or not isinstance(chat_ref, dict) or not chat_ref.get('first'):
             raise PreventUpdate
-        
-        trigger_id = ctx.triggered[0]['prop_id'].split('.')[0]
-        
-        # Determine the message based on trigger
-        message = ""
-        if trigger_id == 'suggestion-1':
-            message = "📊 Show me the main trends"
-        elif trigger_id == 'suggestion-2':
-            message = "📈 What are the key metrics?"
-        elif trigger_id == 'suggestion-3':
-            message = "🌍 Summarize the dataset for me"
-        elif trigger_id == 'suggestion-4':
-            message = "🔍 Find interesting correlations"
-        elif trigger_id in ['send-button', 'chat-input']:
-            message = input_value
-        
-        if not message:
+        return prepend_earlier_messages(session_id, chat_ref)
+
+    # Pages, sorts and filters of the chat's data table, computed on the server
+    @app.callback(
+        [Output('result-table', 'data'),
+         Output('result-table', 'page_count'),
+         Output('result-table-status', 'children')],
+        [Input('result-table', 'page_current'),
+         Input('result-table', 'page_size'),
+         Input('result-table', 'sort_by'),
+         Input('result-table', 'filter_query')],
+        [State('result-table-handle', 'data'),
+         State('store-session-id', 'data')],
+        prevent_initial_call=True
+    )
+    def page_result_table(page_current, page_size, sort_by, filter_query, handle, session_id):
+        if not handle:
             raise PreventUpdate
-        
-        # Initialize chat history if None
-        if not chat_history:
-            chat_history = []
-        
-        # Add user message - bot response will be added by the main callback
-        chat_history.append({
-            'type': 'user',
-            'content': message,
-            'timestamp': datetime.now().strftime('%H:%M')
-        })
-        
-        return chat_history
-    
+        try:
+            page = table_page(handle, page_current, page_size, sort_by, filter_query, session_id)
+        except Exception as e:
+            logger.error(f"Error loading a data table page: {e}", exc_info=True)
+            return dash.no_update, dash.no_update, "Could not load this page of the result."
+        if page is None:
+            return [], 1, "This result has expired. Ask the question again to browse it."
+        return page
+
     # New visible dataset dropdown callbacks
     @app.callback(
         [Output('dataset-dropdown-visible', 'options'),
@@ -684,7 +1055,7 @@ The visualization and detailed insights are shown on the right panel. Feel free
         
         try:
             logger.info("Loading datasets for visible dropdown")
-            schema_agent = SchemaAgent(project_id=PROJECT_ID)
+            schema_agent = get_registry().get_schema_agent(PROJECT_ID)
             if not schema_agent.connector:
                 return [], None, "Error: Failed to connect to BigQuery."
             
@@ -727,14 +1098,14 @@ The visualization and detailed insights are shown on the right panel. Feel free
             if selected_dataset and PROJECT_ID:
                 logger.info(f"Attempting to get schema for dataset: {selected_dataset}")
                 try:
-                    schema_agent = SchemaAgent(project_id=PROJECT_ID)
+                    schema_agent = get_registry().get_schema_agent(PROJECT_ID)
                     if schema_agent.connector:
                         dataset_schema = schema_agent.get_full_dataset_schema(selected_dataset)
                         if dataset_schema:
                             # Convert schema to simplified format for question generator
                             all_columns = []
                             for table_name, table_schema in dataset_schema.items():
-                                all_columns.extend([col['name'] for col in table_schema])
+                                all_columns.extend([col['name'] for col in table_schema.get('columns', [])])
                             schema_info = {'columns': all_columns}
                             logger.info(f"Generated schema info for questions: {len(all_columns)} columns - {all_columns[:5]}...")
                         else:
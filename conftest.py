@@ -0,0 +1,11 @@
+"""
+Shared pytest fixtures.
+"""
+
+import pytest
+
+
+@pytest.fixture
+def duckdb():
+    """DuckDB runs the BigQuery SQL locally; it is optional (not in requirements.txt), so tests using it skip without it."""
+    return pytest.importorskip("duckdb")
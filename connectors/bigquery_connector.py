@@ -1,7 +1,16 @@
+import os
+import time
 import logging
+import threading
+from collections import OrderedDict
+from google.api_core import exceptions as google_exceptions
 from google.cloud import bigquery
-from interfaces.database_interface import DatabaseConnectorInterface
+from interfaces.database_interface import DatabaseConnectorInterface, QueryResultChunks
+from utils.sql_utils import sql_fingerprint
+from utils.tracing import span
+from utils.metrics import BIGQUERY_JOB_LATENCY, BIGQUERY_ROWS_FETCHED, count_rows, record_bigquery_job
 import pandas as pd
+import pyarrow as pa
 from typing import Dict, List, Optional
 
 # Import db_dtypes to ensure BigQuery can handle special data types
@@ -10,15 +19,55 @@ try:
 except ImportError:
     logging.warning("db_dtypes package not found. Some BigQuery data types may not work correctly.")
 
+# The Storage Read API streams results as Arrow record batches; without it results are paged over REST
+try:
+    from google.cloud import bigquery_storage
+except ImportError:
+    bigquery_storage = None
+    logging.warning("google-cloud-bigquery-storage package not found. Query results will be downloaded over the REST API.")
+
 logger = logging.getLogger(__name__)
 
+# Dry runs report the tables a query reads; remembered per SQL fingerprint for the result cache
+REFERENCED_TABLES_CACHE_SIZE = 1024
+# Table versions (last modified times) key the result cache; each is looked up at most once
+# per TTL, so a change to a table may take this long to invalidate the results cached for it
+TABLE_VERSION_TTL_SECONDS = float(os.environ.get("TABLE_VERSION_TTL_SECONDS", 30))
+TABLE_VERSION_CACHE_SIZE = 1024
+
+
+def _short_type(data_type: Optional[str]) -> Optional[str]:
+    """Shortens INFORMATION_SCHEMA types such as 'STRUCT<a INT64, ...>' to 'STRUCT'; nested fields are listed separately."""
+    if not data_type:
+        return data_type
+    if data_type.startswith('STRUCT<'):
+        return 'STRUCT'
+    if data_type.startswith('ARRAY<STRUCT<'):
+        return 'ARRAY<STRUCT>'
+    return data_type
+
+
 class BigQueryConnector(DatabaseConnectorInterface):
     """Connector for Google BigQuery."""
     
-    def __init__(self, project_id: str):
-        self.client = None
+    def __init__(self, project_id: str, client: Optional[bigquery.Client] = None,
+                 bqstorage_client: Optional["bigquery_storage.BigQueryReadClient"] = None,
+                 use_bqstorage: bool = True, table_version_ttl: float = TABLE_VERSION_TTL_SECONDS):
+        self.client = client
         self.project_id = project_id
-        self.connect()
+        self._bqstorage_client = bqstorage_client if use_bqstorage else None
+        self._bqstorage_disabled = not use_bqstorage or (bigquery_storage is None and bqstorage_client is None)
+        self._bqstorage_lock = threading.Lock()
+        self._referenced_tables: "OrderedDict[str, List[str]]" = OrderedDict()
+        self._referenced_tables_lock = threading.Lock()
+        self.table_version_ttl = table_version_ttl
+        # table -> (checked at, last modified time, or None if the table has no reliable version)
+        self._table_versions: "OrderedDict[str, tuple]" = OrderedDict()
+        self._table_versions_lock = threading.Lock()
+        if self.client is None:
+            self.connect()
+        else:
+            logger.info(f"Using shared BigQuery client for project: {self.project_id}")
     
     def connect(self) -> None:
         """Connect to BigQuery."""
@@ -40,15 +89,198 @@ class BigQueryConnector(DatabaseConnectorInterface):
             logger.error(f"Error listing datasets: {str(e)}")
             return []
 
+    @property
+    def bqstorage_client(self) -> Optional["bigquery_storage.BigQueryReadClient"]:
+        """Shared BigQuery Storage Read API client, or None when the API is unavailable."""
+        if self._bqstorage_client is not None or self._bqstorage_disabled:
+            return self._bqstorage_client
+        with self._bqstorage_lock:
+            if self._bqstorage_client is None and not self._bqstorage_disabled:
+                try:
+                    self._bqstorage_client = bigquery_storage.BigQueryReadClient()
+                    logger.info("Created BigQuery Storage Read API client.")
+                except Exception as e:
+                    logger.warning(f"BigQuery Storage Read API client unavailable, using REST downloads: {str(e)}")
+                    self._bqstorage_disabled = True
+        return self._bqstorage_client
+
+    def _storage_failed(self, error: Exception) -> None:
+        """
+        Handles a failed Storage Read API download, which then falls back to REST. Only a
+        permission error (no readsessions access) turns the API off for later queries; a
+        transient error (unavailable, quota, deadline) affects the failed query alone.
+        """
+        if isinstance(error, google_exceptions.Forbidden):
+            logger.warning(f"Storage Read API not permitted, using REST downloads from now on: {str(error)}")
+            self._bqstorage_disabled = True
+            self._bqstorage_client = None
+        else:
+            logger.warning(f"Storage Read API download failed, falling back to REST for this query: {str(error)}")
+
+    def _run_job(self, query: str, **result_kwargs):
+        """Submits a query job and waits for its result; returns (query_job, row iterator)."""
+        with span("bigquery.job_wait"), BIGQUERY_JOB_LATENCY.time():
+            query_job = self.client.query(query)
+            rows = query_job.result(**result_kwargs)
+        record_bigquery_job(query_job)
+        return query_job, rows
+
+    def _download_results(self, query: str, as_arrow: bool):
+        """
+        Runs a query and downloads its rows as an Arrow table or a DataFrame.
+
+        Uses the Storage Read API when available and falls back to paged REST
+        if the read session cannot be created (see _storage_failed).
+        """
+        query_job, rows = self._run_job(query)
+        bqstorage_client = self.bqstorage_client
+        with span("bigquery.download", as_arrow=as_arrow):
+            result = None
+            if bqstorage_client is not None:
+                try:
+                    if as_arrow:
+                        result = rows.to_arrow(bqstorage_client=bqstorage_client)
+                    else:
+                        result = rows.to_dataframe(bqstorage_client=bqstorage_client)
+                except Exception as e:
+                    self._storage_failed(e)
+                    rows = query_job.result()
+            if result is None:
+                if as_arrow:
+                    result = rows.to_arrow(create_bqstorage_client=False)
+                else:
+                    result = rows.to_dataframe(create_bqstorage_client=False)
+        BIGQUERY_ROWS_FETCHED.inc(result.num_rows if as_arrow else len(result))
+        return result
+
+    def _arrow_batches(self, query_job, rows, page_size: int):
+        """
+        Record batches of a query's result. Falls back to REST pages if the Storage Read
+        API fails before its first batch (see _storage_failed).
+        """
+        bqstorage_client = self.bqstorage_client
+        if bqstorage_client is not None:
+            streamed = False
+            try:
+                for batch in rows.to_arrow_iterable(bqstorage_client=bqstorage_client):
+                    streamed = True
+                    yield batch
+                return
+            except Exception as e:
+                if streamed:
+                    raise
+                self._storage_failed(e)
+                rows = query_job.result(page_size=page_size)
+        yield from rows.to_arrow_iterable()
+
     def execute_query(self, query: str) -> pd.DataFrame:
         """Execute a SQL query and return results as DataFrame."""
         try:
-            query_job = self.client.query(query)
-            results = query_job.result()
-            return results.to_dataframe()
+            with span("bigquery.query"):
+                return self._download_results(query, as_arrow=False)
+        except Exception as e:
+            logger.error(f"Error executing query: {str(e)}")
+            raise
+
+    def execute_query_arrow(self, query: str) -> pa.Table:
+        """Execute a SQL query and return results as an Arrow table, skipping the pandas conversion."""
+        try:
+            with span("bigquery.query"):
+                return self._download_results(query, as_arrow=True)
+        except Exception as e:
+            logger.error(f"Error executing query: {str(e)}")
+            raise
+
+    def iter_query(self, query: str, page_size: int = 10000, max_rows: Optional[int] = None,
+                   max_bytes: Optional[int] = None, as_arrow: bool = False) -> QueryResultChunks:
+        """
+        Execute a SQL query and stream its result as Arrow record batches, from the
+        Storage Read API when available and else one REST page at a time, until
+        max_rows / max_bytes is reached.
+        """
+        try:
+            query_job, rows = self._run_job(query, page_size=page_size)
         except Exception as e:
             logger.error(f"Error executing query: {str(e)}")
             raise
+        # Arrow batches let the byte ceiling be checked before any pandas conversion
+        batches = count_rows(self._arrow_batches(query_job, rows, page_size))
+        convert = None if as_arrow else (lambda batch: batch.to_pandas())
+        return QueryResultChunks(batches, max_rows=max_rows, max_bytes=max_bytes,
+                                 total_rows=rows.total_rows, convert=convert,
+                                 bytes_processed=getattr(query_job, 'total_bytes_processed', None),
+                                 bytes_billed=getattr(query_job, 'total_bytes_billed', None))
+
+    def estimate_query_bytes(self, query: str) -> Optional[int]:
+        """Dry-run a query and return the number of bytes it would process."""
+        job_config = bigquery.QueryJobConfig(dry_run=True, use_query_cache=False)
+        query_job = self.client.query(query, job_config=job_config)
+        logger.info(f"Dry run: query would process {query_job.total_bytes_processed} bytes.")
+        referenced = getattr(query_job, 'referenced_tables', None)
+        if referenced is not None:
+            with self._referenced_tables_lock:
+                key = sql_fingerprint(query)
+                self._referenced_tables[key] = [f"{t.project}.{t.dataset_id}.{t.table_id}" for t in referenced]
+                self._referenced_tables.move_to_end(key)
+                while len(self._referenced_tables) > REFERENCED_TABLES_CACHE_SIZE:
+                    self._referenced_tables.popitem(last=False)
+        return query_job.total_bytes_processed
+
+    def get_referenced_tables(self, query: str) -> Optional[List[str]]:
+        """
+        Returns the fully qualified tables a query reads, as reported by its dry run.
+        Remembered from earlier dry runs of the same SQL; dry-runs the query otherwise.
+        """
+        with self._referenced_tables_lock:
+            tables = self._referenced_tables.get(sql_fingerprint(query))
+        if tables is not None:
+            return list(tables)
+        try:
+            self.estimate_query_bytes(query)
+        except Exception as e:
+            logger.warning(f"Could not determine the tables referenced by query: {str(e)}")
+            return None
+        with self._referenced_tables_lock:
+            tables = self._referenced_tables.get(sql_fingerprint(query))
+        return list(tables) if tables is not None else None
+
+    def get_table_versions(self, table_ids: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Returns {table: last modified time} for fully qualified tables. Returns None if any
+        of them is a view, an external table or has a streaming buffer, since their
+        modified time does not track changes to the data. Each table's version is
+        remembered for table_version_ttl seconds.
+        """
+        versions = {}
+        try:
+            for table_id in table_ids:
+                version = self._table_version(table_id)
+                if version is None:
+                    return None
+                versions[table_id] = version
+            return versions
+        except Exception as e:
+            logger.warning(f"Could not read table versions for {table_ids}: {str(e)}")
+            return None
+
+    def _table_version(self, table_id: str) -> Optional[str]:
+        now = time.monotonic()
+        with self._table_versions_lock:
+            cached = self._table_versions.get(table_id)
+            if cached is not None and now - cached[0] < self.table_version_ttl:
+                return cached[1]
+        table = self.client.get_table(table_id)
+        if table.table_type != "TABLE" or table.streaming_buffer is not None:
+            logger.info(f"Table {table_id} ({table.table_type}) has no reliable version; not caching.")
+            version = None
+        else:
+            version = table.modified.isoformat() if table.modified else ""
+        with self._table_versions_lock:
+            self._table_versions[table_id] = (now, version)
+            self._table_versions.move_to_end(table_id)
+            while len(self._table_versions) > TABLE_VERSION_CACHE_SIZE:
+                self._table_versions.popitem(last=False)
+        return version
 
     def list_tables(self, dataset_id: str) -> List[str]:
         """Lists all tables in a given dataset."""
@@ -73,6 +305,93 @@ class BigQueryConnector(DatabaseConnectorInterface):
             logger.error(f"Error getting schema for table {table_ref}: {str(e)}")
             return None
 
+    def get_dataset_schema(self, dataset_id: str) -> Optional[Dict[str, Dict[str, list]]]:
+        """
+        Retrieves the schema of every table in a dataset with one INFORMATION_SCHEMA query.
+
+        Returns {'table': {'columns': [...], 'nested_fields': [...], 'partitioning': [...],
+        'clustering': [...]}}, or None if the query fails.
+        """
+        query = f"""
+            SELECT
+              c.table_name, c.column_name, c.ordinal_position, c.data_type,
+              c.is_partitioning_column, c.clustering_ordinal_position,
+              f.field_path, f.data_type AS field_type, f.description
+            FROM `{self.project_id}.{dataset_id}`.INFORMATION_SCHEMA.COLUMNS AS c
+            LEFT JOIN `{self.project_id}.{dataset_id}`.INFORMATION_SCHEMA.COLUMN_FIELD_PATHS AS f
+              ON f.table_name = c.table_name AND f.column_name = c.column_name
+            ORDER BY c.table_name, c.ordinal_position, f.field_path
+        """
+        try:
+            rows = self.client.query(query).result()
+            dataset_schema = {}
+            for row in rows:
+                table = dataset_schema.setdefault(row['table_name'], {
+                    'columns': [], 'nested_fields': [], 'partitioning': [], 'clustering': []
+                })
+                field_path = row['field_path'] or row['column_name']
+                if field_path == row['column_name']:
+                    column = {'name': row['column_name'], 'type': _short_type(row['data_type'])}
+                    if row['description']:
+                        column['description'] = row['description']
+                    table['columns'].append(column)
+                    if row['is_partitioning_column'] == 'YES':
+                        table['partitioning'].append(row['column_name'])
+                    if row['clustering_ordinal_position'] is not None:
+                        table['clustering'].append((row['clustering_ordinal_position'], row['column_name']))
+                else:
+                    nested = {'name': field_path, 'type': _short_type(row['field_type'])}
+                    if row['description']:
+                        nested['description'] = row['description']
+                    table['nested_fields'].append(nested)
+            for table in dataset_schema.values():
+                table['clustering'] = [name for _, name in sorted(table['clustering'])]
+            logger.info(f"Retrieved schema for {len(dataset_schema)} tables in dataset {dataset_id} with one query.")
+            return dataset_schema
+        except Exception as e:
+            logger.warning(f"Bulk schema query failed for dataset {dataset_id}: {str(e)}")
+            return None
+
+    def get_dataset_version(self, dataset_id: str) -> Optional[str]:
+        """
+        Returns '<table count>:<latest last_modified_time>' for a dataset, read from the
+        __TABLES__ meta-table (metadata only, no table data is scanned), or None on error.
+        """
+        query = f"""
+            SELECT COUNT(*) AS table_count, MAX(last_modified_time) AS last_modified
+            FROM `{self.project_id}.{dataset_id}.__TABLES__`
+        """
+        try:
+            row = next(iter(self.client.query(query).result()), None)
+            if row is None:
+                return None
+            return f"{row['table_count']}:{row['last_modified']}"
+        except Exception as e:
+            logger.warning(f"Could not read last-modified times for dataset {dataset_id}: {str(e)}")
+            return None
+
+    def get_table_stats(self, dataset_id: str) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Returns {'table': {'row_count', 'size_bytes', 'last_modified'}} for every table in a
+        dataset, read from the __TABLES__ meta-table, or None on error.
+        """
+        query = f"""
+            SELECT table_id, row_count, size_bytes, last_modified_time
+            FROM `{self.project_id}.{dataset_id}.__TABLES__`
+        """
+        try:
+            stats = {}
+            for row in self.client.query(query).result():
+                stats[row['table_id']] = {
+                    'row_count': row['row_count'],
+                    'size_bytes': row['size_bytes'],
+                    'last_modified': row['last_modified_time'],
+                }
+            return stats
+        except Exception as e:
+            logger.warning(f"Could not read table statistics for dataset {dataset_id}: {str(e)}")
+            return None
+
     def get_table_info(self) -> Dict[str, List[str]]:
         """Get information about tables in the database, organized by dataset."""
         try:
@@ -0,0 +1,325 @@
+import os
+import logging
+import sqlite3
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Union
+
+import pandas as pd
+import pyarrow as pa
+import sqlglot
+from sqlglot import exp
+from sqlglot.errors import SqlglotError
+
+from interfaces.database_interface import DatabaseConnectorInterface, QueryResultChunks
+
+# DuckDB is the preferred local engine (columnar, Arrow-native); SQLite from the standard library is the fallback
+try:
+    import duckdb
+except ImportError:
+    duckdb = None
+    logging.warning("duckdb package not found. LocalConnector will use SQLite.")
+
+logger = logging.getLogger(__name__)
+
+
+class LocalConnector(DatabaseConnectorInterface):
+    """
+    Connector for a local analytical database, so the whole pipeline can run on a
+    laptop or CI box without GCP. Datasets map to DuckDB schemas (or attached SQLite
+    databases) and tables keep their names. BigQuery-style references such as
+    `project.dataset.table` are rewritten to dataset.table before execution, and the
+    BigQuery SQL is transpiled to the local engine's dialect.
+    """
+
+    def __init__(self, path: str = ":memory:", project_id: str = "local", engine: Optional[str] = None):
+        """
+        path is the database file (":memory:" for a throwaway database); with SQLite,
+        each dataset is stored next to it as <path stem>.<dataset>.sqlite.
+        engine forces "duckdb" or "sqlite"; by default DuckDB is used when installed.
+        """
+        self.path = path
+        self.project_id = project_id
+        self.engine = engine or ("duckdb" if duckdb is not None else "sqlite")
+        if self.engine == "duckdb" and duckdb is None:
+            raise ImportError("duckdb is not installed; use engine='sqlite'.")
+        self._lock = threading.RLock()
+        self._conn = None
+        self.connect()
+
+    def connect(self) -> None:
+        """Open the local database."""
+        try:
+            if self.engine == "duckdb":
+                self._conn = duckdb.connect(self.path)
+            else:
+                self._conn = sqlite3.connect(self.path, check_same_thread=False)
+                self._attach_sqlite_datasets()
+            logger.info(f"Connected to local {self.engine} database: {self.path}")
+        except Exception as e:
+            logger.error(f"Error connecting to local database {self.path}: {str(e)}")
+            raise
+
+    @contextmanager
+    def _cursor(self):
+        # DuckDB connections are not safe to share between threads; each query gets a cursor
+        # of its own, closed once its result is read
+        if self.engine != "duckdb":
+            yield self._conn
+            return
+        cursor = self._conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    def _sqlite_dataset_path(self, dataset_id: str) -> str:
+        if self.path == ":memory:":
+            return ":memory:"
+        stem, _ = os.path.splitext(self.path)
+        return f"{stem}.{dataset_id}.sqlite"
+
+    def _attach_sqlite_datasets(self) -> None:
+        if self.path == ":memory:":
+            return
+        stem, _ = os.path.splitext(self.path)
+        directory = os.path.dirname(os.path.abspath(self.path))
+        prefix = os.path.basename(stem) + "."
+        for name in sorted(os.listdir(directory)):
+            if name.startswith(prefix) and name.endswith(".sqlite"):
+                dataset_id = name[len(prefix):-len(".sqlite")]
+                self._conn.execute("ATTACH DATABASE ? AS " + self._quote(dataset_id), (os.path.join(directory, name),))
+
+    @staticmethod
+    def _quote(identifier: str) -> str:
+        return '"' + identifier.replace('"', '""') + '"'
+
+    def rewrite_sql(self, query: str) -> str:
+        """Transpiles BigQuery SQL for the local engine, dropping the project from table names."""
+        try:
+            statements = sqlglot.parse(query, read="bigquery")
+        except SqlglotError as e:
+            logger.warning(f"Could not parse query for {self.engine}, running it as written: {e}")
+            return query
+        for statement in statements:
+            if statement is None:
+                continue
+            # Three-part names are project.dataset.table; the local database has no project level
+            for table in statement.find_all(exp.Table):
+                if table.args.get("catalog") is not None:
+                    table.set("catalog", None)
+        return ";\n".join(statement.sql(dialect=self.engine) for statement in statements if statement is not None)
+
+    def execute_query(self, query: str) -> pd.DataFrame:
+        """Execute a SQL query and return results as DataFrame."""
+        sql = self.rewrite_sql(query)
+        try:
+            with self._lock if self.engine == "sqlite" else nullcontext():
+                if self.engine == "duckdb":
+                    with self._cursor() as cursor:
+                        return cursor.execute(sql).df()
+                return pd.read_sql_query(sql, self._conn)
+        except Exception as e:
+            logger.error(f"Error executing local query: {str(e)}")
+            raise
+
+    def execute_query_arrow(self, query: str) -> pa.Table:
+        """Execute a SQL query and return results as an Arrow table."""
+        if self.engine == "duckdb":
+            try:
+                with self._cursor() as cursor:
+                    result = cursor.execute(self.rewrite_sql(query))
+                    # to_arrow_table replaced fetch_arrow_table in DuckDB 1.4
+                    return result.to_arrow_table() if hasattr(result, "to_arrow_table") else result.fetch_arrow_table()
+            except Exception as e:
+                logger.error(f"Error executing local query: {str(e)}")
+                raise
+        return pa.Table.from_pandas(self.execute_query(query), preserve_index=False)
+
+    def iter_query(self, query: str, page_size: int = 10000, max_rows: Optional[int] = None,
+                   max_bytes: Optional[int] = None, as_arrow: bool = False) -> QueryResultChunks:
+        """
+        Executes a query and pages through its result with a database cursor. The cursor
+        is closed once the result is read, or when the caller drops it part way.
+        """
+        sql = self.rewrite_sql(query)
+        if self.engine == "duckdb":
+            # A cursor of its own, since the reader is consumed lazily by the caller
+            cursor = self._conn.cursor()
+            try:
+                result = cursor.execute(sql)
+                if hasattr(result, "to_arrow_reader"):
+                    reader = result.to_arrow_reader(page_size)
+                else:
+                    reader = result.fetch_record_batch(page_size)
+            except Exception:
+                cursor.close()
+                raise
+
+            def duckdb_batches():
+                try:
+                    yield from reader
+                finally:
+                    cursor.close()
+
+            convert = None if as_arrow else (lambda batch: batch.to_pandas())
+            return QueryResultChunks(duckdb_batches(), max_rows=max_rows, max_bytes=max_bytes, convert=convert)
+
+        def sqlite_pages():
+            # The connection is locked while a page is fetched, not while the caller holds
+            # it, so other queries run between pages
+            with self._lock:
+                cursor = self._conn.execute(sql)
+            try:
+                columns = [description[0] for description in cursor.description or []]
+                while True:
+                    with self._lock:
+                        rows = cursor.fetchmany(page_size)
+                    if not rows:
+                        break
+                    yield pd.DataFrame.from_records(rows, columns=columns)
+            finally:
+                with self._lock:
+                    cursor.close()
+
+        convert = (lambda chunk: pa.Table.from_pandas(chunk, preserve_index=False)) if as_arrow else None
+        return QueryResultChunks(sqlite_pages(), max_rows=max_rows, max_bytes=max_bytes, convert=convert)
+
+    def create_dataset(self, dataset_id: str) -> None:
+        """Creates a dataset (DuckDB schema or attached SQLite database) if it does not exist."""
+        with self._lock:
+            if self.engine == "duckdb":
+                self._conn.execute(f"CREATE SCHEMA IF NOT EXISTS {self._quote(dataset_id)}")
+            elif dataset_id not in self.list_datasets():
+                self._conn.execute("ATTACH DATABASE ? AS " + self._quote(dataset_id),
+                                   (self._sqlite_dataset_path(dataset_id),))
+
+    def load_table(self, dataset_id: str, table_id: str, data: Union[pd.DataFrame, pa.Table],
+                   replace: bool = True) -> None:
+        """Creates (or replaces) dataset_id.table_id from a DataFrame or Arrow table."""
+        self.create_dataset(dataset_id)
+        target = f"{self._quote(dataset_id)}.{self._quote(table_id)}"
+        with self._lock:
+            if self.engine == "duckdb":
+                staged = data if isinstance(data, pa.Table) else pa.Table.from_pandas(data, preserve_index=False)
+                self._conn.register("_load_table_data", staged)
+                try:
+                    verb = "CREATE OR REPLACE TABLE" if replace else "CREATE TABLE"
+                    self._conn.execute(f"{verb} {target} AS SELECT * FROM _load_table_data")
+                finally:
+                    self._conn.unregister("_load_table_data")
+            else:
+                df = data.to_pandas() if isinstance(data, pa.Table) else data
+                if replace:
+                    self._conn.execute(f"DROP TABLE IF EXISTS {target}")
+                columns = ", ".join(f"{self._quote(str(name))} {self._sqlite_type(dtype)}"
+                                    for name, dtype in df.dtypes.items())
+                self._conn.execute(f"CREATE TABLE {target} ({columns})")
+                placeholders = ", ".join("?" for _ in df.columns)
+                rows = df.astype(object).where(pd.notna(df), None).itertuples(index=False, name=None)
+                self._conn.executemany(f"INSERT INTO {target} VALUES ({placeholders})", rows)
+                self._conn.commit()
+        logger.info(f"Loaded {len(data)} rows into local table {dataset_id}.{table_id}")
+
+    @staticmethod
+    def _sqlite_type(dtype) -> str:
+        if pd.api.types.is_bool_dtype(dtype) or pd.api.types.is_integer_dtype(dtype):
+            return "INTEGER"
+        if pd.api.types.is_float_dtype(dtype):
+            return "REAL"
+        return "TEXT"
+
+    def list_datasets(self) -> List[str]:
+        """Lists all datasets in the local database."""
+        try:
+            with self._lock:
+                if self.engine == "duckdb":
+                    rows = self._conn.execute(
+                        "SELECT schema_name FROM information_schema.schemata "
+                        "WHERE catalog_name = current_database() "
+                        "AND schema_name NOT IN ('information_schema', 'pg_catalog', 'main') ORDER BY 1"
+                    ).fetchall()
+                else:
+                    rows = [(row[1],) for row in self._conn.execute("PRAGMA database_list").fetchall()
+                            if row[1] not in ("main", "temp")]
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error listing local datasets: {str(e)}")
+            return []
+
+    def list_tables(self, dataset_id: str) -> List[str]:
+        """Lists all tables in a given dataset."""
+        try:
+            with self._lock:
+                if self.engine == "duckdb":
+                    rows = self._conn.execute(
+                        "SELECT table_name FROM information_schema.tables WHERE table_schema = ? ORDER BY 1",
+                        [dataset_id],
+                    ).fetchall()
+                else:
+                    rows = self._conn.execute(
+                        f"SELECT name FROM {self._quote(dataset_id)}.sqlite_master "
+                        f"WHERE type IN ('table', 'view') ORDER BY 1"
+                    ).fetchall()
+            return [row[0] for row in rows]
+        except Exception as e:
+            logger.error(f"Error listing tables in local dataset {dataset_id}: {str(e)}")
+            return []
+
+    def get_table_schema(self, dataset_id: str, table_id: str) -> Optional[Dict[str, List[Dict[str, str]]]]:
+        """Retrieves the schema for a specific table."""
+        try:
+            with self._lock:
+                if self.engine == "duckdb":
+                    rows = self._conn.execute(
+                        "SELECT column_name, data_type FROM information_schema.columns "
+                        "WHERE table_schema = ? AND table_name = ? ORDER BY ordinal_position",
+                        [dataset_id, table_id],
+                    ).fetchall()
+                else:
+                    rows = [(row[1], row[2] or "TEXT") for row in self._conn.execute(
+                        f"PRAGMA {self._quote(dataset_id)}.table_info({self._quote(table_id)})"
+                    ).fetchall()]
+            if not rows:
+                return None
+            return {'columns': [{'name': name, 'type': data_type} for name, data_type in rows]}
+        except Exception as e:
+            logger.error(f"Error getting schema for local table {dataset_id}.{table_id}: {str(e)}")
+            return None
+
+    def get_dataset_schema(self, dataset_id: str) -> Optional[Dict[str, Dict[str, list]]]:
+        """Retrieves the schema of every table in a dataset."""
+        dataset_schema = {}
+        for table_id in self.list_tables(dataset_id):
+            schema = self.get_table_schema(dataset_id, table_id)
+            if schema:
+                dataset_schema[table_id] = schema
+        return dataset_schema or None
+
+    def get_table_stats(self, dataset_id: str) -> Optional[Dict[str, Dict[str, int]]]:
+        """Row counts of the tables in a dataset (sizes are not tracked locally)."""
+        counts = self.get_row_counts(dataset_id)
+        return {table: {'row_count': count, 'size_bytes': None, 'last_modified': None}
+                for table, count in counts.items()}
+
+    def get_table_info(self) -> Dict[str, List[str]]:
+        """Get information about tables in the database, organized by dataset."""
+        return {dataset_id: self.list_tables(dataset_id) for dataset_id in self.list_datasets()}
+
+    def get_row_counts(self, dataset_id: Optional[str] = None) -> Dict[str, int]:
+        """Get the number of rows in each table (of one dataset, or of all datasets)."""
+        datasets = [dataset_id] if dataset_id else self.list_datasets()
+        counts = {}
+        for dataset in datasets:
+            for table_id in self.list_tables(dataset):
+                target = f"{self._quote(dataset)}.{self._quote(table_id)}"
+                with self._lock, self._cursor() as cursor:
+                    counts[table_id] = int(cursor.execute(f"SELECT COUNT(*) FROM {target}").fetchone()[0])
+        return counts
+
+    def get_sample_data(self, table_name: str, limit: int = 5) -> pd.DataFrame:
+        """Get sample data from a table ('dataset.table')."""
+        dataset_id, table_id = table_name.split(".", 1)
+        return self.execute_query(
+            f"SELECT * FROM {self._quote(dataset_id)}.{self._quote(table_id)} LIMIT {int(limit)}"
+        )
@@ -1,30 +1,195 @@
 from abc import ABC, abstractmethod
-from typing import Dict, List, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Union
 import pandas as pd
+import pyarrow as pa
+
+ResultChunk = Union[pd.DataFrame, pa.Table, pa.RecordBatch]
+
+
+def _chunk_num_rows(chunk: ResultChunk) -> int:
+    return chunk.num_rows if isinstance(chunk, (pa.Table, pa.RecordBatch)) else len(chunk)
+
+
+def _chunk_num_bytes(chunk: ResultChunk) -> int:
+    if isinstance(chunk, (pa.Table, pa.RecordBatch)):
+        return chunk.nbytes
+    return int(chunk.memory_usage(index=False, deep=True).sum())
+
+
+def _chunk_head(chunk: ResultChunk, num_rows: int) -> ResultChunk:
+    if isinstance(chunk, (pa.Table, pa.RecordBatch)):
+        return chunk.slice(0, num_rows)
+    return chunk.iloc[:num_rows]
+
+
+class QueryResultChunks:
+    """
+    Iterates over the chunks of a query result, stopping at a row and/or byte ceiling.
+
+    After iteration, `rows` and `bytes` hold what was yielded and `truncated` tells
+    whether the ceiling cut the result short. `total_rows` is the size of the full
+    result when the connector knows it, else None. `bytes_processed` and
+    `bytes_billed` carry the warehouse job statistics when available.
+    """
+
+    def __init__(self, chunks: Iterable[ResultChunk], max_rows: Optional[int] = None,
+                 max_bytes: Optional[int] = None, total_rows: Optional[int] = None,
+                 convert: Optional[Callable[[ResultChunk], ResultChunk]] = None,
+                 bytes_processed: Optional[int] = None, bytes_billed: Optional[int] = None):
+        self._chunks = chunks
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.total_rows = total_rows
+        self.bytes_processed = bytes_processed
+        self.bytes_billed = bytes_billed
+        self._convert = convert
+        self.rows = 0
+        self.bytes = 0
+        self.truncated = False
+
+    def _ceiling_reached(self) -> bool:
+        return ((self.max_rows is not None and self.rows >= self.max_rows) or
+                (self.max_bytes is not None and self.bytes >= self.max_bytes))
+
+    def __iter__(self) -> Iterator[ResultChunk]:
+        for chunk in self._chunks:
+            if self._ceiling_reached():
+                # There is at least one more chunk, so the result was cut short
+                self.truncated = True
+                break
+
+            num_rows = _chunk_num_rows(chunk)
+            if num_rows == 0:
+                continue
+            num_bytes = _chunk_num_bytes(chunk)
+            keep = num_rows
+            if self.max_rows is not None:
+                keep = min(keep, self.max_rows - self.rows)
+            if self.max_bytes is not None and num_bytes > 0:
+                keep = min(keep, int(num_rows * (self.max_bytes - self.bytes) / num_bytes))
+
+            if keep < num_rows:
+                self.truncated = True
+                chunk = _chunk_head(chunk, keep)
+                num_bytes = _chunk_num_bytes(chunk)
+            if keep > 0:
+                self.rows += keep
+                self.bytes += num_bytes
+                yield self._convert(chunk) if self._convert else chunk
+            if self.truncated:
+                break
+
+            if self._ceiling_reached() and self.total_rows is not None:
+                # Avoid fetching another page just to find out whether there is one
+                self.truncated = self.rows < self.total_rows
+                break
+
 
 class DatabaseConnectorInterface(ABC):
     """Abstract base class for database connectors."""
-    
+
     @abstractmethod
     def connect(self) -> None:
         """Connect to the database."""
         pass
-    
+
     @abstractmethod
     def execute_query(self, query: str) -> pd.DataFrame:
         """Execute a SQL query and return results as DataFrame."""
         pass
-    
+
+    def execute_query_arrow(self, query: str) -> pa.Table:
+        """
+        Execute a SQL query and return results as an Arrow table.
+        The default implementation converts the result of execute_query.
+        """
+        return pa.Table.from_pandas(self.execute_query(query), preserve_index=False)
+
+    def iter_query(self, query: str, page_size: int = 10000, max_rows: Optional[int] = None,
+                   max_bytes: Optional[int] = None, as_arrow: bool = False) -> QueryResultChunks:
+        """
+        Execute a SQL query and yield its result in chunks of at most page_size rows
+        (DataFrames, or Arrow tables when as_arrow is set), stopping at max_rows / max_bytes.
+
+        The default implementation slices the result of execute_query; connectors that
+        can page through results on the server side should override it.
+        """
+        df = self.execute_query(query)
+        chunks = (df.iloc[start:start + page_size] for start in range(0, len(df), page_size))
+        convert = (lambda chunk: pa.Table.from_pandas(chunk, preserve_index=False)) if as_arrow else None
+        return QueryResultChunks(chunks, max_rows=max_rows, max_bytes=max_bytes,
+                                 total_rows=len(df), convert=convert)
+
+    def estimate_query_bytes(self, query: str) -> Optional[int]:
+        """
+        Estimate how many bytes a query would scan without running it.
+        Returns None when the connector cannot estimate.
+        """
+        return None
+
+    def get_referenced_tables(self, query: str) -> Optional[List[str]]:
+        """
+        Get the fully qualified tables a query reads without running it.
+        Returns None when the connector cannot tell.
+        """
+        return None
+
+    def get_table_versions(self, table_ids: List[str]) -> Optional[Dict[str, str]]:
+        """
+        Get a version token (e.g. last modified time) per table, used to key cached results.
+        Returns None when any table cannot be versioned; its results are then not cached.
+        """
+        return None
+
+    def get_dataset_schema(self, dataset_id: str) -> Optional[Dict[str, Dict[str, list]]]:
+        """
+        Get the schema of every table in a dataset in one round trip, as
+        {'table': {'columns': [{'name': ..., 'type': ...}], ...}}.
+        Returns None when the connector has no bulk path; callers then fetch tables one by one.
+        """
+        return None
+
+    def get_dataset_version(self, dataset_id: str) -> Optional[str]:
+        """
+        Get a cheap token that changes whenever a table in the dataset is created,
+        dropped or modified, so cached schemas can be revalidated without refetching them.
+        Returns None when the connector cannot tell.
+        """
+        return None
+
+    def get_table_stats(self, dataset_id: str) -> Optional[Dict[str, Dict[str, int]]]:
+        """
+        Get row counts and sizes of the tables in a dataset from metadata, as
+        {'table': {'row_count': ..., 'size_bytes': ..., 'last_modified': ...}}.
+        Returns None when the connector cannot provide them cheaply.
+        """
+        return None
+
+    @abstractmethod
+    def list_datasets(self) -> List[str]:
+        """List the datasets (schemas) in the database."""
+        pass
+
+    @abstractmethod
+    def list_tables(self, dataset_id: str) -> List[str]:
+        """List the tables in a dataset."""
+        pass
+
+    @abstractmethod
+    def get_table_schema(self, dataset_id: str, table_id: str) -> Optional[Dict[str, List[Dict[str, str]]]]:
+        """Get the schema of a table as {'columns': [{'name': ..., 'type': ...}]}, or None."""
+        pass
+
     @abstractmethod
     def get_table_info(self) -> Dict[str, List[str]]:
         """Get information about tables in the database."""
         pass
-    
+
     @abstractmethod
     def get_row_counts(self) -> Dict[str, int]:
         """Get the number of rows in each table."""
         pass
-    
+
     @abstractmethod
     def get_sample_data(self, table_name: str, limit: int = 5) -> pd.DataFrame:
         """Get sample data from a table."""
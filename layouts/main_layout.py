@@ -6,10 +6,10 @@ from layouts.visualization_panel import create_visualization_panel
 
 def create_layout():
     return html.Div(className="app-container dark-theme", children=[
-        # Store components
+        # Store components: keys of values kept in the server-side session store
         dcc.Store(id='store-generated-sql'),
-        dcc.Store(id='store-chat-messages', data=[]),
-        dcc.Store(id='store-current-data', data={}),
+        dcc.Store(id='store-chat-messages', data={}),
+        dcc.Store(id='store-session-id', storage_type='session'),
         
         # Two-panel layout
         html.Div(className="main-panels", children=[
@@ -33,8 +33,12 @@ def create_layout():
                         "🚀 Welcome to the AI-Powered Data Agent Platform! I'm your intelligent data analyst assistant. I can help you explore, analyze, and gain insights from your data using advanced AI and natural language processing. Try the suggested questions below or ask me anything!"
                     ]),
                     
-                    # Chat messages will be added here dynamically
-                    html.Div(id="chat-messages", className="chat-messages"),
+                    # Older messages stay on the server until asked for
+                    dbc.Button("Load earlier messages", id="chat-load-earlier-button", color="link", size="sm",
+                               className="chat-load-earlier", style={'display': 'none'}),
+
+                    # Chat messages will be added here dynamically, one turn at a time
+                    html.Div(id="chat-messages", className="chat-messages", children=[]),
                 ]),
                 
                 # Suggested Questions
@@ -62,6 +66,18 @@ def create_layout():
                             color="primary",
                             className="send-button"
                         )
+                    ]),
+                    # Progress of the running chat turn, with a button to cancel it
+                    html.Div(className="chat-progress-container", children=[
+                        html.Span(id="chat-progress", className="chat-progress"),
+                        dbc.Button(
+                            [html.I(className="fas fa-stop me-1"), "Cancel"],
+                            id="cancel-chat-button",
+                            color="link",
+                            size="sm",
+                            className="cancel-chat-button",
+                            style={'display': 'none'}
+                        )
                     ])
                 ])
             ]),
@@ -0,0 +1,98 @@
+"""
+Tests for the process-wide agent registry: clients, Vertex AI and models are built once per worker.
+"""
+
+import sys
+import os
+import threading
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.registry import AgentRegistry
+
+
+class _Counter:
+    """Callable stand-in that counts how many times it was constructed/called."""
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, *args, **kwargs):
+        with self._lock:
+            self.calls += 1
+        return mock.MagicMock(name="constructed")
+
+
+def _patched_registry():
+    client_factory, vertex_init, model_factory = _Counter(), _Counter(), _Counter()
+    patches = [
+        mock.patch("agents.registry.bigquery.Client", client_factory),
+        mock.patch("connectors.bigquery_connector.bigquery.Client", client_factory),
+        mock.patch("agents.registry.vertexai.init", vertex_init),
+        mock.patch("agents.data_analyst_agent.vertexai.init", vertex_init),
+        mock.patch("agents.data_analyst_agent.GenerativeModel", model_factory),
+    ]
+    return AgentRegistry(), patches, client_factory, vertex_init, model_factory
+
+
+def test_clients_are_built_once_per_worker():
+    registry, patches, client_factory, vertex_init, model_factory = _patched_registry()
+    for p in patches:
+        p.start()
+    try:
+        agents = [registry.get_data_analyst_agent("test-project") for _ in range(5)]
+        schema_agent = registry.get_schema_agent("test-project")
+
+        assert all(agent is agents[0] for agent in agents)
+        assert agents[0].schema_agent is schema_agent
+        assert agents[0].connector is schema_agent.connector
+        assert client_factory.calls == 1
+        assert vertex_init.calls == 1
+        assert model_factory.calls == 1
+    finally:
+        for p in patches:
+            p.stop()
+
+
+def test_concurrent_callbacks_share_one_client():
+    registry, patches, client_factory, vertex_init, model_factory = _patched_registry()
+    for p in patches:
+        p.start()
+    try:
+        results = []
+        barrier = threading.Barrier(8)
+
+        def callback():
+            barrier.wait()
+            results.append(registry.get_data_analyst_agent("test-project"))
+
+        threads = [threading.Thread(target=callback) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len({id(agent) for agent in results}) == 1
+        assert client_factory.calls == 1
+        assert vertex_init.calls == 1
+        assert model_factory.calls == 1
+    finally:
+        for p in patches:
+            p.stop()
+
+
+def test_projects_get_separate_clients():
+    registry, patches, client_factory, _, _ = _patched_registry()
+    for p in patches:
+        p.start()
+    try:
+        first = registry.get_schema_agent("project-a")
+        second = registry.get_schema_agent("project-b")
+        assert first is not second
+        assert client_factory.calls == 2
+    finally:
+        for p in patches:
+            p.stop()
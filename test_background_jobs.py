@@ -0,0 +1,163 @@
+"""
+Tests for the bounded background callback manager and the background chat callback.
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+from unittest import mock
+
+import dash
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.background_jobs import ThreadPoolCallbackManager, get_default_job_manager, when_busy
+from utils.metrics import BACKGROUND_JOB_DURATION, BACKGROUND_JOB_QUEUE_WAIT
+from layouts.main_layout import create_layout
+from callbacks.main_callbacks import register_callbacks
+
+
+def _submit(manager, fn, *args):
+    key = f"key-{id(fn)}-{args}"
+    job_fn = manager.make_job_fn(fn, progress=True)
+    return key, manager.call_job_fn(key, job_fn, list(args), {})
+
+
+def _wait_for_result(manager, key, job, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        result = manager.get_result(key, job)
+        if result is not manager.UNDEFINED:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("background job did not finish")
+
+
+def test_jobs_report_progress_and_queue_is_bounded():
+    manager = ThreadPoolCallbackManager(max_workers=1, max_queued=1)
+    release = threading.Event()
+    waits = BACKGROUND_JOB_QUEUE_WAIT.count(callback="blocking")
+    runs = BACKGROUND_JOB_DURATION.count(callback="blocking", outcome="completed")
+
+    def blocking(set_progress, value):
+        set_progress(f"working on {value}")
+        release.wait(5)
+        return value * 2
+
+    first_key, first = _submit(manager, blocking, 1)
+    second_key, second = _submit(manager, blocking, 2)
+    # Refused jobs finish at once: with no update, or with the callback's busy result
+    refused_key, refused = _submit(manager, blocking, 3)
+    assert manager.job_running(refused) and manager.get_result(refused_key, refused) == {
+        "_dash_no_update": "_dash_no_update"}
+    busy_key, busy = _submit(manager, when_busy(lambda value: f"busy, try {value} again")(blocking), 4)
+    assert manager.get_result(busy_key, busy) == "busy, try 4 again" and not manager.job_running(busy)
+    deadline = time.monotonic() + 5
+    while manager.stats()['running'] != 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert manager.stats()['queued'] == 1
+    assert manager.job_running(first) and manager.get_progress(first_key) == ["working on 1"]
+
+    release.set()
+    assert _wait_for_result(manager, first_key, first) == 2
+    assert _wait_for_result(manager, second_key, second) == 4
+    assert not manager.job_running(first)
+    assert manager.stats()['completed'] == 2 and manager.stats()['rejected'] == 2
+    # Each job that ran records its queue wait and its run time
+    assert BACKGROUND_JOB_QUEUE_WAIT.count(callback="blocking") == waits + 2
+    assert BACKGROUND_JOB_DURATION.count(callback="blocking", outcome="completed") == runs + 2
+
+
+def test_cancelled_job_stops_at_its_next_progress_update():
+    manager = ThreadPoolCallbackManager(max_workers=1, max_queued=1)
+    started, release = threading.Event(), threading.Event()
+    reached_next_stage = []
+
+    def stages(set_progress):
+        set_progress("stage 1")
+        started.set()
+        release.wait(5)
+        set_progress("stage 2")
+        reached_next_stage.append(True)
+        return "done"
+
+    key, job = _submit(manager, stages)
+    queued_key, queued = _submit(manager, stages)
+    assert started.wait(5)
+    manager.terminate_job(queued)
+    manager.terminate_job(job)
+    assert not manager.job_running(job)
+    release.set()
+    deadline = time.monotonic() + 5
+    while manager.stats()['cancelled'] < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert manager.stats()['cancelled'] == 2
+    assert not reached_next_stage
+    assert manager.get_result(key, job) is manager.UNDEFINED
+
+
+def _chat_app():
+    app = dash.Dash(__name__, suppress_callback_exceptions=True)
+    app.layout = create_layout()
+    register_callbacks(app)
+    client = app.server.test_client()
+
+    callback_id = next(key for key in app.callback_map if "chat-messages.children" in key)
+    spec = app.callback_map[callback_id]
+    payload = {
+        "output": callback_id,
+        "outputs": [{"id": o.split(".")[0], "property": o.split(".")[1]}
+                    for o in callback_id.strip(".").split("...")],
+        "inputs": [{"id": i["id"], "property": i["property"], "value": 1 if i["id"] == "send-button" else None}
+                   for i in spec["inputs"]],
+        "state": [{"id": "chat-input", "property": "value", "value": "how many rows?"},
+                  {"id": "store-chat-messages", "property": "data", "value": []},
+                  {"id": "dataset-dropdown", "property": "value", "value": None},
+                  {"id": "store-session-id", "property": "data", "value": "s1"}],
+        "changedPropIds": ["send-button.n_clicks"],
+    }
+    return app, client, payload
+
+
+def _poll(client, payload, started):
+    query = f"?cacheKey={started['cacheKey']}&job={started['job']}"
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        data = json.loads(client.post("/_dash-update-component" + query, json=payload).get_data())
+        if "response" in data:
+            return data
+        time.sleep(0.05)
+    raise AssertionError("chat callback did not answer")
+
+
+def test_chat_callback_runs_in_the_background():
+    app, client, payload = _chat_app()
+    started = json.loads(client.post("/_dash-update-component", json=payload).get_data())
+    assert set(started) >= {"cacheKey", "job", "cancel", "running"}
+    data = _poll(client, payload, started)
+    # The transcript gets a patch appending this turn's two messages, and the store their key
+    patch = data["response"]["chat-messages"]["children"]
+    assert [operation["operation"] for operation in patch["operations"]] == ["Extend"]
+    messages = patch["operations"][0]["params"]["value"]
+    assert len(messages) == 2
+    assert "how many rows?" in json.dumps(messages[0])
+    assert "select a dataset" in json.dumps(messages[1])
+    assert data["response"]["chat-input"]["value"] == ""
+    assert data["response"]["store-chat-messages"]["data"] == {'key': 'chat_history', 'length': 2, 'first': 0}
+    # One callback per chat turn: nothing else listens to the send button
+    assert sum("send-button" in str(spec["inputs"]) for spec in app.callback_map.values()) == 1
+
+
+def test_chat_callback_answers_busy_when_the_queue_is_full():
+    app, client, payload = _chat_app()
+    manager = get_default_job_manager()
+    with mock.patch.object(manager, "max_workers", 0), mock.patch.object(manager, "max_queued", 0):
+        started = json.loads(client.post("/_dash-update-component", json=payload).get_data())
+    data = _poll(client, payload, started)
+    messages = data["response"]["chat-messages"]["children"]["operations"][0]["params"]["value"]
+    assert "how many rows?" in json.dumps(messages[0]) and "busy" in json.dumps(messages[1])
+    # The question stays in the input box, to be sent again
+    assert "chat-input" not in data["response"]
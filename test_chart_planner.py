@@ -0,0 +1,96 @@
+"""
+Tests for chart aggregates computed in BigQuery instead of from downloaded rows.
+"""
+
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import sqlglot
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.chart_planner import OTHER_LABEL, aggregate_frame, aggregate_sql, plan_chart
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import BENCH_ROW_BYTES, FakeBigQueryClient, FakeGenerativeModel
+from utils.cost_guard import QueryCostGuard
+from callbacks.main_callbacks import run_chat_turn
+
+
+def _sample(rows=5000):
+    rng = np.random.default_rng(3)
+    return pd.DataFrame({
+        'day': pd.date_range('2023-01-01', periods=rows, freq='6h'),
+        'region': rng.choice([f"r{i}" for i in range(40)] + [None], rows),
+        'amount': rng.gamma(2.0, 10.0, rows),
+    })
+
+
+def test_plans_follow_the_column_types():
+    df = _sample(10)
+    assert plan_chart(df)['kind'] == 'timeseries'
+    assert plan_chart(df, 'region', 'amount')['kind'] == 'categories'
+    assert plan_chart(df[['amount']])['kind'] == 'histogram'
+    assert plan_chart(df[['region']]) is None
+
+
+def test_bigquery_aggregates_match_the_local_ones(duckdb):
+    # The BigQuery SQL runs on DuckDB through sqlglot, against the same rows the local aggregate sees
+    df = _sample()
+    connection = duckdb.connect()
+    connection.register('source_rows', df)
+    plans = [plan_chart(df), plan_chart(df, 'region', 'amount'), plan_chart(df[['amount']]),
+             {'kind': 'categories', 'category': 'region', 'value': None, 'top_k': 5}]
+    for plan in plans:
+        sql = aggregate_sql(plan, "SELECT * FROM source_rows -- every row")
+        remote = connection.execute(sqlglot.transpile(sql, read="bigquery", write="duckdb")[0]).df()
+        local = aggregate_frame(plan, df)
+        assert list(remote.columns) == list(local.columns) and len(remote) == len(local), plan
+        for column in remote.columns:
+            if column == 'period':
+                assert (remote[column].dt.tz_localize(None).to_numpy() == local[column].to_numpy()).all()
+            elif column == 'category':
+                assert remote[column].tolist() == local[column].tolist()
+            else:
+                assert np.allclose(remote[column].astype(float), local[column].astype(float))
+        if plan['kind'] == 'categories':
+            assert len(local) == plan['top_k'] + 1 and local['category'].iloc[-1] == OTHER_LABEL
+        # BigQuery evaluates a CTE at every reference: each aggregate reads the result once
+        tables = [table.name for table in sqlglot.parse_one(sql, read="bigquery").find_all(sqlglot.exp.Table)]
+        assert tables.count("source") == 1, plan
+
+
+def test_chart_aggregates_are_held_to_the_byte_budgets():
+    client = FakeBigQueryClient(50000)
+    connector = BigQueryConnector("bench", client=client, use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(),
+                             cost_guard=QueryCostGuard(dataset_limits={'ds': 1000}))
+    plan = plan_chart(_sample()[['amount']])
+    assert agent.fetch_chart_data(plan, "SELECT amount FROM `bench.ds.t`", "s1", "ds.t") is None
+    # Dry-run only: the aggregate over the limit never ran
+    assert client.jobs == 0 and len(client.queries) == 1
+    assert agent.fetch_chart_data(plan, "SELECT amount FROM `bench.ds.t`", "s1", "other.t") is not None
+    assert client.jobs == 1 and agent.cost_guard.session_usage("s1") == 50000 * BENCH_ROW_BYTES
+
+
+def test_truncated_chat_results_are_charted_from_bigquery_aggregates():
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}, {'name': 'amount', 'type': 'FLOAT'},
+                                {'name': 'category', 'type': 'STRING'}]}}
+    schema_agent = mock.MagicMock()
+    schema_agent.get_full_dataset_schema.return_value = schema
+    connector = BigQueryConnector("bench", client=FakeBigQueryClient(50000), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=schema_agent,
+                             model=FakeGenerativeModel(["SELECT id, amount FROM `bench.ds.t`"]),
+                             max_result_rows=1000)
+    buckets = pd.DataFrame({'bucket_start': [0.0, 10.0], 'bucket_end': [10.0, 20.0], 'count': [30000, 20000]})
+    with mock.patch.object(DataAnalystAgent, "fetch_chart_data", return_value=buckets) as fetch:
+        _, visualization, _, _ = run_chat_turn("amount per id", [], "ds", data_analyst=agent, project_id="bench")
+
+    plan, source_sql, _, dataset_id = fetch.call_args.args
+    assert plan['kind'] == 'histogram' and plan['column'] == 'amount' and dataset_id == "ds.t"
+    assert source_sql == "SELECT id, amount FROM `bench.ds.t`"
+    assert list(visualization.figure.data[0].y) == [30000, 20000]
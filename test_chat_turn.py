@@ -0,0 +1,72 @@
+"""
+Tests for the chat pipeline outside of the Dash callback, and the chat-turn benchmark.
+"""
+
+import sys
+import os
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from callbacks.main_callbacks import (append_chat_messages, append_to_transcript, prepend_earlier_messages,
+                                      run_chat_turn)
+from utils.session_store import SessionStore
+from benchmarks.bench_chat_turn import run_case, PROJECT, DATASET, SCRIPTED_SQL
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel, FakeMetadataClient
+from connectors.bigquery_connector import BigQueryConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from agents.schema_agent import SchemaAgent
+
+
+def test_run_chat_turn_answers_with_injected_agent():
+    metadata_client = FakeMetadataClient(2, 5, project=PROJECT, call_latency=0.0, query_latency=0.0)
+    schema_agent = SchemaAgent(project_id=PROJECT,
+                               connector=BigQueryConnector(PROJECT, client=metadata_client, use_bqstorage=False))
+    model = FakeGenerativeModel([SCRIPTED_SQL])
+    connector = BigQueryConnector(PROJECT, client=FakeBigQueryClient(30), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id=PROJECT, connector=connector, schema_agent=schema_agent, model=model)
+
+    chat_elements, visualization, data_table, insights = run_chat_turn(
+        "show amount by id", [], DATASET, data_analyst=agent, project_id=PROJECT)
+
+    assert model.calls == 1
+    assert len(chat_elements) == 2
+    assert "Analysis Complete" in chat_elements[1].children[0].children
+    # The browser gets the first page and the result's handle; later pages are served by handle
+    handle, table = data_table.children[0].data, data_table.children[1]
+    assert handle is not None and agent.result_store.get(handle)[0].num_rows == 30
+    assert len(table.data) == 20 and table.page_count == 2 and table.page_action == 'custom'
+    assert insights
+
+
+def test_transcript_updates_send_one_turn_and_window_older_messages():
+    store = SessionStore(None)
+    ref, history = {}, []
+    for turn in range(30):
+        messages = [{'type': 'user', 'content': f"question {turn}", 'timestamp': '10:00'},
+                    {'type': 'bot', 'content': f"answer {turn}", 'timestamp': '10:00'}]
+        history.extend(messages)
+        ref = append_chat_messages("s1", ref, messages, store)
+        patch, ref, style = append_to_transcript(ref, ["user element", "bot element"], window=10)
+    # Each turn appends its two messages and drops the two that fell out of the window
+    assert [op['operation'] for op in patch.to_plotly_json()['operations']] == ["Extend", "Delete", "Delete"]
+    assert ref == {'key': 'chat_history', 'length': 60, 'first': 50} and style == {'display': 'block'}
+
+    patch, ref, style = prepend_earlier_messages("s1", ref, count=45, session_store=store)
+    operations = patch.to_plotly_json()['operations']
+    assert len(operations) == 45 and ref['first'] == 5 and style == {'display': 'block'}
+    # Prepended one by one from the newest, so the last one ends up on top
+    assert operations[0]['params']['value'].children[0].children == "answer 24"
+    assert operations[-1]['params']['value'].children[0].children == "answer 2"
+
+    patch, ref, style = prepend_earlier_messages("s1", ref, count=45, session_store=store)
+    assert len(patch.to_plotly_json()['operations']) == 5 and ref['first'] == 0 and style == {'display': 'none'}
+
+
+def test_chat_turn_benchmark_reports_every_stage():
+    case = run_case(rows=100, columns=120, turns=2, model_latency=0.0, model_latency_per_1k=0.0,
+                    max_result_rows=None, columns_per_table=50)
+    assert case['tables'] == 3
+    assert case['rows_loaded'] == 100
+    assert set(case['stages']) >= {"schema", "sql_generation", "query", "process", "turn", "visualization_agent"}
+    assert all(stage['p50_ms'] <= stage['p99_ms'] for stage in case['stages'].values())
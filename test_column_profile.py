@@ -0,0 +1,102 @@
+"""
+Tests for the single-pass column profiles behind insights and chart heuristics.
+"""
+
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.column_profile import columns_of, profile_chunks, profile_frame
+from agents.data_analyst_agent import DataAnalystAgent
+from agents.visualization_agent import VisualizationAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel
+from callbacks.main_callbacks import run_chat_turn
+
+
+def _sample(rows=60_000):
+    rng = np.random.default_rng(4)
+    df = pd.DataFrame({
+        'amount': rng.gamma(2.0, 10.0, rows),
+        'user_id': rng.integers(0, 30_000, rows),
+        'region': rng.choice(['north', 'south', 'east', 'west', None], rows, p=[0.4, 0.3, 0.2, 0.05, 0.05]),
+        'day': pd.date_range('2023-01-01', periods=rows, freq='h'),
+        'returned': rng.random(rows) < 0.1,
+    })
+    df.loc[::50, 'amount'] = np.nan
+    return df
+
+
+def test_profiles_match_pandas():
+    df = _sample()
+    profile = profile_frame(df)
+    assert {name: column.kind for name, column in profile.items()} == {
+        'amount': 'numeric', 'user_id': 'numeric', 'region': 'text', 'day': 'temporal', 'returned': 'boolean'}
+    assert columns_of(profile, "numeric") == ['amount', 'user_id']
+
+    amount = profile['amount']
+    assert amount.count == len(df) and amount.nulls == int(df['amount'].isna().sum())
+    assert amount.minimum == df['amount'].min() and amount.maximum == df['amount'].max()
+    assert np.isclose(amount.mean, df['amount'].mean()) and np.isclose(amount.std, df['amount'].std())
+    assert profile['day'].minimum == df['day'].min() and profile['day'].maximum == df['day'].max()
+
+    # Text and boolean columns: exact distinct counts and top values
+    region_counts = df['region'].value_counts()
+    assert profile['region'].distinct == 4 and profile['region'].nulls == int(df['region'].isna().sum())
+    assert profile['region'].top[:2] == list(zip(region_counts.index[:2], region_counts.iloc[:2]))
+    assert profile['returned'].top[0] == (False, int((~df['returned']).sum()))
+    # High-cardinality columns: HyperLogLog estimates within a few percent
+    for name in ('amount', 'user_id', 'day'):
+        assert abs(profile[name].distinct - df[name].nunique()) <= 0.05 * df[name].nunique()
+
+
+def test_chunked_and_merged_profiles_equal_the_single_pass():
+    df = _sample()
+    whole = profile_frame(df)
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    chunked = profile_chunks(table.to_batches(max_chunksize=7_000))
+
+    halves = [profile_frame(part) for part in (df.iloc[:25_000], df.iloc[25_000:])]
+    merged = {name: column.merge(halves[1][name]) for name, column in halves[0].items()}
+
+    for profiles in (chunked, merged):
+        for name, column in whole.items():
+            other = profiles[name]
+            assert (other.kind, other.count, other.nulls) == (column.kind, column.count, column.nulls)
+            assert other.minimum == column.minimum and other.maximum == column.maximum
+            if column.mean is not None:
+                assert np.isclose(other.mean, column.mean) and np.isclose(other.std, column.std)
+            assert other.top == column.top
+            assert abs(other.distinct - column.distinct) <= 0.05 * column.distinct
+
+
+def test_insights_and_charts_are_built_from_profiles():
+    df = _sample(5_000)
+    # The profile replaces describe() and the repeated dtype and null scans
+    with mock.patch.object(pd.DataFrame, "describe", side_effect=AssertionError("describe() called")), \
+            mock.patch.object(pd.DataFrame, "select_dtypes", side_effect=AssertionError("select_dtypes() called")):
+        result = VisualizationAgent().generate_visualizations(df)
+        assert "Column Profile:" in result['insights_text'] and "north" in result['insights_text']
+        assert len(result['charts']) == 3
+
+        schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}, {'name': 'amount', 'type': 'FLOAT'},
+                                    {'name': 'category', 'type': 'STRING'}]}}
+        schema_agent = mock.MagicMock()
+        schema_agent.get_full_dataset_schema.return_value = schema
+        connector = BigQueryConnector("bench", client=FakeBigQueryClient(500), use_bqstorage=False)
+        agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=schema_agent,
+                                 model=FakeGenerativeModel(["SELECT * FROM `bench.ds.t`"]))
+        _, visualization, _, insights = run_chat_turn("show the rows", [], "ds", data_analyst=agent,
+                                                      project_id="bench")
+
+    texts = [element.children[1].children for element in insights]
+    assert "id: ranges from 0.00 to 499.00" in texts
+    assert "category: 50 distinct values, most common 'category_0' (10 records)" in texts
+    assert visualization.figure.data[0].type == 'bar'
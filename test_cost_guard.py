@@ -0,0 +1,70 @@
+"""
+Tests for dry-run cost estimation and byte-budget guardrails.
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.cost_guard import QueryCostGuard
+from utils.sql_utils import sql_fingerprint
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient, BENCH_ROW_BYTES
+
+
+def test_fingerprint_ignores_whitespace_and_comments():
+    assert sql_fingerprint("SELECT a\n  FROM t -- all rows\n;") == sql_fingerprint("SELECT a FROM t")
+    assert sql_fingerprint("SELECT 'a  b' FROM t") != sql_fingerprint("SELECT 'a b' FROM t")
+
+
+def test_estimates_are_cached_by_fingerprint():
+    connector = mock.MagicMock()
+    connector.estimate_query_bytes.return_value = 1234
+    guard = QueryCostGuard()
+
+    assert guard.estimate(connector, "SELECT a FROM t") == 1234
+    assert guard.estimate(connector, "SELECT  a\nFROM t;") == 1234
+    assert connector.estimate_query_bytes.call_count == 1
+    assert guard.estimate_hits == 1
+
+
+def test_dataset_and_session_budgets():
+    guard = QueryCostGuard(max_bytes_per_query=1000, confirm_bytes_per_query=500,
+                           session_budget=1500, dataset_limits={'small': 100})
+
+    assert guard.check(200, 'small.table')['action'] == 'refuse'
+    assert guard.check(200, 'big.table')['action'] == 'allow'
+    assert guard.check(800, 'big.table')['action'] == 'confirm'
+    assert guard.check(800, 'big.table', confirmed=True)['action'] == 'allow'
+
+    guard.record_usage('session-a', 1000)
+    assert guard.check(600, 'big.table', 'session-a', confirmed=True)['action'] == 'refuse'
+    assert guard.check(600, 'big.table', 'session-b', confirmed=True)['action'] == 'allow'
+
+
+def test_process_asks_for_confirmation_then_runs_confirmed_sql():
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT * FROM `test-project.ds.t`"
+    connector = BigQueryConnector("test-project", client=FakeBigQueryClient(1000, 500), use_bqstorage=False)
+    guard = QueryCostGuard(confirm_bytes_per_query=100 * BENCH_ROW_BYTES)
+    agent = DataAnalystAgent(project_id="test-project", connector=connector, schema_agent=mock.MagicMock(),
+                             model=model, cost_guard=guard)
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}]}}
+
+    first = agent.process("show everything", schema, "test-project", "ds.t", session_id="s1")
+    assert first['confirmation_required']
+    assert first['bytes_estimated'] == 1000 * BENCH_ROW_BYTES
+    assert first['results_df'] is None
+
+    pending = guard.pop_pending("s1")
+    second = agent.process(pending['query'], schema, "test-project", "ds.t", session_id="s1",
+                           confirmed_sql=pending['sql_query'])
+    assert second['error'] is None
+    assert len(second['results_df']) == 1000
+    assert second['bytes_billed'] == 1000 * BENCH_ROW_BYTES
+    assert model.generate_content.call_count == 1
+    assert guard.session_usage("s1") == 1000 * BENCH_ROW_BYTES
@@ -0,0 +1,72 @@
+"""
+Tests for downsampling of large line and scatter series.
+"""
+
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.downsampling import METHODS, downsample, lttb_indices, make_scatter
+from benchmarks.bench_downsampling import synthetic_series
+
+
+def _reference_lttb(x, y, n_out):
+    """Point-by-point LTTB as published (Steinarsson, 2013)."""
+    n = len(x)
+    bound = lambda i: i * (n - 2) // (n_out - 2) + 1
+    selected, a = [0], 0
+    for i in range(n_out - 2):
+        following = slice(bound(i + 1), bound(i + 2) if i + 2 < n_out - 1 else n)
+        avg_x, avg_y = x[following].mean(), y[following].mean()
+        start, end = bound(i), bound(i + 1)
+        area = np.abs((x[a] - avg_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (avg_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected.append(a)
+    return np.array(selected + [n - 1])
+
+
+def test_lttb_matches_the_reference_algorithm():
+    rng = np.random.default_rng(2)
+    for _ in range(50):
+        n = int(rng.integers(10, 2000))
+        n_out = int(rng.integers(3, n))
+        x, y = np.sort(rng.random(n)), rng.standard_normal(n).cumsum()
+        assert np.array_equal(lttb_indices(x, y, n_out), _reference_lttb(x, y, n_out))
+
+
+def test_every_method_caps_points_and_keeps_the_ends():
+    df = synthetic_series(100_000)
+    peak, trough = df['value'].idxmax(), df['value'].idxmin()
+    for method in METHODS:
+        kept = downsample(df['time'], df['value'], 1000, method)
+        assert len(kept) <= 1000 and kept[0] == 0 and kept[-1] == len(df) - 1, method
+        assert np.all(np.diff(kept) > 0), method
+    minmax = set(downsample(df['time'], df['value'], 1000, "minmax").tolist())
+    assert peak in minmax and trough in minmax
+    # Short series are left alone
+    assert np.array_equal(downsample(None, np.arange(10.0), 1000), np.arange(10))
+
+
+def test_unsorted_and_missing_values_map_back_to_the_callers_rows():
+    rng = np.random.default_rng(4)
+    x = rng.permutation(5000).astype(float)
+    y = np.sin(x / 50.0)
+    y[::7] = np.nan
+    kept = downsample(x, y, 500, "minmax")
+    assert np.all(np.diff(x[kept]) > 0) and not np.isnan(y[kept]).any()
+    valid_x = x[~np.isnan(y)]
+    assert x[kept][0] == valid_x.min() and x[kept][-1] == valid_x.max()
+
+
+def test_large_traces_switch_to_webgl():
+    times = pd.Series(pd.date_range("2024-01-01", periods=20_000, freq="s", tz="UTC"))
+    values = pd.Series(np.random.default_rng(1).standard_normal(20_000))
+    assert make_scatter(times, values, max_points=2000).type == "scattergl"
+    small = make_scatter(times, values, max_points=400)
+    assert small.type == "scatter" and len(small.y) <= 400
+    assert len(make_scatter(times.head(50), values.head(50)).x) == 50
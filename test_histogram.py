@@ -0,0 +1,73 @@
+"""
+Tests for server-side histogram binning.
+"""
+
+import sys
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sqlglot
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.histogram import StreamingHistogram, bin_width, histogram_chunks, histogram_frame
+from utils.chart_planner import aggregate_frame, aggregate_sql, histogram_plan
+
+
+def test_bin_width_follows_freedman_diaconis_with_whole_widths_for_integers():
+    values = np.random.default_rng(0).normal(50.0, 10.0, 20_000)
+    width, origin = bin_width(values)
+    # NumPy's "fd" rule, which then stretches the width so whole bins span the range exactly
+    assert len(np.histogram_bin_edges(values, bins="fd")) - 1 == int(np.ceil(np.ptp(values) / width))
+    assert origin == values.min()
+    # A sample of a larger result gets the width of the whole result
+    assert bin_width(values, total_count=20_000 * 8)[0] < width
+    # The width keeps the bins under the limit, and integer columns get whole-number widths
+    assert bin_width(np.arange(1_000_000), max_bins=50)[0] >= 1_000_000 / 50
+    assert bin_width(pd.Series([1, 2, 2, 3, 9], dtype="int64")) == (2.0, 1.0)
+    assert bin_width(np.full(100, 7.0))[0] > 0
+
+
+def test_chunked_and_merged_histograms_equal_the_one_shot_histogram():
+    rng = np.random.default_rng(1)
+    values = np.concatenate([rng.normal(0, 1, 50_000), rng.normal(400, 5, 1_000)])
+    values[::97] = np.nan
+    # The first chunk only sees the main mode, so later chunks force the width to double
+    chunks = np.array_split(values, 20)
+    width, origin = bin_width(chunks[0])
+    whole = StreamingHistogram(width, origin, max_bins=60).add(values)
+    streamed = StreamingHistogram(width, origin, max_bins=60)
+    for chunk in chunks:
+        streamed.add(chunk)
+    left, right = StreamingHistogram(width, origin, 60), StreamingHistogram(width, origin, 60)
+    left.add(values[:40_000])
+    right.add(values[40_000:])
+    merged = left.merge(right)
+    for other in (streamed, merged):
+        assert other.doublings == whole.doublings > 0
+        pd.testing.assert_frame_equal(other.to_frame(), whole.to_frame())
+    frame = whole.to_frame()
+    assert len(frame) <= 60 and frame['count'].sum() + whole.missing == len(values)
+    assert whole.missing == len(values[::97])
+
+    batches = [pa.record_batch([pa.array(chunk)], names=["v"]) for chunk in chunks]
+    assert histogram_chunks(batches, "v", max_bins=60)['count'].sum() == frame['count'].sum()
+
+
+def test_bigquery_bins_match_numpy_bins_on_the_same_grid(duckdb):
+    rng = np.random.default_rng(2)
+    df = pd.DataFrame({'amount': np.concatenate([rng.gamma(2.0, 10.0, 30_000), [2_500.0, -40.0]])})
+    # Planned from the first rows only, as for a truncated result; the full range needs wider bins
+    plan = histogram_plan(df.head(1_000), 'amount', total_rows=len(df))
+    connection = duckdb.connect()
+    connection.register('source_rows', df)
+    sql = sqlglot.transpile(aggregate_sql(plan, "SELECT * FROM source_rows"), read="bigquery", write="duckdb")[0]
+    remote = connection.execute(sql).df()
+    local = aggregate_frame(plan, df)
+    assert len(local) <= plan['max_bins'] and remote['count'].tolist() == local['count'].tolist()
+    assert np.allclose(remote['bucket_start'], local['bucket_start'])
+    assert local['bucket_start'].iloc[0] <= -40.0 and local['bucket_end'].iloc[-1] > 2_500.0
+    assert histogram_frame([]).empty
@@ -0,0 +1,116 @@
+"""
+Tests for the offline DuckDB/SQLite connector.
+"""
+
+import sys
+import os
+import tempfile
+import threading
+from unittest import mock
+
+import pandas as pd
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from connectors.local_connector import LocalConnector, duckdb
+from agents.data_analyst_agent import DataAnalystAgent
+from agents.schema_agent import SchemaAgent
+from utils.schema_cache import SchemaCache
+
+ENGINES = ["sqlite"] + (["duckdb"] if duckdb is not None else [])
+
+CROPS = pd.DataFrame({
+    'state_name': ["Punjab", "Punjab", "Kerala", "Bihar"],
+    'crop': ["wheat", "rice", "rice", "maize"],
+    'production': [10.5, 7.0, 3.25, 4.0],
+    'crop_year': [2010, 2010, 2011, 2012],
+})
+
+
+def _connector(engine, path=":memory:"):
+    connector = LocalConnector(path=path, project_id="local-project", engine=engine)
+    connector.load_table("agri", "crop_production", CROPS)
+    return connector
+
+
+def test_metadata_and_bigquery_style_queries():
+    for engine in ENGINES:
+        connector = _connector(engine)
+        assert connector.list_datasets() == ["agri"]
+        assert connector.list_tables("agri") == ["crop_production"]
+        schema = connector.get_table_schema("agri", "crop_production")
+        assert [col['name'] for col in schema['columns']] == list(CROPS.columns)
+        assert connector.get_dataset_schema("agri") == {'crop_production': schema}
+        assert connector.get_table_stats("agri")['crop_production']['row_count'] == 4
+        assert connector.get_table_info() == {'agri': ["crop_production"]}
+
+        df = connector.execute_query(
+            "SELECT state_name, SUM(production) AS total FROM `local-project.agri.crop_production` "
+            "GROUP BY state_name ORDER BY total DESC"
+        )
+        assert df['state_name'].tolist() == ["Punjab", "Bihar", "Kerala"], engine
+        # Backticks inside string literals are values, not table names
+        df = connector.execute_query(
+            "SELECT 'see `a.b.c`' AS note, COUNT(*) AS n FROM `local-project.agri.crop_production` "
+            "WHERE crop != 'x `local-project.agri.t` y'"
+        )
+        assert df['note'].tolist() == ["see `a.b.c`"] and df['n'].tolist() == [4], engine
+        assert connector.execute_query_arrow("SELECT * FROM `agri.crop_production`").num_rows == 4
+        assert len(connector.get_sample_data("agri.crop_production", limit=2)) == 2
+
+
+def test_iter_query_pages_and_stops_at_ceiling():
+    for engine in ENGINES:
+        connector = _connector(engine)
+        connector.load_table("agri", "numbers", pd.DataFrame({'n': range(1000)}))
+        chunks = connector.iter_query("SELECT n FROM `agri.numbers` ORDER BY n", page_size=100,
+                                      max_rows=250, as_arrow=True)
+        tables = list(chunks)
+        assert sum(t.num_rows for t in tables) == 250
+        assert chunks.truncated
+        assert connector.estimate_query_bytes("SELECT 1") is None
+
+
+def test_other_queries_run_while_a_result_is_paged():
+    for engine in ENGINES:
+        connector = _connector(engine)
+        connector.load_table("agri", "numbers", pd.DataFrame({'n': range(1000)}))
+        chunks = iter(connector.iter_query("SELECT n FROM `agri.numbers` ORDER BY n", page_size=100))
+        assert len(next(chunks)) == 100
+        # Another thread is not locked out between the pages the caller holds
+        counted = []
+        worker = threading.Thread(target=lambda: counted.append(connector.get_row_counts("agri")), daemon=True)
+        worker.start()
+        worker.join(5)
+        assert counted == [{'crop_production': 4, 'numbers': 1000}], engine
+        assert sum(len(chunk) for chunk in chunks) == 900
+
+
+def test_sqlite_datasets_persist_next_to_the_database_file():
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "warehouse.db")
+        _connector("sqlite", path)
+        reopened = LocalConnector(path=path, engine="sqlite")
+        assert reopened.list_datasets() == ["agri"]
+        assert reopened.get_row_counts() == {'crop_production': 4}
+
+
+def test_agents_run_end_to_end_on_local_connector():
+    for engine in ENGINES:
+        connector = _connector(engine)
+        schema_agent = SchemaAgent(project_id="local-project", connector=connector,
+                                   schema_cache=SchemaCache(background=False))
+        schema = schema_agent.get_full_dataset_schema("agri")
+        assert 'crop_production' in schema
+
+        model = mock.MagicMock()
+        model.generate_content.return_value.text = (
+            "SELECT crop, SUM(production) AS total FROM `local-project.agri.crop_production` GROUP BY crop ORDER BY crop"
+        )
+        agent = DataAnalystAgent(project_id="local-project", connector=connector, schema_agent=schema_agent,
+                                 model=model)
+        result = agent.process("total production by crop", schema, "local-project", "agri")
+        assert result['error'] is None, result['error']
+        assert result['results_df']['crop'].tolist() == ["maize", "rice", "wheat"]
+        assert result['bytes_estimated'] is None
@@ -0,0 +1,105 @@
+"""
+Tests for the in-process metrics registry and the /metrics endpoint.
+"""
+
+import sys
+import os
+import threading
+
+import dash
+from dash import html, dcc
+from dash.dependencies import Input, Output
+from dash.exceptions import PreventUpdate
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import metrics
+from utils.metrics import MetricsRegistry, cache_metrics_collector, register_metrics_endpoint
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel
+from connectors.bigquery_connector import BigQueryConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from unittest import mock
+
+
+def test_counters_and_histograms_are_exact_under_threads():
+    registry = MetricsRegistry()
+    requests = registry.counter("requests_total", "Requests.", ("path",))
+    latency = registry.histogram("latency_seconds", "Latency.", ("path",), buckets=(0.1, 1.0))
+
+    def work():
+        for i in range(5000):
+            requests.inc(path="/a")
+            latency.observe(0.05 if i % 2 else 0.5, path="/a")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    text = registry.render()
+    assert 'requests_total{path="/a"} 40000' in text
+    assert 'latency_seconds_bucket{path="/a",le="0.1"} 20000' in text
+    assert 'latency_seconds_bucket{path="/a",le="1"} 40000' in text
+    assert 'latency_seconds_bucket{path="/a",le="+Inf"} 40000' in text
+    assert 'latency_seconds_count{path="/a"} 40000' in text
+    assert "# TYPE latency_seconds histogram" in text
+
+
+def test_metrics_endpoint_counts_dash_callbacks_and_caches():
+    app = dash.Dash(__name__)
+    app.layout = html.Div([dcc.Input(id="inp"), html.Div(id="out")])
+
+    @app.callback(Output("out", "children"), Input("inp", "value"))
+    def echo(value):
+        if value == "skip":
+            raise PreventUpdate
+        return value
+
+    registry = MetricsRegistry()
+    register_metrics_endpoint(app.server, registry)
+    cache_metrics_collector(lambda: {'sql_generation': {'hits': 3, 'misses': 1}}, registry)
+    client = app.server.test_client()
+    for value in ["a", "b", "skip"]:
+        client.post("/_dash-update-component", json={
+            "output": "out.children", "outputs": {"id": "out", "property": "children"},
+            "inputs": [{"id": "inp", "property": "value", "value": value}], "changedPropIds": ["inp.value"],
+        })
+    # Polls for a background callback's result are counted apart from its requests
+    client.post("/_dash-update-component?cacheKey=k&job=1", json={
+        "output": "out.children", "outputs": {"id": "out", "property": "children"},
+        "inputs": [{"id": "inp", "property": "value", "value": "c"}], "changedPropIds": ["inp.value"],
+    })
+
+    text = client.get("/metrics").get_data(as_text=True)
+    assert 'data_agent_dash_callback_requests_total{callback="out.children",status="200"} 2' in text
+    assert 'data_agent_dash_callback_requests_total{callback="out.children",status="204"} 1' in text
+    assert 'data_agent_dash_callback_duration_seconds_count{callback="out.children"} 3' in text
+    assert 'data_agent_dash_callback_polls_total{callback="out.children",status="200"} 1' in text
+    assert "data_agent_inflight_requests 0" in text
+    assert 'data_agent_cache_lookups_total{cache="sql_generation",result="hit"} 3' in text
+    assert 'data_agent_cache_hit_ratio{cache="sql_generation"} 0.75' in text
+
+
+def test_pipeline_records_llm_and_bigquery_metrics():
+    before = {
+        'llm': metrics.LLM_LATENCY.count(model="fake-model", status="ok"),
+        'tokens': metrics.LLM_TOKENS.value(model="fake-model", kind="prompt"),
+        'jobs': metrics.BIGQUERY_JOB_LATENCY.count(status="ok"),
+        'rows': metrics.BIGQUERY_ROWS_FETCHED.value(),
+        'bytes': metrics.BIGQUERY_BYTES_PROCESSED.value(),
+    }
+    model = FakeGenerativeModel(["SELECT * FROM `test-project.ds.t`"])
+    connector = BigQueryConnector("test-project", client=FakeBigQueryClient(1500, 500), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="test-project", connector=connector, schema_agent=mock.MagicMock(),
+                             model=model, model_name="fake-model")
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}]}}
+    result = agent.process("show everything", schema, "test-project", "ds")
+    assert result['error'] is None
+
+    assert metrics.LLM_LATENCY.count(model="fake-model", status="ok") == before['llm'] + 1
+    assert metrics.LLM_TOKENS.value(model="fake-model", kind="prompt") > before['tokens']
+    assert metrics.BIGQUERY_JOB_LATENCY.count(status="ok") == before['jobs'] + 1
+    assert metrics.BIGQUERY_ROWS_FETCHED.value() == before['rows'] + 1500
+    assert metrics.BIGQUERY_BYTES_PROCESSED.value() > before['bytes']
@@ -0,0 +1,90 @@
+"""
+Tests for bounded, chunked query result iteration.
+"""
+
+import sys
+import os
+from unittest import mock
+
+import pandas as pd
+import pyarrow as pa
+from google.api_core import exceptions as google_exceptions
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from interfaces.database_interface import QueryResultChunks
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient, StandInRowIterator
+
+
+def _frames(num_chunks, rows_per_chunk):
+    return [pd.DataFrame({'value': range(i * rows_per_chunk, (i + 1) * rows_per_chunk)}) for i in range(num_chunks)]
+
+
+def test_row_ceiling_truncates_and_slices_last_chunk():
+    chunks = QueryResultChunks(_frames(5, 10), max_rows=25)
+    frames = list(chunks)
+    assert [len(f) for f in frames] == [10, 10, 5]
+    assert chunks.rows == 25
+    assert chunks.truncated
+
+
+def test_exact_fit_is_not_truncated():
+    chunks = QueryResultChunks(_frames(2, 10), max_rows=20)
+    assert sum(len(f) for f in chunks) == 20
+    assert not chunks.truncated
+
+
+def test_known_total_rows_avoids_extra_page():
+    def pages():
+        yield from _frames(2, 10)
+        raise AssertionError("a page past the ceiling was fetched")
+
+    chunks = QueryResultChunks(pages(), max_rows=20, total_rows=30)
+    assert sum(len(f) for f in chunks) == 20
+    assert chunks.truncated
+
+
+def test_byte_ceiling_on_arrow_chunks():
+    batches = [pa.record_batch([pa.array(range(1000), type=pa.int64())], names=['v']) for _ in range(10)]
+    chunks = QueryResultChunks(batches, max_bytes=8 * 2500)
+    assert sum(b.num_rows for b in chunks) == 2500
+    assert chunks.bytes <= 8 * 2500
+    assert chunks.truncated
+
+
+def test_bigquery_connector_pages_until_ceiling():
+    client = FakeBigQueryClient(num_rows=50_000, page_size=1000)
+    connector = BigQueryConnector(project_id="test-project", client=client, use_bqstorage=False)
+
+    chunks = connector.iter_query("SELECT * FROM t", page_size=1000, max_rows=2500)
+    frames = list(chunks)
+    assert all(isinstance(f, pd.DataFrame) for f in frames)
+    assert sum(len(f) for f in frames) == 2500
+    assert chunks.truncated
+    assert chunks.total_rows == 50_000
+
+
+def test_bigquery_connector_streams_from_the_storage_read_api():
+    client = FakeBigQueryClient(num_rows=50_000, page_size=1000)
+    connector = BigQueryConnector(project_id="test-project", client=client, bqstorage_client=object())
+
+    with mock.patch.object(StandInRowIterator, "_rest_iterator", side_effect=AssertionError("paged over REST")):
+        chunks = connector.iter_query("SELECT * FROM t", page_size=1000, max_rows=2500, as_arrow=True)
+        assert sum(batch.num_rows for batch in chunks) == 2500
+    assert chunks.truncated
+
+    # A transient failure falls back to REST pages for that query only
+    with mock.patch.object(StandInRowIterator, "_storage_batches",
+                           side_effect=google_exceptions.ServiceUnavailable("try again")):
+        chunks = connector.iter_query("SELECT * FROM t", page_size=1000, max_rows=2500, as_arrow=True)
+        assert sum(batch.num_rows for batch in chunks) == 2500
+    assert connector.bqstorage_client is not None
+
+    # Without the readsessions permission the API is not tried again
+    with mock.patch.object(StandInRowIterator, "_storage_batches",
+                           side_effect=google_exceptions.PermissionDenied("readsessions.create denied")):
+        chunks = connector.iter_query("SELECT * FROM t", page_size=1000, max_rows=2500, as_arrow=True)
+        assert sum(batch.num_rows for batch in chunks) == 2500
+    assert connector.bqstorage_client is None
@@ -0,0 +1,67 @@
+"""
+Tests for the query result cache.
+"""
+
+import sys
+import os
+import datetime
+import tempfile
+from unittest import mock
+
+import pyarrow as pa
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.result_cache import QueryResultCache, result_cache_key
+from utils.sql_utils import is_deterministic
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient
+
+
+def test_memory_tier_evicts_by_bytes_and_disk_tier_survives():
+    with tempfile.TemporaryDirectory() as tmp:
+        table = pa.table({'x': list(range(1000))})
+        cache = QueryResultCache(memory_bytes=table.nbytes * 2, directory=tmp)
+        for i in range(3):
+            cache.put(f"k{i}", table, {'truncated': False, 'total_rows': 1000})
+        assert cache.stats()['memory_entries'] == 2
+
+        # k0 was evicted from memory but is still on disk; a new process sees every entry
+        table_back, metadata = cache.get("k0")
+        assert table_back.equals(table) and metadata['total_rows'] == 1000
+        assert cache.disk_hits == 1
+        assert QueryResultCache(directory=tmp).get("k2") is not None
+        assert cache.get("missing") is None
+        assert 0 < cache.hit_rate < 1
+
+
+def test_keys_depend_on_table_versions_and_skip_volatile_sql():
+    assert result_cache_key("SELECT a FROM t", {'t': '1'}) == result_cache_key("SELECT  a\nFROM t;", {'t': '1'})
+    assert result_cache_key("SELECT a FROM t", {'t': '1'}) != result_cache_key("SELECT a FROM t", {'t': '2'})
+    assert not is_deterministic("SELECT * FROM t WHERE d = CURRENT_DATE()")
+    assert is_deterministic("SELECT 'current_date' AS label FROM t")
+
+
+def test_repeated_question_skips_bigquery_until_table_changes():
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT * FROM `bench.ds.t`"
+    client = FakeBigQueryClient(500, 100)
+    agent = DataAnalystAgent(project_id="bench", connector=BigQueryConnector("bench", client=client, use_bqstorage=False),
+                             schema_agent=mock.MagicMock(), model=model,
+                             result_cache=QueryResultCache(directory=None))
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}]}}
+
+    first = agent.process("show rows", schema, "bench", "ds")
+    second = agent.process("show rows", schema, "bench", "ds")
+    assert client.jobs == 1
+    assert second['from_cache'] and second['bytes_billed'] == 0
+    assert second['results_df'].equals(first['results_df'])
+    # The table's version is looked up once per TTL, not for every query
+    assert client.table_lookups == 1
+
+    client.modified += datetime.timedelta(minutes=1)
+    agent.connector.table_version_ttl = 0  # the change is seen once the versions expire
+    third = agent.process("show rows", schema, "bench", "ds")
+    assert client.jobs == 2 and not third['from_cache'] and client.table_lookups == 2
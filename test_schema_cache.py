@@ -0,0 +1,85 @@
+"""
+Tests for the TTL + last-modified-aware schema cache.
+"""
+
+import sys
+import os
+import time
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.schema_cache import SchemaCache
+from agents.schema_agent import SchemaAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeMetadataClient
+
+
+class _Source:
+    def __init__(self):
+        self.version = "v1"
+        self.loads = 0
+
+    def load(self):
+        self.loads += 1
+        return {'t': {'columns': [], 'version': self.version}}
+
+
+def test_stale_entries_are_revalidated_or_refreshed():
+    cache = SchemaCache(ttl_seconds=0.01, background=False)
+    source = _Source()
+    get = lambda: cache.get(("p", "ds"), source.load, lambda: source.version)
+
+    assert get()['t']['version'] == "v1"
+    assert get()['t']['version'] == "v1"
+    assert source.loads == 1 and cache.hits == 1 and cache.misses == 1
+
+    time.sleep(0.02)
+    get()  # stale, version unchanged: revalidated without reloading
+    assert source.loads == 1 and cache.revalidations == 1
+
+    time.sleep(0.02)
+    source.version = "v2"
+    assert get()['t']['version'] == "v1"  # stale copy is served while refreshing
+    assert source.loads == 2 and cache.refreshes == 1
+    assert get()['t']['version'] == "v2"
+
+
+def test_lru_eviction_and_invalidate():
+    cache = SchemaCache(max_entries=2, background=False)
+    for dataset in ["a", "b", "c"]:
+        cache.get(("p", dataset), lambda: {'t': {}})
+    assert cache.stats()['entries'] == 2 and cache.evictions == 1
+
+    assert cache.invalidate("c") == 1
+    assert cache.invalidate() == 1
+    assert cache.stats()['entries'] == 0
+
+
+def test_schema_agent_serves_repeat_lookups_from_cache():
+    client = FakeMetadataClient(num_tables=3, num_columns=2, call_latency=0, query_latency=0)
+    agent = SchemaAgent(project_id="bench", connector=BigQueryConnector("bench", client=client, use_bqstorage=False))
+
+    first = agent.get_full_dataset_schema("ds")
+    assert agent.get_full_dataset_schema("ds") is first
+    assert client.calls == 1
+
+    agent.invalidate("ds")
+    agent.get_full_dataset_schema("ds")
+    assert client.calls == 2
+
+
+def test_background_refresh_picks_up_dataset_changes():
+    client = FakeMetadataClient(num_tables=2, num_columns=2, call_latency=0, query_latency=0)
+    cache = SchemaCache(ttl_seconds=0)
+    agent = SchemaAgent(project_id="bench", connector=BigQueryConnector("bench", client=client, use_bqstorage=False),
+                        schema_cache=cache)
+    agent.get_full_dataset_schema("ds")
+
+    client.num_tables = 3
+    client.last_modified += 1
+    assert len(agent.get_full_dataset_schema("ds")) == 2
+    deadline = time.time() + 5
+    while cache.refreshes == 0 and time.time() < deadline:
+        time.sleep(0.01)
+    assert len(agent.get_full_dataset_schema("ds")) == 3
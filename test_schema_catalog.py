@@ -0,0 +1,69 @@
+"""
+Tests for the persistent on-disk schema catalog.
+"""
+
+import sys
+import os
+import tempfile
+import threading
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.schema_cache import SchemaCache
+from utils.schema_catalog import SchemaCatalog
+from agents.schema_agent import SchemaAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeMetadataClient
+
+
+def _agent(client, catalog):
+    connector = BigQueryConnector("bench", client=client, use_bqstorage=False)
+    return SchemaAgent(project_id="bench", connector=connector, catalog=catalog,
+                       schema_cache=SchemaCache(background=False))
+
+
+def test_new_process_starts_warm_from_catalog():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.sqlite3")
+        client = FakeMetadataClient(num_tables=4, num_columns=3, call_latency=0, query_latency=0)
+        first = _agent(client, SchemaCatalog(path))
+        schema = first.get_full_dataset_schema("ds")
+        stats = first.get_table_stats("ds")
+        assert stats["table_1"]["row_count"] == 2000
+
+        # A "restarted" worker: fresh cache and catalog handle on the same file
+        client.calls = 0
+        second = _agent(client, SchemaCatalog(path))
+        assert second.get_full_dataset_schema("ds") == schema
+        assert second.get_table_stats("ds") == stats
+        # Only the cheap last-modified revalidation hit the warehouse
+        assert client.calls == 0
+        assert second.schema_cache.revalidations == 2
+
+        second.invalidate("ds")
+        assert SchemaCatalog(path).load_project("bench") == []
+
+
+def test_concurrent_workers_share_one_catalog_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "catalog.sqlite3")
+        errors = []
+
+        def worker(n):
+            try:
+                catalog = SchemaCatalog(path)
+                for i in range(50):
+                    catalog.put(("schema", "bench", f"ds_{n}_{i}"), {'t': {'columns': []}}, str(i))
+                    catalog.load_project("bench")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(SchemaCatalog(path).load_project("bench")) == 200
@@ -0,0 +1,27 @@
+"""
+Tests for single-query schema harvesting via INFORMATION_SCHEMA.
+"""
+
+import sys
+import os
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from agents.schema_agent import SchemaAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeMetadataClient
+
+
+def test_dataset_schema_is_fetched_in_one_call():
+    client = FakeMetadataClient(num_tables=5, num_columns=3, call_latency=0, query_latency=0)
+    agent = SchemaAgent(project_id="bench", connector=BigQueryConnector("bench", client=client, use_bqstorage=False))
+
+    schema = agent.get_full_dataset_schema("ds")
+
+    assert client.calls == 1
+    assert sorted(schema) == [f"table_{t}" for t in range(5)]
+    assert schema["table_0"]["columns"] == [{'name': 'col_0', 'type': 'STRING'},
+                                            {'name': 'col_1', 'type': 'INT64'},
+                                            {'name': 'col_2', 'type': 'FLOAT64'}]
+    assert schema["table_0"]["partitioning"] == ["col_0"]
@@ -0,0 +1,55 @@
+"""
+Tests for relevance-ranked pruning of the schema in the SQL prompt.
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.schema_pruning import SchemaPruner, estimate_tokens, name_tokens
+from benchmarks.bench_schema_pruning import synthetic_schema, synthetic_questions
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel
+
+
+def test_small_schemas_are_left_untouched():
+    schema = synthetic_schema(5, 10)
+    assert SchemaPruner(token_budget=4000).prune("total amount by region", schema) is schema
+    assert name_tokens("orderLineItems") == ["order", "line", "item"]
+
+
+def test_wide_schema_keeps_the_relevant_tables_and_columns_under_budget():
+    schema = synthetic_schema(1000, 30)
+    pruner = SchemaPruner(token_budget=1000, max_tables=4)
+    for question, table, columns in synthetic_questions(schema, 20):
+        pruned = pruner.prune(question, schema)
+        assert len(pruned) <= 4 and table in pruned, question
+        kept = [col['name'] for col in pruned[table]['columns']]
+        assert all(col in kept for col in columns), question
+        tokens = sum(estimate_tokens(f"Table: {name}, Columns: []") +
+                     sum(estimate_tokens(f"{col['name']} ({col['type']})") + 1 for col in info['columns'])
+                     for name, info in pruned.items())
+        assert tokens <= 1000
+
+    # Descriptions are indexed too
+    schema['finance_assets']['columns'].append({'name': 'x17', 'type': 'FLOAT64', 'description': 'depreciation'})
+    pruned = SchemaPruner(token_budget=100, max_tables=2).prune("yearly depreciation of finance assets", schema)
+    assert 'x17' in [col['name'] for col in pruned['finance_assets']['columns']]
+    assert pruned['finance_assets']['omitted_columns'] > 0
+
+
+def test_prompt_describes_only_the_pruned_schema():
+    schema = synthetic_schema(1000, 30)
+    connector = BigQueryConnector("bench", client=FakeBigQueryClient(10), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(),
+                             model=FakeGenerativeModel(["SELECT 1"]),
+                             schema_pruner=SchemaPruner(token_budget=2000, max_tables=3))
+    question, table, _ = synthetic_questions(schema, 1)[0]
+    prompt, parts = agent._build_prompt(question, schema, "bench", "ds")
+    assert f"Table: {table}," in prompt
+    assert parts[-1] == "(997 other tables in the dataset are not shown.)"
+    assert estimate_tokens(prompt) < 2500
@@ -0,0 +1,47 @@
+"""
+Tests for the local semantic question cache.
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.semantic_cache import SemanticQuestionCache
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient
+
+SCHEMA = {'crop_production': {'columns': [{'name': name, 'type': 'STRING'}
+                                          for name in ['state_name', 'district_name', 'crop', 'production']]}}
+
+
+def test_paraphrases_match_but_different_answers_do_not():
+    cache = SemanticQuestionCache()
+    cache.add("p.ds", SCHEMA, "total production by state", "SQL_STATE")
+    cache.add("p.ds", SCHEMA, "top 10 crops by production", "SQL_TOP10")
+
+    assert cache.lookup("p.ds", SCHEMA, "sum of production per state")['sql'] == "SQL_STATE"
+    assert cache.lookup("p.ds", SCHEMA, "which 10 crops have the highest production")['sql'] == "SQL_TOP10"
+    assert cache.lookup("p.ds", SCHEMA, "total production by district") is None
+    assert cache.lookup("p.ds", SCHEMA, "average production by state") is None
+    assert cache.lookup("p.ds", SCHEMA, "top 5 crops by production") is None
+    assert cache.lookup("p.ds", SCHEMA, "total production of millet by state") is None
+    # Another dataset, or a changed schema, starts from an empty index
+    assert cache.lookup("p.other", SCHEMA, "sum of production per state") is None
+    assert cache.lookup("p.ds", {'t': {'columns': []}}, "sum of production per state") is None
+
+
+def test_agent_reuses_validated_sql_for_a_paraphrase():
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT state_name, SUM(production) FROM `bench.ds.crop_production` GROUP BY 1"
+    connector = BigQueryConnector("bench", client=FakeBigQueryClient(10, 10), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(), model=model)
+
+    agent.process("total production by state", SCHEMA, "bench", "ds")
+    result = agent.process("sum of production per state", SCHEMA, "bench", "ds")
+    assert model.generate_content.call_count == 1
+    assert result['semantic_match']['question'] == "total production by state"
+    assert result['error'] is None
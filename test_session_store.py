@@ -0,0 +1,142 @@
+"""
+Tests for the server-side session store behind the layout's dcc.Store keys.
+"""
+
+import sys
+import os
+import time
+import tempfile
+from unittest import mock
+
+import numpy as np
+import pyarrow as pa
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.session_store import SessionStore
+from utils.result_store import ResultStore
+from callbacks.main_callbacks import append_chat_messages, load_chat_history, remember_generated_sql
+
+
+def _table(rows):
+    return pa.table({'id': np.arange(rows), 'value': np.random.default_rng(rows).random(rows)})
+
+
+def test_workers_share_values_through_the_directory():
+    with tempfile.TemporaryDirectory() as directory:
+        # Two stores on one directory stand for two gunicorn workers
+        first = SessionStore(directory, memory_bytes=64 * 1024)
+        second = SessionStore(directory, memory_bytes=64 * 1024)
+
+        big = _table(20_000)  # larger than the memory tier: kept on disk only
+        assert first.put("s1", "result", big) and first.stats()['entries'] == 0
+        assert second.get("s1", "result").equals(big)
+        assert second.get("s1", "missing", "default") == "default"
+
+        first.put("s1", "chat", [{'type': 'user', 'content': 'hi'}])
+        assert second.get("s1", "chat") == [{'type': 'user', 'content': 'hi'}]
+        # A write by one worker replaces what the other holds in memory
+        second.put("s1", "chat", [{'type': 'user', 'content': 'hello'}])
+        assert first.get("s1", "chat") == [{'type': 'user', 'content': 'hello'}]
+        # Values are copies: changing what get returned leaves the store alone
+        first.get("s1", "chat").append({'type': 'bot'})
+        assert len(first.get("s1", "chat")) == 1 and first.stats()['hits'] >= 1
+
+        # Result handles from one worker page in another
+        handle = ResultStore(first).put(_table(50), {'truncated': True}, session_id="s1")
+        table, metadata = ResultStore(second).get(handle)
+        assert table.num_rows == 50 and metadata == {'truncated': True} and table.schema.metadata is None
+        assert ResultStore(second).get("s1:unknown") is None and ResultStore(second).get("nonsense") is None
+
+        first.clear_session("s1")
+        assert second.get("s1", "chat") is None
+
+
+def test_values_expire_after_the_ttl():
+    with tempfile.TemporaryDirectory() as directory:
+        store = SessionStore(directory, ttl_seconds=60, sweep_seconds=3600)
+        store.put("s1", "old", "stale")
+        store.put("s1", "fresh", "kept")
+        store.put("s2", "old", "stale")
+        for session in ("s1", "s2"):
+            path = store._path(session, "old")
+            os.utime(path, (time.time() - 120, time.time() - 120))
+
+        assert store.get("s1", "old") is None and store.get("s1", "fresh") == "kept"
+        assert store.sweep() == 1
+        assert os.listdir(directory) == ["s1"] and os.listdir(os.path.join(directory, "s1")) == ["fresh.value"]
+
+    # Without a directory values expire from memory
+    store = SessionStore(None, ttl_seconds=60)
+    store.put("s1", "sql", "SELECT 1")
+    with mock.patch("utils.session_store.time.time", return_value=time.time() + 120):
+        assert store.get("s1", "sql") is None
+
+
+def test_sessions_are_held_to_their_quota():
+    table = _table(1_000)
+    for directory in (tempfile.mkdtemp(), None):
+        store = SessionStore(directory, session_bytes=int(table.nbytes * 2.5))
+        for name in ("a", "b"):
+            assert store.put("s1", name, table)
+            time.sleep(0.01)
+        store.get("s1", "a")  # read last: "b" is now the least recently used
+        time.sleep(0.01)
+        store.put("s1", "c", table)
+        store.put("s2", "a", table)  # other sessions have their own quota
+        assert store.get("s1", "b") is None
+        assert all(store.get(*key) is not None for key in [("s1", "a"), ("s1", "c"), ("s2", "a")])
+        assert not store.put("s1", "huge", _table(10_000))
+
+
+def test_the_directory_is_held_to_its_cap():
+    table = _table(1_000)
+    with tempfile.TemporaryDirectory() as directory:
+        size = SessionStore(directory).put("probe", "a", table) and os.path.getsize(
+            os.path.join(directory, "probe", "a.value"))
+        store = SessionStore(directory, disk_bytes=int(size * 3.5))
+        store.clear_session("probe")
+        for session in ("s1", "s2", "s3"):
+            assert store.put(session, "a", table)
+            time.sleep(0.01)
+        store.get("s1", "a")  # read last: the value of "s2" is now the least recently used
+        time.sleep(0.01)
+        assert store.put("s4", "a", table)  # each session is well under its own quota
+        assert store.get("s2", "a") is None
+        assert all(store.get(session, "a") is not None for session in ("s1", "s3", "s4"))
+        assert not store.put("s5", "huge", _table(10_000))
+
+
+def test_rewrites_of_the_same_size_are_seen_by_other_workers():
+    with tempfile.TemporaryDirectory() as directory:
+        first = SessionStore(directory)
+        second = SessionStore(directory)
+        first.put("s1", "sql", "SELECT 1")
+        assert second.get("s1", "sql") == "SELECT 1"
+        # Reads leave the mtime alone, so they do not invalidate the other worker's copy
+        hits = first.stats()['hits']
+        assert first.get("s1", "sql") == "SELECT 1" and first.stats()['hits'] == hits + 1
+
+        # Same size, and the inode may be reused: the mtime tells the two writes apart
+        path = first._path("s1", "sql")
+        second.delete("s1", "sql")
+        time.sleep(0.01)
+        second.put("s1", "sql", "SELECT 2")
+        assert os.path.getsize(path) == len('"SELECT 1"')
+        assert first.get("s1", "sql") == "SELECT 2"
+
+
+def test_callbacks_keep_small_keys_in_the_browser():
+    store = SessionStore(None)
+    ref = append_chat_messages("s1", {}, [{'type': 'user', 'content': 'first'}], store)
+    assert ref == {'key': 'chat_history', 'length': 1, 'first': 0}
+    snapshot = dict(ref)
+    ref = append_chat_messages("s1", ref, [{'type': 'user', 'content': 'second'}], store)
+    # A callback holding the older reference sees the transcript as it was then
+    assert [m['content'] for m in load_chat_history("s1", snapshot, store)] == ['first']
+    assert len(load_chat_history("s1", ref, store)) == 2 and load_chat_history("s2", ref, store) == []
+    assert load_chat_history("s1", None, store) == []
+
+    assert remember_generated_sql("s1", "SELECT 1", store) == "generated_sql"
+    assert store.get("s1", "generated_sql") == "SELECT 1" and remember_generated_sql("s1", "", store) == ""
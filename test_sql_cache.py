@@ -0,0 +1,55 @@
+"""
+Tests for the NL-to-SQL generation cache.
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sql_cache import SQLGenerationCache
+from utils.text_utils import normalize_question
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient
+
+
+def _agent(model, client):
+    connector = BigQueryConnector("bench", client=client, use_bqstorage=False)
+    return DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(), model=model)
+
+
+def test_normalized_questions_share_an_entry_until_the_schema_changes():
+    assert normalize_question("  Top 10   crops? ") == normalize_question("top 10 crops")
+    cache = SQLGenerationCache()
+    schema = {'t': {'columns': [{'name': 'a', 'type': 'INT64'}]}}
+    key = cache.make_key("Top crops?", "p.ds", schema, "gemini")
+    cache.put(key, "SELECT a FROM t")
+    assert cache.get(cache.make_key("top crops", "p.ds", schema, "gemini")) == "SELECT a FROM t"
+    assert cache.get(cache.make_key("top crops", "p.ds", schema, "other-model")) is None
+
+    changed = {'t': {'columns': [{'name': 'a', 'type': 'INT64'}, {'name': 'b', 'type': 'STRING'}]}}
+    cache.make_key("top crops", "p.ds", changed, "gemini")
+    assert cache.stats()['entries'] == 0
+
+
+def test_repeated_question_skips_the_model_and_failed_sql_is_forgotten():
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT * FROM `bench.ds.t`"
+    client = FakeBigQueryClient(10, 10)
+    agent = _agent(model, client)
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}]}}
+
+    agent.process("Show rows", schema, "bench", "ds")
+    with mock.patch.object(agent, "_build_prompt", wraps=agent._build_prompt) as build_prompt:
+        second = agent.process("show rows?", schema, "bench", "ds")
+    assert model.generate_content.call_count == 1
+    assert build_prompt.call_count == 0
+    assert second['sql_from_cache'] and second['error'] is None
+
+    client.query = mock.MagicMock(side_effect=RuntimeError("Unrecognized name"))
+    assert agent.process("show rows", schema, "bench", "ds")['error']
+    agent.process("show rows", schema, "bench", "ds")
+    assert model.generate_content.call_count == 2
@@ -0,0 +1,91 @@
+"""
+Tests for local validation of generated SQL.
+"""
+
+import sys
+import os
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.sql_validator import validate_sql
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import BENCH_ROW_BYTES, FakeBigQueryClient, FakeGenerativeModel
+
+SCHEMA = {
+    'orders': {'columns': [{'name': 'order_id', 'type': 'INT64'}, {'name': 'amount', 'type': 'FLOAT64'},
+                           {'name': 'created', 'type': 'DATE'}, {'name': 'items', 'type': 'ARRAY'}]},
+    'customers': {'columns': [{'name': 'order_id', 'type': 'INT64'}, {'name': 'name', 'type': 'STRING'}]},
+}
+
+
+def test_only_a_single_read_only_query_is_accepted():
+    for sql in ["DELETE FROM orders WHERE true", "SELECT 1; DROP TABLE orders",
+                "CREATE TABLE x AS SELECT 1", "SELEC amount FROM orders", ""]:
+        assert validate_sql(sql, SCHEMA, "ds")['error'], sql
+    result = validate_sql("SELECT amount FROM orders;", SCHEMA, "ds")
+    assert result['error'] is None and result['sql'] == "SELECT amount FROM orders"
+
+
+def test_tables_and_columns_are_checked_against_the_schema():
+    assert "`refunds`" in validate_sql("SELECT amount FROM ds.refunds", SCHEMA, "ds")['error']
+    assert "`total`" in validate_sql("SELECT o.total FROM orders o", SCHEMA, "ds")['error']
+    for sql in [
+        "WITH big AS (SELECT order_id, amount AS a FROM `p.ds.orders`) SELECT big.a, c.name "
+        "FROM big JOIN customers c USING (order_id)",
+        "SELECT i FROM orders, UNNEST(items) AS i WHERE _PARTITIONTIME IS NOT NULL",
+        "SELECT * EXCEPT (items) FROM orders QUALIFY ROW_NUMBER() OVER (ORDER BY created) = 1",
+        "SELECT x FROM other_ds.unknown",
+    ]:
+        assert validate_sql(sql, SCHEMA, "ds")['error'] is None, sql
+
+
+def test_limit_is_added_only_to_row_level_queries():
+    rows = validate_sql("SELECT amount FROM orders -- every order", SCHEMA, "ds", limit=1001)
+    assert rows['limit_added'] and rows['sql'] == "SELECT amount FROM orders -- every order\nLIMIT 1001"
+    assert rows['normalized'].endswith("LIMIT 1001")
+    for sql in ["SELECT created, SUM(amount) FROM orders GROUP BY created", "SELECT COUNT(*) FROM orders",
+                "SELECT amount FROM orders LIMIT 5",
+                "SELECT COUNT(*) FROM orders UNION ALL (SELECT MAX(amount) FROM orders)"]:
+        assert not validate_sql(sql, SCHEMA, "ds", limit=1001)['limit_added'], sql
+    # A set operation is bounded unless every branch aggregates
+    for sql in ["SELECT order_id FROM orders UNION ALL SELECT COUNT(*) FROM orders",
+                "SELECT COUNT(*) FROM orders EXCEPT DISTINCT (SELECT order_id FROM customers)"]:
+        assert validate_sql(sql, SCHEMA, "ds", limit=1001)['limit_added'], sql
+    windowed = validate_sql("SELECT amount, SUM(amount) OVER () FROM orders", SCHEMA, "ds", limit=1001)
+    assert windowed['limit_added']
+
+
+def test_rejected_sql_never_reaches_bigquery():
+    client = FakeBigQueryClient(10)
+    connector = BigQueryConnector("bench", client=client, use_bqstorage=False)
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(),
+                             model=FakeGenerativeModel(["SELECT revenue FROM orders"]))
+    result = agent.process("revenue per order", SCHEMA, "bench", "ds")
+    assert "rejected before running it" in result['error'] and "`revenue`" in result['error']
+    assert client.queries == []
+
+
+def test_truncated_results_report_the_full_row_count():
+    # The fake applies the download LIMIT, so the LIMITed query reports at most max_result_rows + 1 rows
+    client = FakeBigQueryClient(5_000, page_size=1_000, table_id="bench.ds.t", apply_limit=True)
+    connector = BigQueryConnector("bench", client=client, use_bqstorage=False)
+    schema = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}, {'name': 'amount', 'type': 'FLOAT'},
+                                {'name': 'category', 'type': 'STRING'}]}}
+    agent = DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(),
+                             model=FakeGenerativeModel(["SELECT * FROM `bench.ds.t`"]), max_result_rows=500)
+    result = agent.process("list the rows", schema, "bench", "ds", session_id="s1")
+    assert result['truncated'] and len(result['results_df']) == 500
+    assert result['total_rows'] == 5_000
+    assert "showing the first 500 of 5000 rows" in result['results_markdown']
+    assert any(query.startswith("SELECT COUNT(*) AS total_rows") for query in client.queries)
+    # The count is checked against the byte budgets first and billed to the session
+    assert agent.cost_guard.session_usage("s1") == 2 * 5_000 * BENCH_ROW_BYTES
+
+    # Without budget for the count the total is unknown rather than wrong
+    agent.cost_guard.session_budget = 6_000 * BENCH_ROW_BYTES
+    result = agent.process("list the rows", schema, "bench", "ds", session_id="s2")
+    assert result['truncated'] and result['total_rows'] is None
+    assert "showing the first 500 rows" in result['results_markdown']
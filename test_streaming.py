@@ -0,0 +1,61 @@
+"""
+Tests for streamed SQL generation.
+"""
+
+import sys
+import os
+import time
+from unittest import mock
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import metrics
+from utils.sql_utils import complete_statement_end
+from agents.data_analyst_agent import DataAnalystAgent
+from connectors.bigquery_connector import BigQueryConnector
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel
+
+SCHEMA = {'t': {'columns': [{'name': 'id', 'type': 'INTEGER'}]}}
+
+
+def _agent(model):
+    connector = BigQueryConnector("bench", client=FakeBigQueryClient(10, 10), use_bqstorage=False)
+    return DataAnalystAgent(project_id="bench", connector=connector, schema_agent=mock.MagicMock(),
+                            model=model, model_name="fake-model")
+
+
+def test_complete_statement_end_ignores_semicolons_in_literals_and_comments():
+    assert complete_statement_end("SELECT 1") is None
+    assert complete_statement_end("SELECT 1; -- done") == len("SELECT 1;")
+    assert complete_statement_end("SELECT ';' AS s") is None
+    assert complete_statement_end("SELECT 'a;") is None
+    assert complete_statement_end("SELECT 1 /* ; */ FROM t; x") == len("SELECT 1 /* ; */ FROM t;")
+    assert complete_statement_end("```sql\nSELECT 1\n``` The query counts") == len("```sql\nSELECT 1\n```")
+    assert complete_statement_end("```sql\nSELECT 1") is None
+
+
+def test_streamed_sql_is_reported_as_it_arrives_and_validated_without_the_trailing_text():
+    sql = "SELECT id FROM `bench.ds.t` WHERE id > 3"
+    response = f"```sql\n{sql}\n```\nThis query selects the ids above three." + " More explanation." * 20
+    model = FakeGenerativeModel([response], chunk_chars=8, chunk_latency=0.005)
+    agent = _agent(model)
+    first_tokens_before = metrics.LLM_TIME_TO_FIRST_TOKEN.count(model="fake-model")
+
+    received = []
+    start = time.perf_counter()
+    result = agent.process("ids above three", SCHEMA, "bench", "ds",
+                           on_sql_text=lambda text: received.append((time.perf_counter() - start, text)))
+
+    assert result['error'] is None and result['sql_query'].startswith(f"{sql}\nLIMIT ")
+    assert len(received) > 3 and received[-1][1].strip() == sql
+    assert sql.startswith(received[0][1].strip()) and len(received[0][1]) < len(sql)
+    # Reading stopped at the closing fence, so the explanation was never waited for
+    assert model.chunks_sent < -(-len(response) // 8)
+    assert metrics.LLM_TIME_TO_FIRST_TOKEN.count(model="fake-model") == first_tokens_before + 1
+
+
+def test_without_a_listener_the_response_is_not_streamed():
+    model = FakeGenerativeModel(["SELECT * FROM `bench.ds.t`"])
+    result = _agent(model).process("everything", SCHEMA, "bench", "ds")
+    assert result['error'] is None and model.chunks_sent == 0
@@ -0,0 +1,148 @@
+"""
+Tests for the server-side paging, sorting and filtering of the chat's data table.
+"""
+
+import sys
+import os
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import sqlglot
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils.table_query import TOTAL_ROWS_COLUMN, page_sql, page_table, parse_filter_query
+from connectors.local_connector import LocalConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from callbacks.main_callbacks import _result_table, table_page
+from utils.column_profile import profile_frame
+
+
+def _orders(rows=2_000):
+    rng = np.random.default_rng(6)
+    amount = rng.gamma(2.0, 10.0, rows)
+    amount[::37] = np.nan
+    return pd.DataFrame({
+        'order_id': np.arange(rows),
+        'amount': amount,
+        'region': rng.choice(['North', 'north-east', 'South', 'West'], rows),
+    })
+
+
+def test_filters_sorts_and_pages_like_pandas():
+    assert parse_filter_query('{amount} >= 12.5 && {region} icontains "NORTH" && {bad filter}') == [
+        {'column': 'amount', 'operator': '>=', 'value': '12.5', 'ignore_case': False},
+        {'column': 'region', 'operator': 'contains', 'value': 'NORTH', 'ignore_case': True},
+    ]
+    df = _orders()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+
+    page, total = page_table(table, page_current=2, page_size=25, sort_by=[{'column_id': 'amount', 'direction': 'desc'}],
+                             filter_query='{amount} >= 12.5 && {region} icontains "NORTH" && {missing} = 1')
+    expected = df[(df['amount'] >= 12.5) & df['region'].str.lower().str.contains('north')]
+    expected = expected.sort_values('amount', ascending=False, kind='stable')
+    assert total == len(expected)
+    assert page.column('order_id').to_pylist() == expected['order_id'].iloc[50:75].tolist()
+
+    # Missing amounts sort last either way, and text equality is case-sensitive unless asked otherwise
+    page, total = page_table(table, page_current=(len(df) - 1) // 20, page_size=20,
+                             sort_by=[{'column_id': 'amount', 'direction': 'asc'}])
+    assert total == len(df) and all(value is None for value in page.column('amount').to_pylist()[-5:])
+    assert page_table(table, filter_query='{region} = north-east')[1] == (df['region'] == 'north-east').sum()
+    assert page_table(table, filter_query='{region} ieq NORTH')[1] == (df['region'] == 'North').sum()
+
+    # Values that are no finite number compare as text, so the SQL stays valid
+    sql = page_sql("SELECT * FROM orders", table.schema, 0, 10, None, '{amount} > inf && {amount} < 1e400')
+    assert "(CAST(`amount` AS STRING) > 'inf') AND (CAST(`amount` AS STRING) < '1e400')" in sql
+    assert page_table(table, filter_query='{amount} > nan')[1] == page_table(table, filter_query='{amount} > "nan"')[1]
+
+
+def test_page_sql_matches_the_local_pages(duckdb):
+    df = _orders()
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    source_sql = "SELECT order_id, amount, region FROM orders -- every order"
+    connection = duckdb.connect()
+    connection.register("orders", df)
+    cases = [
+        (0, None, None),
+        (7, [{'column_id': 'amount', 'direction': 'desc'}], '{amount} > 20'),
+        (1, [{'column_id': 'region', 'direction': 'asc'}], '{region} contains South && {order_id} lt 900'),
+        (0, [{'column_id': 'order_id', 'direction': 'desc'}], '{region} ine north'),
+    ]
+    for page_current, sort_by, filter_query in cases:
+        sql = page_sql(source_sql, table.schema, page_current, 30, sort_by, filter_query)
+        remote = connection.execute(sqlglot.transpile(sql, read="bigquery", write="duckdb")[0]).df()
+        local, total = page_table(table, page_current, 30, sort_by, filter_query)
+        assert remote['order_id'].tolist() == local.column('order_id').to_pylist(), (sort_by, filter_query)
+        assert (remote[TOTAL_ROWS_COLUMN] == total).all()
+
+
+def test_truncated_results_page_in_the_warehouse(duckdb):
+    connector = LocalConnector(project_id="local-project", engine="duckdb")
+    connector.load_table("shop", "orders", _orders(5_000))
+    schema = connector.get_dataset_schema("shop")
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT order_id, amount, region FROM `local-project.shop.orders`"
+    agent = DataAnalystAgent(project_id="local-project", connector=connector, schema_agent=mock.MagicMock(),
+                             model=model, max_result_rows=500)
+    result = agent.process("list the orders", schema, "local-project", "shop")
+    assert result['truncated'] and len(result['results_df']) == 500
+    handle = result['result_handle']
+
+    # Pages of the downloaded rows are cut locally; anything else runs over the full result
+    with mock.patch.object(DataAnalystAgent, "_fetch_page_sql", wraps=agent._fetch_page_sql) as pushed:
+        page = agent.fetch_table_page(handle, page_current=3, page_size=20)
+        assert not page['pushed_down'] and pushed.call_count == 0
+        assert page['rows']['order_id'].tolist() == result['results_df']['order_id'].iloc[60:80].tolist()
+
+        rows, page_count, status = table_page(handle, 0, 20, [{'column_id': 'order_id', 'direction': 'desc'}],
+                                              '{region} = West', data_analyst=agent)
+        assert pushed.call_count == 1
+    full = _orders(5_000)
+    west = full[full['region'] == 'West'].sort_values('order_id', ascending=False)
+    assert [row['order_id'] for row in rows] == west['order_id'].iloc[:20].tolist()
+    assert page_count == -(-len(west) // 20) and "BigQuery" in status
+    assert set(rows[0]) == {'order_id', 'amount', 'region'}
+
+    assert agent.fetch_table_page("expired-handle") is None
+
+
+def test_truncated_results_page_from_the_first_page_to_the_last(duckdb):
+    connector = LocalConnector(project_id="local-project", engine="duckdb")
+    full = _orders(5_000)
+    connector.load_table("shop", "orders", full)
+    model = mock.MagicMock()
+    model.generate_content.return_value.text = "SELECT order_id, amount, region FROM `local-project.shop.orders`"
+    agent = DataAnalystAgent(project_id="local-project", connector=connector, schema_agent=mock.MagicMock(),
+                             model=model, max_result_rows=500)
+    result = agent.process("list the orders", connector.get_dataset_schema("shop"), "local-project", "shop")
+    # The download LIMIT does not cap the row count
+    assert result['truncated'] and result['total_rows'] == 5_000
+
+    # Unsorted, the pager covers the downloaded rows; the status gives the full count
+    div = _result_table(result['results_df'], result, profile_frame(result['results_df']))
+    handle, table, status = div.children[0].data, div.children[1], div.children[2].children
+    assert table.page_count == 25 and "5,000 rows" in status
+    rows, page_count, status = table_page(handle, table.page_count - 1, 20, data_analyst=agent)
+    assert [row['order_id'] for row in rows] == result['results_df']['order_id'].iloc[480:].tolist()
+    assert page_count == 25 and status.startswith("Rows 481–500 of 500 downloaded")
+
+    # Sorted, every page of the full result is reachable, in a stable order
+    sort_by = [{'column_id': 'region', 'direction': 'desc'}]
+    rows, page_count, status = table_page(handle, 0, 20, sort_by, data_analyst=agent)
+    assert page_count == 250 and "BigQuery" in status
+    expected = full.sort_values(['region', 'order_id'], ascending=[False, True])['order_id'].tolist()
+    pages = [table_page(handle, page, 20, sort_by, data_analyst=agent)[0] for page in (page_count - 2, page_count - 1)]
+    assert [row['order_id'] for row in pages[0] + pages[1]] == expected[-40:]
+
+    # A page query the cost guard refuses is not run: the sort applies to the downloaded rows
+    with mock.patch.object(agent.cost_guard, "check", return_value={'action': 'refuse', 'reason': "over budget"}), \
+            mock.patch.object(DataAnalystAgent, "_fetch_bounded") as fetch:
+        rows, page_count, status = table_page(handle, 1, 20, [{'column_id': 'amount', 'direction': 'asc'}],
+                                              data_analyst=agent)
+    assert fetch.call_count == 0 and page_count == 25 and "downloaded" in status
+    downloaded = result['results_df'].sort_values('amount', kind='stable')
+    assert [row['order_id'] for row in rows] == downloaded['order_id'].iloc[20:40].tolist()
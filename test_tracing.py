@@ -0,0 +1,78 @@
+"""
+Tests for per-stage timing spans.
+"""
+
+import sys
+import os
+from unittest import mock
+
+import pytest
+
+# Add the current directory to Python path for imports
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from utils import tracing
+from utils.tracing import collect_timings, span, traced
+from callbacks.main_callbacks import run_chat_turn
+from benchmarks.bench_chat_turn import PROJECT, DATASET, SCRIPTED_SQL
+from benchmarks.fakes import FakeBigQueryClient, FakeGenerativeModel, FakeMetadataClient
+from connectors.bigquery_connector import BigQueryConnector
+from agents.data_analyst_agent import DataAnalystAgent
+from agents.schema_agent import SchemaAgent
+
+
+def test_spans_nest_and_are_noops_outside_a_collector():
+    with span("ignored"):
+        pass
+
+    @traced("inner")
+    def inner():
+        return 42
+
+    with collect_timings() as timings:
+        with span("outer"):
+            assert inner() == 42
+            assert inner() == 42
+        with span("second"):
+            pass
+    assert [(name, depth) for name, depth, _ in timings.spans] == [
+        ("inner", 1), ("inner", 1), ("outer", 0), ("second", 0)]
+    assert set(timings.totals()) == {"inner", "outer", "second"}
+    summary = timings.to_markdown()
+    assert summary.startswith("outer ") and "(inner " in summary and " · second " in summary
+
+
+def test_spans_are_exported_to_opentelemetry_when_enabled():
+    # The OpenTelemetry SDK is optional: spans are only exported when it is installed
+    pytest.importorskip("opentelemetry.sdk")
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    with mock.patch.object(tracing, "_tracer", provider.get_tracer("test")):
+        with span("parent", rows=3):
+            with span("child"):
+                pass
+    finished = {s.name: s for s in exporter.get_finished_spans()}
+    assert finished["child"].parent.span_id == finished["parent"].context.span_id
+    assert finished["parent"].attributes["rows"] == 3
+
+
+def test_chat_answer_shows_its_timings():
+    metadata_client = FakeMetadataClient(1, 5, project=PROJECT, call_latency=0.0, query_latency=0.0)
+    schema_agent = SchemaAgent(project_id=PROJECT,
+                               connector=BigQueryConnector(PROJECT, client=metadata_client, use_bqstorage=False))
+    connector = BigQueryConnector(PROJECT, client=FakeBigQueryClient(10), use_bqstorage=False)
+    agent = DataAnalystAgent(project_id=PROJECT, connector=connector, schema_agent=schema_agent,
+                             model=FakeGenerativeModel([SCRIPTED_SQL]))
+
+    chat_elements, _, _, _ = run_chat_turn("show amount by id", [], DATASET, data_analyst=agent, project_id=PROJECT)
+
+    answer = chat_elements[1].children[0].children
+    timings_line = answer.split("⏱️ **Timings:** ")[1]
+    for stage in ["schema", "process", "llm.generate", "bigquery.dry_run", "bigquery.job_wait",
+                  "bigquery.download", "results.to_pandas", "figure.build", "table.build"]:
+        assert f"{stage} " in timings_line, stage
@@ -0,0 +1,263 @@
+"""
+Bounded in-process job manager for Dash background callbacks.
+
+A background callback returns as soon as its job is queued; the browser then
+polls for progress and the result, so slow chat turns no longer hold gunicorn
+threads and quick callbacks (theme toggle, dataset list) stay responsive.
+
+Dash's DiskcacheManager starts a process per job and its CeleryManager needs a
+broker. Chat turns are mostly spent waiting on Gemini and BigQuery, and the warm
+clients and caches of the agent registry live in this process, so jobs run on a
+fixed pool of threads instead. At most BACKGROUND_WORKERS jobs run at once and
+BACKGROUND_MAX_QUEUED more wait their turn. Further jobs are refused: a callback
+decorated with when_busy() gets the result of its busy function instead (a
+"busy, try again" message), any other gets no update. Cancelling a queued job
+drops it; a running job stops at its next set_progress() call.
+
+Jobs run in a copy of the submitting request's context variables, which hold
+Dash's callback context, so dash.callback_context works inside them.
+"""
+
+import os
+import time
+import logging
+import itertools
+import threading
+import traceback
+import contextvars
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dash.exceptions import PreventUpdate
+from dash.long_callback.managers import BaseLongCallbackManager
+
+from utils.metrics import BACKGROUND_JOB_DURATION, BACKGROUND_JOB_QUEUE_WAIT
+
+logger = logging.getLogger(__name__)
+
+BACKGROUND_WORKERS = int(os.environ.get("BACKGROUND_WORKERS", "4"))
+BACKGROUND_MAX_QUEUED = int(os.environ.get("BACKGROUND_MAX_QUEUED", "16"))
+# Results nobody polls for (closed tabs) are dropped after this long
+BACKGROUND_RESULT_TTL_SECONDS = int(os.environ.get("BACKGROUND_RESULT_TTL_SECONDS", "600"))
+
+_NO_UPDATE = {"_dash_no_update": "_dash_no_update"}
+
+
+class JobCancelled(BaseException):
+    """
+    Raised by set_progress() inside a job that was cancelled. It derives from
+    BaseException so the `except Exception` handlers of the pipeline let it through.
+    """
+
+
+def when_busy(busy_fn: Callable[..., Any]):
+    """
+    Decorator for a background callback (below @app.callback): when the job queue is
+    full, busy_fn is called with the callback's arguments (without set_progress) and
+    its return value is the callback's result.
+    """
+    def decorator(fn):
+        fn._job_busy_fn = busy_fn
+        return fn
+    return decorator
+
+
+class _Job:
+    def __init__(self, key: str):
+        self.key = key
+        self.cancelled = threading.Event()
+        self.future = None
+        self.submitted_at = time.monotonic()
+
+
+class ThreadPoolCallbackManager(BaseLongCallbackManager):
+    """Runs Dash background callbacks on a bounded thread pool and keeps their results in memory."""
+
+    def __init__(self, max_workers: int = BACKGROUND_WORKERS, max_queued: int = BACKGROUND_MAX_QUEUED,
+                 result_ttl: float = BACKGROUND_RESULT_TTL_SECONDS):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.result_ttl = result_ttl
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="dash-job")
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._jobs: Dict[str, _Job] = {}
+        self._results: Dict[str, Tuple[float, Any]] = {}
+        self._progress: Dict[str, Any] = {}
+        self._running = 0
+        self._counts = {'completed': 0, 'cancelled': 0, 'rejected': 0}
+        # Results are handed out once, so they are never shared between callers
+        super().__init__(cache_by=None)
+
+    def make_job_fn(self, fn, progress, key=None):
+        def job_fn(job: _Job, args, context: contextvars.Context):
+            context.run(self._run_job, job, fn, progress, args)
+        job_fn.busy_fn = getattr(fn, "_job_busy_fn", None)
+        return job_fn
+
+    @staticmethod
+    def _call(fn, args, *extra):
+        if isinstance(args, dict):
+            return fn(*extra, **args)
+        if isinstance(args, (list, tuple)):
+            return fn(*extra, *args)
+        return fn(*extra, args)
+
+    def _run_job(self, job: _Job, fn, progress: bool, args) -> None:
+        def set_progress(value):
+            if job.cancelled.is_set():
+                raise JobCancelled()
+            if not isinstance(value, (list, tuple)):
+                value = [value]
+            with self._lock:
+                self._progress[self._make_progress_key(job.key)] = value
+
+        with self._lock:
+            self._running += 1
+        callback = getattr(fn, "__name__", "unknown")
+        started = time.monotonic()
+        BACKGROUND_JOB_QUEUE_WAIT.observe(started - job.submitted_at, callback=callback)
+        maybe_progress = [set_progress] if progress else []
+        outcome = "completed"
+        try:
+            if job.cancelled.is_set():
+                raise JobCancelled()
+            output = self._call(fn, args, *maybe_progress)
+        except JobCancelled:
+            logger.info(f"Background job {job.key[:12]} was cancelled")
+            output = None
+            outcome = "cancelled"
+        except PreventUpdate:
+            output = _NO_UPDATE
+            outcome = "prevented"
+        except Exception as e:
+            logger.error(f"Background job {job.key[:12]} failed: {e}", exc_info=True)
+            output = {"long_callback_error": {"msg": str(e), "tb": traceback.format_exc()}}
+            outcome = "failed"
+        finally:
+            with self._lock:
+                self._running -= 1
+            BACKGROUND_JOB_DURATION.observe(time.monotonic() - started, callback=callback, outcome=outcome)
+
+        with self._lock:
+            if job.cancelled.is_set():
+                self._counts['cancelled'] += 1
+            else:
+                self._results[job.key] = (time.monotonic(), output)
+                self._counts['completed'] += 1
+
+    def call_job_fn(self, key, job_fn, args, context):
+        # Dash has set its callback context in the request's context variables; the
+        # job gets a copy of them (context holds the same values, for Dash's own managers)
+        job_context = contextvars.copy_context()
+        with self._lock:
+            self._drop_expired_results()
+            pending = sum(1 for job in self._jobs.values() if not job.future.done())
+            if pending < self.max_workers + self.max_queued:
+                job_id = str(next(self._ids))
+                job = _Job(key)
+                self._jobs[job_id] = job
+                job.future = self._executor.submit(job_fn, job, args, job_context)
+                return job_id
+            self._counts['rejected'] += 1
+        logger.warning(f"Background job refused: {pending} jobs are already running or queued")
+        return self._refuse(key, getattr(job_fn, "busy_fn", None), args)
+
+    def _refuse(self, key, busy_fn, args) -> str:
+        """A job that is already finished, its result the callback's busy result."""
+        output = _NO_UPDATE
+        if busy_fn is not None:
+            try:
+                output = self._call(busy_fn, args)
+            except PreventUpdate:
+                pass
+            except Exception as e:
+                logger.error(f"Busy result of a background job failed: {e}", exc_info=True)
+        done = Future()
+        done.set_result(None)
+        with self._lock:
+            job_id = str(next(self._ids))
+            job = _Job(key)
+            job.future = done
+            self._jobs[job_id] = job
+            self._results[key] = (time.monotonic(), output)
+        return job_id
+
+    def _drop_expired_results(self) -> None:
+        cutoff = time.monotonic() - self.result_ttl
+        for key in [key for key, (finished, _) in self._results.items() if finished < cutoff]:
+            del self._results[key]
+            self._progress.pop(self._make_progress_key(key), None)
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.future.done() and job.key not in self._results]:
+            del self._jobs[job_id]
+
+    def terminate_job(self, job):
+        if job is None:
+            return
+        with self._lock:
+            record = self._jobs.pop(str(job), None)
+            if record is None:
+                return
+            record.cancelled.set()
+            self._results.pop(record.key, None)
+            self._progress.pop(self._make_progress_key(record.key), None)
+        if record.future.cancel():
+            # Never started, so _run_job will not count it
+            with self._lock:
+                self._counts['cancelled'] += 1
+
+    def terminate_unhealthy_job(self, job):
+        with self._lock:
+            record = self._jobs.get(str(job))
+            unhealthy = record is not None and record.future.done() and record.key not in self._results
+        if unhealthy:
+            self.terminate_job(job)
+        return unhealthy
+
+    def job_running(self, job):
+        with self._lock:
+            record = self._jobs.get(str(job)) if job is not None else None
+            if record is None or record.cancelled.is_set():
+                return False
+            # A finished job counts as running until its result is collected, so a
+            # poll that races with completion is not mistaken for a cancellation
+            return not record.future.done() or record.key in self._results
+
+    def get_progress(self, key):
+        with self._lock:
+            return self._progress.pop(self._make_progress_key(key), None)
+
+    def result_ready(self, key):
+        with self._lock:
+            return key in self._results
+
+    def get_result(self, key, job):
+        with self._lock:
+            entry = self._results.pop(key, None)
+            if entry is None:
+                return self.UNDEFINED
+            self._progress.pop(self._make_progress_key(key), None)
+            if job is not None:
+                self._jobs.pop(str(job), None)
+        return entry[1]
+
+    def stats(self) -> Dict[str, int]:
+        """Jobs running and queued right now, and totals of completed, cancelled and rejected jobs."""
+        with self._lock:
+            pending = sum(1 for job in self._jobs.values() if not job.future.done())
+            return {'running': self._running, 'queued': max(0, pending - self._running), **self._counts}
+
+
+_default_manager: Optional[ThreadPoolCallbackManager] = None
+_default_manager_lock = threading.Lock()
+
+
+def get_default_job_manager() -> ThreadPoolCallbackManager:
+    """Process-wide job manager shared by the background callbacks of the app."""
+    global _default_manager
+    if _default_manager is None:
+        with _default_manager_lock:
+            if _default_manager is None:
+                _default_manager = ThreadPoolCallbackManager()
+    return _default_manager
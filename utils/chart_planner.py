@@ -0,0 +1,194 @@
+"""
+Chart data planning: aggregates computed where the data is.
+
+A chart of a large result needs only a few dozen points, so instead of
+downloading every row to draw it, the chart's aggregation is wrapped around the
+user's SQL and run in BigQuery:
+  - histograms count a numeric column in bins on the grid of utils.histogram,
+    with the width picked from the downloaded rows and doubled in BigQuery
+    until the full result fits in the bin limit
+  - time series roll a value up with TIMESTAMP_TRUNC, at a grain picked from
+    the time span so the chart has at most a few hundred points
+  - categories keep the top K by value and fold the rest into an "Other" bar
+
+aggregate_frame computes the same aggregates from a DataFrame, for results that
+were downloaded in full, so a chart looks the same wherever its data came from.
+"""
+
+import os
+import logging
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from utils.column_profile import ColumnProfile, column_classes
+from utils.histogram import HISTOGRAM_MAX_BINS, bin_width, histogram_frame
+from utils.sql_utils import quote_identifier
+
+logger = logging.getLogger(__name__)
+
+CHART_TOP_K = int(os.environ.get("CHART_TOP_K", 20))
+OTHER_LABEL = "Other"
+NULL_LABEL = "(null)"
+
+# (longest span in hours, grain): the first grain whose span covers the data's is used
+TIME_GRAINS = [
+    (48, "HOUR"),
+    (24 * 120, "DAY"),
+    (24 * 730, "WEEK"),
+    (24 * 365 * 15, "MONTH"),
+    (None, "YEAR"),
+]
+# pandas Period frequencies matching BigQuery's TIMESTAMP_TRUNC grains (BigQuery weeks start on Sunday)
+_PANDAS_GRAINS = {"HOUR": "h", "DAY": "D", "WEEK": "W-SAT", "MONTH": "M", "YEAR": "Y"}
+
+
+def histogram_plan(df: pd.DataFrame, column: str, total_rows: Optional[int] = None) -> Dict[str, Any]:
+    """Histogram of a column, with the bin width chosen from the rows at hand (see utils.histogram)."""
+    width, origin = bin_width(df[column], total_rows, max_bins=HISTOGRAM_MAX_BINS)
+    return {'kind': 'histogram', 'column': column, 'width': width, 'origin': origin, 'max_bins': HISTOGRAM_MAX_BINS}
+
+
+def plan_chart(df: pd.DataFrame, x: Optional[str] = None, y: Optional[str] = None,
+               total_rows: Optional[int] = None,
+               profile: Optional[Dict[str, ColumnProfile]] = None) -> Optional[Dict[str, Any]]:
+    """
+    Picks the aggregate chart for a result from the column types of (a page of) its
+    rows: a time series when x is a date, categories when x is text, and a histogram
+    of the first numeric column otherwise. total_rows is the size of the whole result
+    when df is only part of it; profile, the column profiles of df if already computed
+    (utils.column_profile). Returns None if nothing can be charted.
+    """
+    if df is None or len(df.columns) == 0:
+        return None
+    classes = {col: p.kind for col, p in profile.items()} if profile is not None else column_classes(df)
+    numeric = [col for col, kind in classes.items() if kind == "numeric"]
+    x = x if x is not None else df.columns[0]
+    y = y if y is not None else next((col for col in numeric if col != x), None)
+    if y is not None and classes.get(x) == "temporal":
+        return {'kind': 'timeseries', 'time': x, 'value': y}
+    if y is not None and x not in numeric:
+        return {'kind': 'categories', 'category': x, 'value': y, 'top_k': CHART_TOP_K}
+    if numeric:
+        return histogram_plan(df, y if y is not None else numeric[0], total_rows)
+    return None
+
+
+def aggregate_sql(plan: Dict[str, Any], sql: str) -> str:
+    """BigQuery SQL computing the chart data of plan over the rows of sql."""
+    # The newline before the closing parenthesis ends any trailing comment in sql
+    source = f"WITH source AS (\n{sql.strip().rstrip(';')}\n)"
+    kind = plan['kind']
+    if kind == 'histogram':
+        column = quote_identifier(plan['column'])
+        origin, width = repr(plan['origin']), repr(plan['width'])
+        # Counts per bin of the base width, then the fewest doublings of it that fit max_bins
+        # (StreamingHistogram's grid). BigQuery evaluates a CTE each time it is referenced,
+        # so source is read exactly once: the later steps work on the base bins.
+        return f"""{source}
+SELECT ({origin}) + bucket * {width} * POW(2, k) AS bucket_start,
+       ({origin}) + (bucket + 1) * {width} * POW(2, k) AS bucket_end,
+       SUM(n) AS count
+FROM (
+  SELECT CAST(FLOOR(base_bucket / POW(2, k)) AS INT64) AS bucket, k, n
+  FROM (
+    SELECT base_bucket, n,
+           (SELECT MIN(k) FROM UNNEST(GENERATE_ARRAY(0, 62)) AS k
+            WHERE FLOOR(hi / POW(2, k)) - FLOOR(lo / POW(2, k)) + 1 <= {int(plan['max_bins'])}) AS k
+    FROM (
+      SELECT base_bucket, n, MIN(base_bucket) OVER () AS lo, MAX(base_bucket) OVER () AS hi
+      FROM (
+        SELECT CAST(FLOOR(({column} - ({origin})) / {width}) AS INT64) AS base_bucket, COUNT(*) AS n
+        FROM source
+        WHERE {column} IS NOT NULL AND NOT IS_INF({column}) AND NOT IS_NAN({column})
+        GROUP BY base_bucket
+      )
+    )
+  )
+)
+GROUP BY bucket, k
+ORDER BY bucket"""
+    if kind == 'timeseries':
+        time, value = quote_identifier(plan['time']), quote_identifier(plan['value'])
+        cases = "\n".join(f"    WHEN hours <= {limit} THEN TIMESTAMP_TRUNC(base_period, {grain})"
+                          for limit, grain in TIME_GRAINS if limit is not None)
+        # Sums per period of the finest grain with their first and last time, so source is
+        # read once; the span of the data picks the grain those sums are rolled up to
+        return f"""{source}
+SELECT
+  CASE
+{cases}
+    ELSE TIMESTAMP_TRUNC(base_period, {TIME_GRAINS[-1][1]})
+  END AS period,
+  SUM(value) AS value
+FROM (
+  SELECT base_period, value, TIMESTAMP_DIFF(MAX(last_time) OVER (), MIN(first_time) OVER (), HOUR) AS hours
+  FROM (
+    SELECT TIMESTAMP_TRUNC(CAST({time} AS TIMESTAMP), {TIME_GRAINS[0][1]}) AS base_period, SUM({value}) AS value,
+           MIN(CAST({time} AS TIMESTAMP)) AS first_time, MAX(CAST({time} AS TIMESTAMP)) AS last_time
+    FROM source
+    WHERE {time} IS NOT NULL
+    GROUP BY base_period
+  )
+)
+GROUP BY period
+ORDER BY period"""
+    if kind == 'categories':
+        category, top_k = quote_identifier(plan['category']), int(plan['top_k'])
+        value = f"SUM({quote_identifier(plan['value'])})" if plan.get('value') is not None else "COUNT(*)"
+        return f"""{source},
+totals AS (
+  SELECT IFNULL(CAST({category} AS STRING), '{NULL_LABEL}') AS category, {value} AS value
+  FROM source
+  GROUP BY category
+),
+ranked AS (
+  SELECT category, value, ROW_NUMBER() OVER (ORDER BY value DESC, category) AS position FROM totals
+)
+SELECT IF(MIN(position) <= {top_k}, ANY_VALUE(category), '{OTHER_LABEL}') AS category, SUM(value) AS value
+FROM ranked
+GROUP BY LEAST(position, {top_k + 1})
+ORDER BY MIN(position)"""
+    raise ValueError(f"Unknown chart kind: {kind}")
+
+
+def time_grain(start, end) -> str:
+    """TIMESTAMP_TRUNC grain for data spanning start to end."""
+    hours = (pd.Timestamp(end) - pd.Timestamp(start)) // pd.Timedelta(hours=1)
+    for limit, grain in TIME_GRAINS:
+        if limit is None or hours <= limit:
+            return grain
+    return TIME_GRAINS[-1][1]
+
+
+def aggregate_frame(plan: Dict[str, Any], df: pd.DataFrame) -> pd.DataFrame:
+    """The chart data of plan computed from a DataFrame, in the same shape as aggregate_sql's result."""
+    kind = plan['kind']
+    if kind == 'histogram':
+        return histogram_frame(df[plan['column']], plan['width'], plan['origin'], plan['max_bins'])
+    if kind == 'timeseries':
+        times = pd.to_datetime(df[plan['time']], errors='coerce')
+        if times.dt.tz is not None:
+            # TIMESTAMP_TRUNC truncates in UTC
+            times = times.dt.tz_convert(None)
+        frame = pd.DataFrame({'time': times, 'value': df[plan['value']]}).dropna(subset=['time'])
+        if frame.empty:
+            return pd.DataFrame({'period': [], 'value': []})
+        grain = _PANDAS_GRAINS[time_grain(frame['time'].min(), frame['time'].max())]
+        frame['period'] = frame['time'].dt.to_period(grain).dt.start_time
+        return frame.groupby('period', sort=True)['value'].sum(min_count=1).reset_index()
+    if kind == 'categories':
+        top_k = int(plan['top_k'])
+        categories = df[plan['category']].astype(object).where(df[plan['category']].notna(), NULL_LABEL).astype(str)
+        if plan.get('value') is not None:
+            totals = df[plan['value']].groupby(categories).sum(min_count=1)
+        else:
+            totals = categories.value_counts()
+        totals = totals.rename('value').reset_index().set_axis(['category', 'value'], axis=1)
+        totals = totals.sort_values(['value', 'category'], ascending=[False, True], na_position='last',
+                                    kind='stable').reset_index(drop=True)
+        if len(totals) > top_k:
+            other = pd.DataFrame({'category': [OTHER_LABEL], 'value': [totals['value'].iloc[top_k:].sum()]})
+            totals = pd.concat([totals.iloc[:top_k], other], ignore_index=True)
+        return totals
+    raise ValueError(f"Unknown chart kind: {kind}")
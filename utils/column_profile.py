@@ -0,0 +1,285 @@
+"""
+Column profiles: the per-column statistics behind insights and chart heuristics.
+
+profile_frame() computes, once per column, everything the insight bullets, the
+insights text and the chart planner need, in place of repeated describe(),
+select_dtypes(), isnull() and min/max/mean scans of the same frame:
+  - the dtype class: numeric, boolean, temporal, text or other
+  - row and null counts
+  - min / max (numeric and temporal columns), mean and std (numeric columns)
+  - the distinct count: exact for text and boolean columns with at most
+    PROFILE_TOP_K_CANDIDATES values, a HyperLogLog estimate otherwise
+  - the top K values of text and boolean columns
+
+A ColumnProfile can also be fed a result chunk by chunk (profile_chunks) and
+merged with the profile of another part of the result: means and variances are
+combined exactly (Chan et al.), sketches register by register, and top-K
+candidates by count. The top K is exact as long as a column has at most
+PROFILE_TOP_K_CANDIDATES distinct values, approximate beyond that.
+"""
+
+import os
+import math
+import datetime
+import logging
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+PROFILE_TOP_K = int(os.environ.get("PROFILE_TOP_K", 5))
+# Distinct values whose counts are tracked for the top K of a text column
+PROFILE_TOP_K_CANDIDATES = int(os.environ.get("PROFILE_TOP_K_CANDIDATES", 1000))
+# HyperLogLog registers: 2 ** 12, about 1.6% standard error. At least 11 bits, so the
+# remaining hash bits fit a float64 exactly (see _sketch_update)
+PROFILE_SKETCH_BITS = 12
+
+DTYPE_CLASSES = ("numeric", "boolean", "temporal", "text", "other")
+
+
+def is_temporal(series: pd.Series) -> bool:
+    """True for datetime columns, including BigQuery DATE columns that arrive as objects."""
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return True
+    if str(series.dtype) == "dbdate":
+        return True
+    if series.dtype == object:
+        first = series.dropna().head(1)
+        return not first.empty and isinstance(first.iloc[0], (datetime.date, datetime.datetime))
+    return False
+
+
+def dtype_class(series: pd.Series) -> str:
+    """The dtype class of a column, one of DTYPE_CLASSES."""
+    dtype = series.dtype
+    if pd.api.types.is_bool_dtype(dtype):
+        return "boolean"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "numeric"
+    if is_temporal(series):
+        return "temporal"
+    if dtype == object or isinstance(dtype, (pd.CategoricalDtype, pd.StringDtype)):
+        return "text"
+    return "other"
+
+
+def column_classes(df: pd.DataFrame) -> Dict[str, str]:
+    """The dtype class of every column, without profiling them."""
+    return {col: dtype_class(df[col]) for col in df.columns}
+
+
+def _sketch_update(registers: np.ndarray, hashes: np.ndarray) -> None:
+    """Adds 64-bit hashes to HyperLogLog registers."""
+    bits = PROFILE_SKETCH_BITS
+    index = (hashes >> np.uint64(64 - bits)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (64 - bits)) - 1)
+    # Position of the first set bit of the remaining bits; frexp's exponent is the bit length
+    rank = (64 - bits + 1) - np.frexp(rest.astype(np.float64))[1]
+    np.maximum.at(registers, index, rank.astype(np.uint8))
+
+
+def _sketch_estimate(registers: np.ndarray) -> float:
+    m = len(registers)
+    zeros = int(np.count_nonzero(registers == 0))
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / float(np.sum(np.ldexp(1.0, -registers.astype(np.int64))))
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting, accurate for small cardinalities
+        estimate = m * math.log(m / zeros)
+    return estimate
+
+
+def _mix(hashes: np.ndarray) -> np.ndarray:
+    """splitmix64 finalizer: spreads Python's hashes (small integers hash to themselves) over 64 bits."""
+    hashes = hashes ^ (hashes >> np.uint64(30))
+    hashes *= np.uint64(0xBF58476D1CE4E5B9)
+    hashes ^= hashes >> np.uint64(27)
+    hashes *= np.uint64(0x94D049BB133111EB)
+    return hashes ^ (hashes >> np.uint64(31))
+
+
+def _hash(values: np.ndarray) -> np.ndarray:
+    """64-bit hashes of an array of values."""
+    if values.dtype != object:
+        return pd.util.hash_array(values)
+    # hash() is several times faster than pandas' hashing of Python objects; the
+    # sketches never leave the process, so its per-process seed does not matter
+    try:
+        hashes = np.fromiter(map(hash, values), dtype=np.int64, count=len(values))
+    except TypeError:
+        # Unhashable values such as BigQuery REPEATED fields
+        hashes = np.fromiter(map(hash, values.astype(str)), dtype=np.int64, count=len(values))
+    return _mix(hashes.view(np.uint64))
+
+
+class ColumnProfile:
+    """Running statistics of one column; see the module docstring."""
+
+    def __init__(self, name: str, kind: str, top_k: int = PROFILE_TOP_K):
+        if kind not in DTYPE_CLASSES:
+            raise ValueError(f"Unknown dtype class: {kind}")
+        self.name = name
+        self.kind = kind
+        self.top_k = top_k
+        self.count = 0
+        self.nulls = 0
+        self.minimum: Any = None
+        self.maximum: Any = None
+        self.mean: Optional[float] = None
+        # Sum of squared deviations from the mean, for std
+        self._m2 = 0.0
+        self._moment_count = 0
+        self._registers = np.zeros(1 << PROFILE_SKETCH_BITS, dtype=np.uint8)
+        # Value counts of the top K candidates, most common first; None for columns without a top K
+        self._counts: Optional[pd.Series] = None
+        self._counts_exact = True
+
+    @property
+    def non_null(self) -> int:
+        return self.count - self.nulls
+
+    @property
+    def std(self) -> Optional[float]:
+        """Sample standard deviation, as pandas computes it."""
+        if self._moment_count < 2:
+            return None
+        return math.sqrt(self._m2 / (self._moment_count - 1))
+
+    @property
+    def distinct(self) -> int:
+        """Distinct non-null values: exact while every value's count is tracked, estimated otherwise."""
+        if self._counts is not None and self._counts_exact:
+            return len(self._counts)
+        return min(self.non_null, int(round(_sketch_estimate(self._registers))))
+
+    @property
+    def top(self) -> List[tuple]:
+        """(value, count) of the most common values, most common first."""
+        if self._counts is None:
+            return []
+        return [(value, int(count)) for value, count in self._counts.iloc[:self.top_k].items()]
+
+    def _update_range(self, minimum, maximum) -> None:
+        self.minimum = minimum if self.minimum is None or minimum < self.minimum else self.minimum
+        self.maximum = maximum if self.maximum is None or maximum > self.maximum else self.maximum
+
+    def _update_moments(self, count: int, mean: float, m2: float) -> None:
+        if count == 0:
+            return
+        if self._moment_count == 0:
+            self._moment_count, self.mean, self._m2 = count, mean, m2
+            return
+        total = self._moment_count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self._m2 += m2 + delta * delta * self._moment_count * count / total
+        self._moment_count = total
+
+    def _update_counts(self, counts: pd.Series, exact: bool) -> None:
+        """
+        Adds value counts. While every distinct value is counted the distinct count is
+        exact and nothing is hashed; from the first trim on, values go into the sketch.
+        """
+        combined = counts
+        if self._counts is not None and len(self._counts):
+            combined = self._counts.add(counts, fill_value=0).astype(np.int64).sort_values(ascending=False,
+                                                                                         kind="stable")
+        if self._counts_exact and not (exact and len(combined) <= PROFILE_TOP_K_CANDIDATES):
+            # Every value seen so far is in combined
+            _sketch_update(self._registers, _hash(combined.index.to_numpy(dtype=object)))
+            self._counts_exact = False
+        elif not self._counts_exact:
+            _sketch_update(self._registers, _hash(counts.index.to_numpy(dtype=object)))
+        self._counts = combined.iloc[:PROFILE_TOP_K_CANDIDATES]
+
+    def update(self, values: pd.Series) -> "ColumnProfile":
+        """Adds a chunk of the column's values."""
+        self.count += len(values)
+        if self.kind == "numeric":
+            numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            finite_mask = np.isfinite(numbers)
+            finite = numbers if finite_mask.all() else numbers[finite_mask]
+            if finite.size < numbers.size:
+                self.nulls += int(np.isnan(numbers).sum())
+            if finite.size:
+                self._update_range(float(finite.min()), float(finite.max()))
+                mean = float(finite.mean())
+                self._update_moments(finite.size, mean, float(np.square(finite - mean).sum()))
+                _sketch_update(self._registers, _hash(finite))
+        elif self.kind in ("text", "boolean"):
+            self.nulls += int(values.isna().sum())
+            try:
+                counts = values.value_counts(sort=True, dropna=True)
+            except TypeError:
+                counts = values.dropna().astype(str).value_counts(sort=True)
+            if len(counts):
+                self._update_counts(counts, exact=True)
+        else:
+            missing = values.isna().to_numpy()
+            self.nulls += int(missing.sum())
+            present = values[~missing] if missing.any() else values
+            if present.empty:
+                return self
+            if self.kind == "temporal":
+                try:
+                    self._update_range(present.min(), present.max())
+                except TypeError:
+                    logger.debug(f"Column '{self.name}' mixes incomparable temporal values.")
+            _sketch_update(self._registers, _hash(np.asarray(present.to_numpy())))
+        return self
+
+    def merge(self, other: "ColumnProfile") -> "ColumnProfile":
+        """Adds the statistics of another part of the same column."""
+        if other.kind != self.kind:
+            raise ValueError(f"Cannot merge a {other.kind} profile of '{other.name}' into a {self.kind} one")
+        self.count += other.count
+        self.nulls += other.nulls
+        if other.minimum is not None:
+            self._update_range(other.minimum, other.maximum)
+        if other.mean is not None:
+            self._update_moments(other._moment_count, other.mean, other._m2)
+        np.maximum(self._registers, other._registers, out=self._registers)
+        if other._counts is not None:
+            self._update_counts(other._counts, other._counts_exact)
+        return self
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'column': self.name, 'kind': self.kind, 'count': self.count, 'nulls': self.nulls,
+                'distinct': self.distinct, 'min': self.minimum, 'max': self.maximum, 'mean': self.mean,
+                'std': self.std, 'top': self.top}
+
+
+def profile_frame(df: pd.DataFrame, top_k: int = PROFILE_TOP_K) -> Dict[str, ColumnProfile]:
+    """Profiles of every column of df, in column order."""
+    return {col: ColumnProfile(col, dtype_class(df[col]), top_k).update(df[col]) for col in df.columns}
+
+
+def profile_chunks(chunks: Iterable, top_k: int = PROFILE_TOP_K) -> Dict[str, ColumnProfile]:
+    """
+    Profiles of a chunked result (DataFrames or Arrow batches / tables) without holding
+    it in memory; the first chunk sets the column classes.
+    """
+    profiles: Dict[str, ColumnProfile] = {}
+    for chunk in chunks:
+        frame = chunk.to_pandas() if hasattr(chunk, "schema") else chunk
+        for col in frame.columns:
+            if col not in profiles:
+                profiles[col] = ColumnProfile(col, dtype_class(frame[col]), top_k)
+            profiles[col].update(frame[col])
+    return profiles
+
+
+def columns_of(profiles: Dict[str, ColumnProfile], *kinds: str) -> List[str]:
+    """Names of the profiled columns of the given dtype classes, in column order."""
+    return [name for name, profile in profiles.items() if profile.kind in kinds]
+
+
+def profile_table(profiles: Dict[str, ColumnProfile]) -> pd.DataFrame:
+    """One row per column, for the insights text."""
+    rows = []
+    for profile in profiles.values():
+        row = profile.to_dict()
+        row['top'] = ", ".join(f"{value} ({count})" for value, count in row['top'])
+        rows.append(row)
+    return pd.DataFrame(rows).set_index('column') if rows else pd.DataFrame()
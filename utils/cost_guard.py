@@ -0,0 +1,174 @@
+"""
+Pre-flight cost checks for generated SQL.
+
+Queries are dry-run before execution to learn how many bytes they would scan.
+A query over the per-query limit of its dataset is refused, one over the
+confirmation threshold waits for the user to confirm it, and every session has
+a cumulative byte budget. Estimates are cached by SQL fingerprint.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from utils.sql_utils import sql_fingerprint
+
+logger = logging.getLogger(__name__)
+
+GIB = 1024 ** 3
+DEFAULT_SESSION_ID = "default"
+
+MAX_BYTES_PER_QUERY = int(os.environ.get("MAX_BYTES_PER_QUERY", 100 * GIB))
+CONFIRM_BYTES_PER_QUERY = int(os.environ.get("CONFIRM_BYTES_PER_QUERY", 10 * GIB))
+SESSION_BYTES_BUDGET = int(os.environ.get("SESSION_BYTES_BUDGET", 500 * GIB))
+# Per-dataset overrides of MAX_BYTES_PER_QUERY, e.g. "sales=10737418240,logs=1073741824"
+DATASET_BYTES_LIMITS = os.environ.get("DATASET_BYTES_LIMITS", "")
+
+ESTIMATE_CACHE_SIZE = 1024
+ESTIMATE_TTL_SECONDS = 3600
+PENDING_TTL_SECONDS = 600
+MAX_TRACKED_SESSIONS = 10000
+
+
+def parse_dataset_limits(spec: str) -> Dict[str, int]:
+    """Parses a "dataset=bytes,dataset=bytes" specification."""
+    limits = {}
+    for item in (spec or "").split(","):
+        if "=" not in item:
+            continue
+        dataset, value = item.split("=", 1)
+        try:
+            limits[dataset.strip()] = int(value.strip())
+        except ValueError:
+            logger.warning(f"Ignoring invalid byte limit for dataset '{dataset.strip()}': {value.strip()}")
+    return limits
+
+
+def format_bytes(num_bytes: Optional[int]) -> str:
+    """Formats a byte count for display, e.g. 1536 -> '1.5 KB'."""
+    if num_bytes is None:
+        return "unknown"
+    size = float(num_bytes)
+    for unit in ["B", "KB", "MB", "GB", "TB"]:
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class QueryCostGuard:
+    """Dry-run estimates, byte budgets and pending confirmations for generated queries."""
+
+    def __init__(self, max_bytes_per_query: Optional[int] = MAX_BYTES_PER_QUERY,
+                 confirm_bytes_per_query: Optional[int] = CONFIRM_BYTES_PER_QUERY,
+                 session_budget: Optional[int] = SESSION_BYTES_BUDGET,
+                 dataset_limits: Optional[Dict[str, int]] = None,
+                 estimate_cache_size: int = ESTIMATE_CACHE_SIZE,
+                 estimate_ttl_seconds: float = ESTIMATE_TTL_SECONDS):
+        self.max_bytes_per_query = max_bytes_per_query
+        self.confirm_bytes_per_query = confirm_bytes_per_query
+        self.session_budget = session_budget
+        self.dataset_limits = dataset_limits if dataset_limits is not None else parse_dataset_limits(DATASET_BYTES_LIMITS)
+        self._estimate_cache_size = estimate_cache_size
+        self._estimate_ttl = estimate_ttl_seconds
+        self._estimates: "OrderedDict[str, tuple]" = OrderedDict()
+        self._session_usage: "OrderedDict[str, int]" = OrderedDict()
+        self._pending: Dict[str, tuple] = {}
+        self._lock = threading.Lock()
+        self.estimate_hits = 0
+        self.estimate_misses = 0
+
+    def estimate(self, connector, sql: str) -> Optional[int]:
+        """
+        Returns the bytes the query would process, from cache or a dry run.
+        Returns None when the connector cannot estimate; dry-run errors are raised.
+        """
+        key = sql_fingerprint(sql)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._estimates.get(key)
+            if cached is not None and now - cached[1] < self._estimate_ttl:
+                self._estimates.move_to_end(key)
+                self.estimate_hits += 1
+                return cached[0]
+            self.estimate_misses += 1
+
+        estimated_bytes = connector.estimate_query_bytes(sql)
+        if estimated_bytes is None:
+            return None
+        with self._lock:
+            self._estimates[key] = (estimated_bytes, now)
+            self._estimates.move_to_end(key)
+            while len(self._estimates) > self._estimate_cache_size:
+                self._estimates.popitem(last=False)
+        return estimated_bytes
+
+    def query_limit(self, dataset_id: Optional[str]) -> Optional[int]:
+        """Per-query byte limit for a dataset ('dataset' or 'dataset.table')."""
+        dataset = (dataset_id or "").split(".")[0]
+        return self.dataset_limits.get(dataset, self.max_bytes_per_query)
+
+    def check(self, estimated_bytes: Optional[int], dataset_id: Optional[str],
+              session_id: str = DEFAULT_SESSION_ID, confirmed: bool = False) -> Dict[str, Any]:
+        """
+        Decides whether a query may run.
+
+        Returns {'action': 'allow' | 'confirm' | 'refuse', 'reason': str}.
+        """
+        if estimated_bytes is None:
+            return {'action': 'allow', 'reason': "No estimate available."}
+
+        limit = self.query_limit(dataset_id)
+        if limit is not None and estimated_bytes > limit:
+            return {'action': 'refuse',
+                    'reason': f"This query would scan {format_bytes(estimated_bytes)}, which exceeds the "
+                              f"{format_bytes(limit)} per-query limit for this dataset. Try narrowing it with "
+                              f"filters on partitioned columns, fewer columns or an aggregation."}
+
+        used = self.session_usage(session_id)
+        if self.session_budget is not None and used + estimated_bytes > self.session_budget:
+            return {'action': 'refuse',
+                    'reason': f"This query would scan {format_bytes(estimated_bytes)}, but this session has already "
+                              f"used {format_bytes(used)} of its {format_bytes(self.session_budget)} budget."}
+
+        if (not confirmed and self.confirm_bytes_per_query is not None
+                and estimated_bytes > self.confirm_bytes_per_query):
+            return {'action': 'confirm',
+                    'reason': f"This query will scan about {format_bytes(estimated_bytes)}. "
+                              f"Reply **yes** to run it, or ask a narrower question."}
+
+        return {'action': 'allow', 'reason': ""}
+
+    def record_usage(self, session_id: str, bytes_used: Optional[int]) -> None:
+        """Adds bytes billed (or processed) to a session's running total."""
+        if not bytes_used:
+            return
+        with self._lock:
+            self._session_usage[session_id] = self._session_usage.get(session_id, 0) + int(bytes_used)
+            self._session_usage.move_to_end(session_id)
+            while len(self._session_usage) > MAX_TRACKED_SESSIONS:
+                self._session_usage.popitem(last=False)
+
+    def session_usage(self, session_id: str) -> int:
+        """Bytes recorded for a session so far."""
+        with self._lock:
+            return self._session_usage.get(session_id, 0)
+
+    def set_pending(self, session_id: str, pending: Dict[str, Any]) -> None:
+        """Remembers a query that is waiting for the user's confirmation."""
+        now = time.monotonic()
+        with self._lock:
+            expired = [key for key, (_, created) in self._pending.items() if now - created > PENDING_TTL_SECONDS]
+            for key in expired:
+                del self._pending[key]
+            self._pending[session_id] = (pending, now)
+
+    def pop_pending(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Returns and forgets the session's pending query, if it has not expired."""
+        with self._lock:
+            entry = self._pending.pop(session_id, None)
+        if entry is None or time.monotonic() - entry[1] > PENDING_TTL_SECONDS:
+            return None
+        return entry[0]
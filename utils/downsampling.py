@@ -0,0 +1,144 @@
+"""
+Downsampling of large line and scatter series before they are sent to the browser.
+
+A chart a thousand pixels wide cannot show more than a couple of points per
+pixel column, yet every point is serialized into the figure JSON and drawn by
+the browser. downsample() picks the indices of at most max_points points:
+  - "minmax" (default): the minimum and maximum of each of max_points / 2
+    equal-count buckets, fully vectorized; every peak and trough survives, and at
+    two points per pixel column the line looks the same as the full series
+  - "lttb": Largest-Triangle-Three-Buckets, which keeps the point of each bucket
+    forming the largest triangle with its neighbours; it best preserves the shape
+    when far fewer points than pixels are kept, but may skip a narrow extreme
+  - "minmaxlttb": min/max preselection down to a few times max_points, then LTTB
+    over those, as faithful as LTTB at a fraction of its cost on long series
+make_scatter() builds the trace from the kept points, and switches to WebGL
+(Scattergl) above SCATTERGL_THRESHOLD points, where SVG rendering gets slow.
+"""
+
+import os
+import logging
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+logger = logging.getLogger(__name__)
+
+# Points kept per trace: about two per horizontal pixel of a chart
+DOWNSAMPLE_MAX_POINTS = int(os.environ.get("DOWNSAMPLE_MAX_POINTS", 2000))
+# Traces with more points than this are drawn with WebGL
+SCATTERGL_THRESHOLD = int(os.environ.get("SCATTERGL_THRESHOLD", 1000))
+DOWNSAMPLE_METHOD = os.environ.get("DOWNSAMPLE_METHOD", "minmax")
+# Points kept by the min/max preselection of "minmaxlttb", per output point
+MINMAX_PRESELECTION_RATIO = 4
+
+METHODS = ("minmax", "lttb", "minmaxlttb")
+
+
+def _as_float(values) -> np.ndarray:
+    """Numeric view of x or y values; datetimes become nanoseconds and anything unparsable NaN."""
+    series = values if isinstance(values, pd.Series) else pd.Series(np.asarray(values))
+    if pd.api.types.is_datetime64_any_dtype(series):
+        if series.dt.tz is not None:
+            series = series.dt.tz_convert(None)
+        nanoseconds = series.to_numpy(dtype="datetime64[ns]").view(np.int64)
+        result = nanoseconds.astype(float)
+        result[nanoseconds == np.iinfo(np.int64).min] = np.nan  # NaT
+        return result
+    return pd.to_numeric(series, errors="coerce").to_numpy(dtype=float)
+
+
+def minmax_indices(y: np.ndarray, n_out: int) -> np.ndarray:
+    """Indices of the first and last points and of the min and max of equal-count buckets, at most n_out."""
+    n = len(y)
+    if n <= n_out:
+        return np.arange(n)
+    # Room for the first and last points and for the leftover bucket
+    buckets = max(1, (n_out - 4) // 2)
+    interior = y[1:n - 1]
+    size = len(interior) // buckets
+    body = interior[:buckets * size].reshape(buckets, size)
+    offsets = np.arange(buckets) * size + 1
+    picked = [np.array([0, n - 1]), offsets + body.argmax(axis=1), offsets + body.argmin(axis=1)]
+    rest = interior[buckets * size:]
+    if len(rest):
+        start = buckets * size + 1
+        picked.append(np.array([start + rest.argmax(), start + rest.argmin()]))
+    return np.unique(np.concatenate(picked))
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """Largest-Triangle-Three-Buckets: indices of n_out points of a series sorted by x."""
+    n = len(y)
+    if n <= n_out or n_out < 3:
+        return np.arange(n)
+    # Buckets of the points between the first and the last, which are always kept
+    # Integer arithmetic, so the last bucket ends exactly at the last point
+    bounds = np.append(np.arange(n_out - 1, dtype=np.int64) * (n - 2) // (n_out - 2) + 1, n)
+    sizes = np.diff(bounds)
+    # Average of each bucket, the third corner of the triangles of the bucket before it
+    mean_x = np.add.reduceat(x, bounds[:-1]) / sizes
+    mean_y = np.add.reduceat(y, bounds[:-1]) / sizes
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        start, end = bounds[i], bounds[i + 1]
+        next_x, next_y = mean_x[i + 1], mean_y[i + 1]
+        area = np.abs((x[a] - next_x) * (y[start:end] - y[a]) - (x[a] - x[start:end]) * (next_y - y[a]))
+        a = start + int(np.argmax(area))
+        selected[i + 1] = a
+    return selected
+
+
+def downsample(x, y, max_points: int = DOWNSAMPLE_MAX_POINTS, method: str = DOWNSAMPLE_METHOD) -> np.ndarray:
+    """
+    Indices of at most max_points points of the series (x, y) to plot, in x order.
+    x may be None (the series is its own index), numbers or datetimes; unsorted x
+    is sorted first. Points with a missing x or y are dropped from long series.
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown downsampling method: {method}")
+    ys = _as_float(y)
+    n = len(ys)
+    if n <= max_points:
+        return np.arange(n)
+    xs = _as_float(x) if x is not None else np.arange(n, dtype=float)
+
+    # positions maps indices into xs / ys back to the caller's; None while they are the same
+    positions = None
+    valid = np.isfinite(xs) & np.isfinite(ys)
+    if not valid.all():
+        positions = np.flatnonzero(valid)
+        xs, ys = xs[positions], ys[positions]
+    if np.any(xs[1:] < xs[:-1]):
+        order = np.argsort(xs, kind="stable")
+        xs, ys = xs[order], ys[order]
+        positions = order if positions is None else positions[order]
+
+    if method == "minmax":
+        kept = minmax_indices(ys, max_points)
+    elif method == "lttb":
+        kept = lttb_indices(xs, ys, max_points)
+    else:
+        preselected = minmax_indices(ys, max_points * MINMAX_PRESELECTION_RATIO)
+        kept = preselected[lttb_indices(xs[preselected], ys[preselected], max_points)]
+    logger.debug(f"Downsampled a series of {n} points to {len(kept)} ({method}).")
+    return kept if positions is None else positions[kept]
+
+
+def make_scatter(x, y, max_points: Optional[int] = DOWNSAMPLE_MAX_POINTS, method: str = DOWNSAMPLE_METHOD,
+                 **trace_kwargs):
+    """
+    A go.Scatter trace of (x, y) downsampled to max_points (None keeps every point),
+    as go.Scattergl when more than SCATTERGL_THRESHOLD points remain.
+    """
+    if max_points is not None:
+        kept = downsample(x, y, max_points, method)
+        x = x.iloc[kept] if isinstance(x, pd.Series) else np.asarray(x)[kept]
+        y = y.iloc[kept] if isinstance(y, pd.Series) else np.asarray(y)[kept]
+    trace_class = go.Scattergl if len(y) > SCATTERGL_THRESHOLD else go.Scatter
+    return trace_class(x=x, y=y, **trace_kwargs)
@@ -0,0 +1,197 @@
+"""
+Server-side histogram binning.
+
+Handing a raw column to px.histogram serializes every value into the figure
+JSON and bins it in the browser. Here the bins are counted with NumPy and only
+the counts are sent, as a go.Bar.
+
+Bins are width wide and start at origin. The width comes from the
+Freedman-Diaconis rule (2 * IQR / n^(1/3)), or from Sturges' rule when the IQR
+is zero. Integer columns get whole-number widths. StreamingHistogram counts a
+column chunk by chunk: when the values span more than max_bins bins, it doubles
+the width and adds neighbouring bins together. Coarsening is exact, so
+histograms with the same origin and base width can be merged, whatever chunks
+each one saw. Pushed-down chart SQL (utils.chart_planner) bins on the same grid,
+so BigQuery and NumPy produce the same bars.
+"""
+
+import os
+import math
+import logging
+from typing import Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import plotly.graph_objects as go
+
+logger = logging.getLogger(__name__)
+
+HISTOGRAM_MAX_BINS = int(os.environ.get("HISTOGRAM_MAX_BINS", 100))
+HISTOGRAM_RULES = ("fd", "sturges")
+
+
+def _finite(values) -> np.ndarray:
+    array = pd.to_numeric(pd.Series(values) if not isinstance(values, pd.Series) else values,
+                          errors='coerce').to_numpy(dtype=float)
+    return array[np.isfinite(array)]
+
+
+def _is_integral(values) -> bool:
+    dtype = getattr(values, "dtype", None)
+    return dtype is not None and pd.api.types.is_integer_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype)
+
+
+def bin_width(values, total_count: Optional[int] = None, rule: str = "fd",
+              max_bins: int = HISTOGRAM_MAX_BINS) -> Tuple[float, float]:
+    """
+    (width, origin) of the bins for values, which may be a sample of a larger result
+    of total_count rows. The width never makes the sample's range span more than
+    max_bins bins.
+    """
+    if rule not in HISTOGRAM_RULES:
+        raise ValueError(f"Unknown histogram rule: {rule}")
+    integral = _is_integral(values)
+    finite = _finite(values)
+    if finite.size == 0:
+        return 1.0, 0.0
+    lo, hi = float(finite.min()), float(finite.max())
+    n = max(int(total_count or 0), finite.size)
+    span = hi - lo
+    width = 0.0
+    if rule == "fd":
+        q1, q3 = np.percentile(finite, [25, 75])
+        width = 2.0 * (q3 - q1) / n ** (1.0 / 3.0)
+    if width <= 0:
+        # Sturges, also the fallback when most values are equal
+        width = span / (math.log2(n) + 1.0) if span > 0 else 0.0
+    width = max(width, span / max_bins)
+    if integral:
+        return float(max(1, math.ceil(width))), float(math.floor(lo))
+    if width <= 0:
+        width = abs(lo) * 1e-3 or 1.0
+    return float(width), lo
+
+
+class StreamingHistogram:
+    """Bin counts of a numeric column fed in chunks; see the module docstring."""
+
+    def __init__(self, width: float, origin: float = 0.0, max_bins: int = HISTOGRAM_MAX_BINS):
+        if width <= 0:
+            raise ValueError("Histogram bin width must be positive")
+        self.base_width = float(width)
+        self.origin = float(origin)
+        self.max_bins = max_bins
+        self.doublings = 0
+        self.first = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.missing = 0
+
+    @property
+    def width(self) -> float:
+        return self.base_width * 2 ** self.doublings
+
+    @property
+    def count(self) -> int:
+        return int(self.counts.sum())
+
+    @staticmethod
+    def _halve(first: int, counts: np.ndarray) -> Tuple[int, np.ndarray]:
+        """The counts at twice the width: pads to whole pairs aligned on even indices and adds each pair."""
+        if first % 2:
+            counts, first = np.concatenate([[0], counts]), first - 1
+        if len(counts) % 2:
+            counts = np.concatenate([counts, [0]])
+        return first // 2, counts.reshape(-1, 2).sum(axis=1)
+
+    def _coarsen(self) -> None:
+        if len(self.counts):
+            self.first, self.counts = self._halve(self.first, self.counts)
+        self.doublings += 1
+
+    def _add_counts(self, first: int, counts: np.ndarray) -> None:
+        if not len(counts):
+            return
+        if not len(self.counts):
+            self.first, self.counts = first, counts.astype(np.int64)
+            return
+        start = min(self.first, first)
+        end = max(self.first + len(self.counts), first + len(counts))
+        merged = np.zeros(end - start, dtype=np.int64)
+        merged[self.first - start:self.first - start + len(self.counts)] += self.counts
+        merged[first - start:first - start + len(counts)] += counts
+        self.first, self.counts = start, merged
+
+    def add(self, values) -> "StreamingHistogram":
+        """Counts a chunk of values; missing and non-finite values are only tallied."""
+        total = len(values)
+        finite = _finite(values)
+        self.missing += total - finite.size
+        if finite.size == 0:
+            return self
+        index = np.floor((finite - self.origin) / self.base_width).astype(np.int64)
+        lo, hi = int(index.min()), int(index.max())
+        if len(self.counts):
+            # Base-width indices covered by the current bins
+            lo = min(lo, self.first << self.doublings)
+            hi = max(hi, ((self.first + len(self.counts)) << self.doublings) - 1)
+        # Double the width until the values seen so far fit in max_bins
+        while (hi >> self.doublings) - (lo >> self.doublings) + 1 > self.max_bins:
+            self._coarsen()
+        index >>= self.doublings
+        first = int(index.min())
+        self._add_counts(first, np.bincount(index - first))
+        return self
+
+    def merge(self, other: "StreamingHistogram") -> "StreamingHistogram":
+        """Adds the counts of a histogram over the same grid (origin and base width)."""
+        if other.origin != self.origin or other.base_width != self.base_width:
+            raise ValueError("Only histograms with the same origin and base width can be merged")
+        while self.doublings < other.doublings:
+            self._coarsen()
+        first, counts = other.first, other.counts
+        for _ in range(self.doublings - other.doublings):
+            if len(counts):
+                first, counts = self._halve(first, counts)
+        self._add_counts(first, counts)
+        self.missing += other.missing
+        while len(self.counts) > self.max_bins:
+            self._coarsen()
+        return self
+
+    def to_frame(self) -> pd.DataFrame:
+        """The non-empty bins, in order: bucket_start, bucket_end, count."""
+        nonzero = np.flatnonzero(self.counts)
+        counts = self.counts[nonzero]
+        index = self.first + nonzero
+        width = self.width
+        return pd.DataFrame({'bucket_start': self.origin + index * width,
+                             'bucket_end': self.origin + (index + 1) * width, 'count': counts})
+
+
+def histogram_frame(values, width: Optional[float] = None, origin: Optional[float] = None,
+                    max_bins: int = HISTOGRAM_MAX_BINS, rule: str = "fd") -> pd.DataFrame:
+    """Bins of an in-memory column, with the rule's width unless one is given."""
+    if width is None or origin is None:
+        width, origin = bin_width(values, rule=rule, max_bins=max_bins)
+    return StreamingHistogram(width, origin, max_bins).add(values).to_frame()
+
+
+def histogram_chunks(chunks: Iterable, column: str, total_count: Optional[int] = None,
+                     max_bins: int = HISTOGRAM_MAX_BINS, rule: str = "fd") -> pd.DataFrame:
+    """
+    Bins a column of a chunked result (DataFrames or Arrow batches) without holding it
+    in memory; the first chunk sets the width, later chunks coarsen it if needed.
+    """
+    histogram = None
+    for chunk in chunks:
+        values = chunk.column(column).to_numpy(zero_copy_only=False) if hasattr(chunk, "schema") else chunk[column]
+        if histogram is None:
+            histogram = StreamingHistogram(*bin_width(values, total_count, rule, max_bins), max_bins=max_bins)
+        histogram.add(values)
+    return histogram.to_frame() if histogram is not None else histogram_frame([])
+
+
+def histogram_bar(frame: pd.DataFrame, **trace_kwargs) -> go.Bar:
+    """A go.Bar of bin counts, one bar per bin spanning its edges."""
+    return go.Bar(x=(frame['bucket_start'] + frame['bucket_end']) / 2, y=frame['count'],
+                  width=frame['bucket_end'] - frame['bucket_start'], **trace_kwargs)
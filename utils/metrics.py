@@ -0,0 +1,407 @@
+"""
+In-process metrics registry rendered in the Prometheus text exposition format.
+
+Counters, gauges and histograms keep one value per label combination behind a
+lock, so gunicorn threads can update them concurrently. Each worker process has
+its own registry; the Cloud Run deployment runs one worker per instance, so a
+scrape of /metrics sees the whole instance.
+
+Values that already live elsewhere (cache hit counters) are copied into metrics
+at scrape time by collectors registered with MetricsRegistry.add_collector.
+"""
+
+import os
+import time
+import math
+import logging
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans fast cache hits up to slow LLM calls and large BigQuery jobs
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    type_name = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        header = f"# HELP {self.name} {self.documentation}\n# TYPE {self.name} {self.type_name}\n"
+        return header + "".join(line + "\n" for line in self._samples())
+
+
+class Counter(_Metric):
+    """Monotonically increasing value per label combination."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        if amount < 0:
+            raise ValueError("Counters can only increase")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def set_total(self, value: float, **labels) -> None:
+        """Sets the value from a counter kept elsewhere; for collectors only."""
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down per label combination."""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels) -> None:
+        self.inc(-amount, **labels)
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(_Metric):
+    """Bucketed distribution (e.g. latencies) per label combination."""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        # label values -> [per-bucket counts (non-cumulative), sum]
+        self._values: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = next(i for i, bound in enumerate(self.buckets) if value <= bound)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0]
+            entry[0][index] += 1
+            entry[1] += value
+
+    def time(self, **labels):
+        """
+        Context manager observing the duration of the enclosed block. A 'status' label,
+        when the histogram has one and it is not given, is set to "ok" or "error".
+        """
+        return _Timer(self, labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            entry = self._values.get(self._key(labels))
+            return sum(entry[0]) if entry else 0
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, (list(counts), total)) for key, (counts, total) in self._values.items())
+        lines = []
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, counts):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, ("le", _format_value(bound)))
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram, labels: Dict[str, str]):
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        labels = self._labels
+        if "status" in self._histogram.labelnames and "status" not in labels:
+            labels = dict(labels, status="error" if exc_type is not None else "ok")
+        self._histogram.observe(time.perf_counter() - self._start, **labels)
+        return False
+
+
+class MetricsRegistry:
+    """Named metrics of one process, plus collectors run before each exposition."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, documentation: str, labelnames: Sequence[str], **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, documentation, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} is already registered with another type or labels")
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, documentation, labelnames)
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def add_collector(self, collector: Callable[[], None]) -> None:
+        """Registers a function that updates metrics right before they are rendered."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text format (version 0.0.4)."""
+        with self._lock:
+            collectors = list(self._collectors)
+        for collector in collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.warning(f"MetricsRegistry: collector {getattr(collector, '__name__', collector)} failed: {e}")
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        return "".join(metric.render() for metric in metrics)
+
+
+_default_registry = MetricsRegistry()
+
+# Pipeline metrics, updated where the work happens
+LLM_LATENCY = _default_registry.histogram(
+    "data_agent_llm_request_duration_seconds", "Latency of language model calls.", ("model", "status"))
+LLM_TIME_TO_FIRST_TOKEN = _default_registry.histogram(
+    "data_agent_llm_time_to_first_token_seconds", "Time until the first chunk of a streamed language model response.",
+    ("model",))
+LLM_TOKENS = _default_registry.counter(
+    "data_agent_llm_tokens_total", "Tokens sent to and received from the language model.", ("model", "kind"))
+BIGQUERY_JOB_LATENCY = _default_registry.histogram(
+    "data_agent_bigquery_job_duration_seconds", "Time from submitting a query job until its result is ready.",
+    ("status",))
+BIGQUERY_BYTES_PROCESSED = _default_registry.counter(
+    "data_agent_bigquery_bytes_processed_total", "Bytes processed by query jobs.")
+BIGQUERY_BYTES_BILLED = _default_registry.counter(
+    "data_agent_bigquery_bytes_billed_total", "Bytes billed for query jobs.")
+BIGQUERY_ROWS_FETCHED = _default_registry.counter(
+    "data_agent_bigquery_rows_fetched_total", "Result rows downloaded from query jobs.")
+# Background callbacks (chat turns) answer through polls, so their latency is measured on the job
+BACKGROUND_JOB_QUEUE_WAIT = _default_registry.histogram(
+    "data_agent_background_job_queue_seconds", "Time background callback jobs waited for a worker.",
+    ("callback",))
+BACKGROUND_JOB_DURATION = _default_registry.histogram(
+    "data_agent_background_job_duration_seconds", "Run time of background callback jobs.",
+    ("callback", "outcome"))
+
+
+def get_default_registry() -> MetricsRegistry:
+    """Returns the process-wide metrics registry."""
+    return _default_registry
+
+
+def record_llm_usage(model: str, response) -> None:
+    """Counts the prompt and response tokens reported in a model response's usage metadata, if any."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        return
+    for kind, attribute in (("prompt", "prompt_token_count"), ("response", "candidates_token_count")):
+        count = getattr(usage, attribute, None)
+        if isinstance(count, (int, float)) and count > 0:
+            LLM_TOKENS.inc(count, model=model, kind=kind)
+
+
+def record_bigquery_job(query_job) -> None:
+    """Adds a finished query job's processed and billed bytes to the BigQuery counters."""
+    for counter, attribute in ((BIGQUERY_BYTES_PROCESSED, "total_bytes_processed"),
+                               (BIGQUERY_BYTES_BILLED, "total_bytes_billed")):
+        value = getattr(query_job, attribute, None)
+        if isinstance(value, (int, float)) and value > 0:
+            counter.inc(value)
+
+
+def count_rows(batches: Iterable, counter: Counter = BIGQUERY_ROWS_FETCHED) -> Iterable:
+    """Passes result chunks through, counting their rows as they are downloaded."""
+    for batch in batches:
+        counter.inc(batch.num_rows if hasattr(batch, "num_rows") else len(batch))
+        yield batch
+
+
+def cache_metrics_collector(stats_fn: Callable[[], Dict[str, Dict[str, int]]],
+                            registry: Optional[MetricsRegistry] = None) -> Callable[[], None]:
+    """
+    Builds a collector exporting {'cache': {'hits': n, 'misses': m}} from stats_fn as
+    lookup counters and hit ratios, and registers it.
+    """
+    registry = registry or _default_registry
+    lookups = registry.counter("data_agent_cache_lookups_total", "Cache lookups.", ("cache", "result"))
+    hit_ratio = registry.gauge("data_agent_cache_hit_ratio", "Share of cache lookups that were hits.", ("cache",))
+
+    def collect() -> None:
+        for cache, stats in stats_fn().items():
+            hits, misses = stats.get('hits', 0), stats.get('misses', 0)
+            lookups.set_total(hits, cache=cache, result="hit")
+            lookups.set_total(misses, cache=cache, result="miss")
+            hit_ratio.set(hits / (hits + misses) if hits + misses else 0.0, cache=cache)
+
+    registry.add_collector(collect)
+    return collect
+
+
+def background_jobs_collector(stats_fn: Callable[[], Dict[str, int]],
+                              registry: Optional[MetricsRegistry] = None) -> Callable[[], None]:
+    """
+    Builds a collector exporting the job counts of a background callback manager
+    (see utils.background_jobs.ThreadPoolCallbackManager.stats), and registers it.
+    """
+    registry = registry or _default_registry
+    active = registry.gauge("data_agent_background_jobs", "Background callback jobs by state.", ("state",))
+    finished = registry.counter("data_agent_background_jobs_total",
+                                "Background callback jobs that completed, were cancelled or were rejected.",
+                                ("outcome",))
+
+    def collect() -> None:
+        stats = stats_fn()
+        for state in ("running", "queued"):
+            active.set(stats.get(state, 0), state=state)
+        for outcome in ("completed", "cancelled", "rejected"):
+            finished.set_total(stats.get(outcome, 0), outcome=outcome)
+
+    registry.add_collector(collect)
+    return collect
+
+
+def register_metrics_endpoint(server, registry: Optional[MetricsRegistry] = None, path: str = "/metrics") -> None:
+    """
+    Adds `path` to a Flask server and instruments its requests: in-flight requests,
+    and count and latency of Dash callbacks, labelled by the callback's output. Polls
+    for the result of a background callback are only counted: their latency is not
+    the callback's (see BACKGROUND_JOB_DURATION).
+    """
+    from flask import Response, g, request
+
+    registry = registry or _default_registry
+    inflight = registry.gauge("data_agent_inflight_requests", "HTTP requests being served by this worker.")
+    callback_requests = registry.counter(
+        "data_agent_dash_callback_requests_total", "Dash callback requests.", ("callback", "status"))
+    callback_latency = registry.histogram(
+        "data_agent_dash_callback_duration_seconds", "Latency of Dash callback requests.", ("callback",))
+    callback_polls = registry.counter(
+        "data_agent_dash_callback_polls_total", "Polls for the result of background Dash callbacks.",
+        ("callback", "status"))
+    registry.gauge("data_agent_worker_start_time_seconds",
+                   "Unix time this worker process started.").set(time.time())
+    registry.gauge("data_agent_worker_pid", "Process id of this worker.").set(os.getpid())
+
+    def _observe_callback(status: str) -> None:
+        payload = request.get_json(silent=True) or {}
+        callback = payload.get("output", "unknown")
+        g.metrics_recorded = True
+        # Dash polls a background callback's job with its cacheKey and job id
+        if request.args.get("cacheKey") or request.args.get("job"):
+            callback_polls.inc(callback=callback, status=status)
+            return
+        callback_latency.observe(time.perf_counter() - g.metrics_start, callback=callback)
+        callback_requests.inc(callback=callback, status=status)
+
+    @server.before_request
+    def _start_request_metrics():
+        if request.path == path:
+            return
+        g.metrics_start = time.perf_counter()
+        inflight.inc()
+
+    @server.after_request
+    def _record_callback_metrics(response):
+        # 204 is a callback that raised PreventUpdate
+        if "metrics_start" in g and request.path.endswith("_dash-update-component"):
+            _observe_callback(str(response.status_code))
+        return response
+
+    @server.teardown_request
+    def _finish_request_metrics(error=None):
+        if "metrics_start" not in g:
+            return
+        # Unhandled exceptions skip after_request
+        if not g.get("metrics_recorded") and request.path.endswith("_dash-update-component"):
+            _observe_callback("500")
+        inflight.dec()
+
+    def metrics():
+        return Response(registry.render(), mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    server.add_url_rule(path, "metrics", metrics)
@@ -0,0 +1,217 @@
+"""
+Cache of query results, keyed by SQL fingerprint and the versions of the tables
+the query reads.
+
+Results are kept as Arrow tables in a memory tier and, when RESULT_CACHE_DIR is
+set, written through to a Parquet disk tier, which gunicorn workers on the same
+instance share. Both tiers are LRU and bounded by total bytes. A hit skips the
+BigQuery job and the download; the Arrow table converts to pandas without
+decoding rows again.
+
+The disk tier is off by default: under the temp directory it would be RAM on
+Cloud Run, next to the session store's copies of the same results. Point
+RESULT_CACHE_DIR at real disk to turn it on.
+"""
+
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.sql_utils import sql_fingerprint
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_MEMORY_BYTES = int(os.environ.get("RESULT_CACHE_MEMORY_BYTES", 256 * 1024 * 1024))
+RESULT_CACHE_DISK_BYTES = int(os.environ.get("RESULT_CACHE_DISK_BYTES", 512 * 1024 * 1024))
+# Empty (the default) keeps results in memory only
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "")
+
+_METADATA_KEY = b"data_agent_result_meta"
+
+
+def result_cache_key(sql: str, table_versions: Dict[str, str]) -> str:
+    """Key of a result: the SQL fingerprint plus the version of every table it reads."""
+    versions = json.dumps(sorted(table_versions.items()))
+    return hashlib.sha256(f"{sql_fingerprint(sql)}|{versions}".encode("utf-8")).hexdigest()
+
+
+class QueryResultCache:
+    """Two-tier (Arrow in memory, Parquet on disk) LRU cache of query results."""
+
+    def __init__(self, memory_bytes: int = RESULT_CACHE_MEMORY_BYTES,
+                 disk_bytes: int = RESULT_CACHE_DISK_BYTES,
+                 directory: Optional[str] = RESULT_CACHE_DIR):
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+        self.directory = directory or None
+        self._memory: "OrderedDict[str, Tuple[pa.Table, Dict[str, Any]]]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"QueryResultCache: disk tier disabled, cannot create {self.directory}: {e}")
+                self.directory = None
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of lookups served from either tier."""
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and sizes, for logs and metrics."""
+        with self._lock:
+            return {
+                'memory_entries': len(self._memory),
+                'memory_bytes': self._memory_used,
+                'memory_hits': self.memory_hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'hit_rate': self.hit_rate,
+            }
+
+    def get(self, key: str) -> Optional[Tuple[pa.Table, Dict[str, Any]]]:
+        """Returns (table, metadata) for a key, or None."""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry
+
+        entry = self._read_disk(key)
+        with self._lock:
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+        self._put_memory(key, entry[0], entry[1])
+        return entry
+
+    def put(self, key: str, table: pa.Table, metadata: Optional[Dict[str, Any]] = None) -> None:
+        """Caches a result in memory and on disk. Results larger than a tier are skipped by that tier."""
+        metadata = dict(metadata or {})
+        self._put_memory(key, table, metadata)
+        self._write_disk(key, table, metadata)
+
+    def clear(self) -> None:
+        """Empties the memory tier and deletes the disk tier's files."""
+        with self._lock:
+            self._memory.clear()
+            self._memory_used = 0
+        for path, _, _ in self._disk_files():
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def _put_memory(self, key: str, table: pa.Table, metadata: Dict[str, Any]) -> None:
+        size = table.nbytes
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_used -= previous[0].nbytes
+            self._memory[key] = (table, metadata)
+            self._memory_used += size
+            while self._memory_used > self.memory_bytes:
+                _, (evicted, _) = self._memory.popitem(last=False)
+                self._memory_used -= evicted.nbytes
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.parquet")
+
+    def _read_disk(self, key: str) -> Optional[Tuple[pa.Table, Dict[str, Any]]]:
+        if not self.directory:
+            return None
+        path = self._path(key)
+        try:
+            table = pq.read_table(path)
+            os.utime(path)  # LRU order on disk is by modification time
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"QueryResultCache: dropping unreadable entry {path}: {e}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        schema_metadata = table.schema.metadata or {}
+        metadata = json.loads(schema_metadata.get(_METADATA_KEY, b"{}"))
+        table = table.replace_schema_metadata(
+            {k: v for k, v in schema_metadata.items() if k != _METADATA_KEY} or None
+        )
+        return table, metadata
+
+    def _write_disk(self, key: str, table: pa.Table, metadata: Dict[str, Any]) -> None:
+        if not self.directory or table.nbytes > self.disk_bytes:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            schema_metadata = dict(table.schema.metadata or {})
+            schema_metadata[_METADATA_KEY] = json.dumps(metadata, default=str).encode("utf-8")
+            pq.write_table(table.replace_schema_metadata(schema_metadata), tmp_path)
+            # Atomic, so other workers never read a partially written file
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"QueryResultCache: could not write {path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return
+        self._evict_disk()
+
+    def _disk_files(self):
+        if not self.directory:
+            return []
+        files = []
+        try:
+            with os.scandir(self.directory) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".parquet"):
+                        stat = entry.stat()
+                        files.append((entry.path, stat.st_mtime, stat.st_size))
+        except OSError as e:
+            logger.warning(f"QueryResultCache: cannot list {self.directory}: {e}")
+        return files
+
+    def _evict_disk(self) -> None:
+        files = self._disk_files()
+        used = sum(size for _, _, size in files)
+        for path, _, size in sorted(files, key=lambda f: f[1]):
+            if used <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+                used -= size
+            except OSError:
+                pass
+
+
+_default_cache: Optional[QueryResultCache] = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_result_cache() -> QueryResultCache:
+    """Returns the process-wide result cache configured by the RESULT_CACHE_* settings."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = QueryResultCache()
+        return _default_cache
@@ -0,0 +1,84 @@
+"""
+Query results kept on the server under an opaque handle.
+
+The chat's data table shows one page of a result at a time: the browser gets the
+handle and the first page, and asks for further pages, sorts and filters by
+handle (see utils.table_query and DataAnalystAgent.fetch_table_page). Results
+are Arrow tables kept in a SessionStore under the session that ran the query, so
+they count towards its quota, expire with its TTL and, with a store directory,
+are readable from every worker; a handle whose result is gone is reported as
+expired.
+"""
+
+import json
+import uuid
+import logging
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import pyarrow as pa
+
+from utils.cost_guard import DEFAULT_SESSION_ID
+from utils.session_store import SessionStore, get_default_session_store
+
+logger = logging.getLogger(__name__)
+
+# Schema metadata key holding a result's metadata (JSON)
+_METADATA_KEY = b"data_agent_result_meta"
+# Separates the session id from the result's name in a handle
+_HANDLE_SEPARATOR = ":"
+
+
+class ResultStore:
+    """Query results (Arrow tables and their metadata) by handle, kept in a SessionStore."""
+
+    def __init__(self, session_store: Optional[SessionStore] = None):
+        # Without a shared store, results live in this process's memory only
+        self.session_store = session_store if session_store is not None else SessionStore(directory=None)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and sizes, for logs and metrics."""
+        return self.session_store.stats()
+
+    def put(self, table: pa.Table, metadata: Optional[Dict[str, Any]] = None,
+            session_id: str = DEFAULT_SESSION_ID) -> Optional[str]:
+        """Stores a result and returns its handle, or None if it is larger than the session's quota."""
+        name = uuid.uuid4().hex
+        schema_metadata = dict(table.schema.metadata or {})
+        schema_metadata[_METADATA_KEY] = json.dumps(metadata or {}, default=str).encode("utf-8")
+        if not self.session_store.put(session_id, name, table.replace_schema_metadata(schema_metadata)):
+            return None
+        return f"{session_id}{_HANDLE_SEPARATOR}{name}"
+
+    @staticmethod
+    def _split(handle: str) -> Optional[Tuple[str, str]]:
+        session_id, separator, name = str(handle or "").rpartition(_HANDLE_SEPARATOR)
+        return (session_id, name) if separator and name else None
+
+    def get(self, handle: str) -> Optional[Tuple[pa.Table, Dict[str, Any]]]:
+        """Returns (table, metadata) for a handle, or None if it is unknown or expired."""
+        key = self._split(handle)
+        table = self.session_store.get(*key) if key else None
+        if not isinstance(table, pa.Table):
+            return None
+        schema_metadata = dict(table.schema.metadata or {})
+        metadata = json.loads(schema_metadata.pop(_METADATA_KEY, b"{}"))
+        return table.replace_schema_metadata(schema_metadata or None), metadata
+
+    def discard(self, handle: str) -> None:
+        key = self._split(handle)
+        if key:
+            self.session_store.delete(*key)
+
+
+_default_store: Optional[ResultStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_result_store() -> ResultStore:
+    """Returns the process-wide result store, backed by the default session store."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ResultStore(get_default_session_store())
+        return _default_store
@@ -0,0 +1,198 @@
+"""
+In-process cache of dataset schemas and other warehouse metadata.
+
+Entries are keyed by tuples ending in the dataset id, e.g. ('schema', project,
+dataset), and are fresh for a TTL. Once an entry
+is older than the TTL it is still served, and a background thread asks the
+connector for the dataset's version (a cheap last-modified check): if nothing
+changed the entry is simply marked fresh again, otherwise the schema is
+reloaded and swapped in. The cache is bounded and evicts least recently used
+entries.
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CACHE_TTL_SECONDS = float(os.environ.get("SCHEMA_CACHE_TTL_SECONDS", 300))
+SCHEMA_CACHE_MAX_ENTRIES = int(os.environ.get("SCHEMA_CACHE_MAX_ENTRIES", 256))
+SCHEMA_REFRESH_WORKERS = 2
+
+
+class _Entry:
+    __slots__ = ("value", "version", "checked_at")
+
+    def __init__(self, value: Any, version: Optional[str], checked_at: float):
+        self.value = value
+        self.version = version
+        self.checked_at = checked_at
+
+
+class SchemaCache:
+    """Bounded TTL cache that serves stale schemas while revalidating them in the background."""
+
+    def __init__(self, ttl_seconds: float = SCHEMA_CACHE_TTL_SECONDS,
+                 max_entries: int = SCHEMA_CACHE_MAX_ENTRIES,
+                 background: bool = True,
+                 on_store: Optional[Callable[[Hashable, Any, Optional[str]], None]] = None):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._background = background
+        # Called with (key, value, version) whenever a freshly loaded value is cached
+        self.on_store = on_store
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._refreshing: set = set()
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.revalidations = 0
+        self.refreshes = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, loader: Callable[[], Any],
+            version_fn: Optional[Callable[[], Optional[str]]] = None) -> Any:
+        """
+        Returns the cached value for key, calling loader() on a miss.
+
+        version_fn returns a token that changes whenever the underlying schema may
+        have changed (None if unknown). Falsy loader results are not cached.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                if now - entry.checked_at < self.ttl_seconds:
+                    return entry.value
+                self.stale_hits += 1
+                schedule = key not in self._refreshing
+                if schedule:
+                    self._refreshing.add(key)
+                value = entry.value
+            else:
+                self.misses += 1
+
+        if entry is not None:
+            if schedule:
+                self._schedule_refresh(key, loader, version_fn)
+            return value
+
+        # Read the version before loading so a change during the load is caught next time
+        version = self._safe_version(key, version_fn)
+        value = loader()
+        if value:
+            self._store(key, value, version)
+        return value
+
+    def seed(self, key: Hashable, value: Any, version: Optional[str]) -> bool:
+        """
+        Adds a value loaded from elsewhere (e.g. the on-disk catalog) as a stale
+        entry: it is served immediately and revalidated on first use.
+        Returns False if the key is already cached or the cache is full.
+        """
+        with self._lock:
+            if key in self._entries or len(self._entries) >= self.max_entries:
+                return False
+            self._entries[key] = _Entry(value, version, float("-inf"))
+            return True
+
+    def invalidate(self, dataset_id: Optional[str] = None) -> int:
+        """
+        Drops cached entries for a dataset (the last element of the key), or all
+        entries when dataset_id is None. Returns the number of entries removed.
+        """
+        with self._lock:
+            if dataset_id is None:
+                removed = len(self._entries)
+                self._entries.clear()
+                return removed
+            keys = [key for key in self._entries if _dataset_of(key) == dataset_id]
+            for key in keys:
+                del self._entries[key]
+            return len(keys)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and current size, for logs and metrics."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'stale_hits': self.stale_hits,
+                'revalidations': self.revalidations,
+                'refreshes': self.refreshes,
+                'evictions': self.evictions,
+            }
+
+    def _store(self, key: Hashable, value: Any, version: Optional[str]) -> None:
+        with self._lock:
+            self._entries[key] = _Entry(value, version, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        if self.on_store is not None:
+            try:
+                self.on_store(key, value, version)
+            except Exception as e:
+                logger.warning(f"SchemaCache: on_store failed for {key}: {e}")
+
+    def _safe_version(self, key: Hashable, version_fn) -> Optional[str]:
+        if version_fn is None:
+            return None
+        try:
+            return version_fn()
+        except Exception as e:
+            logger.warning(f"SchemaCache: version check failed for {key}: {e}")
+            return None
+
+    def _schedule_refresh(self, key: Hashable, loader, version_fn) -> None:
+        if not self._background:
+            self._refresh(key, loader, version_fn)
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=SCHEMA_REFRESH_WORKERS,
+                                                    thread_name_prefix="schema-refresh")
+            executor = self._executor
+        executor.submit(self._refresh, key, loader, version_fn)
+
+    def _refresh(self, key: Hashable, loader, version_fn) -> None:
+        try:
+            version = self._safe_version(key, version_fn)
+            with self._lock:
+                entry = self._entries.get(key)
+                unchanged = entry is not None and version is not None and version == entry.version
+                if unchanged:
+                    entry.checked_at = time.monotonic()
+                    self.revalidations += 1
+            if unchanged:
+                return
+
+            value = loader()
+            with self._lock:
+                # Skip if the entry was invalidated or evicted meanwhile
+                still_cached = key in self._entries
+            if value and still_cached:
+                self._store(key, value, version)
+                with self._lock:
+                    self.refreshes += 1
+            logger.info(f"SchemaCache: refreshed schema for {key}")
+        except Exception as e:
+            logger.warning(f"SchemaCache: background refresh failed for {key}: {e}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+
+def _dataset_of(key: Hashable) -> Hashable:
+    return key[-1] if isinstance(key, tuple) else key
@@ -0,0 +1,153 @@
+"""
+Persistent on-disk catalog of warehouse metadata.
+
+SchemaAgent writes what it fetches (dataset and table lists, dataset schemas,
+row counts and sizes) to a small SQLite file. A new process seeds its in-memory
+schema cache from the file on startup and then revalidates the entries lazily,
+so the first question after a cold start does not wait for metadata calls.
+
+The file is opened in WAL mode with a busy timeout, so several gunicorn workers
+can read and write the same catalog concurrently. WAL needs a local filesystem:
+it does not work on network filesystems (Cloud Storage FUSE, NFS). On Cloud Run,
+which has no local persistent disk, the default file in the temp directory lives
+in the instance's memory, so it only carries schemas across worker restarts
+within an instance, not across cold starts.
+"""
+
+import os
+import json
+import time
+import sqlite3
+import logging
+import tempfile
+import threading
+from typing import Any, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Set SCHEMA_CATALOG_PATH to an empty string to disable the catalog
+SCHEMA_CATALOG_PATH = os.environ.get(
+    "SCHEMA_CATALOG_PATH", os.path.join(tempfile.gettempdir(), "data_agent_schema_catalog.sqlite3")
+)
+SCHEMA_CATALOG_BUSY_TIMEOUT_SECONDS = 5.0
+
+_CREATE_TABLE = """
+    CREATE TABLE IF NOT EXISTS catalog_entries (
+        kind TEXT NOT NULL,
+        project TEXT NOT NULL,
+        dataset TEXT NOT NULL DEFAULT '',
+        version TEXT,
+        payload TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (kind, project, dataset)
+    )
+"""
+
+
+def _split_key(key: Hashable) -> Tuple[str, str, str]:
+    """Catalog keys are (kind, project, dataset or None) tuples, as used by SchemaAgent."""
+    kind, project, dataset = key
+    return kind, project, dataset or ''
+
+
+class SchemaCatalog:
+    """SQLite-backed store of (kind, project, dataset) -> (payload, version)."""
+
+    def __init__(self, path: str = SCHEMA_CATALOG_PATH,
+                 busy_timeout: float = SCHEMA_CATALOG_BUSY_TIMEOUT_SECONDS):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connection() as conn:
+            try:
+                conn.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError as e:
+                # Another worker may hold the lock while switching modes; WAL is persistent once set
+                logger.warning(f"SchemaCatalog: could not enable WAL on {path}: {e}")
+            conn.execute(_CREATE_TABLE)
+        logger.info(f"SchemaCatalog: using {path}")
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread; sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout * 1000)}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, key: Hashable) -> Optional[Tuple[Any, Optional[str]]]:
+        """Returns (payload, version) for a key, or None."""
+        try:
+            row = self._connection().execute(
+                "SELECT payload, version FROM catalog_entries WHERE kind = ? AND project = ? AND dataset = ?",
+                _split_key(key),
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.warning(f"SchemaCatalog: read failed for {key}: {e}")
+            return None
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def put(self, key: Hashable, payload: Any, version: Optional[str]) -> None:
+        """Stores or replaces an entry. Errors are logged, never raised."""
+        try:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO catalog_entries (kind, project, dataset, version, payload, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (*_split_key(key), version, json.dumps(payload, default=str), time.time()),
+            )
+        except (sqlite3.Error, TypeError, ValueError) as e:
+            logger.warning(f"SchemaCatalog: write failed for {key}: {e}")
+
+    def load_project(self, project: str) -> List[Tuple[Tuple[str, str, Optional[str]], Any, Optional[str]]]:
+        """Returns every (key, payload, version) stored for a project."""
+        try:
+            rows = self._connection().execute(
+                "SELECT kind, dataset, payload, version FROM catalog_entries WHERE project = ?", (project,)
+            ).fetchall()
+        except sqlite3.Error as e:
+            logger.warning(f"SchemaCatalog: could not load catalog for project {project}: {e}")
+            return []
+        entries = []
+        for kind, dataset, payload, version in rows:
+            try:
+                entries.append(((kind, project, dataset or None), json.loads(payload), version))
+            except ValueError:
+                logger.warning(f"SchemaCatalog: skipping unreadable {kind} entry for {project}.{dataset}")
+        return entries
+
+    def invalidate(self, project: str, dataset_id: Optional[str] = None) -> None:
+        """Deletes the entries of a dataset, or of the whole project when dataset_id is None."""
+        try:
+            if dataset_id is None:
+                self._connection().execute("DELETE FROM catalog_entries WHERE project = ?", (project,))
+            else:
+                self._connection().execute(
+                    "DELETE FROM catalog_entries WHERE project = ? AND dataset = ?", (project, dataset_id)
+                )
+        except sqlite3.Error as e:
+            logger.warning(f"SchemaCatalog: invalidate failed for {project}.{dataset_id or '*'}: {e}")
+
+
+_default_catalog: Optional[SchemaCatalog] = None
+_default_catalog_lock = threading.Lock()
+
+
+def get_default_catalog() -> Optional[SchemaCatalog]:
+    """Returns the process-wide catalog at SCHEMA_CATALOG_PATH, or None if disabled or unusable."""
+    global _default_catalog
+    if not SCHEMA_CATALOG_PATH:
+        return None
+    with _default_catalog_lock:
+        if _default_catalog is None:
+            try:
+                _default_catalog = SchemaCatalog(SCHEMA_CATALOG_PATH)
+            except (sqlite3.Error, OSError) as e:
+                logger.warning(f"SchemaCatalog: disabled, could not open {SCHEMA_CATALOG_PATH}: {e}")
+                return None
+        return _default_catalog
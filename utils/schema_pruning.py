@@ -0,0 +1,194 @@
+"""
+Relevance-ranked pruning of the dataset schema put into the SQL prompt.
+
+Listing every table and column makes the prompt, and the model's latency, grow
+with the width of the dataset, and very wide datasets do not fit in the context
+at all. SchemaPruner keeps a BM25 index over the tables of each schema (table
+name, column names and descriptions) and, for each question, keeps the best
+matching tables and, within them, the matching columns first, until the schema
+part of the prompt reaches its token budget. Schemas that already fit the budget
+are left untouched.
+"""
+
+import os
+import re
+import math
+import logging
+import threading
+from collections import Counter, OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from utils.sql_cache import schema_fingerprint
+from utils.text_utils import QUESTION_WORDS, normalize_question, stem_word
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_TOKEN_BUDGET = int(os.environ.get("SCHEMA_TOKEN_BUDGET", 4000))
+SCHEMA_MAX_TABLES = int(os.environ.get("SCHEMA_MAX_TABLES", 8))
+SCHEMA_INDEX_CACHE_SIZE = 16
+
+# BM25 parameters; table names are repeated so a hit on them outweighs one on a column
+BM25_K1 = 1.2
+BM25_B = 0.75
+TABLE_NAME_WEIGHT = 3
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+_CAMEL_RE = re.compile(r"(?<=[a-z0-9])(?=[A-Z])")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of prompt text (about four characters per token)."""
+    return max(1, len(text) // 4)
+
+
+def name_tokens(name: str) -> List[str]:
+    """Stemmed parts of a snake_case or camelCase identifier."""
+    return [stem_word(word) for word in _WORD_RE.findall(_CAMEL_RE.sub(" ", name or "").lower()) if len(word) > 1]
+
+
+def text_tokens(text: str) -> List[str]:
+    """Stemmed content words of a question or description."""
+    return [stem_word(word) for word in _WORD_RE.findall(normalize_question(text)) if word not in QUESTION_WORDS]
+
+
+def column_line(column: Dict[str, Any]) -> str:
+    """How a column is written in the prompt."""
+    return f"{column['name']} ({column['type']})"
+
+
+class SchemaIndex:
+    """BM25 index over the tables of one dataset schema."""
+
+    def __init__(self, dataset_schema: Dict[str, Any]):
+        self.table_names = list(dataset_schema)
+        self._doc_ids = {name: doc_id for doc_id, name in enumerate(self.table_names)}
+        self._postings: Dict[str, List[Tuple[int, int]]] = {}
+        self._column_tokens: List[List[frozenset]] = []
+        lengths = []
+        for doc_id, table_name in enumerate(self.table_names):
+            columns = (dataset_schema[table_name] or {}).get('columns', [])
+            tokens = name_tokens(table_name) * TABLE_NAME_WEIGHT + text_tokens(
+                (dataset_schema[table_name] or {}).get('description', ''))
+            per_column = []
+            for column in columns:
+                column_tokens = name_tokens(column.get('name', '')) + text_tokens(column.get('description', ''))
+                per_column.append(frozenset(column_tokens))
+                tokens.extend(column_tokens)
+            self._column_tokens.append(per_column)
+            lengths.append(len(tokens))
+            for token, count in Counter(tokens).items():
+                self._postings.setdefault(token, []).append((doc_id, count))
+        self._lengths = lengths
+        self._average_length = (sum(lengths) / len(lengths)) if lengths else 0.0
+        # Size of the schema part of the prompt if nothing is left out
+        self.full_tokens = sum(
+            estimate_tokens(f"Table: {name}, Columns: []") +
+            sum(estimate_tokens(column_line(column)) + 1 for column in (info or {}).get('columns', []))
+            for name, info in dataset_schema.items())
+
+    def idf(self, token: str) -> float:
+        df = len(self._postings.get(token, ()))
+        count = len(self.table_names)
+        return math.log(1 + (count - df + 0.5) / (df + 0.5))
+
+    def rank_tables(self, question: str) -> List[Tuple[str, float]]:
+        """Tables with a positive BM25 score for the question, best first."""
+        scores: Dict[int, float] = {}
+        for token in set(text_tokens(question)):
+            postings = self._postings.get(token)
+            if not postings:
+                continue
+            idf = self.idf(token)
+            for doc_id, tf in postings:
+                norm = 1 - BM25_B + BM25_B * self._lengths[doc_id] / (self._average_length or 1.0)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * norm)
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.table_names[doc_id], score) for doc_id, score in ranked]
+
+    def column_scores(self, table_name: str, question: str) -> List[float]:
+        """Sum of the IDF of the question words each column of a table matches."""
+        words = set(text_tokens(question))
+        doc_id = self._doc_ids[table_name]
+        return [sum(self.idf(token) for token in words & tokens) for tokens in self._column_tokens[doc_id]]
+
+
+class SchemaPruner:
+    """Cuts a dataset schema down to the tables and columns relevant to a question, under a token budget."""
+
+    def __init__(self, token_budget: int = SCHEMA_TOKEN_BUDGET, max_tables: int = SCHEMA_MAX_TABLES):
+        self.token_budget = token_budget
+        self.max_tables = max_tables
+        self._indexes: "OrderedDict[str, SchemaIndex]" = OrderedDict()
+        self._last: Optional[Tuple[Dict[str, Any], SchemaIndex]] = None
+        self._lock = threading.Lock()
+
+    def _index(self, dataset_schema: Dict[str, Any]) -> SchemaIndex:
+        # The schema cache hands out the same dict until the dataset changes, so an
+        # identity check usually avoids fingerprinting a large schema
+        last = self._last
+        if last is not None and last[0] is dataset_schema:
+            return last[1]
+        fingerprint = schema_fingerprint(dataset_schema)
+        with self._lock:
+            index = self._indexes.get(fingerprint)
+            if index is not None:
+                self._indexes.move_to_end(fingerprint)
+        if index is None:
+            index = SchemaIndex(dataset_schema)
+            with self._lock:
+                self._indexes[fingerprint] = index
+                while len(self._indexes) > SCHEMA_INDEX_CACHE_SIZE:
+                    self._indexes.popitem(last=False)
+        self._last = (dataset_schema, index)
+        return index
+
+    def prune(self, question: str, dataset_schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """
+        Returns the schema to describe in the prompt: dataset_schema itself when it fits
+        the budget, otherwise a copy with the most relevant tables and columns. Tables
+        whose columns were cut have 'omitted_columns' set to the number left out.
+        """
+        if not dataset_schema or self.token_budget is None:
+            return dataset_schema
+        index = self._index(dataset_schema)
+        if index.full_tokens <= self.token_budget:
+            return dataset_schema
+
+        ranked = [name for name, _ in index.rank_tables(question)][:self.max_tables]
+        if not ranked:
+            # Nothing in the question names a table or column; fall back to the first tables
+            ranked = index.table_names[:self.max_tables]
+
+        # Relevant columns of every kept table come first, then the others in table order
+        budget = self.token_budget
+        picked: Dict[str, List[int]] = {}
+        candidates = []
+        for rank, table_name in enumerate(ranked):
+            cost = estimate_tokens(f"Table: {table_name}, Columns: []")
+            if cost > budget:
+                break
+            budget -= cost
+            picked[table_name] = []
+            columns = (dataset_schema[table_name] or {}).get('columns', [])
+            key_columns = set((dataset_schema[table_name] or {}).get('partitioning', []))
+            for position, score in enumerate(index.column_scores(table_name, question)):
+                boost = 0.5 if columns[position].get('name') in key_columns else 0.0
+                candidates.append((-(score + boost) if score or boost else 0.0, rank, position, table_name))
+        for _, _, position, table_name in sorted(candidates):
+            column = dataset_schema[table_name]['columns'][position]
+            cost = estimate_tokens(column_line(column)) + 1
+            if cost <= budget:
+                budget -= cost
+                picked[table_name].append(position)
+
+        pruned = {}
+        for table_name, positions in picked.items():
+            info = dict(dataset_schema[table_name] or {})
+            all_columns = info.get('columns', [])
+            info['columns'] = [all_columns[position] for position in sorted(positions)]
+            if len(positions) < len(all_columns):
+                info['omitted_columns'] = len(all_columns) - len(positions)
+            pruned[table_name] = info
+        logger.info(f"Pruned schema for the prompt from {len(dataset_schema)} tables (~{index.full_tokens} tokens) "
+                    f"to {len(pruned)} tables (~{self.token_budget - budget} tokens).")
+        return pruned
@@ -0,0 +1,278 @@
+"""
+Local semantic cache of questions, so paraphrases ("total production by state"
+vs "sum of production per state") can reuse SQL that already ran successfully.
+
+Questions are embedded on the CPU with hashed character n-gram TF-IDF and kept
+in a sparse inverted index per dataset. A cached question is reused when its
+cosine similarity is above the threshold and it mentions the same schema terms,
+numbers and aggregation intent as the new question, which keeps "by state" from
+matching "by district" and "top 10" from matching "top 5". Other words, such as
+filter values, lower the similarity for every word only one question has, so the
+threshold trades recall against precision.
+"""
+
+import os
+import re
+import math
+import zlib
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, FrozenSet, List, Optional
+
+import numpy as np
+
+from utils.sql_cache import schema_fingerprint
+from utils.text_utils import QUESTION_WORDS, normalize_question, stem_word
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_THRESHOLD = float(os.environ.get("SEMANTIC_CACHE_THRESHOLD", 0.8))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.environ.get("SEMANTIC_CACHE_MAX_ENTRIES", 100000))
+# Similarity is multiplied by this for every content word only one of the two questions has
+UNMATCHED_WORD_PENALTY = 0.85
+NGRAM_SIZES = (3, 4)
+HASH_BUCKETS = 1 << 20
+
+_WORD_RE = re.compile(r"[a-z0-9]+")
+
+# Words that change the aggregation or ranking of an answer, mapped to a canonical intent
+INTENT_WORDS = {
+    'sum': ['total', 'sum', 'overall'],
+    'avg': ['average', 'avg', 'mean'],
+    'count': ['count', 'number', 'many'],
+    'max': ['max', 'maximum', 'highest', 'largest', 'most', 'top', 'biggest'],
+    'min': ['min', 'minimum', 'lowest', 'smallest', 'least', 'bottom', 'fewest'],
+    'distinct': ['distinct', 'unique', 'different'],
+}
+_INTENTS = {word: intent for intent, words in INTENT_WORDS.items() for word in words}
+
+
+def _content_words(question: str) -> List[str]:
+    """Stemmed words of a question without question phrasing, with aggregation words canonicalized."""
+    words = [stem_word(word) for word in _WORD_RE.findall(normalize_question(question)) if word not in QUESTION_WORDS]
+    return [f"~{_INTENTS[word]}" if word in _INTENTS else word for word in words]
+
+
+def question_features(question: str) -> Counter:
+    """Hashed character n-gram and word counts of a question's content words."""
+    words = _content_words(question)
+    features = Counter()
+    for word in words:
+        features[zlib.crc32(f"w:{word}".encode("utf-8")) % HASH_BUCKETS] += 1
+        padded = f" {word} "
+        for n in NGRAM_SIZES:
+            for i in range(len(padded) - n + 1):
+                features[zlib.crc32(padded[i:i + n].encode("utf-8")) % HASH_BUCKETS] += 1
+    return features
+
+
+def schema_terms(dataset_schema: Optional[Dict[str, Any]]) -> FrozenSet[str]:
+    """Table and column names of a schema, and their underscore-separated parts, stemmed."""
+    terms = set()
+    for table_name, table_info in (dataset_schema or {}).items():
+        names = [table_name] + [col.get('name', '') for col in (table_info or {}).get('columns', [])]
+        for name in names:
+            lowered = name.lower()
+            terms.add(stem_word(lowered))
+            terms.update(stem_word(part) for part in re.split(r"[_\W]+", lowered) if len(part) > 2)
+    return frozenset(terms)
+
+
+def key_terms(question: str, vocabulary: FrozenSet[str]) -> FrozenSet[str]:
+    """
+    What a reused answer must agree on: the schema terms, numbers and aggregation intents
+    of the question. Other words (filter values, phrasing) are left to the similarity threshold.
+    """
+    terms = {word for word in _content_words(question) if word in vocabulary or word.isdigit() or word[0] == "~"}
+    # Multi-word column names such as "crop year" for crop_year
+    words = [stem_word(word) for word in _WORD_RE.findall(normalize_question(question))]
+    terms.update(f"{a}_{b}" for a, b in zip(words, words[1:]) if f"{a}_{b}" in vocabulary)
+    return frozenset(terms)
+
+
+class _Postings:
+    """Growable (doc id, weight) arrays for one feature."""
+
+    __slots__ = ("ids", "weights", "size")
+
+    def __init__(self):
+        self.ids = np.empty(4, dtype=np.int32)
+        self.weights = np.empty(4, dtype=np.float32)
+        self.size = 0
+
+    def append(self, doc_id: int, weight: float) -> None:
+        if self.size == len(self.ids):
+            self.ids = np.resize(self.ids, self.size * 2)
+            self.weights = np.resize(self.weights, self.size * 2)
+        self.ids[self.size] = doc_id
+        self.weights[self.size] = weight
+        self.size += 1
+
+
+class QuestionIndex:
+    """Sparse TF-IDF inverted index over the questions of one dataset schema."""
+
+    def __init__(self, fingerprint: str, vocabulary: FrozenSet[str]):
+        self.fingerprint = fingerprint
+        self.vocabulary = vocabulary
+        self._postings: Dict[int, _Postings] = {}
+        self._norms = np.zeros(0, dtype=np.float32)
+        self._norms_built_at = 0
+        self.questions: List[str] = []
+        self.sqls: List[Optional[str]] = []
+        self.terms: List[FrozenSet[str]] = []
+        self.words: List[FrozenSet[str]] = []
+        self._known: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.questions)
+
+    def _idf(self, feature: int) -> float:
+        postings = self._postings.get(feature)
+        df = postings.size if postings is not None else 0
+        return math.log((len(self.questions) + 1) / (df + 1)) + 1.0
+
+    def add(self, question: str, sql: str) -> None:
+        normalized = normalize_question(question)
+        if normalized in self._known:
+            self.sqls[self._known[normalized]] = sql
+            return
+        doc_id = len(self.questions)
+        self._known[normalized] = doc_id
+        self.questions.append(question)
+        self.sqls.append(sql)
+        self.terms.append(key_terms(question, self.vocabulary))
+        self.words.append(frozenset(_content_words(question)))
+
+        features = question_features(question)
+        for feature, count in features.items():
+            self._postings.setdefault(feature, _Postings()).append(doc_id, 1.0 + math.log(count))
+        if doc_id >= len(self._norms):
+            self._norms = np.resize(self._norms, max(16, 2 * len(self._norms)))
+        # Norm under the current IDF; _refresh_norms corrects the drift as more questions arrive
+        self._norms[doc_id] = math.sqrt(sum(((1.0 + math.log(c)) * self._idf(f)) ** 2 for f, c in features.items()))
+
+    def forget(self, question: str) -> None:
+        # Postings are append-only, so the entry is tombstoned rather than removed
+        doc_id = self._known.get(normalize_question(question))
+        if doc_id is not None:
+            self.sqls[doc_id] = None
+
+    def _refresh_norms(self) -> None:
+        """
+        Recomputes the document norms with the current IDF. IDF drifts as questions are
+        added, so this runs lazily once the index has grown by more than 5%.
+        """
+        count = len(self.questions)
+        if count <= self._norms_built_at * 1.05:
+            return
+        ids = [postings.ids[:postings.size] for postings in self._postings.values()]
+        weights = [postings.weights[:postings.size].astype(np.float64) * self._idf(feature)
+                   for feature, postings in self._postings.items()]
+        squares = np.bincount(np.concatenate(ids), weights=np.square(np.concatenate(weights)), minlength=count)
+        self._norms[:count] = np.sqrt(squares)
+        self._norms_built_at = count
+
+    def search(self, question: str, top_k: int = 5) -> List[tuple]:
+        """Returns up to top_k (doc id, cosine similarity) pairs, best first."""
+        count = len(self.questions)
+        if count == 0:
+            return []
+        self._refresh_norms()
+        features = question_features(question)
+        ids, weights, query_norm = [], [], 0.0
+        for feature, qcount in features.items():
+            idf = self._idf(feature)
+            query_weight = (1.0 + math.log(qcount)) * idf
+            query_norm += query_weight * query_weight
+            postings = self._postings.get(feature)
+            if postings is None:
+                continue
+            ids.append(postings.ids[:postings.size])
+            weights.append(postings.weights[:postings.size] * np.float32(query_weight * idf))
+        if not ids or query_norm == 0:
+            return []
+        scores = np.bincount(np.concatenate(ids), weights=np.concatenate(weights), minlength=count)
+        norms = self._norms[:count]
+        scores = np.divide(scores, norms * math.sqrt(query_norm), out=np.zeros(count), where=norms > 0)
+        np.minimum(scores, 1.0, out=scores)
+        k = min(top_k, count)
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(int(doc_id), float(scores[doc_id])) for doc_id in best if scores[doc_id] > 0]
+
+
+class SemanticQuestionCache:
+    """Per-dataset semantic lookup of previously validated question -> SQL pairs."""
+
+    def __init__(self, threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 max_entries_per_dataset: int = SEMANTIC_CACHE_MAX_ENTRIES):
+        self.threshold = threshold
+        self.max_entries_per_dataset = max_entries_per_dataset
+        self._indexes: Dict[str, QuestionIndex] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _index(self, dataset_id: str, dataset_schema: Optional[Dict[str, Any]]) -> QuestionIndex:
+        fingerprint = schema_fingerprint(dataset_schema)
+        index = self._indexes.get(dataset_id)
+        if index is None or index.fingerprint != fingerprint:
+            # A new schema invalidates every answer given against the old one
+            index = QuestionIndex(fingerprint, schema_terms(dataset_schema))
+            self._indexes[dataset_id] = index
+        return index
+
+    def add(self, dataset_id: str, dataset_schema: Optional[Dict[str, Any]], question: str, sql: str) -> None:
+        """Remembers SQL that ran successfully for a question."""
+        with self._lock:
+            index = self._index(dataset_id, dataset_schema)
+            if len(index) >= self.max_entries_per_dataset:
+                # Keep the newer half; rebuilding is cheaper than deleting from the postings
+                keep = list(zip(index.questions, index.sqls))[len(index) // 2:]
+                index = QuestionIndex(index.fingerprint, index.vocabulary)
+                for kept_question, kept_sql in keep:
+                    index.add(kept_question, kept_sql)
+                self._indexes[dataset_id] = index
+            index.add(question, sql)
+
+    def forget(self, dataset_id: str, question: str) -> None:
+        """Stops reusing the SQL cached for a question, e.g. because it failed to run."""
+        with self._lock:
+            index = self._indexes.get(dataset_id)
+            if index is not None:
+                index.forget(question)
+
+    def lookup(self, dataset_id: str, dataset_schema: Optional[Dict[str, Any]],
+               question: str, threshold: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Returns {'question', 'sql', 'similarity'} for the most similar cached question above
+        the threshold that mentions the same schema terms and numbers, or None.
+        """
+        threshold = self.threshold if threshold is None else threshold
+        with self._lock:
+            index = self._index(dataset_id, dataset_schema)
+            terms = key_terms(question, index.vocabulary)
+            words = frozenset(_content_words(question))
+            best = None
+            for doc_id, similarity in index.search(question, top_k=20):
+                if similarity < threshold:
+                    break
+                if index.sqls[doc_id] is None or index.terms[doc_id] != terms:
+                    continue
+                score = similarity * UNMATCHED_WORD_PENALTY ** len(words ^ index.words[doc_id])
+                if score >= threshold and (best is None or score > best[1]):
+                    best = (doc_id, score)
+            if best is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            doc_id, score = best
+            return {'question': index.questions[doc_id], 'sql': index.sqls[doc_id], 'similarity': score}
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and index sizes, for logs and metrics."""
+        with self._lock:
+            return {'datasets': len(self._indexes), 'entries': sum(len(i) for i in self._indexes.values()),
+                    'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,428 @@
+"""
+Per-session state kept on the server, so callbacks pass small keys instead of payloads.
+
+Whatever a client-side dcc.Store holds is JSON-encoded, sent to the browser and
+posted back with every callback that lists it as State. SessionStore keeps that
+state on the server, by browser session (store-session-id) and name:
+  - values are Arrow tables (query results) or JSON-compatible objects (chat
+    transcripts, generated SQL)
+  - writes go through to SESSION_STORE_DIR, one file per value (Arrow IPC or
+    JSON), written atomically, so every gunicorn worker on the instance reads
+    what another wrote; an empty SESSION_STORE_DIR keeps values in memory only.
+    Point it at real disk: the default under the temp directory is RAM on Cloud
+    Run, where it counts against the instance's memory limit
+  - reads are served from a memory tier, least recently used first out once it
+    holds more than SESSION_STORE_MEMORY_BYTES; values evicted from memory (or
+    written by another worker) are read back from disk, Arrow files memory-mapped
+  - values expire SESSION_STORE_TTL_SECONDS after they were last written or
+    read; expired files are swept at most every SESSION_STORE_SWEEP_SECONDS
+  - a session holds at most SESSION_STORE_SESSION_BYTES; storing more drops
+    that session's least recently used values first
+  - the directory holds at most SESSION_STORE_DISK_BYTES across all sessions;
+    storing more drops the least recently used values of any session first
+
+A file's mtime is when it was written and its atime when it was last read, so
+readers never change what marks a write.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import hashlib
+import logging
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+
+logger = logging.getLogger(__name__)
+
+SESSION_STORE_MEMORY_BYTES = int(os.environ.get("SESSION_STORE_MEMORY_BYTES", 256 * 1024 * 1024))
+# Large enough for one result of DataAnalystAgent's MAX_RESULT_BYTES (256 MB)
+SESSION_STORE_SESSION_BYTES = int(os.environ.get("SESSION_STORE_SESSION_BYTES", 256 * 1024 * 1024))
+SESSION_STORE_DISK_BYTES = int(os.environ.get("SESSION_STORE_DISK_BYTES", 1024 * 1024 * 1024))
+SESSION_STORE_TTL_SECONDS = float(os.environ.get("SESSION_STORE_TTL_SECONDS", 4 * 3600))
+SESSION_STORE_SWEEP_SECONDS = float(os.environ.get("SESSION_STORE_SWEEP_SECONDS", 300))
+SESSION_STORE_DIR = os.environ.get("SESSION_STORE_DIR", os.path.join(tempfile.gettempdir(), "data_agent_sessions"))
+
+_ARROW_MAGIC = b"ARROW1"
+_SAFE_NAME = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def _safe(part: str) -> str:
+    """A file name for a session id or value name: itself if harmless, else its hash."""
+    part = str(part)
+    return part if _SAFE_NAME.match(part) else hashlib.sha256(part.encode("utf-8")).hexdigest()[:32]
+
+
+def _encode(value: Any) -> Tuple[Any, int]:
+    """(the value as kept in memory, its size in bytes)."""
+    if isinstance(value, pa.Table):
+        return value, value.nbytes
+    data = json.dumps(value, default=str).encode("utf-8")
+    # Kept as decoded JSON, so callers never share a mutable object with the store
+    return data, len(data)
+
+
+def _decode(kept: Any) -> Any:
+    return kept if isinstance(kept, pa.Table) else json.loads(kept)
+
+
+def _version(stat: os.stat_result) -> Tuple[int, int, int]:
+    """What identifies one write of a file: its inode, size and modification time."""
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+def _last_used(stat: os.stat_result) -> float:
+    """When a file was last written (mtime) or read (atime)."""
+    return max(stat.st_atime, stat.st_mtime)
+
+
+class _Entry:
+    __slots__ = ("kept", "size", "used_at", "version")
+
+    def __init__(self, kept: Any, size: int, used_at: float, version: Optional[Tuple[int, int, int]]):
+        self.kept = kept
+        self.size = size
+        self.used_at = used_at
+        # (inode, size, mtime) of the file the value was read from or written to; a write by
+        # any worker replaces the file, so a different version means the memory copy is stale
+        self.version = version
+
+
+class SessionStore:
+    """Session-scoped values: a memory LRU in front of a directory shared by the workers."""
+
+    def __init__(self, directory: Optional[str] = SESSION_STORE_DIR,
+                 memory_bytes: int = SESSION_STORE_MEMORY_BYTES,
+                 session_bytes: int = SESSION_STORE_SESSION_BYTES,
+                 disk_bytes: int = SESSION_STORE_DISK_BYTES,
+                 ttl_seconds: float = SESSION_STORE_TTL_SECONDS,
+                 sweep_seconds: float = SESSION_STORE_SWEEP_SECONDS):
+        self.directory = directory or None
+        self.memory_bytes = memory_bytes
+        self.session_bytes = session_bytes
+        self.disk_bytes = disk_bytes
+        self.ttl_seconds = ttl_seconds
+        self.sweep_seconds = sweep_seconds
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+        self._memory_used = 0
+        self._lock = threading.Lock()
+        self._last_sweep = time.time()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        if self.directory:
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+            except OSError as e:
+                logger.warning(f"SessionStore: cannot use {self.directory} ({e}), keeping values in memory only.")
+                self.directory = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters and sizes, for logs and metrics."""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'memory_bytes': self._memory_used,
+                'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+            }
+
+    # -- Files -----------------------------------------------------------------------------
+
+    def _session_dir(self, session_id: str) -> str:
+        return os.path.join(self.directory, _safe(session_id))
+
+    def _path(self, session_id: str, name: str) -> str:
+        return os.path.join(self._session_dir(session_id), _safe(name) + ".value")
+
+    def _write(self, path: str, kept: Any) -> Tuple[int, int, int]:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if isinstance(kept, pa.Table):
+                with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, kept.schema) as writer:
+                    writer.write_table(kept)
+            else:
+                with open(tmp_path, "wb") as f:
+                    f.write(kept)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return _version(os.stat(path))
+
+    @staticmethod
+    def _read(path: str) -> Any:
+        with open(path, "rb") as f:
+            is_arrow = f.read(len(_ARROW_MAGIC)) == _ARROW_MAGIC
+            if not is_arrow:
+                f.seek(0)
+                return f.read()
+        return pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    # -- Memory tier -----------------------------------------------------------------------
+
+    def _forget(self, key: Tuple[str, str]) -> None:
+        """Drops a memory entry; the caller holds the lock."""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._memory_used -= entry.size
+
+    def _remember(self, key: Tuple[str, str], entry: _Entry) -> None:
+        """Adds a memory entry, evicting least recently used ones; the caller holds the lock."""
+        self._forget(key)
+        if entry.size > self.memory_bytes:
+            return
+        self._entries[key] = entry
+        self._memory_used += entry.size
+        while self._memory_used > self.memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_used -= evicted.size
+            self.evictions += 1
+
+    # -- Quota and expiry ------------------------------------------------------------------
+
+    def _session_usage(self, session_id: str) -> List[Tuple[float, str, int]]:
+        """(last used, name key, size) of a session's values, oldest first."""
+        if not self.directory:
+            with self._lock:
+                return sorted((entry.used_at, key[1], entry.size)
+                              for key, entry in self._entries.items() if key[0] == session_id)
+        usage = []
+        try:
+            with os.scandir(self._session_dir(session_id)) as it:
+                for item in it:
+                    if item.name.endswith(".value"):
+                        try:
+                            stat = item.stat()
+                        except FileNotFoundError:
+                            continue
+                        usage.append((_last_used(stat), item.name, stat.st_size))
+        except FileNotFoundError:
+            pass
+        return sorted(usage)
+
+    def _enforce_quota(self, session_id: str, keep: str) -> None:
+        usage = self._session_usage(session_id)
+        total = sum(size for _, _, size in usage)
+        kept_key = _safe(keep) + ".value" if self.directory else keep
+        for _, name_key, size in usage:
+            if total <= self.session_bytes:
+                break
+            if name_key == kept_key:
+                continue
+            total -= size
+            self.evictions += 1
+            if self.directory:
+                self._evict_file(self._session_dir(session_id), name_key)
+            else:
+                with self._lock:
+                    self._forget((session_id, name_key))
+            logger.info(f"SessionStore: session {session_id} over its quota, dropped {name_key} ({size} bytes).")
+
+    def _evict_file(self, session_dir: str, name_key: str) -> None:
+        """Removes a value's file and any memory copy of it."""
+        self._remove(os.path.join(session_dir, name_key))
+        session_key = os.path.basename(session_dir)
+        with self._lock:
+            for key in [k for k in self._entries
+                        if _safe(k[0]) == session_key and _safe(k[1]) + ".value" == name_key]:
+                self._forget(key)
+
+    def _enforce_disk_limit(self, keep_path: str) -> None:
+        """Holds the whole directory to disk_bytes, dropping the least recently used values of any session."""
+        usage = []
+        try:
+            sessions = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            sessions = []
+        for session in sessions:
+            try:
+                with os.scandir(session.path) as it:
+                    for item in it:
+                        if item.name.endswith(".value"):
+                            stat = item.stat()
+                            usage.append((_last_used(stat), session.path, item.name, stat.st_size))
+            except OSError:
+                # Not a session directory, or another worker removed it
+                continue
+        total = sum(size for _, _, _, size in usage)
+        for _, session_dir, name_key, size in sorted(usage):
+            if total <= self.disk_bytes:
+                break
+            if os.path.join(session_dir, name_key) == keep_path:
+                continue
+            total -= size
+            self.evictions += 1
+            self._evict_file(session_dir, name_key)
+            logger.info(f"SessionStore: {self.directory} over {self.disk_bytes} bytes, "
+                        f"dropped {name_key} of session {os.path.basename(session_dir)} ({size} bytes).")
+
+    def _maybe_sweep(self) -> None:
+        if time.time() - self._last_sweep >= self.sweep_seconds:
+            self.sweep()
+
+    def sweep(self) -> int:
+        """Removes the values unused for longer than the TTL; returns how many were removed."""
+        now = time.time()
+        self._last_sweep = now
+        removed = 0
+        with self._lock:
+            for key in [k for k, entry in self._entries.items() if now - entry.used_at > self.ttl_seconds]:
+                self._forget(key)
+                if not self.directory:
+                    removed += 1
+        if self.directory:
+            try:
+                sessions = list(os.scandir(self.directory))
+            except FileNotFoundError:
+                sessions = []
+            for session in sessions:
+                if not session.is_dir():
+                    continue
+                try:
+                    with os.scandir(session.path) as it:
+                        items = list(it)
+                    for item in items:
+                        if now - _last_used(item.stat()) > self.ttl_seconds:
+                            self._remove(item.path)
+                            removed += item.name.endswith(".value")
+                    if not os.listdir(session.path):
+                        os.rmdir(session.path)
+                except OSError:
+                    # Another worker is sweeping or writing to the same session
+                    continue
+        self.expirations += removed
+        if removed:
+            logger.info(f"SessionStore: removed {removed} expired values.")
+        return removed
+
+    # -- Values ----------------------------------------------------------------------------
+
+    def put(self, session_id: str, name: str, value: Any) -> bool:
+        """Stores a value; returns False if it is larger than the session's quota or the directory's cap."""
+        kept, size = _encode(value)
+        if size > self.session_bytes or (self.directory and size > self.disk_bytes):
+            logger.warning(f"SessionStore: {name} of {size} bytes exceeds the session quota or the directory cap, not kept.")
+            return False
+        self._maybe_sweep()
+        version = None
+        path = self._path(session_id, name) if self.directory else None
+        if self.directory:
+            try:
+                version = self._write(path, kept)
+            except OSError as e:
+                logger.error(f"SessionStore: could not write {name} for session {session_id}: {e}")
+                return False
+        with self._lock:
+            self._remember((session_id, name), _Entry(kept, size, time.time(), version))
+        self._enforce_quota(session_id, name)
+        if self.directory:
+            self._enforce_disk_limit(path)
+        return True
+
+    def get(self, session_id: str, name: str, default: Any = None) -> Any:
+        """The stored value, or default if it is unknown or expired."""
+        self._maybe_sweep()
+        key = (session_id, name)
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+        if not self.directory:
+            with self._lock:
+                if entry is None or now - entry.used_at > self.ttl_seconds:
+                    self._forget(key)
+                    self.misses += 1
+                    return default
+                entry.used_at = now
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return _decode(entry.kept)
+
+        path = self._path(session_id, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+            return default
+        if now - _last_used(stat) > self.ttl_seconds:
+            self._remove(path)
+            with self._lock:
+                self._forget(key)
+                self.misses += 1
+                self.expirations += 1
+            return default
+        version = _version(stat)
+        if entry is None or entry.version != version:
+            try:
+                kept = self._read(path)
+            except (OSError, pa.ArrowInvalid) as e:
+                logger.warning(f"SessionStore: could not read {name} for session {session_id}: {e}")
+                with self._lock:
+                    self.misses += 1
+                return default
+            entry = _Entry(kept, kept.nbytes if isinstance(kept, pa.Table) else len(kept), now, version)
+            with self._lock:
+                self._remember(key, entry)
+                self.disk_hits += 1
+        else:
+            with self._lock:
+                entry.used_at = now
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                self.hits += 1
+        try:
+            # Reading counts as use, for the TTL and the LRU order: it sets the atime and
+            # leaves the mtime, so the version other workers hold stays valid
+            os.utime(path, ns=(time.time_ns(), stat.st_mtime_ns))
+        except OSError:
+            pass
+        return _decode(entry.kept)
+
+    def delete(self, session_id: str, name: str) -> None:
+        with self._lock:
+            self._forget((session_id, name))
+        if self.directory:
+            self._remove(self._path(session_id, name))
+
+    def clear_session(self, session_id: str) -> None:
+        """Removes every value of a session."""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == session_id]:
+                self._forget(key)
+        if self.directory:
+            for _, name_key, _ in self._session_usage(session_id):
+                self._remove(os.path.join(self._session_dir(session_id), name_key))
+
+
+_default_store: Optional[SessionStore] = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_session_store() -> SessionStore:
+    """Returns the process-wide session store configured by the SESSION_STORE_* settings."""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = SessionStore()
+        return _default_store
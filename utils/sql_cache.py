@@ -0,0 +1,90 @@
+"""
+Cache of generated SQL, so asking the same question against an unchanged schema
+does not call the language model again.
+
+Entries are keyed by (normalized question, dataset, schema fingerprint, model
+name). When a dataset is seen with a new schema fingerprint, its entries for
+older fingerprints are dropped.
+"""
+
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from utils.text_utils import normalize_question
+
+logger = logging.getLogger(__name__)
+
+SQL_CACHE_TTL_SECONDS = float(os.environ.get("SQL_CACHE_TTL_SECONDS", 3600))
+SQL_CACHE_MAX_ENTRIES = int(os.environ.get("SQL_CACHE_MAX_ENTRIES", 2048))
+
+GenerationKey = Tuple[str, str, str, str]
+
+
+def schema_fingerprint(dataset_schema: Optional[Dict[str, Any]]) -> str:
+    """Stable hash of a dataset schema dict."""
+    return hashlib.sha256(json.dumps(dataset_schema or {}, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+class SQLGenerationCache:
+    """LRU + TTL cache of question -> cleaned SQL."""
+
+    def __init__(self, max_entries: int = SQL_CACHE_MAX_ENTRIES, ttl_seconds: float = SQL_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[GenerationKey, Tuple[str, float]]" = OrderedDict()
+        self._fingerprints: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def make_key(self, question: str, dataset_id: str, dataset_schema: Optional[Dict[str, Any]],
+                 model_name: str) -> GenerationKey:
+        """Builds the key for a question, and drops entries made against an older schema of the dataset."""
+        fingerprint = schema_fingerprint(dataset_schema)
+        with self._lock:
+            previous = self._fingerprints.get(dataset_id)
+            if previous != fingerprint:
+                self._fingerprints[dataset_id] = fingerprint
+                if previous is not None:
+                    stale = [key for key in self._entries if key[1] == dataset_id and key[2] != fingerprint]
+                    for key in stale:
+                        del self._entries[key]
+                    logger.info(f"SQLGenerationCache: schema of {dataset_id} changed, dropped {len(stale)} entries")
+        return normalize_question(question), dataset_id, fingerprint, model_name
+
+    def get(self, key: GenerationKey) -> Optional[str]:
+        """Returns the cached SQL for a key, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[1] < self.ttl_seconds:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: GenerationKey, sql: str) -> None:
+        """Caches the SQL generated for a key."""
+        with self._lock:
+            self._entries[key] = (sql, time.monotonic())
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def discard(self, key: GenerationKey) -> None:
+        """Forgets an entry, e.g. because its SQL failed to run."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Counters and current size, for logs and metrics."""
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
@@ -0,0 +1,108 @@
+"""
+SQL text helpers shared by the query caches and guardrails.
+"""
+
+import hashlib
+import re
+
+_TOKEN_RE = re.compile(
+    r"""
+    (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")   # string literals
+    |(?P<quoted>`[^`]*`)                               # quoted identifiers
+    |(?P<line_comment>(?:--|\#)[^\n]*)                 # -- and # comments
+    |(?P<block_comment>/\*.*?\*/)                      # /* */ comments
+    |(?P<space>\s+)
+    """,
+    re.VERBOSE | re.DOTALL,
+)
+
+
+def normalize_sql(sql: str) -> str:
+    """
+    Normalizes SQL text for fingerprinting: drops comments, collapses whitespace
+    and the trailing semicolon. Literals and quoted identifiers are left untouched.
+    """
+    if not sql:
+        return ""
+
+    parts = []
+    position = 0
+    for match in _TOKEN_RE.finditer(sql):
+        if match.start() > position:
+            parts.append(sql[position:match.start()])
+        if match.group("string") or match.group("quoted"):
+            parts.append(match.group(0))
+        elif not parts or not parts[-1].endswith(" "):
+            parts.append(" ")
+        position = match.end()
+    if position < len(sql):
+        parts.append(sql[position:])
+    return "".join(parts).strip().rstrip(";").strip()
+
+
+def sql_fingerprint(sql: str) -> str:
+    """Returns a stable hash of the normalized SQL text."""
+    return hashlib.sha256(normalize_sql(sql).encode("utf-8")).hexdigest()
+
+
+_NONDETERMINISTIC_RE = re.compile(
+    r"\b(?:CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIME|CURRENT_TIMESTAMP|NOW|RAND|GENERATE_UUID|SESSION_USER)\b",
+    re.IGNORECASE,
+)
+
+
+def strip_literals_and_comments(sql: str) -> str:
+    """SQL with every string literal and comment replaced by a space, so keywords can be searched safely."""
+    def replace(match):
+        if match.group("string") or match.group("line_comment") or match.group("block_comment"):
+            return " "
+        return match.group(0)
+    return _TOKEN_RE.sub(replace, sql or "")
+
+
+def is_deterministic(sql: str) -> bool:
+    """False when the query calls functions whose result changes between runs (CURRENT_DATE, RAND, ...)."""
+    return not _NONDETERMINISTIC_RE.search(strip_literals_and_comments(sql))
+
+
+def complete_statement_end(text: str):
+    """
+    Position just past the first complete statement in model output that is still
+    streaming in: the closing fence of a ``` block, or the first `;` outside string
+    literals, quoted identifiers and comments. None while the statement may continue.
+    """
+    fence = text.find("```")
+    if fence != -1:
+        closing = text.find("```", fence + 3)
+        if closing != -1:
+            return closing + 3
+
+    position = 0
+    for match in list(_TOKEN_RE.finditer(text)) + [None]:
+        gap = text[position:match.start() if match else len(text)]
+        semicolon = gap.find(";")
+        # Terminated literals and comments are tokens, so an opener left in a gap is unterminated
+        opener = min((gap.find(mark) for mark in ("'", '"', "`", "/*") if mark in gap), default=-1)
+        if opener != -1 and (semicolon == -1 or opener < semicolon):
+            return None
+        if semicolon != -1:
+            return position + semicolon + 1
+        if match is not None:
+            position = match.end()
+    return None
+
+
+def quote_identifier(name: str) -> str:
+    """A BigQuery column name as a backquoted identifier."""
+    return "`" + str(name).replace("\\", "\\\\").replace("`", "\\`") + "`"
+
+
+def string_literal(value: str) -> str:
+    """A BigQuery single-quoted string literal."""
+    return "'" + str(value).replace("\\", "\\\\").replace("'", "\\'").replace("\n", "\\n") + "'"
+
+
+def count_sql(sql: str) -> str:
+    """BigQuery SQL whose single row holds the number of rows of sql's result, as total_rows."""
+    # The newline before the closing parenthesis ends any trailing comment in sql
+    return f"SELECT COUNT(*) AS total_rows FROM (\n{sql.strip().rstrip(';')}\n)"
@@ -0,0 +1,187 @@
+"""
+Local validation of generated SQL before it is sent to BigQuery.
+
+The query is parsed in the BigQuery dialect with sqlglot, so malformed SQL,
+anything other than a single read-only query, and references to tables or
+columns that are not in the cached dataset schema fail in milliseconds instead
+of after a warehouse round trip. Queries without aggregation get a LIMIT, and
+the canonical rendering of the query is returned for cache fingerprinting.
+
+The SQL sent to BigQuery is the model's own text (plus the LIMIT), not sqlglot's
+rendering of it, so a rendering difference can never change what runs. Without
+sqlglot only the statement type is checked.
+"""
+
+import re
+import logging
+from typing import Any, Dict, Optional, Set
+
+try:
+    import sqlglot
+    from sqlglot import exp
+    from sqlglot.errors import SqlglotError
+except ImportError:
+    sqlglot = None
+    logging.warning("sqlglot package not found. Generated SQL will only get basic checks before it is sent to BigQuery.")
+
+from utils.sql_utils import strip_literals_and_comments
+
+logger = logging.getLogger(__name__)
+
+# Pseudo-columns BigQuery adds to partitioned and wildcard tables
+PSEUDO_COLUMNS = {"_partitiontime", "_partitiondate", "_table_suffix", "_file_name"}
+# Names listed in an error message, so a 5,000-column table does not flood the chat
+MAX_LISTED_NAMES = 20
+
+_FORBIDDEN_RE = re.compile(
+    r"\b(?:INSERT|UPDATE|DELETE|MERGE|CREATE|DROP|ALTER|TRUNCATE|GRANT|REVOKE|CALL|EXECUTE|DECLARE|BEGIN|EXPORT|LOAD)\b",
+    re.IGNORECASE,
+)
+
+
+def _listing(names) -> str:
+    names = sorted(names)
+    shown = ", ".join(names[:MAX_LISTED_NAMES])
+    return shown + (f", ... ({len(names) - MAX_LISTED_NAMES} more)" if len(names) > MAX_LISTED_NAMES else "")
+
+
+def validate_sql(sql: str, dataset_schema: Optional[Dict[str, Any]] = None, dataset_id: Optional[str] = None,
+                 limit: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Checks a generated query before it is run. dataset_schema is the cached schema
+    of dataset_id ({'table': {'columns': [...]}}); tables of other datasets are not
+    checked. limit, if given, is appended to queries that neither aggregate nor
+    already have a LIMIT.
+
+    Returns {'sql': the query to run, 'normalized': canonical text for cache keys,
+    'limit_added': bool, 'error': None or why the query was rejected}.
+    """
+    sql = (sql or "").strip().rstrip(";").strip()
+    result = {'sql': sql, 'normalized': sql, 'limit_added': False, 'error': None}
+    if not sql:
+        result['error'] = "The query is empty."
+        return result
+
+    if sqlglot is None:
+        stripped = strip_literals_and_comments(sql).strip()
+        if not re.match(r"(?:\(\s*)*(?:SELECT|WITH)\b", stripped, re.IGNORECASE):
+            result['error'] = "Only SELECT queries can be run."
+        elif ";" in stripped or _FORBIDDEN_RE.search(stripped):
+            result['error'] = "Only a single read-only SELECT query can be run."
+        return result
+
+    try:
+        statements = [statement for statement in sqlglot.parse(sql, read="bigquery") if statement is not None]
+    except SqlglotError as e:
+        result['error'] = f"The query could not be parsed: {e}"
+        return result
+    if len(statements) != 1:
+        result['error'] = "Only a single SELECT query can be run."
+        return result
+    query = statements[0]
+    forbidden = tuple(getattr(exp, name) for name in
+                      ("Insert", "Update", "Delete", "Merge", "Create", "Drop", "Alter", "Command", "Set")
+                      if hasattr(exp, name))
+    if not isinstance(query, exp.Query) or query.find(*forbidden) is not None:
+        result['error'] = f"Only SELECT queries can be run, not {query.key.upper()} statements."
+        return result
+
+    error = _check_references(query, dataset_schema, dataset_id)
+    if error:
+        result['error'] = error
+        return result
+
+    if limit is not None and query.args.get("limit") is None and not _aggregates(query):
+        # Appended as text so the model's SQL runs as written; the newline ends any trailing comment
+        result['sql'] = f"{sql}\nLIMIT {int(limit)}"
+        result['limit_added'] = True
+        query = query.limit(int(limit))
+    try:
+        result['normalized'] = query.sql(dialect="bigquery")
+    except SqlglotError as e:
+        logger.warning(f"Could not render the parsed query, fingerprinting its text instead: {e}")
+        result['normalized'] = result['sql']
+    return result
+
+
+def _aggregates(query) -> bool:
+    """
+    True when a query returns grouped rows: GROUP BY, or an aggregate outside a window.
+    A UNION, INTERSECT or EXCEPT does only when every one of its branches does.
+    """
+    while isinstance(query, exp.Subquery):
+        query = query.this
+    if isinstance(query, exp.SetOperation):
+        return _aggregates(query.left) and _aggregates(query.right)
+    if not isinstance(query, exp.Select):
+        return False
+    if query.args.get("group") is not None:
+        return True
+    for projection in query.expressions:
+        for aggregate in projection.find_all(exp.AggFunc):
+            # Not inside a window or a scalar subquery of the projection
+            if aggregate.find_ancestor(exp.Window, exp.Select) is query:
+                return True
+    return False
+
+
+def _check_references(query, dataset_schema: Optional[Dict[str, Any]], dataset_id: Optional[str]) -> Optional[str]:
+    """Error message for the first table or column not found in the dataset schema, or None."""
+    if not dataset_schema:
+        return None
+    dataset = (dataset_id or "").split(".")[0].lower()
+    tables = {name.lower(): info for name, info in dataset_schema.items()}
+    cte_names = {cte.alias_or_name.lower() for cte in query.find_all(exp.CTE)}
+
+    columns: Set[str] = set(PSEUDO_COLUMNS)
+    referenced_columns: Set[str] = set()
+    # Aliases of CTEs, subqueries and UNNEST, whose columns the schema does not describe
+    opaque_sources: Set[str] = set(cte_names)
+    all_sources_known = True
+    for table in query.find_all(exp.Table):
+        name = table.name.lower()
+        if name in cte_names and not table.db:
+            continue
+        db = (table.db or "").lower()
+        if "information_schema" in f"{db}.{name}" or name.startswith("__") or (db and dataset and db != dataset):
+            # Metadata views and other datasets are left to BigQuery
+            all_sources_known = False
+            continue
+        if name.endswith("*"):
+            matches = [info for table_name, info in tables.items() if table_name.startswith(name[:-1])]
+        else:
+            matches = [tables[name]] if name in tables else []
+        if not matches:
+            return f"Table `{table.name}` is not in the dataset. Available tables: {_listing(dataset_schema)}."
+        for info in matches:
+            for column in (info or {}).get('columns', []):
+                columns.add(column['name'].lower())
+                referenced_columns.add(column['name'])
+            for nested in (info or {}).get('nested_fields', []):
+                columns.update(part.lower() for part in nested['name'].split("."))
+            if not (info or {}).get('columns'):
+                all_sources_known = False
+
+    for node in query.find_all(exp.Alias):
+        if node.alias:
+            columns.add(node.alias.lower())
+    for node in query.find_all(exp.TableAlias):
+        if isinstance(node.parent, exp.Table):
+            continue
+        # A subquery or UNNEST alias; UNNEST(arr) AS v also names the values as column v
+        if node.name:
+            opaque_sources.add(node.name.lower())
+            columns.add(node.name.lower())
+        columns.update(column.name.lower() for column in node.columns)
+    if not all_sources_known:
+        return None
+
+    for column in query.find_all(exp.Column):
+        name, qualifier = column.name.lower(), (column.table or "").lower()
+        if not name or name in columns or qualifier in opaque_sources or qualifier in columns:
+            continue
+        if isinstance(column.this, exp.Star):
+            continue
+        return (f"Column `{column.name}` does not exist in the referenced tables. "
+                f"Their columns: {_listing(referenced_columns)}.")
+    return None
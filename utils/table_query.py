@@ -0,0 +1,186 @@
+"""
+Paging, sorting and filtering of a query result for the chat's data table.
+
+The DataTable runs with page_action, sort_action and filter_action set to
+'custom': the browser only sends the page it shows, its sort_by and its
+filter_query, and receives that page's rows. page_table() computes the page from
+a result held as Arrow (utils.result_store); page_sql() wraps the user's query
+in the same WHERE / ORDER BY / LIMIT for BigQuery, for results that were only
+partly downloaded.
+
+Filters use the DataTable's syntax, e.g. `{amount} > 10 && {region} icontains nor`.
+A filter compares numerically when the column is numeric and the value a
+number, and otherwise compares the column's text (so dates filter and sort by
+their ISO text). Unsupported filter parts are ignored, as the DataTable does.
+"""
+
+import os
+import re
+import math
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from utils.sql_utils import quote_identifier, string_literal
+
+logger = logging.getLogger(__name__)
+
+TABLE_PAGE_SIZE = int(os.environ.get("TABLE_PAGE_SIZE", 20))
+# Column of page_sql's result holding the number of rows matching the filters
+TOTAL_ROWS_COLUMN = "_page_total_rows"
+
+# DataTable operators and their comparison: the word forms take an i (case-insensitive)
+# or s (case-sensitive) prefix
+_OPERATORS = {
+    '=': '=', 'eq': '=', '!=': '!=', 'ne': '!=', '<': '<', 'lt': '<', '<=': '<=', 'le': '<=',
+    '>': '>', 'gt': '>', '>=': '>=', 'ge': '>=', 'contains': 'contains', 'datestartswith': 'datestartswith',
+}
+_FILTER_RE = re.compile(
+    r"""^\{(?P<column>(?:[^}\\]|\\.)+)\}\s*
+    (?P<operator>>=|<=|!=|=|<|>|[is]?(?:eq|ne|lt|le|gt|ge|contains|datestartswith))\s*
+    (?P<value>.*)$""",
+    re.VERBOSE | re.DOTALL,
+)
+_COMPARISONS = {'=': pc.equal, '!=': pc.not_equal, '<': pc.less, '<=': pc.less_equal,
+                '>': pc.greater, '>=': pc.greater_equal}
+
+
+def parse_filter_query(filter_query: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    Filter conditions of a DataTable filter_query: dicts with column, operator (one of
+    =, !=, <, <=, >, >=, contains, datestartswith), value (text) and ignore_case.
+    """
+    conditions = []
+    for part in (filter_query or "").split(" && "):
+        part = part.strip()
+        if not part:
+            continue
+        match = _FILTER_RE.match(part)
+        if not match:
+            logger.warning(f"Ignoring unsupported table filter: {part}")
+            continue
+        operator = match.group('operator')
+        ignore_case = operator[0] == 'i' and operator[1:] in _OPERATORS
+        if operator[0] in 'is' and operator[1:] in _OPERATORS:
+            operator = operator[1:]
+        value = match.group('value').strip()
+        if len(value) >= 2 and value[0] == value[-1] and value[0] in "'\"`":
+            value = value[1:-1].replace("\\" + value[0], value[0])
+        conditions.append({'column': match.group('column').replace("\\}", "}"), 'operator': _OPERATORS[operator],
+                           'value': value, 'ignore_case': ignore_case})
+    return conditions
+
+
+def _number(value: str) -> Optional[float]:
+    """The filter value as a number, or None; inf, nan and overflowing values are compared as text."""
+    try:
+        number = float(value)
+    except ValueError:
+        return None
+    return number if math.isfinite(number) else None
+
+
+def _is_numeric(data_type: pa.DataType) -> bool:
+    return pa.types.is_integer(data_type) or pa.types.is_floating(data_type) or pa.types.is_decimal(data_type)
+
+
+def _known(conditions: List[Dict[str, Any]], sort_by: Optional[List[Dict[str, str]]],
+           schema: pa.Schema) -> Tuple[List[Dict[str, Any]], List[Tuple[str, str]]]:
+    """The conditions and sort keys that refer to columns of schema."""
+    names = set(schema.names)
+    for condition in conditions:
+        if condition['column'] not in names:
+            logger.warning(f"Ignoring table filter on unknown column: {condition['column']}")
+    keys = [(key['column_id'], 'descending' if key.get('direction') == 'desc' else 'ascending')
+            for key in sort_by or [] if key.get('column_id') in names]
+    return [c for c in conditions if c['column'] in names], keys
+
+
+def _condition_mask(table: pa.Table, condition: Dict[str, Any]):
+    column = table.column(condition['column'])
+    operator, value = condition['operator'], condition['value']
+    number = _number(value)
+    if operator in _COMPARISONS and _is_numeric(column.type) and number is not None:
+        return _COMPARISONS[operator](column, pa.scalar(number))
+    text = pc.cast(column, pa.string())
+    if operator == 'contains':
+        return pc.match_substring(text, value, ignore_case=condition['ignore_case'])
+    if operator == 'datestartswith':
+        return pc.starts_with(text, value)
+    if condition['ignore_case']:
+        text, value = pc.utf8_lower(text), value.lower()
+    return _COMPARISONS[operator](text, pa.scalar(value))
+
+
+def page_table(table: pa.Table, page_current: int = 0, page_size: int = TABLE_PAGE_SIZE,
+               sort_by: Optional[List[Dict[str, str]]] = None,
+               filter_query: Optional[str] = None) -> Tuple[pa.Table, int]:
+    """(rows of the page, number of rows matching the filters) of an Arrow result."""
+    conditions, keys = _known(parse_filter_query(filter_query), sort_by, table.schema)
+    for condition in conditions:
+        try:
+            table = table.filter(_condition_mask(table, condition))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Ignoring table filter {condition}: {e}")
+    if keys:
+        try:
+            table = table.take(pc.sort_indices(table, sort_keys=keys))
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            logger.warning(f"Cannot sort the table by {keys}: {e}")
+    return table.slice(page_current * page_size, page_size), table.num_rows
+
+
+def _condition_sql(condition: Dict[str, Any], data_type: pa.DataType) -> str:
+    column = quote_identifier(condition['column'])
+    operator, value = condition['operator'], condition['value']
+    number = _number(value)
+    if operator in _COMPARISONS and _is_numeric(data_type) and number is not None:
+        return f"{column} {operator} {number!r}"
+    text = f"CAST({column} AS STRING)"
+    if operator == 'contains':
+        if condition['ignore_case']:
+            return f"STRPOS(LOWER({text}), {string_literal(value.lower())}) > 0"
+        return f"STRPOS({text}, {string_literal(value)}) > 0"
+    if operator == 'datestartswith':
+        return f"STARTS_WITH({text}, {string_literal(value)})"
+    if condition['ignore_case']:
+        return f"LOWER({text}) {operator} {string_literal(value.lower())}"
+    return f"{text} {operator} {string_literal(value)}"
+
+
+def _orderable(field: pa.Field) -> bool:
+    """Whether BigQuery can ORDER BY a result column (not ARRAY, STRUCT, GEOGRAPHY or JSON)."""
+    data_type = field.type
+    if pa.types.is_nested(data_type):
+        return False
+    extension = (field.metadata or {}).get(b"ARROW:extension:name", b"").lower()
+    return b"geography" not in extension and b"json" not in extension
+
+
+def page_sql(sql: str, schema: pa.Schema, page_current: int = 0, page_size: int = TABLE_PAGE_SIZE,
+             sort_by: Optional[List[Dict[str, str]]] = None, filter_query: Optional[str] = None) -> str:
+    """
+    BigQuery SQL for one page of the rows of sql, with the filters and sort of page_table.
+    schema is the schema of the result's rows; the TOTAL_ROWS_COLUMN column of every row
+    holds the number of rows matching the filters. BigQuery keeps no row order of its own,
+    so the sort keys are followed by every other orderable column: rows that tie on the
+    keys (or all rows, without a sort) come in the same order for every page.
+    """
+    conditions, keys = _known(parse_filter_query(filter_query), sort_by, schema)
+    where = " AND ".join(f"({_condition_sql(c, schema.field(c['column']).type)})" for c in conditions)
+    sorted_names = {name for name, _ in keys}
+    keys = keys + [(field.name, 'ascending') for field in schema
+                   if field.name not in sorted_names and _orderable(field)]
+    order = ", ".join(f"{quote_identifier(name)} {'DESC' if direction == 'descending' else 'ASC'} NULLS LAST"
+                      for name, direction in keys)
+    # The newline before the closing parenthesis ends any trailing comment in sql
+    return "\n".join(part for part in [
+        f"WITH source AS (\n{sql.strip().rstrip(';')}\n)",
+        f"SELECT *, COUNT(*) OVER () AS {TOTAL_ROWS_COLUMN}",
+        "FROM source",
+        f"WHERE {where}" if where else "",
+        f"ORDER BY {order}" if order else "",
+        f"LIMIT {int(page_size)} OFFSET {int(page_current) * int(page_size)}",
+    ] if part)
@@ -0,0 +1,22 @@
+"""
+Helpers for the text of user questions, shared by the SQL caches and the schema pruner.
+"""
+
+import re
+
+# Words that only phrase a question; matching leaves them out
+QUESTION_WORDS = frozenset("""
+    a all an and any are across as at be between breakdown by can could did do does each for from get give had has
+    have how i in is it its list me of on or order ordered over per please rank ranked show sorted tell than that
+    the their them there these this those to was we were what when where which who with would you
+""".split())
+
+
+def normalize_question(question: str) -> str:
+    """Lower-cases a question, collapses whitespace and drops trailing punctuation."""
+    return re.sub(r"\s+", " ", (question or "").strip().lower()).rstrip(" ?!.")
+
+
+def stem_word(word: str) -> str:
+    """Drops a plural 's' ("states" -> "state"), so singular and plural words match."""
+    return word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word
@@ -0,0 +1,131 @@
+"""
+Lightweight timing spans for the query pipeline.
+
+`with span("llm.generate"):` times a block. Spans are recorded into the
+StageTimings of the current request (see collect_timings), which the chat shows
+under each answer. When TRACING_ENABLED is set and the OpenTelemetry API is
+installed, every span is also started on the OpenTelemetry tracer, so the
+configured SDK/exporter receives them with their nesting. With neither, a span
+only costs a context variable lookup.
+"""
+
+import os
+import time
+import logging
+import functools
+import contextvars
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "").lower() in ("1", "true", "yes")
+
+_tracer = None
+if TRACING_ENABLED:
+    try:
+        from opentelemetry import trace as otel_trace
+        _tracer = otel_trace.get_tracer("data_agent")
+    except ImportError:
+        logging.warning("opentelemetry-api package not found. Tracing spans will not be exported.")
+
+logger = logging.getLogger(__name__)
+
+
+class StageTimings:
+    """
+    Spans recorded during one request, as (name, depth, seconds) in the order they
+    ended. on_start, if given, is called with the name of each span as it starts.
+    """
+
+    def __init__(self, on_start: Optional[Callable[[str], None]] = None):
+        self.spans: List[Tuple[str, int, float]] = []
+        self.on_start = on_start
+
+    def add(self, name: str, depth: int, seconds: float) -> None:
+        self.spans.append((name, depth, seconds))
+
+    def totals(self) -> Dict[str, float]:
+        """Milliseconds per span name, summed over repeats, in order of first completion."""
+        totals: Dict[str, float] = {}
+        for name, _, seconds in self.spans:
+            totals[name] = totals.get(name, 0.0) + seconds * 1000
+        return totals
+
+    def to_markdown(self) -> str:
+        """Top-level stages with their sub-stages in parentheses, e.g. 'process 812 ms (llm.generate 640 ms)'."""
+        parts, children = [], []
+        # Spans end child-first, so children are collected until their parent ends
+        for name, depth, seconds in self.spans:
+            if depth > 0:
+                children.append((name, depth, seconds))
+                continue
+            direct = _merge([(child, secs) for child, child_depth, secs in children if child_depth == 1])
+            detail = ", ".join(f"{child} {secs * 1000:.0f} ms" for child, secs in direct)
+            parts.append(f"{name} {seconds * 1000:.0f} ms" + (f" ({detail})" if detail else ""))
+            children = []
+        return " · ".join(parts)
+
+
+def _merge(spans: List[Tuple[str, float]]) -> List[Tuple[str, float]]:
+    merged: Dict[str, float] = {}
+    for name, seconds in spans:
+        merged[name] = merged.get(name, 0.0) + seconds
+    return list(merged.items())
+
+
+_current_timings: contextvars.ContextVar[Optional[StageTimings]] = contextvars.ContextVar(
+    "stage_timings", default=None)
+_current_depth: contextvars.ContextVar[int] = contextvars.ContextVar("stage_depth", default=0)
+
+
+@contextmanager
+def collect_timings(on_start: Optional[Callable[[str], None]] = None):
+    """
+    Records the spans of the enclosed block into a new StageTimings, which it yields.
+    on_start is called with each span name as the span starts; an exception it
+    raises propagates out of the span, which is how a stage can be aborted.
+    """
+    timings = StageTimings(on_start)
+    timings_token = _current_timings.set(timings)
+    depth_token = _current_depth.set(0)
+    try:
+        yield timings
+    finally:
+        _current_depth.reset(depth_token)
+        _current_timings.reset(timings_token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """Times the enclosed block as stage `name`; attributes are passed to OpenTelemetry."""
+    timings = _current_timings.get()
+    if timings is None and _tracer is None:
+        yield
+        return
+    if timings is not None and timings.on_start is not None:
+        timings.on_start(name)
+    depth = _current_depth.get()
+    depth_token = _current_depth.set(depth + 1)
+    otel_span = _tracer.start_as_current_span(name, attributes=attributes or None) if _tracer else None
+    start = time.perf_counter()
+    try:
+        if otel_span is not None:
+            with otel_span:
+                yield
+        else:
+            yield
+    finally:
+        elapsed = time.perf_counter() - start
+        _current_depth.reset(depth_token)
+        if timings is not None:
+            timings.add(name, depth, elapsed)
+
+
+def traced(name: str):
+    """Decorator form of span()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator